@@ -5,6 +5,7 @@ Reads from environment variables with sane defaults for local development.
 from __future__ import annotations
 
 import os
+import tempfile
 
 ENV = os.environ.get("LOMA_ENV", "development")  # development | staging | production
 
@@ -16,6 +17,12 @@ def _bool(val: str | None) -> bool:
 # --- Anthropic ---
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
 
+# --- Request budget ---
+# Used when no Lambda context is available (local server); matches the Lambda timeout.
+REQUEST_BUDGET_S = float(os.environ.get("REQUEST_BUDGET_S", "30"))
+# Time kept back from the pipeline for the post-rewrite DB writes and analytics.
+POST_PIPELINE_RESERVE_S = float(os.environ.get("POST_PIPELINE_RESERVE_S", "2"))
+
 # --- Supabase ---
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
@@ -36,6 +43,97 @@ ALLOWED_ORIGINS: list[str] = [
 FREE_REWRITES_PER_DAY = int(os.environ.get("FREE_REWRITES_PER_DAY", "5"))
 PAYG_PACK_SIZE = int(os.environ.get("PAYG_PACK_SIZE", "20"))
 
+# --- Entity masking (placeholders around LLM calls) ---
+ENTITY_MASKING = _bool(os.environ.get("ENTITY_MASKING", "true"))
+# Re-ask the model once when deterministic entity repair can't recover a dropped entity
+ENTITY_REPAIR_RETRY = _bool(os.environ.get("ENTITY_REPAIR_RETRY", "true"))
+
+# --- Output length: per-request max_tokens from predicted output length ---
+DYNAMIC_MAX_TOKENS = _bool(os.environ.get("DYNAMIC_MAX_TOKENS", "true"))
+OUTPUT_LENGTH_PROFILE_PATH = os.environ.get("OUTPUT_LENGTH_PROFILE_PATH", "")  # run_calibrate_output.py artifact
+
+# --- Cascade routing: Sonnet-routed rewrites try Haiku first, escalate on failed checks ---
+ROUTING_CASCADE = _bool(os.environ.get("ROUTING_CASCADE", "false"))
+CASCADE_HAIKU_TIMEOUT_S = float(os.environ.get("CASCADE_HAIKU_TIMEOUT_S", "6"))
+
+# --- Learned routing policy (run_train_router.py artifact; rules are the fallback) ---
+ROUTING_POLICY_PATH = os.environ.get("ROUTING_POLICY_PATH", "")  # "" = rule-based routing only
+ROUTING_QUALITY_TARGET = float(os.environ.get("ROUTING_QUALITY_TARGET", "0.6"))  # min acceptance rate
+ROUTING_MAX_EDIT_PCT = float(os.environ.get("ROUTING_MAX_EDIT_PCT", "40"))  # max mean post-accept edit %
+ROUTING_POLICY_MIN_FEEDBACK = int(os.environ.get("ROUTING_POLICY_MIN_FEEDBACK", "30"))
+
+# --- Hedged Sonnet calls per billing tier: "pro:haiku,payg:duplicate" ---
+# haiku = hedge with a Haiku request, duplicate = hedge with a second Sonnet request
+HEDGE_POLICY: dict[str, str] = {
+    tier.strip(): mode.strip()
+    for tier, _, mode in (
+        item.partition(":") for item in os.environ.get("HEDGE_POLICY", "").split(",") if ":" in item
+    )
+    if mode.strip() in ("haiku", "duplicate")
+}
+
+# --- Rewrite cache ---
+REWRITE_CACHE_ENABLED = _bool(os.environ.get("REWRITE_CACHE_ENABLED", "true"))
+REWRITE_CACHE_BACKEND = os.environ.get("REWRITE_CACHE_BACKEND", "")  # "" | sqlite | redis
+REWRITE_CACHE_URL = os.environ.get("REWRITE_CACHE_URL", "")  # sqlite path or redis:// URL
+REWRITE_CACHE_TTL_S = float(os.environ.get("REWRITE_CACHE_TTL_S", "86400"))
+REWRITE_CACHE_MAX_ENTRIES = int(os.environ.get("REWRITE_CACHE_MAX_ENTRIES", "1000"))
+
+# --- Near-duplicate (SimHash) index ---
+NEAR_DUP_ENABLED = _bool(os.environ.get("NEAR_DUP_ENABLED", "true"))
+NEAR_DUP_MAX_ENTRIES = int(os.environ.get("NEAR_DUP_MAX_ENTRIES", "5000"))
+NEAR_DUP_MAX_DISTANCE = int(os.environ.get("NEAR_DUP_MAX_DISTANCE", "6"))  # Hamming bits (≤7 for 8-band LSH)
+# Pass a non-reusable near match to the model as a reference draft
+NEAR_DUP_HINTS = _bool(os.environ.get("NEAR_DUP_HINTS", "false"))
+
+# --- Background semantic quality scoring (sampled, spooled, scored by Haiku off the response path) ---
+SEMANTIC_SCORING = _bool(os.environ.get("SEMANTIC_SCORING", "false"))
+SEMANTIC_SAMPLE_RATE = float(os.environ.get("SEMANTIC_SAMPLE_RATE", "0.05"))
+# Per intent / tier / "intent/tier" overrides: "haiku:0.1,formal_request/sonnet:0.25"
+SEMANTIC_SAMPLE_RATES: dict[str, float] = {
+    key.strip(): float(rate)
+    for key, _, rate in (
+        item.rpartition(":") for item in os.environ.get("SEMANTIC_SAMPLE_RATES", "").split(",") if ":" in item
+    )
+}
+# Per-process local file (writable /tmp on Lambda); drained by this process's workers
+SEMANTIC_SPOOL_PATH = os.environ.get(
+    "SEMANTIC_SPOOL_PATH", os.path.join(tempfile.gettempdir(), "loma_semantic_spool.sqlite3")
+)
+SEMANTIC_QUEUE_MAX = int(os.environ.get("SEMANTIC_QUEUE_MAX", "10000"))  # pending rows before samples drop
+SEMANTIC_WORKERS = int(os.environ.get("SEMANTIC_WORKERS", "1"))  # 0 = drain with run_semantic_worker.py on the same host
+SEMANTIC_BATCH_SIZE = int(os.environ.get("SEMANTIC_BATCH_SIZE", "8"))
+
+# --- Tone variants: the other tones generated alongside a rewrite for instant tone switches ---
+TONE_VARIANTS = _bool(os.environ.get("TONE_VARIANTS", "false"))  # requests can also opt in per call
+# How long the rewrite response waits for its variants (0 = never; set on Lambda, which freezes after returning)
+TONE_VARIANTS_WAIT_S = float(os.environ.get("TONE_VARIANTS_WAIT_S", "0"))
+TONE_VARIANTS_TTL_S = float(os.environ.get("TONE_VARIANTS_TTL_S", "3600"))
+TONE_VARIANTS_MAX_ENTRIES = int(os.environ.get("TONE_VARIANTS_MAX_ENTRIES", "5000"))
+
+# --- Optimistic quota: signed-in users' quota read overlaps the pipeline's CPU stages ---
+OPTIMISTIC_QUOTA = _bool(os.environ.get("OPTIMISTIC_QUOTA", "true"))
+# A paid user's allowed check this recent lets the model call start before the quota read returns (0 = never)
+QUOTA_SPECULATION_TTL_S = float(os.environ.get("QUOTA_SPECULATION_TTL_S", "300"))
+
+# --- Input size and long-document mode (chunks rewritten concurrently, loma/chunking.py) ---
+MAX_INPUT_CHARS = int(os.environ.get("MAX_INPUT_CHARS", "5000"))
+LONG_INPUT_CHUNKING = _bool(os.environ.get("LONG_INPUT_CHUNKING", "false"))
+LONG_INPUT_MAX_CHARS = int(os.environ.get("LONG_INPUT_MAX_CHARS", "20000"))  # input limit with chunking on
+CHUNK_THRESHOLD_CHARS = int(os.environ.get("CHUNK_THRESHOLD_CHARS", "1500"))  # longer inputs are chunked
+CHUNK_TARGET_CHARS = int(os.environ.get("CHUNK_TARGET_CHARS", "800"))
+CHUNK_CONCURRENCY = int(os.environ.get("CHUNK_CONCURRENCY", "6"))  # chunks in flight per rewrite
+
+# --- Batch rewrite endpoint (/api/v1/rewrite/batch) ---
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "20"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))  # items in flight per batch request
+
+# --- Per-stage timings (always logged as rewrite_timings; RESPONSE_TIMINGS also returns them) ---
+RESPONSE_TIMINGS = _bool(os.environ.get("RESPONSE_TIMINGS", "false"))
+
+# --- Ops stats (/api/v1/stats/usage needs this key in X-Admin-Key; unset = endpoint disabled) ---
+STATS_ADMIN_KEY = os.environ.get("STATS_ADMIN_KEY", "")
+
 # --- Logging ---
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO" if ENV == "production" else "DEBUG")
 
@@ -5,10 +5,21 @@ Includes: auth, billing quota check, analytics, error handling.
 """
 from __future__ import annotations
 
+import hmac
 import json
 import logging
-
-from loma import analytics, auth, billing, db, payment
+import re
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from loma import (
+    analytics, auth, billing, db, deadlines, llm, payment, rewrite_cache, route_policy, router, semantic_scoring, timing,
+    tone_variants, usage,
+)
 from loma.intent import INTENT_PATTERNS
 from loma.pipeline import run_rewrite
 
@@ -28,12 +39,37 @@ _VALID_PLATFORMS = frozenset({
     "linkedin", "jira", "notion", "chatgpt", "claude", "generic",
 })
 _VALID_INTENTS = frozenset(INTENT_PATTERNS.keys())
+# Per-item rewrite fields of a batch request (top-level values are the defaults)
+_ITEM_FIELDS = (
+    "input_text", "platform", "tone", "language_mix", "intent",
+    "output_language", "output_language_source", "regenerate",
+)
+
+# HTTP status for error responses returned by run_rewrite (others are 500)
+_PIPELINE_ERROR_STATUS = {"text_too_short": 400, "text_too_long": 400, "deadline_exceeded": 503}
+
+# /api/v1/rewrite/{rewrite_id}/tone/{tone}
+_TONE_SWITCH_PATH = re.compile(r"/rewrite/([0-9A-Za-z-]{1,64})/tone/([a-z_]+)/?$")
 
 # Anonymous rate limiting (per-IP, in-memory for Lambda)
 _anon_ip_counts: dict[str, list] = {}  # ip -> [count, reset_timestamp]
 _ANON_RATE_LIMIT = 20  # requests per window
 _ANON_RATE_WINDOW_S = 3600  # 1 hour
 
+# Quota checks run alongside the pipeline's CPU stages (OPTIMISTIC_QUOTA)
+_quota_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="loma-quota")
+# user_id -> (expires_at, quota) of the last allowed check, for speculative model calls
+# (LRU: the least recently checked users are dropped past _KNOWN_QUOTA_MAX)
+_KNOWN_QUOTA_MAX = 10_000
+_known_quota: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_known_quota_lock = threading.Lock()
+_overlap_lock = threading.Lock()
+_overlap_counts = {"checks": 0, "speculative": 0, "denied": 0, "denied_after_llm": 0}
+_overlap_saved_ms: deque[float] = deque(maxlen=2048)
+
+# Load the learned routing policy during cold start rather than on the first rewrite
+route_policy.preload()
+
 
 def handler(event: dict, context: object) -> dict:
     """Route API requests."""
@@ -55,6 +91,10 @@ def handler(event: dict, context: object) -> dict:
     if path.endswith("/stats/acceptance"):
         return _handle_acceptance_rates(event)
 
+    # Token usage / cost aggregates (this process)
+    if path.endswith("/stats/usage"):
+        return _handle_usage_stats(event)
+
     # PayOS payment webhook
     if path.endswith("/webhook/payos"):
         return _handle_payos_webhook(event)
@@ -63,12 +103,141 @@ def handler(event: dict, context: object) -> dict:
     if path.endswith("/payment/create"):
         return _handle_create_payment(event)
 
+    # Tone switch served from a rewrite's stored tone variants
+    tone_switch = _TONE_SWITCH_PATH.search(path)
+    if tone_switch:
+        return _handle_tone_switch(event, tone_switch.group(1), tone_switch.group(2))
+
+    # Batch rewrite (several paragraphs / fields in one request)
+    if path.endswith("/rewrite/batch"):
+        return _handle_rewrite_batch(event, context)
+
     # Rewrite endpoint (default)
-    return _handle_rewrite(event)
+    return _handle_rewrite(event, context)
+
+
+def _request_deadlines(context: object) -> tuple[float, float]:
+    """
+    (request deadline, pipeline deadline) as time.monotonic() values: the Lambda's
+    remaining time (or the configured budget locally), and that minus the reserve
+    for the post-rewrite writes. The quota read and the pipeline run against the
+    pipeline deadline, the writes against the request deadline.
+    """
+    request_deadline = deadlines.from_context(context, config.REQUEST_BUDGET_S)
+    return request_deadline, request_deadline - config.POST_PIPELINE_RESERVE_S
+
+
+class _QuotaCheck:
+    """
+    billing.check_quota for one request, run on a worker thread while the
+    pipeline does its CPU stages (language, intent, routing, rules, cache).
+    gate() is the pipeline's go-ahead for the first model call: it waits for
+    the check, or returns True at once when the user's last allowed check
+    (within QUOTA_SPECULATION_TTL_S) was pro or PAYG with credits to spare.
+    result() is the check itself, which still decides what the client gets.
+    The pipeline calls gate() again before every later model call, so a
+    speculative rewrite stops at the next call once the check denies it.
+    """
+
+    def __init__(self, user_id: str | None, deadline: float | None):
+        self.started = timing.now()
+        self.elapsed_s: float | None = None
+        self.waited_s = 0.0
+        self.known = _known_good_quota(user_id)
+        self.speculative = False
+        if user_id and config.OPTIMISTIC_QUOTA:
+            self._future = _quota_executor.submit(self._check, user_id, deadline)
+            _quota_executor.submit(llm.warm_up)
+        else:
+            self._future = None
+            self._quota = self._check(user_id, deadline)
+
+    def _check(self, user_id: str | None, deadline: float | None) -> dict:
+        quota = billing.check_quota(user_id, deadline=deadline)
+        self.elapsed_s = timing.now() - self.started
+        if user_id:
+            _remember_quota(user_id, quota)
+        return quota
+
+    @property
+    def overlapped(self) -> bool:
+        return self._future is not None
+
+    def tier(self) -> str | None:
+        """Billing tier for the hedge policy: the check's when done, else the last known one."""
+        if self._future is None or self._future.done():
+            return self.result()["tier"]
+        return self.known["tier"] if self.known else None
+
+    def gate(self) -> bool:
+        if self.known is not None and (self._future is None or not self._future.done()):
+            self.speculative = True
+            return True
+        return self.result()["allowed"]
+
+    def result(self) -> dict:
+        if self._future is None:
+            return self._quota
+        t = timing.now()
+        quota = self._future.result()
+        self.waited_s += timing.now() - t
+        return quota
+
+
+def _known_good_quota(user_id: str | None) -> dict | None:
+    """The user's last allowed quota when recent enough and paid, with credits to spare."""
+    if not user_id or config.QUOTA_SPECULATION_TTL_S <= 0:
+        return None
+    with _known_quota_lock:
+        entry = _known_quota.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    quota = entry[1]
+    if quota["tier"] == "pro" or (quota["tier"] == "payg" and (quota.get("remaining") or 0) > 1):
+        return quota
+    return None
+
+
+def _remember_quota(user_id: str, quota: dict) -> None:
+    with _known_quota_lock:
+        if not quota.get("allowed"):
+            _known_quota.pop(user_id, None)
+            return
+        _known_quota[user_id] = (time.monotonic() + config.QUOTA_SPECULATION_TTL_S, quota)
+        _known_quota.move_to_end(user_id)
+        while len(_known_quota) > _KNOWN_QUOTA_MAX:
+            _known_quota.popitem(last=False)
+
+
+def _record_overlap(check: _QuotaCheck, allowed: bool, llm_started: bool) -> None:
+    """Count an overlapped quota check; saved time = its round-trip minus the time the request blocked on it."""
+    if not check.overlapped or check.elapsed_s is None:
+        return
+    with _overlap_lock:
+        _overlap_counts["checks"] += 1
+        _overlap_counts["speculative"] += check.speculative
+        if not allowed:
+            _overlap_counts["denied"] += 1
+            _overlap_counts["denied_after_llm"] += llm_started
+        _overlap_saved_ms.append(max(0.0, check.elapsed_s - check.waited_s) * 1000)
+
+
+def _overlap_stats() -> dict:
+    """Overlapped quota checks: counts and the latency they took off the request path."""
+    with _overlap_lock:
+        saved = list(_overlap_saved_ms)
+        counts = dict(_overlap_counts)
+    return {
+        **counts,
+        "saved_ms_p50": round(statistics.median(saved), 2) if saved else None,
+        "saved_ms_mean": round(statistics.fmean(saved), 2) if saved else None,
+    }
 
 
-def _handle_rewrite(event: dict) -> dict:
+def _handle_rewrite(event: dict, context: object = None) -> dict:
     """Handle POST /api/v1/rewrite."""
+    request_deadline, deadline = _request_deadlines(context)
+    timings = timing.Timings()
     # Parse body
     try:
         body = event.get("body") or "{}"
@@ -83,25 +252,17 @@ def _handle_rewrite(event: dict) -> dict:
 
     # Auth (optional — anonymous users get limited free tier)
     headers = event.get("headers") or {}
+    t = timing.now()
     token = auth.get_bearer_token(headers)
     user_id = auth.extract_user_id(token)
+    t = timings.add(timing.AUTH, t)
 
-    # Quota check
-    quota = billing.check_quota(user_id)
-    if not quota["allowed"]:
-        analytics.track(analytics.EVENT_QUOTA_HIT, user_id=user_id, properties={"reason": quota["reason"]})
-        msg = "Free limit reached. Add credit to continue."
-        msg_vi = "Bạn đã dùng hết lượt miễn phí. Nạp tiền để tiếp tục."
-        if quota["reason"] == "payg_exhausted":
-            msg = "PAYG credits exhausted. Purchase more credits."
-            msg_vi = "Đã hết lượt PAYG. Mua thêm để tiếp tục."
-        return _json_response(429, {
-            "error": quota["reason"],
-            "message": msg,
-            "message_vi": msg_vi,
-            "tier": quota["tier"],
-            "remaining": quota["remaining"],
-        })
+    # Quota check: for signed-in users it runs alongside the pipeline, which waits
+    # for it only before the model call (see _QuotaCheck)
+    quota_check = _QuotaCheck(user_id, deadline)
+    timings.add(timing.QUOTA, t)
+    if not quota_check.overlapped and not quota_check.result()["allowed"]:
+        return _quota_exceeded(user_id, quota_check.result())
 
     # Anonymous rate limiting (per-IP)
     if not user_id:
@@ -121,26 +282,15 @@ def _handle_rewrite(event: dict) -> dict:
     intent_override = body.get("intent")
     output_language = body.get("output_language")
     output_language_source = body.get("output_language_source")
+    regenerate = bool(body.get("regenerate"))
+    # Variants are read back by their owner only, so anonymous rewrites get none
+    variants = bool(user_id) and (config.TONE_VARIANTS or bool(body.get("tone_variants")))
+    return_timings = config.RESPONSE_TIMINGS or bool(body.get("timings"))
 
     # Input validation
-    if tone not in _VALID_TONES:
-        return _json_response(400, {
-            "error": "invalid_tone",
-            "message": f"Invalid tone: {tone}. Must be one of: {', '.join(sorted(_VALID_TONES))}.",
-            "message_vi": f"Tone không hợp lệ: {tone}.",
-        })
-    if platform and platform not in _VALID_PLATFORMS:
-        return _json_response(400, {
-            "error": "invalid_platform",
-            "message": f"Invalid platform: {platform}.",
-            "message_vi": f"Platform không hợp lệ: {platform}.",
-        })
-    if intent_override and intent_override not in _VALID_INTENTS:
-        return _json_response(400, {
-            "error": "invalid_intent",
-            "message": f"Invalid intent: {intent_override}.",
-            "message_vi": f"Intent không hợp lệ: {intent_override}.",
-        })
+    invalid = _validate_params(tone, platform, intent_override)
+    if invalid:
+        return _json_response(400, invalid)
 
     # Run pipeline
     try:
@@ -152,8 +302,19 @@ def _handle_rewrite(event: dict) -> dict:
             intent_override=intent_override,
             output_language_in=output_language,
             output_language_source_in=output_language_source,
+            deadline=deadline,
+            regenerate=regenerate,
+            hedge=config.HEDGE_POLICY.get(quota_check.tier()),
+            timings=timings,
+            return_timings=return_timings,
+            tone_variants=variants,
+            variants_owner=user_id,
+            gate=quota_check.gate,
         )
     except Exception as e:
+        quota = quota_check.result()
+        if not quota["allowed"]:
+            return _quota_exceeded(user_id, quota)
         logger.exception("Pipeline error: %s", e)
         analytics.track(analytics.EVENT_ERROR, user_id=user_id, properties={"error": str(e)})
         return _json_response(500, {
@@ -162,22 +323,281 @@ def _handle_rewrite(event: dict) -> dict:
             "message_vi": "Có lỗi xảy ra. Vui lòng thử lại.",
         })
 
+    # The quota decides whether the result is served (a denied request's model call,
+    # if it was started speculatively, is discarded uncharged)
+    quota = quota_check.result()
+    timings.add(timing.QUOTA, timing.now() - quota_check.waited_s)
+    _record_overlap(quota_check, quota["allowed"], bool(result.get("usage")))
+    if not quota["allowed"]:
+        return _quota_exceeded(user_id, quota)
+
     if "error" in result:
-        status = 400 if result["error"] in ("text_too_short", "text_too_long") else 500
-        return _json_response(status, result)
+        return _json_response(_PIPELINE_ERROR_STATUS.get(result["error"], 500), result)
 
-    # Success — increment usage, store rewrite, track analytics
+    # Success — debit usage (always), then store the rewrite and track analytics within
+    # what's left of the request
+    t = timing.now()
     if user_id:
         db.increment_rewrite_count(user_id)
     result["payg_balance_remaining"] = quota.get("remaining")
     result["tier"] = quota.get("tier")
 
-    db.store_rewrite(user_id, result)
-    analytics.track_rewrite(user_id, result)
+    db.store_rewrite(user_id, result, deadline=request_deadline)
+    t = timings.add(timing.DB_STORE, t)
+    analytics.track_rewrite(user_id, result, deadline=request_deadline)
+    # Sampled for background meaning / tone scoring; never waits on the scorer
+    semantic_scoring.submit(result)
+    timings.add(timing.ANALYTICS, t)
+    stages = timing.emit(timings, result)
+    if return_timings:
+        result["timings"] = stages
+    # A tone switch the stored variants couldn't serve (client fell back to a full rewrite)
+    if body.get("tone_switch"):
+        tone_variants.record_switch("rewrite", stages["total"])
 
     return _json_response(200, result)
 
 
+def _handle_rewrite_batch(event: dict, context: object = None) -> dict:
+    """
+    Handle POST /api/v1/rewrite/batch — {"items": [{input_text, platform?, tone?, ...}]},
+    top-level fields as defaults for every item. Auth and quota are checked once;
+    items are validated, then the valid ones within the remaining quota have their
+    credits reserved in one update before they run concurrently (BATCH_CONCURRENCY),
+    and credits for items that fail are refunded. Rewrites / events are
+    bulk-inserted. Results come back in item order: a rewrite response or an
+    {"error", "message", "message_vi"} entry per item. Valid items past the
+    remaining quota get the quota error.
+    """
+    request_deadline, deadline = _request_deadlines(context)
+    try:
+        body = event.get("body") or "{}"
+        if isinstance(body, str):
+            body = json.loads(body)
+    except json.JSONDecodeError:
+        return _json_response(400, {
+            "error": "invalid_json",
+            "message": "Invalid JSON body.",
+            "message_vi": "Dữ liệu gửi lên không đúng định dạng.",
+        })
+
+    items = body.get("items")
+    if not isinstance(items, list) or not items or not all(isinstance(i, dict) for i in items):
+        return _json_response(400, {
+            "error": "invalid_items",
+            "message": "items must be a non-empty array of rewrite requests.",
+            "message_vi": "items phải là danh sách yêu cầu viết lại.",
+        })
+    if len(items) > config.BATCH_MAX_ITEMS:
+        return _json_response(400, {
+            "error": "batch_too_large",
+            "message": f"At most {config.BATCH_MAX_ITEMS} items per batch.",
+            "message_vi": f"Tối đa {config.BATCH_MAX_ITEMS} mục mỗi lần.",
+        })
+
+    headers = event.get("headers") or {}
+    token = auth.get_bearer_token(headers)
+    user_id = auth.extract_user_id(token)
+
+    quota = billing.check_quota(user_id, deadline=deadline)
+    if not quota["allowed"]:
+        return _quota_exceeded(user_id, quota)
+
+    if not user_id:
+        client_ip = _extract_client_ip(event)
+        if client_ip and not _check_anon_rate_limit(client_ip, len(items)):
+            return _json_response(429, {
+                "error": "rate_limited",
+                "message": "Too many requests. Please try again later.",
+                "message_vi": "Quá nhiều yêu cầu. Vui lòng thử lại sau.",
+            })
+
+    defaults = {k: body.get(k) for k in _ITEM_FIELDS}
+    requests = [{**defaults, **{k: v for k, v in item.items() if v is not None}} for item in items]
+    # Validate first: an invalid item neither runs nor uses up quota
+    results: list[dict | None] = [
+        _validate_params(p.get("tone") or "professional", p.get("platform"), p.get("intent")) for p in requests
+    ]
+    valid = [i for i, invalid in enumerate(results) if invalid is None]
+    allowed = len(valid) if quota["remaining"] is None else min(len(valid), quota["remaining"])
+    to_run, over_quota = valid[:allowed], valid[allowed:]
+    hedge = config.HEDGE_POLICY.get(quota["tier"])
+
+    # Reserve the credits before any model call; a debit that can't be covered
+    # (balance spent since the quota read) serves nothing
+    if user_id and to_run and not db.increment_rewrite_count(user_id, len(to_run)):
+        return _quota_exceeded(user_id, {
+            "allowed": False, "tier": quota["tier"], "remaining": 0,
+            "reason": "payg_exhausted" if quota["tier"] == "payg" else "free_limit_reached",
+        })
+
+    def _one(params: dict) -> dict:
+        try:
+            return run_rewrite(
+                input_text=params.get("input_text") or "",
+                platform=params.get("platform"),
+                tone=params.get("tone") or "professional",
+                language_mix_in=params.get("language_mix"),
+                intent_override=params.get("intent"),
+                output_language_in=params.get("output_language"),
+                output_language_source_in=params.get("output_language_source"),
+                deadline=deadline,
+                regenerate=bool(params.get("regenerate")),
+                hedge=hedge,
+            )
+        except Exception as e:
+            logger.exception("Pipeline error in batch item: %s", e)
+            return {
+                "error": "pipeline_error",
+                "message": "Something went wrong. Please try again.",
+                "message_vi": "Có lỗi xảy ra. Vui lòng thử lại.",
+            }
+
+    workers = max(1, min(config.BATCH_CONCURRENCY, len(to_run)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loma-batch") as pool:
+        for i, result in zip(to_run, pool.map(_one, [requests[i] for i in to_run])):
+            results[i] = result
+    for i in over_quota:
+        results[i] = {
+            "error": "payg_exhausted" if quota["tier"] == "payg" else "free_limit_reached",
+            "message": "Not enough rewrites left for this item.",
+            "message_vi": "Không đủ lượt viết lại cho mục này.",
+        }
+
+    succeeded = [r for r in results if "error" not in r]
+    pipeline_errors = sum(r.get("error") == "pipeline_error" for r in results)
+    if user_id and len(succeeded) < len(to_run):
+        db.refund_rewrite_count(user_id, len(to_run) - len(succeeded))
+    remaining = None if quota["remaining"] is None else quota["remaining"] - len(succeeded)
+    for r in succeeded:
+        r["payg_balance_remaining"] = remaining
+        r["tier"] = quota.get("tier")
+    if succeeded:
+        db.store_rewrites(user_id, succeeded, deadline=request_deadline)
+        analytics.track_rewrites(user_id, succeeded, deadline=request_deadline)
+        for r in succeeded:
+            semantic_scoring.submit(r)
+    if pipeline_errors:
+        analytics.track(
+            analytics.EVENT_ERROR, user_id=user_id,
+            properties={"error": "batch_pipeline_error", "items": pipeline_errors},
+        )
+
+    return _json_response(200, {
+        "ok": True,
+        "results": results,
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "tier": quota.get("tier"),
+        "remaining": remaining,
+    })
+
+
+def _quota_exceeded(user_id: str | None, quota: dict) -> dict:
+    """
+    429 for a request the user's quota doesn't allow (tracked as a quota hit);
+    503 when the quota couldn't be read within the request deadline.
+    """
+    if quota["reason"] == billing.QUOTA_UNAVAILABLE:
+        return _json_response(503, {
+            "error": "quota_unavailable",
+            "message": "Couldn't check your usage in time. Please try again.",
+            "message_vi": "Không kiểm tra được lượt sử dụng kịp thời. Vui lòng thử lại.",
+        })
+    analytics.track(analytics.EVENT_QUOTA_HIT, user_id=user_id, properties={"reason": quota["reason"]})
+    msg = "Free limit reached. Add credit to continue."
+    msg_vi = "Bạn đã dùng hết lượt miễn phí. Nạp tiền để tiếp tục."
+    if quota["reason"] == "payg_exhausted":
+        msg = "PAYG credits exhausted. Purchase more credits."
+        msg_vi = "Đã hết lượt PAYG. Mua thêm để tiếp tục."
+    return _json_response(429, {
+        "error": quota["reason"],
+        "message": msg,
+        "message_vi": msg_vi,
+        "tier": quota["tier"],
+        "remaining": quota["remaining"],
+    })
+
+
+def _handle_tone_switch(event: dict, rewrite_id: str, tone: str) -> dict:
+    """
+    Handle GET /api/v1/rewrite/{id}/tone/{tone} — a stored tone variant of the
+    caller's own earlier rewrite. No quota debit. Best-effort: variants are kept
+    in the serving process (and the shared cache tier when one is configured),
+    so a 404 is routine; its `regenerate` field is the /rewrite call to make
+    instead (with the original input_text).
+    """
+    started = time.monotonic()
+    headers = event.get("headers") or {}
+    user_id = auth.extract_user_id(auth.get_bearer_token(headers))
+    if not user_id:
+        return _json_response(401, {
+            "error": "auth_required",
+            "message": "Sign in to switch tones.",
+            "message_vi": "Đăng nhập để đổi tone.",
+        })
+    if tone not in _VALID_TONES:
+        return _json_response(400, {
+            "error": "invalid_tone",
+            "message": f"Invalid tone: {tone}. Must be one of: {', '.join(sorted(_VALID_TONES))}.",
+            "message_vi": f"Tone không hợp lệ: {tone}.",
+        })
+    variant = tone_variants.lookup(rewrite_id, tone, user_id)
+    if variant is None:
+        return _json_response(404, {
+            "error": "variant_not_found",
+            "message": "No stored variant for this tone. Request a new rewrite.",
+            "message_vi": "Chưa có bản viết lại cho tone này.",
+            "regenerate": {
+                "method": "POST",
+                "path": "/api/v1/rewrite",
+                "body": {"tone": tone, "tone_switch": True},
+            },
+        })
+    response_time_ms = round((time.monotonic() - started) * 1000, 1)
+    tone_variants.record_switch("variant", response_time_ms)
+
+    analytics.track(analytics.EVENT_TONE_CHANGE, user_id=user_id, properties={
+        "rewrite_id": rewrite_id, "tone": tone, "served": "variant", "response_time_ms": response_time_ms,
+    })
+    return _json_response(200, {
+        "rewrite_id": rewrite_id,
+        "tone": tone,
+        "output_text": variant["output_text"],
+        "original_text": variant["original_text"],
+        "detected_intent": variant["detected_intent"],
+        "routing_tier": variant["routing_tier"],
+        "output_language": variant["output_language"],
+        "scores": variant["scores"],
+        "cache_hit": True,
+        "cache_match": "tone_variant",
+        "response_time_ms": response_time_ms,
+    })
+
+
+def _validate_params(tone: str, platform: str | None, intent_override: str | None) -> dict | None:
+    """Error body for an invalid tone / platform / intent; None when all are valid."""
+    if tone not in _VALID_TONES:
+        return {
+            "error": "invalid_tone",
+            "message": f"Invalid tone: {tone}. Must be one of: {', '.join(sorted(_VALID_TONES))}.",
+            "message_vi": f"Tone không hợp lệ: {tone}.",
+        }
+    if platform and platform not in _VALID_PLATFORMS:
+        return {
+            "error": "invalid_platform",
+            "message": f"Invalid platform: {platform}.",
+            "message_vi": f"Platform không hợp lệ: {platform}.",
+        }
+    if intent_override and intent_override not in _VALID_INTENTS:
+        return {
+            "error": "invalid_intent",
+            "message": f"Invalid intent: {intent_override}.",
+            "message_vi": f"Intent không hợp lệ: {intent_override}.",
+        }
+    return None
+
+
 def _handle_event(event: dict) -> dict:
     """Handle POST /api/v1/events — client-side analytics."""
     try:
@@ -233,6 +653,41 @@ def _handle_acceptance_rates(event: dict) -> dict:
     return _json_response(200, {"ok": True, **rates})
 
 
+def _is_admin(headers: dict) -> bool:
+    """X-Admin-Key matches STATS_ADMIN_KEY (always False while the key is unset)."""
+    key = headers.get("x-admin-key") or headers.get("X-Admin-Key") or ""
+    return bool(config.STATS_ADMIN_KEY) and hmac.compare_digest(key.encode(), config.STATS_ADMIN_KEY.encode())
+
+
+def _handle_usage_stats(event: dict) -> dict:
+    """
+    Handle GET /api/v1/stats/usage — rolling token / cost / latency aggregates.
+    Operator-only (cost, routing and cache internals): needs X-Admin-Key.
+    """
+    if not _is_admin(event.get("headers") or {}):
+        return _json_response(401, {"error": "admin_key_required"})
+    params = event.get("queryStringParameters") or {}
+    try:
+        window_s = float(params["window_s"]) if params.get("window_s") else None
+    except ValueError:
+        return _json_response(400, {"error": "invalid_window"})
+    return _json_response(200, {
+        "ok": True,
+        **usage.stats(window_s),
+        "models": llm.usage_totals(),
+        "concurrency": llm.limiter_states(),
+        "deadline_calls": deadlines.stats(),
+        "cascade": router.cascade_stats(),
+        "quota_overlap": _overlap_stats(),
+        "routing_policy": route_policy.info(),
+        "hedging": llm.hedge_stats(),
+        "rewrite_cache": rewrite_cache.stats(),
+        "semantic_scoring": semantic_scoring.stats(),
+        "stage_timings": timing.stats(),
+        "tone_variants": tone_variants.stats(),
+    })
+
+
 def _handle_payos_webhook(event: dict) -> dict:
     """Handle POST /api/v1/webhook/payos — PayOS payment confirmation."""
     try:
@@ -306,17 +761,18 @@ def _extract_client_ip(event: dict) -> str | None:
     return http_info.get("sourceIp") or rc.get("identity", {}).get("sourceIp")
 
 
-def _check_anon_rate_limit(ip: str) -> bool:
-    """Returns True if request is allowed, False if rate limited."""
-    import time
+def _check_anon_rate_limit(ip: str, cost: int = 1) -> bool:
+    """Returns True if request is allowed, False if rate limited. cost: rewrites in the request."""
     now = time.time()
     entry = _anon_ip_counts.get(ip)
     if entry is None or now > entry[1]:
-        _anon_ip_counts[ip] = [1, now + _ANON_RATE_WINDOW_S]
+        if cost > _ANON_RATE_LIMIT:
+            return False
+        _anon_ip_counts[ip] = [cost, now + _ANON_RATE_WINDOW_S]
         return True
-    if entry[0] >= _ANON_RATE_LIMIT:
+    if entry[0] + cost > _ANON_RATE_LIMIT:
         return False
-    entry[0] += 1
+    entry[0] += cost
     return True
 
 
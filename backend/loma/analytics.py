@@ -33,31 +33,45 @@ def track(
     event_name: str,
     user_id: str | None = None,
     properties: dict[str, Any] | None = None,
+    deadline: float | None = None,
 ) -> None:
     """
-    Record an analytics event. Non-blocking — failures are logged, not raised.
+    Record an analytics event. Non-blocking — failures are logged, not raised;
+    past the request's deadline the write is not waited for.
     """
     try:
-        db.log_event(user_id=user_id, event_name=event_name, event_data=properties)
+        db.log_event(user_id=user_id, event_name=event_name, event_data=properties, deadline=deadline)
     except Exception as e:
         logger.error("analytics.track failed for %s: %s", event_name, e)
 
 
-def track_rewrite(user_id: str | None, rewrite_result: dict) -> None:
+def _rewrite_properties(rewrite_result: dict) -> dict[str, Any]:
+    return {
+        "rewrite_id": rewrite_result.get("rewrite_id"),
+        "detected_intent": rewrite_result.get("detected_intent"),
+        "routing_tier": rewrite_result.get("routing_tier"),
+        "fallback": rewrite_result.get("fallback"),
+        "cache_hit": rewrite_result.get("cache_hit"),
+        "output_language": rewrite_result.get("output_language"),
+        "response_time_ms": rewrite_result.get("response_time_ms"),
+        "language_mix": rewrite_result.get("language_mix"),
+        "scores": rewrite_result.get("scores"),
+        "usage": rewrite_result.get("usage"),
+        "cascade": rewrite_result.get("cascade"),
+    }
+
+
+def track_rewrite(user_id: str | None, rewrite_result: dict, deadline: float | None = None) -> None:
     """Convenience: track a completed rewrite with standard properties."""
-    track(
-        EVENT_REWRITE,
-        user_id=user_id,
-        properties={
-            "rewrite_id": rewrite_result.get("rewrite_id"),
-            "detected_intent": rewrite_result.get("detected_intent"),
-            "routing_tier": rewrite_result.get("routing_tier"),
-            "output_language": rewrite_result.get("output_language"),
-            "response_time_ms": rewrite_result.get("response_time_ms"),
-            "language_mix": rewrite_result.get("language_mix"),
-            "scores": rewrite_result.get("scores"),
-        },
-    )
+    track(EVENT_REWRITE, user_id=user_id, properties=_rewrite_properties(rewrite_result), deadline=deadline)
+
+
+def track_rewrites(user_id: str | None, rewrite_results: list[dict], deadline: float | None = None) -> None:
+    """track_rewrite for a batch — one bulk events insert. Non-blocking like track()."""
+    try:
+        db.log_events(user_id, [(EVENT_REWRITE, _rewrite_properties(r)) for r in rewrite_results], deadline=deadline)
+    except Exception as e:
+        logger.error("analytics.track_rewrites failed (%d events): %s", len(rewrite_results), e)
 
 
 def track_user_edit(
@@ -0,0 +1,198 @@
+"""
+Quality regression benchmark — run the rewrite API over the benchmark
+scenarios, summarize quality and latency, and diff a run against a baseline.
+
+run_scenarios() calls a rewrite function (the handler in run_benchmark.py)
+for every scenario on a thread pool and keeps one compact row per scenario.
+summarize() aggregates rows overall and per expected intent: intent accuracy,
+mean entity preservation and length reduction, routing tier mix, error rate
+and latency percentiles. A run artifact (build_run) is the summary plus the
+rows; diff() compares two artifacts metric by metric against THRESHOLDS and
+fails the run when an overall metric regresses by more than its tolerance
+(per-intent regressions are reported, and gated only on request).
+"""
+from __future__ import annotations
+
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+RUN_VERSION = 1
+
+# metric → (better direction, tolerance kind, tolerance): "abs" is in the metric's
+# units, "rel" a fraction of the baseline value
+THRESHOLDS: dict[str, tuple[str, str, float]] = {
+    "intent_accuracy": ("higher", "abs", 0.02),
+    "entity_preserved_pct": ("higher", "abs", 1.0),
+    "length_reduction_pct": ("higher", "abs", 5.0),
+    "error_rate": ("lower", "abs", 0.0),
+    "sonnet_share": ("lower", "abs", 0.1),
+    "p50_ms": ("lower", "rel", 0.25),
+    "p95_ms": ("lower", "rel", 0.25),
+}
+# Latency tolerance never drops below this (fast runs jitter by more than 25%)
+MIN_LATENCY_SLACK_MS = 50
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(pct / 100 * len(ordered))) - 1)]
+
+
+def scenario_row(scenario: dict, body: dict | None, error: str | None = None) -> dict:
+    """Compact per-scenario result from a rewrite response body (or the error it failed with)."""
+    body = body or {}
+    scores = body.get("scores") or {}
+    return {
+        "id": scenario.get("id"),
+        "intent": scenario.get("intent"),
+        "platform": scenario.get("platform"),
+        "error": error,
+        "detected_intent": body.get("detected_intent"),
+        "routing_tier": body.get("routing_tier"),
+        "cache_hit": bool(body.get("cache_hit")),
+        "response_time_ms": body.get("response_time_ms"),
+        "length_reduction_pct": scores.get("length_reduction_pct"),
+        "entity_preserved_pct": scores.get("entity_preserved_pct"),
+        "entity_missing": scores.get("entity_missing") or [],
+        "output_text": body.get("output_text"),
+    }
+
+
+def run_scenarios(
+    scenarios: list[dict],
+    rewrite: Callable[[dict], dict],
+    concurrency: int = 4,
+    on_row: Callable[[dict], None] | None = None,
+) -> list[dict]:
+    """
+    rewrite(scenario) returns a response body; an "error" key or an exception
+    marks the scenario as failed. Rows come back in scenario order.
+    """
+    def _one(scenario: dict) -> dict:
+        try:
+            body = rewrite(scenario)
+        except Exception as e:
+            row = scenario_row(scenario, None, str(e))
+        else:
+            error = body.get("message", body["error"]) if "error" in body else None
+            row = scenario_row(scenario, None if error else body, error)
+        if on_row is not None:
+            on_row(row)
+        return row
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="loma-bench") as pool:
+        return list(pool.map(_one, scenarios))
+
+
+def _metrics(rows: list[dict]) -> dict:
+    ok = [r for r in rows if not r["error"]]
+    latencies = [r["response_time_ms"] for r in ok if r["response_time_ms"] is not None]
+    entity = [r["entity_preserved_pct"] for r in ok if r["entity_preserved_pct"] is not None]
+    length = [r["length_reduction_pct"] for r in ok if r["length_reduction_pct"] is not None]
+    tiers: dict[str, int] = {}
+    for r in ok:
+        tier = r["routing_tier"] or "unknown"
+        tiers[tier] = tiers.get(tier, 0) + 1
+    return {
+        "scenarios": len(rows),
+        "errors": len(rows) - len(ok),
+        "error_rate": round((len(rows) - len(ok)) / len(rows), 4) if rows else 0.0,
+        "intent_accuracy": round(sum(r["detected_intent"] == r["intent"] for r in ok) / len(rows), 4) if rows else None,
+        "entity_preserved_pct": round(statistics.fmean(entity), 1) if entity else None,
+        "entity_missing": sum(len(r["entity_missing"]) for r in ok),
+        "length_reduction_pct": round(statistics.fmean(length), 1) if length else None,
+        "tiers": dict(sorted(tiers.items())),
+        "sonnet_share": round(tiers.get("sonnet", 0) / len(ok), 4) if ok else None,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "max_ms": max(latencies) if latencies else None,
+    }
+
+
+def summarize(rows: list[dict]) -> dict:
+    """{"overall": metrics, "by_intent": {expected intent: metrics}}."""
+    by_intent: dict[str, list[dict]] = {}
+    for r in rows:
+        by_intent.setdefault(r["intent"] or "unknown", []).append(r)
+    return {
+        "overall": _metrics(rows),
+        "by_intent": {intent: _metrics(group) for intent, group in sorted(by_intent.items())},
+    }
+
+
+def build_run(rows: list[dict], meta: dict | None = None) -> dict:
+    """Run artifact: version, timestamp, caller metadata (benchmark, prompt bundle, flags), summary, rows."""
+    return {
+        "version": RUN_VERSION,
+        "created_at": int(time.time()),
+        "meta": meta or {},
+        "summary": summarize(rows),
+        "scenarios": rows,
+    }
+
+
+def _check(metric: str, scope: str, baseline, current, threshold: tuple[str, str, float], gated: bool) -> dict | None:
+    if baseline is None or current is None:
+        return None
+    direction, kind, tolerance = threshold
+    allowed = tolerance * abs(baseline) if kind == "rel" else tolerance
+    if metric.endswith("_ms"):
+        allowed = max(allowed, MIN_LATENCY_SLACK_MS)
+    regression = current - baseline if direction == "lower" else baseline - current
+    return {
+        "metric": metric,
+        "scope": scope,
+        "baseline": baseline,
+        "current": current,
+        "delta": round(current - baseline, 4),
+        "allowed": round(allowed, 4),
+        "ok": regression <= allowed + 1e-9,
+        "gated": gated,
+    }
+
+
+def diff(
+    current: dict,
+    baseline: dict,
+    thresholds: dict[str, tuple[str, str, float]] | None = None,
+    gate_per_intent: bool = False,
+) -> dict:
+    """
+    Compare two run artifacts. Returns {"passed", "checks", "tier_shift"}: one
+    check per metric overall and per intent present in both runs; passed is
+    False when a gated check regressed beyond its tolerance.
+    """
+    thresholds = {**THRESHOLDS, **(thresholds or {})}
+    checks = []
+    scopes = [("overall", current["summary"]["overall"], baseline["summary"]["overall"], True)]
+    for intent, metrics in current["summary"]["by_intent"].items():
+        base = baseline["summary"]["by_intent"].get(intent)
+        if base is not None:
+            scopes.append((intent, metrics, base, gate_per_intent))
+    for scope, cur, base, gated in scopes:
+        for metric, threshold in thresholds.items():
+            check = _check(metric, scope, base.get(metric), cur.get(metric), threshold, gated)
+            if check is not None:
+                checks.append(check)
+
+    cur_tiers = current["summary"]["overall"]["tiers"]
+    base_tiers = baseline["summary"]["overall"]["tiers"]
+    return {
+        "passed": all(c["ok"] for c in checks if c["gated"]),
+        "checks": checks,
+        "tier_shift": {t: cur_tiers.get(t, 0) - base_tiers.get(t, 0) for t in sorted(set(cur_tiers) | set(base_tiers))},
+    }
+
+
+def parse_threshold(spec: str) -> tuple[str, tuple[str, str, float]]:
+    """"p95_ms=0.5" → override the tolerance of a known metric."""
+    metric, _, value = spec.partition("=")
+    if metric not in THRESHOLDS or not value:
+        raise ValueError(f"unknown threshold {spec!r} (metrics: {', '.join(THRESHOLDS)})")
+    direction, kind, _ = THRESHOLDS[metric]
+    return metric, (direction, kind, float(value))
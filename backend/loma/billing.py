@@ -4,25 +4,36 @@ Tiers: free (5/day), payg (20 credits per pack), pro (unlimited).
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import Any
 
 import config
 from . import db
+from .deadlines import DeadlineExceeded
 
 logger = logging.getLogger("loma.billing")
 
+# check_quota reason when the subscription couldn't be read in time (handler: 503)
+QUOTA_UNAVAILABLE = "quota_unavailable"
 
-def check_quota(user_id: str | None) -> dict[str, Any]:
+
+def check_quota(user_id: str | None, deadline: float | None = None) -> dict[str, Any]:
     """
     Check if user can perform a rewrite.
     Returns: {"allowed": bool, "tier": str, "remaining": int|None, "reason": str|None}
+    deadline: the request's deadline; a subscription read that overruns it fails
+    closed (not allowed, reason "quota_unavailable", tier None).
     """
     if not user_id:
         # Anonymous: allow with daily limit (tracked client-side, soft enforcement)
         return {"allowed": True, "tier": "anonymous", "remaining": None, "reason": None}
 
-    sub = db.get_user_subscription(user_id)
+    try:
+        sub = db.get_user_subscription(user_id, deadline=deadline)
+    except DeadlineExceeded:
+        logger.warning("Quota for %s unavailable within the request deadline; denying", user_id)
+        return {"allowed": False, "tier": None, "remaining": None, "reason": QUOTA_UNAVAILABLE}
     tier = sub["tier"]
 
     if tier == "pro":
@@ -57,6 +68,13 @@ def check_quota(user_id: str | None) -> dict[str, Any]:
     }
 
 
+async def check_quota_async(user_id: str | None, deadline: float | None = None) -> dict[str, Any]:
+    """Async variant of check_quota (subscription read runs off the event loop)."""
+    if not user_id:
+        return check_quota(None)
+    return await asyncio.to_thread(check_quota, user_id, deadline)
+
+
 def _add_payg_credits(user_id: str, credits: int) -> None:
     """Add PAYG credits to user's balance."""
     client = db._get_client()
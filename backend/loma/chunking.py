@@ -0,0 +1,129 @@
+"""
+Long-document mode — split a long input into chunks rewritten concurrently.
+
+split() cuts the input at paragraph breaks, then sentence ends, then (for a
+run-on sentence) whitespace, and packs the pieces into chunks of at most
+CHUNK_TARGET_CHARS. Each chunk keeps the whitespace that followed it in the
+input, so join() puts the rewritten chunks back with the original paragraph
+structure. The pipeline routes and rewrites every chunk on its own (short
+chunks can land on Haiku or the rules engine); context_header() is the small
+block added to each chunk's prompt so the parts keep one voice.
+"""
+from __future__ import annotations
+
+import re
+
+import config
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Characters of the message's opening quoted in every chunk's context header
+OPENING_CHARS = 200
+
+
+def max_input_chars() -> int:
+    """Longest accepted input: LONG_INPUT_MAX_CHARS in long-document mode, else MAX_INPUT_CHARS."""
+    return config.LONG_INPUT_MAX_CHARS if config.LONG_INPUT_CHUNKING else config.MAX_INPUT_CHARS
+
+
+def should_chunk(text: str) -> bool:
+    return config.LONG_INPUT_CHUNKING and len(text) > config.CHUNK_THRESHOLD_CHARS
+
+
+def _pieces(text: str, pattern: re.Pattern) -> list[tuple[str, str]]:
+    """[(piece, separator after it)] — the last piece's separator is ""."""
+    out = []
+    pos = 0
+    for m in pattern.finditer(text):
+        if m.start() > pos:
+            out.append((text[pos:m.start()], m.group()))
+        pos = m.end()
+    if pos < len(text):
+        out.append((text[pos:], ""))
+    return out
+
+
+def _hard_split(sentence: str, target_chars: int) -> list[tuple[str, str]]:
+    """A sentence longer than target_chars, cut at the last whitespace before each limit."""
+    out = []
+    rest = sentence
+    while len(rest) > target_chars:
+        cut = None
+        for m in _WHITESPACE.finditer(rest, 0, target_chars + 1):
+            cut = m
+        if cut is None or cut.start() == 0:
+            out.append((rest[:target_chars], ""))
+            rest = rest[target_chars:]
+        else:
+            out.append((rest[:cut.start()], cut.group()))
+            rest = rest[cut.end():]
+    if rest:
+        out.append((rest, ""))
+    return out
+
+
+def _units(text: str, target_chars: int) -> list[tuple[str, str]]:
+    """Paragraphs, with over-long ones broken into sentences (and over-long sentences at whitespace)."""
+    units = []
+    for paragraph, paragraph_sep in _pieces(text, _PARAGRAPH_BREAK):
+        if len(paragraph) <= target_chars:
+            units.append((paragraph, paragraph_sep))
+            continue
+        for sentence, sentence_sep in _pieces(paragraph, _SENTENCE_END):
+            units.extend(_hard_split(sentence, target_chars))
+            units[-1] = (units[-1][0], sentence_sep)
+        units[-1] = (units[-1][0], paragraph_sep)
+    return units
+
+
+def split(text: str, target_chars: int | None = None) -> list[tuple[str, str]]:
+    """
+    [(chunk, separator after it)] in input order; every chunk is at most
+    target_chars (default CHUNK_TARGET_CHARS). Consecutive paragraphs / sentences
+    are packed together up to the target.
+    """
+    target_chars = target_chars or config.CHUNK_TARGET_CHARS
+    chunks: list[tuple[str, str]] = []
+    current, current_sep = "", ""
+    for unit, sep in _units(text.strip(), target_chars):
+        if current and len(current) + len(current_sep) + len(unit) > target_chars:
+            chunks.append((current, current_sep))
+            current, current_sep = "", ""
+        current = current + current_sep + unit if current else unit
+        current_sep = sep
+    if current:
+        chunks.append((current, ""))
+    return chunks
+
+
+def join(outputs: list[str], separators: list[str]) -> str:
+    """Rewritten chunks back into one text, separated as their inputs were."""
+    return "".join(out.strip() + sep for out, sep in zip(outputs, separators)).strip()
+
+
+def part_role(index: int, count: int) -> str:
+    """"opening" | "middle" | "closing" — what a chunk may add (greeting, sign-off)."""
+    if index == 0:
+        return "opening"
+    return "closing" if index == count - 1 else "middle"
+
+
+def context_header(index: int, count: int, opening: str) -> str:
+    """Prompt block telling the model its chunk is one part of a longer message."""
+    role = part_role(index, count)
+    if role == "opening":
+        edges = "Do not add a sign-off; the message continues after this part."
+    elif role == "closing":
+        edges = "Do not add a greeting; the message starts before this part."
+    else:
+        edges = "Do not add a greeting or a sign-off; this part is in the middle of the message."
+    header = (
+        f"DOCUMENT CONTEXT: this input is part {index + 1} of {count} of one longer message; "
+        "the other parts are rewritten separately and joined after yours. Rewrite only this part, "
+        "in the same voice, register and tone as the rest, and keep its paragraph breaks. " + edges
+    )
+    if index > 0:
+        header += "\n\nThe message opens with:\n" + opening[:OPENING_CHARS]
+    return header
@@ -2,14 +2,20 @@
 Database layer — Supabase PostgreSQL via supabase-py.
 Provides functions for users, rewrites, and events tables.
 Falls back gracefully when Supabase is not configured (local dev).
+Calls on the request path take an optional `deadline` (loma.deadlines): past it
+they give up waiting and return their no-database fallback. Billing debits
+(increment_rewrite_count) take none and always run.
 """
 from __future__ import annotations
 
+import itertools
+import json
 import logging
 from datetime import datetime, timezone
 from typing import Any
 
 import config
+from .deadlines import within_deadline
 
 logger = logging.getLogger("loma.db")
 
@@ -72,8 +78,12 @@ def upsert_user(user_id: str, email: str, auth_provider: str = "google") -> dict
         return None
 
 
+@within_deadline(required=True)
 def get_user_subscription(user_id: str) -> dict:
-    """Returns subscription info: tier, payg_balance, rewrites_today."""
+    """
+    Returns subscription info: tier, payg_balance, rewrites_today.
+    Raises DeadlineExceeded when the read overruns `deadline` (no fallback quota).
+    """
     client = _get_client()
     if not client:
         return {"tier": "free", "payg_balance": 0, "rewrites_today": 0}
@@ -96,77 +106,185 @@ def get_user_subscription(user_id: str) -> dict:
         return {"tier": "free", "payg_balance": 0, "rewrites_today": 0}
 
 
-def increment_rewrite_count(user_id: str) -> None:
+def increment_rewrite_count(user_id: str, count: int = 1) -> bool:
     """Increment daily rewrite counter. Deduct PAYG credit atomically if applicable.
 
     Uses an RPC function for PAYG deduction to prevent race conditions.
     Falls back to read-then-write if the RPC is not available.
+    count > 1 debits a whole batch in one update: all `count` credits or none;
+    returns False when that debit matched no row (balance below `count`) or failed.
+    Takes no deadline: a debit for a rewrite that was served always runs.
     """
     client = _get_client()
     if not client:
-        return
+        return True
     try:
         today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         sub = get_user_subscription(user_id)
-        new_count = sub["rewrites_today"] + 1
+        new_count = sub["rewrites_today"] + count
 
         if sub["tier"] == "payg" and sub["payg_balance"] > 0:
             # Atomic: decrement balance and update count in one operation
-            # Uses Postgres: UPDATE ... SET payg_balance = GREATEST(payg_balance - 1, 0)
+            # Uses Postgres: UPDATE ... SET payg_balance = GREATEST(payg_balance - n, 0)
             try:
-                client.rpc("decrement_payg_and_count", {
-                    "p_user_id": user_id,
-                    "p_new_count": new_count,
-                    "p_date": today,
-                }).execute()
-                return
+                if count == 1:
+                    client.rpc("decrement_payg_and_count", {
+                        "p_user_id": user_id,
+                        "p_new_count": new_count,
+                        "p_date": today,
+                    }).execute()
+                else:
+                    result = client.rpc("debit_payg_and_count", {
+                        "p_user_id": user_id,
+                        "p_count": count,
+                        "p_new_count": new_count,
+                        "p_date": today,
+                    }).execute()
+                    return result.data is True
+                return True
             except Exception:
                 # RPC not available — fall back to conditional update
-                client.table("users").update({
+                result = client.table("users").update({
                     "rewrites_today": new_count,
                     "last_rewrite_date": today,
-                    "payg_balance": max(sub["payg_balance"] - 1, 0),
-                }).eq("id", user_id).gte("payg_balance", 1).execute()
-                return
+                    "payg_balance": max(sub["payg_balance"] - count, 0),
+                }).eq("id", user_id).gte("payg_balance", count).execute()
+                return bool(result.data)
+        if sub["tier"] == "payg" and count > 1:
+            # No balance left to reserve a batch from
+            return False
 
         client.table("users").update({
             "rewrites_today": new_count,
             "last_rewrite_date": today,
         }).eq("id", user_id).execute()
+        return True
     except Exception as e:
         logger.error("increment_rewrite_count failed: %s", e)
+        return False
+
+
+def refund_rewrite_count(user_id: str, count: int) -> None:
+    """Give back `count` rewrites reserved by increment_rewrite_count (batch items that failed)."""
+    client = _get_client()
+    if not client or count <= 0:
+        return
+    try:
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        sub = get_user_subscription(user_id)
+        if sub["tier"] == "payg":
+            try:
+                client.rpc("refund_payg_and_count", {
+                    "p_user_id": user_id,
+                    "p_count": count,
+                    "p_date": today,
+                }).execute()
+                return
+            except Exception:
+                # RPC not available — fall back to read-then-write
+                client.table("users").update({
+                    "rewrites_today": max(sub["rewrites_today"] - count, 0),
+                    "payg_balance": sub["payg_balance"] + count,
+                }).eq("id", user_id).execute()
+                return
+
+        client.table("users").update({
+            "rewrites_today": max(sub["rewrites_today"] - count, 0),
+        }).eq("id", user_id).eq("last_rewrite_date", today).execute()
+    except Exception as e:
+        logger.error("refund_rewrite_count failed: %s", e)
 
 
 # ---------- Rewrites ----------
 
+def _rewrite_row(user_id: str | None, rewrite_data: dict) -> dict:
+    return {
+        "id": rewrite_data.get("rewrite_id"),
+        "user_id": user_id,
+        "input_text": rewrite_data.get("original_text", ""),
+        "output_text": rewrite_data.get("output_text", ""),
+        "detected_intent": rewrite_data.get("detected_intent"),
+        "intent_confidence": rewrite_data.get("intent_confidence"),
+        "routing_tier": rewrite_data.get("routing_tier"),
+        "output_language": rewrite_data.get("output_language"),
+        "platform": rewrite_data.get("platform"),
+        "tone": rewrite_data.get("tone"),
+        "language_mix": rewrite_data.get("language_mix"),
+        "scores": rewrite_data.get("scores"),
+        "response_time_ms": rewrite_data.get("response_time_ms"),
+    }
+
+
+@within_deadline()
 def store_rewrite(user_id: str | None, rewrite_data: dict) -> None:
     """Persist a completed rewrite to the rewrites table."""
     client = _get_client()
     if not client:
         return
     try:
-        row = {
-            "id": rewrite_data.get("rewrite_id"),
-            "user_id": user_id,
-            "input_text": rewrite_data.get("original_text", ""),
-            "output_text": rewrite_data.get("output_text", ""),
-            "detected_intent": rewrite_data.get("detected_intent"),
-            "intent_confidence": rewrite_data.get("intent_confidence"),
-            "routing_tier": rewrite_data.get("routing_tier"),
-            "output_language": rewrite_data.get("output_language"),
-            "platform": rewrite_data.get("platform"),
-            "tone": rewrite_data.get("tone"),
-            "language_mix": rewrite_data.get("language_mix"),
-            "scores": rewrite_data.get("scores"),
-            "response_time_ms": rewrite_data.get("response_time_ms"),
-        }
-        client.table("rewrites").insert(row).execute()
+        client.table("rewrites").insert(_rewrite_row(user_id, rewrite_data)).execute()
     except Exception as e:
         logger.error("store_rewrite failed: %s", e)
 
 
+@within_deadline()
+def store_rewrites(user_id: str | None, rewrites: list[dict]) -> None:
+    """Persist a batch of completed rewrites with one bulk insert."""
+    client = _get_client()
+    if not client or not rewrites:
+        return
+    try:
+        client.table("rewrites").insert([_rewrite_row(user_id, r) for r in rewrites]).execute()
+    except Exception as e:
+        logger.error("store_rewrites failed (%d rows): %s", len(rewrites), e)
+
+
+def update_rewrite_semantic_scores(rewrite_id: str, semantic_scores: dict) -> bool:
+    """Attach background semantic scores to a stored rewrite. False when not written."""
+    client = _get_client()
+    if not client:
+        return False
+    try:
+        client.table("rewrites").update({"semantic_scores": semantic_scores}).eq("id", rewrite_id).execute()
+        return True
+    except Exception as e:
+        logger.error("update_rewrite_semantic_scores failed: %s", e)
+        return False
+
+
+def iter_rewrites(
+    columns: str = "*",
+    since: str | None = None,
+    batch_size: int = 1000,
+    limit: int | None = None,
+):
+    """
+    Stream stored rewrites oldest-first in pages (offline analysis / replay).
+    since: ISO timestamp lower bound on created_at. Yields row dicts.
+    """
+    client = _get_client()
+    if not client:
+        return
+    offset = 0
+    while limit is None or offset < limit:
+        size = batch_size if limit is None else min(batch_size, limit - offset)
+        try:
+            query = client.table("rewrites").select(columns).order("created_at")
+            if since:
+                query = query.gte("created_at", since)
+            rows = query.range(offset, offset + size - 1).execute().data or []
+        except Exception as e:
+            logger.error("iter_rewrites failed at offset %d: %s", offset, e)
+            return
+        yield from rows
+        if len(rows) < size:
+            return
+        offset += size
+
+
 # ---------- Events / Analytics ----------
 
+@within_deadline()
 def log_event(user_id: str | None, event_name: str, event_data: dict | None = None) -> None:
     """Store an analytics event."""
     client = _get_client()
@@ -182,3 +300,88 @@ def log_event(user_id: str | None, event_name: str, event_data: dict | None = No
         ).execute()
     except Exception as e:
         logger.error("log_event failed: %s", e)
+
+
+@within_deadline()
+def log_events(user_id: str | None, events: list[tuple[str, dict | None]]) -> None:
+    """Store several analytics events ((event_name, event_data) pairs) with one bulk insert."""
+    client = _get_client()
+    if not client or not events:
+        return
+    try:
+        client.table("events").insert([
+            {"user_id": user_id, "event_name": name, "event_data": data or {}}
+            for name, data in events
+        ]).execute()
+    except Exception as e:
+        logger.error("log_events failed (%d rows): %s", len(events), e)
+
+
+def iter_events(
+    event_names: list[str],
+    since: str | None = None,
+    batch_size: int = 1000,
+    limit: int | None = None,
+):
+    """
+    Stream stored events with the given names oldest-first in pages (offline
+    analysis). Yields {"event_name", "event_data", "created_at"} dicts.
+    """
+    client = _get_client()
+    if not client:
+        return
+    offset = 0
+    while limit is None or offset < limit:
+        size = batch_size if limit is None else min(batch_size, limit - offset)
+        try:
+            query = (
+                client.table("events")
+                .select("event_name,event_data,created_at")
+                .in_("event_name", event_names)
+                .order("created_at")
+            )
+            if since:
+                query = query.gte("created_at", since)
+            rows = query.range(offset, offset + size - 1).execute().data or []
+        except Exception as e:
+            logger.error("iter_events failed at offset %d: %s", offset, e)
+            return
+        yield from rows
+        if len(rows) < size:
+            return
+        offset += size
+
+
+# ---------- Offline row sources (run_*.py) ----------
+
+def iter_jsonl(path: str, limit: int | None = None):
+    """Rows of a JSONL table export, in file order (exports are oldest first); at most `limit`."""
+    def rows():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return itertools.islice(rows(), limit)
+
+
+def rewrite_rows(columns: str, jsonl: str | None = None, since: str | None = None, limit: int | None = None):
+    """
+    Rewrites for an offline script: the JSONL export at `jsonl`, else the table.
+    Either way at most `limit`. `since` filters the table only, so combining it
+    with `jsonl` raises ValueError (scripts turn it into a usage error).
+    """
+    if jsonl:
+        if since:
+            raise ValueError("--since filters the rewrites table; it does not apply to a JSONL export")
+        return iter_jsonl(jsonl, limit)
+    return iter_rewrites(columns=columns, since=since, limit=limit)
+
+
+def event_rows(event_names: list[str], jsonl: str | None = None, since: str | None = None):
+    """Events for an offline script: the JSONL export at `jsonl`, else the table (ValueError as rewrite_rows)."""
+    if jsonl:
+        if since:
+            raise ValueError("--since filters the events table; it does not apply to a JSONL export")
+        return iter_jsonl(jsonl)
+    return iter_events(event_names, since=since)
+
@@ -0,0 +1,121 @@
+"""
+Request deadlines — one time.monotonic() value per request, passed down the
+request path so every stage uses what is left of the budget.
+
+The handler takes the deadline from the Lambda context (or REQUEST_BUDGET_S
+on the local server) at entry. The quota read and the DB writes run within it
+(`@within_deadline` adds a `deadline` keyword to a db function) — billing
+debits do not, a served rewrite is always charged — the pipeline
+keeps POST_PIPELINE_RESERVE_S of it back for the writes, and llm caps every
+attempt's timeout at the remaining time. None means no deadline everywhere.
+"""
+from __future__ import annotations
+
+import copy
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable
+
+logger = logging.getLogger("loma.deadlines")
+
+# Threads for deadline-bounded blocking calls (a call that overruns keeps its
+# thread until it returns; the request moves on without it)
+_MAX_WORKERS = 16
+_executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="loma-deadline")
+
+# Calls submitted and not yet returned, abandoned ones included. At _MAX_WORKERS
+# a slow database has every thread; new calls are refused instead of queued
+# behind them (they'd only wait out their own deadline in the queue).
+_lock = threading.Lock()
+_in_flight = 0
+_counts = {"calls": 0, "overran": 0, "refused": 0}
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's budget ran out before it could be answered."""
+
+
+def from_context(context: object, default_s: float) -> float:
+    """Deadline for a request: the Lambda's remaining time, else default_s from now."""
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    budget_s = get_remaining() / 1000 if callable(get_remaining) else default_s
+    return time.monotonic() + budget_s
+
+
+def remaining_s(deadline: float | None) -> float | None:
+    """Seconds left until `deadline` (None = no deadline)."""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_within(
+    deadline: float | None, fn: Callable, *args, default: Any = None, label: str = "", required: bool = False,
+    **kwargs,
+) -> Any:
+    """
+    fn(*args, **kwargs), given at most the time left until deadline; returns
+    (a copy of) default when the deadline has passed or the call overruns it.
+    required=True raises DeadlineExceeded instead, for reads with no safe default.
+    """
+    left = remaining_s(deadline)
+    if left is None:
+        return fn(*args, **kwargs)
+    name = label or getattr(fn, "__name__", "call")
+    if left <= 0:
+        logger.warning("%s skipped: request deadline passed", name)
+        if required:
+            raise DeadlineExceeded(f"{name}: request deadline passed")
+        return copy.copy(default)
+    global _in_flight
+    with _lock:
+        refused = _in_flight >= _MAX_WORKERS
+        if refused:
+            _counts["refused"] += 1
+        else:
+            _in_flight += 1
+            _counts["calls"] += 1
+    if refused:
+        logger.warning("%s refused: %d deadline-bounded calls still running", name, _MAX_WORKERS)
+        if required:
+            raise DeadlineExceeded(f"{name}: no thread free before the request deadline")
+        return copy.copy(default)
+    future = _executor.submit(fn, *args, **kwargs)
+    future.add_done_callback(_call_done)
+    try:
+        return future.result(timeout=left)
+    except FutureTimeout:
+        with _lock:
+            _counts["overran"] += 1
+        logger.warning("%s overran the request deadline (%.2fs left); continuing without it", name, left)
+        if required:
+            raise DeadlineExceeded(f"{name} overran the request deadline") from None
+        return copy.copy(default)
+
+
+def _call_done(_future) -> None:
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+
+
+def stats() -> dict:
+    """Deadline-bounded calls: run, overran (abandoned while running), refused (all threads busy)."""
+    with _lock:
+        return {**_counts, "in_flight": _in_flight, "max_in_flight": _MAX_WORKERS}
+
+
+def within_deadline(default: Any = None, required: bool = False) -> Callable:
+    """Decorator: adds a keyword-only `deadline` to fn, run through call_within."""
+    def wrap(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def bounded(*args, deadline: float | None = None, **kwargs):
+            return call_within(
+                deadline, fn, *args, default=default, label=fn.__name__, required=required, **kwargs,
+            )
+        return bounded
+    return wrap
@@ -0,0 +1,93 @@
+"""
+Entity masking — swap entities for stable placeholders before the LLM call and
+put them back afterwards.
+
+mask_entities("Anh Hùng ơi, invoice $5,000 ...") →
+    masked_text "Anh ⟦NAME_1⟧ ơi, invoice ⟦AMT_2⟧ ...", placeholders {"⟦NAME_1⟧": "Hùng", ...}
+
+The model can only copy a placeholder or drop it, so restoration is exact and
+missing / duplicated / invented placeholders are detected deterministically.
+Inputs that differ only in masked values become identical, which is what the
+rewrite cache keys on.
+
+Only language-neutral surface forms are masked ($5,000, 15/3, Q4, INV-2024-031,
+names): "tháng 3" or "5 triệu đồng" must be translated, so they stay in the text.
+Kinship honorifics stay outside the name placeholder ("Anh ⟦NAME_1⟧") because
+they carry the seniority the prompt relies on.
+"""
+from __future__ import annotations
+
+import re
+
+from .quality import HONORIFICS, EntitySpan, is_translatable, scan_entities, strip_honorific
+
+# Category → placeholder tag
+PLACEHOLDER_TAGS = {
+    "money": "AMT",
+    "numbers": "NUM",
+    "dates": "DATE",
+    "names": "NAME",
+    "identifiers": "ID",
+}
+
+# Placeholder as the model may echo it: ⟦AMT_1⟧, with stray spaces, or ASCII [[AMT_1]]
+_PLACEHOLDER_OUT = re.compile(r"(?:⟦|\[\[)\s*([A-Z]+_\d+)\s*(?:⟧|\]\])")
+
+
+def mask_entities(text: str, spans: list[EntitySpan] | None = None) -> dict:
+    """
+    Returns {"masked_text": str, "placeholders": {placeholder: original}}.
+    The same value always maps to the same placeholder within one input.
+    spans: quality.scan_entities(text), when the caller already has it.
+    """
+    placeholders: dict[str, str] = {}
+    by_value: dict[str, str] = {}
+    out: list[str] = []
+    pos = 0
+    for start, end, category, item in scan_entities(text) if spans is None else spans:
+        if is_translatable(item):
+            continue
+        prefix = ""
+        if category == "names":
+            prefix, item = strip_honorific(item)
+            if item.split()[0] in HONORIFICS or len(item) < 2:
+                continue
+        if item not in by_value:
+            token = f"⟦{PLACEHOLDER_TAGS[category]}_{len(by_value) + 1}⟧"
+            by_value[item] = token
+            placeholders[token] = item
+        out.append(text[pos:start])
+        out.append(prefix + by_value[item])
+        pos = end
+    out.append(text[pos:])
+    return {"masked_text": "".join(out), "placeholders": placeholders}
+
+
+def restore_entities(output_text: str, placeholders: dict[str, str], masked_input: str = "") -> dict:
+    """
+    Replace placeholders in the model output with the original values.
+    Returns {"text", "missing", "duplicated", "unknown"}:
+    - missing: placeholders from the input absent in the output
+    - duplicated: placeholders used more often in the output than in the input
+    - unknown: placeholder-like tokens the model invented (removed from the text)
+    """
+    counts: dict[str, int] = {}
+    unknown: list[str] = []
+
+    def _sub(m: re.Match) -> str:
+        token = f"⟦{m.group(1)}⟧"
+        if token in placeholders:
+            counts[token] = counts.get(token, 0) + 1
+            return placeholders[token]
+        unknown.append(token)
+        return ""
+
+    text = _PLACEHOLDER_OUT.sub(_sub, output_text)
+    if unknown:
+        text = re.sub(r"[ \t]{2,}", " ", text)
+    missing = [t for t in placeholders if t not in counts]
+    duplicated = [
+        t for t, n in counts.items()
+        if n > max(masked_input.count(t), 1)
+    ]
+    return {"text": text.strip(), "missing": missing, "duplicated": duplicated, "unknown": unknown}
@@ -0,0 +1,440 @@
+"""
+Fake Anthropic Messages API — a local stand-in for load and latency testing.
+
+Serves POST /v1/messages (and GET /v1/models, which llm.warm_up uses to open
+a connection) on a local port so the real SDK client (and with it
+call_claude's retry, timeout and breaker paths) runs unchanged against it:
+
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765   (see run_fake_anthropic.py)
+
+Responses come from, in order:
+- recordings: JSONL of {"key", "model", "text", "usage"?} keyed by prompt_key()
+  (record them once by running in record mode against the real API);
+- synthesis: a deterministic, plausible rewrite that keeps every ⟦TAG_n⟧
+  placeholder and roughly tracks the input length.
+
+Per-model latency is sampled from a log-normal around a median, plus a per
+output token cost; rate limits (429), overloads (529) and timeouts (the server
+stalls for hang_s) are injected at configured rates. Usage includes simulated
+prompt caching: a cache_control prefix is written on first sight, read after.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("loma.fake_anthropic")
+
+UPSTREAM_URL = "https://api.anthropic.com"
+
+# latency_ms: log-normal with the given median (ms) and sigma; capped at max_ms
+# *_rate: probability per request of that injected failure
+DEFAULT_PROFILE = {
+    "default": {
+        "latency_ms": {"median": 900, "sigma": 0.35, "max_ms": 15000},
+        "ms_per_output_token": 8,
+        "rate_limit_rate": 0.0,
+        "overload_rate": 0.0,
+        "timeout_rate": 0.0,
+    },
+    "models": {
+        "claude-3-5-haiku-20241022": {"latency_ms": {"median": 600, "sigma": 0.3}, "ms_per_output_token": 4},
+        "claude-sonnet-4-20250514": {"latency_ms": {"median": 1800, "sigma": 0.4}, "ms_per_output_token": 12},
+    },
+    "hang_s": 60,
+    "retry_after_s": 1,
+    "min_cacheable_tokens": 1024,
+    "seed": None,
+}
+
+# Placeholder forms the pipeline masks entities with (see entity_mask)
+_PLACEHOLDER = re.compile(r"⟦[A-Z]+_\d+⟧")
+_USER_PREFIX = "Rewrite this:\n\n"
+_OPENERS = ("Hi,", "Hello,", "Hi team,")
+_SENTENCES = (
+    "I wanted to follow up on this",
+    "Could you take a look when you have a moment",
+    "Please let me know if anything is unclear",
+    "I have attached the details below",
+    "Happy to discuss further if needed",
+    "It would be great to get your input by the end of the week",
+    "Thank you for your support on this",
+)
+_CLOSERS = ("Thanks!", "Best regards.", "Thank you.")
+
+
+def load_profile(path: str | None = None) -> dict:
+    """DEFAULT_PROFILE, overlaid with a JSON profile file (same shape) when given."""
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    if not path:
+        return profile
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    for key, value in overrides.items():
+        if key == "default":
+            _merge_model(profile["default"], value)
+        elif key == "models":
+            for model, settings in value.items():
+                _merge_model(profile["models"].setdefault(model, {}), settings)
+        else:
+            profile[key] = value
+    return profile
+
+
+def _merge_model(target: dict, settings: dict) -> None:
+    for key, value in settings.items():
+        if key == "latency_ms":
+            target["latency_ms"] = {**target.get("latency_ms", {}), **value}
+        else:
+            target[key] = value
+
+
+def model_settings(profile: dict, model: str) -> dict:
+    """Effective settings for a model: defaults overlaid with its own entry."""
+    settings = copy.deepcopy(profile["default"])
+    _merge_model(settings, profile["models"].get(model, {}))
+    return settings
+
+
+def _system_text(system) -> str:
+    if isinstance(system, list):
+        return "\n\n".join(block.get("text", "") for block in system)
+    return system or ""
+
+
+def _message_text(content) -> str:
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if block.get("type") == "text")
+    return content or ""
+
+
+def prompt_key(body: dict) -> str:
+    """Recording key: model + system text + messages (cache_control layout doesn't matter)."""
+    payload = json.dumps(
+        [
+            body.get("model"),
+            _system_text(body.get("system")),
+            [[m.get("role"), _message_text(m.get("content"))] for m in body.get("messages", [])],
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_recordings(path: str | None) -> dict[str, dict]:
+    recordings: dict[str, dict] = {}
+    if not path:
+        return recordings
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["key"]] = entry
+    except FileNotFoundError:
+        pass
+    return recordings
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token; good enough for cost and cache simulations."""
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+
+def synthesize(body: dict) -> str:
+    """
+    Deterministic stand-in rewrite for the last user message: English filler of
+    roughly 80% of the input's word count that carries every placeholder once.
+    """
+    messages = body.get("messages") or [{}]
+    text = _message_text(messages[-1].get("content"))
+    if text.startswith(_USER_PREFIX):
+        text = text[len(_USER_PREFIX):]
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    placeholders = list(dict.fromkeys(_PLACEHOLDER.findall(text)))
+    target_words = max(8, int(len(text.split()) * 0.8))
+
+    parts = [rng.choice(_OPENERS)]
+    words = 1
+    if placeholders:
+        parts.append(f"Regarding {', '.join(placeholders)}:")
+        words += len(placeholders) + 1
+    while words < target_words:
+        sentence = rng.choice(_SENTENCES)
+        parts.append(sentence + ("?" if sentence.startswith("Could") else "."))
+        words += len(sentence.split())
+    parts.append(rng.choice(_CLOSERS))
+    return " ".join(parts)
+
+
+def _error_body(error_type: str, message: str) -> dict:
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+class FakeBackend:
+    """Request handling state: profile, recordings, cache simulation, counters."""
+
+    def __init__(
+        self,
+        profile: dict | None = None,
+        recordings_path: str | None = None,
+        record_upstream: str | None = None,
+    ):
+        self.profile = profile or load_profile()
+        self.recordings_path = recordings_path
+        self.recordings = load_recordings(recordings_path)
+        self.record_upstream = record_upstream
+        self._rng = random.Random(self.profile.get("seed"))
+        self._cached_prefixes: set[str] = set()
+        self._lock = threading.Lock()
+        self.stats: dict[str, dict[str, int]] = {}
+
+    def _count(self, model: str, outcome: str) -> None:
+        with self._lock:
+            counts = self.stats.setdefault(model, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def sample_latency_s(self, model: str, output_tokens: int = 0) -> float:
+        settings = model_settings(self.profile, model)
+        latency = settings["latency_ms"]
+        with self._lock:
+            z = self._rng.gauss(0, 1)
+        ms = latency["median"] * math.exp(latency.get("sigma", 0) * z)
+        ms = min(ms, latency.get("max_ms", ms)) + settings.get("ms_per_output_token", 0) * output_tokens
+        return ms / 1000
+
+    def _injected_fault(self, model: str) -> str | None:
+        settings = model_settings(self.profile, model)
+        with self._lock:
+            roll = self._rng.random()
+        for fault in ("timeout", "rate_limit", "overload"):
+            rate = settings.get(f"{fault}_rate", 0.0)
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def _usage(self, body: dict, text: str) -> dict:
+        """Token counts with prompt caching simulated on the cache_control system block."""
+        system = body.get("system")
+        total = estimate_tokens(_system_text(system)) + sum(
+            estimate_tokens(_message_text(m.get("content"))) for m in body.get("messages", [])
+        )
+        usage = {
+            "input_tokens": total,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "output_tokens": estimate_tokens(text),
+        }
+        if isinstance(system, list):
+            cached = [b for b in system if b.get("cache_control")]
+            if cached:
+                prefix = "\n\n".join(b.get("text", "") for b in system[: system.index(cached[-1]) + 1])
+                prefix_tokens = estimate_tokens(prefix)
+                if prefix_tokens >= self.profile.get("min_cacheable_tokens", 0):
+                    key = hashlib.sha256(f"{body.get('model')}|{prefix}".encode("utf-8")).hexdigest()
+                    with self._lock:
+                        hit = key in self._cached_prefixes
+                        self._cached_prefixes.add(key)
+                    usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = prefix_tokens
+                    usage["input_tokens"] = total - prefix_tokens
+        return usage
+
+    def respond(self, body: dict) -> tuple[int, dict, dict]:
+        """(status, headers, json body) for one Messages API request. May sleep."""
+        model = body.get("model", "")
+        if body.get("stream"):
+            return 400, {}, _error_body("invalid_request_error", "stream is not supported by the fake backend")
+        fault = self._injected_fault(model)
+        if fault == "timeout":
+            self._count(model, "timeout")
+            time.sleep(self.profile.get("hang_s", 60))
+            return 504, {}, _error_body("timeout_error", "Injected timeout")
+        if fault == "rate_limit":
+            self._count(model, "rate_limit")
+            return 429, {"retry-after": str(self.profile.get("retry_after_s", 1))}, _error_body(
+                "rate_limit_error", "Injected rate limit"
+            )
+        if fault == "overload":
+            self._count(model, "overload")
+            time.sleep(self.sample_latency_s(model) / 4)
+            return 529, {}, _error_body("overloaded_error", "Injected overload")
+
+        key = prompt_key(body)
+        recorded = self.recordings.get(key)
+        source = "replay" if recorded else "synth"
+        text = recorded["text"] if recorded else synthesize(body)
+        stop_reason, stop_sequence = "end_turn", None
+        hits = [(text.index(seq), seq) for seq in body.get("stop_sequences") or [] if seq in text]
+        if hits:
+            cut, stop_sequence = min(hits)
+            text, stop_reason = text[:cut], "stop_sequence"
+        max_chars = int(body.get("max_tokens") or 0) * 4
+        if max_chars and len(text) > max_chars:
+            text, stop_reason, stop_sequence = text[:max_chars], "max_tokens", None
+        usage = self._usage(body, text)
+        time.sleep(self.sample_latency_s(model, usage["output_tokens"]))
+        self._count(model, source)
+        return 200, {}, {
+            "id": f"msg_fake_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": stop_reason,
+            "stop_sequence": stop_sequence,
+            "usage": usage,
+        }
+
+    def models(self, limit: int = 20) -> dict:
+        """GET /v1/models: the profile's models, in the API's list shape (no latency or faults)."""
+        ids = sorted(self.profile.get("models", {}))[:max(1, limit)]
+        data = [
+            {"type": "model", "id": m, "display_name": m, "created_at": "2024-01-01T00:00:00Z"} for m in ids
+        ]
+        return {
+            "data": data,
+            "has_more": False,
+            "first_id": ids[0] if ids else None,
+            "last_id": ids[-1] if ids else None,
+        }
+
+    def record(self, body: dict, headers: dict) -> tuple[int, dict, dict]:
+        """Record mode: forward to the real API and append successful responses to the recordings file."""
+        request = urllib.request.Request(
+            self.record_upstream.rstrip("/") + "/v1/messages",
+            data=json.dumps(body).encode("utf-8"),
+            headers={
+                "content-type": "application/json",
+                "x-api-key": headers.get("x-api-key", ""),
+                "anthropic-version": headers.get("anthropic-version", "2023-06-01"),
+            },
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as resp:
+                status, payload = resp.status, json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, {}, json.loads(e.read() or b"{}")
+        except (urllib.error.URLError, OSError) as e:
+            # Upstream unreachable / timed out: a bad gateway, not a crashed handler
+            return 502, {}, _error_body("api_error", f"Record upstream unreachable: {e}")
+        entry = {
+            "key": prompt_key(body),
+            "model": body.get("model"),
+            "text": _message_text(payload.get("content")),
+            "usage": payload.get("usage"),
+        }
+        with self._lock:
+            self.recordings[entry["key"]] = entry
+            if self.recordings_path:
+                with open(self.recordings_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._count(body.get("model", ""), "recorded")
+        return status, {}, payload
+
+
+def _make_handler(backend: FakeBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, headers: dict, payload: dict) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.send_header("request-id", f"req_fake_{uuid.uuid4().hex[:16]}")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client gave up (its timeout fired first) — expected for injected timeouts
+                pass
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path.rstrip("/") == "/stats":
+                self._send(200, {}, backend.stats)
+            elif path.rstrip("/") == "/v1/models":
+                params = urllib.parse.parse_qs(query)
+                try:
+                    limit = int(params.get("limit", ["20"])[0])
+                except ValueError:
+                    self._send(400, {}, _error_body("invalid_request_error", "limit must be an integer"))
+                    return
+                self._send(200, {}, backend.models(limit))
+            else:
+                self._send(404, {}, _error_body("not_found_error", "Not found"))
+
+        def do_POST(self):
+            length = int(self.headers.get("content-length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send(400, {}, _error_body("invalid_request_error", "Body must be JSON"))
+                return
+            if self.path.split("?")[0].rstrip("/") != "/v1/messages":
+                self._send(404, {}, _error_body("not_found_error", "Not found"))
+                return
+            if backend.record_upstream:
+                self._send(*backend.record(body, {k.lower(): v for k, v in self.headers.items()}))
+            else:
+                self._send(*backend.respond(body))
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+class FakeAnthropicServer:
+    """Threaded HTTP server around a FakeBackend; port 0 picks a free port."""
+
+    def __init__(self, backend: FakeBackend | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.backend = backend or FakeBackend()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self.backend))
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeAnthropicServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info("Fake Anthropic backend listening on %s", self.url)
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def start(
+    port: int = 0,
+    profile_path: str | None = None,
+    recordings_path: str | None = None,
+    record_upstream: str | None = None,
+) -> FakeAnthropicServer:
+    """Start a fake backend in a background thread; point ANTHROPIC_BASE_URL at .url."""
+    backend = FakeBackend(load_profile(profile_path), recordings_path, record_upstream)
+    return FakeAnthropicServer(backend, port=port).start()
@@ -0,0 +1,324 @@
+"""
+Near-duplicate input index — SimHash fingerprints over entity-masked text.
+
+Templated traffic (the same payment reminder with a different name, amount or
+date) never hits the exact rewrite cache. Here each input is masked (entities
+→ category tokens), fingerprinted with a 64-bit SimHash over word unigrams and
+bigrams, and indexed with 8 × 8-bit LSH bands: any two fingerprints within
+Hamming distance 7 share at least one band, so a lookup is eight dict probes
+plus a popcount per candidate.
+
+Matches are scoped to the same (intent, tone, platform, output_language,
+prompt bundle) context. A match whose masked text is identical can be reused
+directly by substituting the new entities into the prior output; a looser
+match is returned as a starting point. Memory is bounded by an LRU over entries.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import config
+from .prompt_assembly import prompt_bundle_version
+from .quality import EntitySpan, scan_entities, strip_honorific
+
+_BITS = 64
+_BANDS = 8
+_BAND_BITS = _BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+# Newest ids kept per band bucket — bounds candidates per lookup on heavily templated traffic
+_MAX_BUCKET = 32
+
+_WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Category tokens used when masking entities for fingerprinting
+_MASK_TOKENS = {
+    "money": "⟦AMT⟧",
+    "numbers": "⟦NUM⟧",
+    "dates": "⟦DATE⟧",
+    "names": "⟦NAME⟧",
+    "identifiers": "⟦ID⟧",
+}
+# Single digits ("2 tuần") are not entities for preservation, but differ across templated messages
+_BARE_NUMBER = re.compile(r"(?<![\w.,/-])\d+(?![\w/-]|[.,]\d)")
+
+
+def entity_sequence(text: str, spans: list[EntitySpan] | None = None) -> list[tuple[str, str]]:
+    """
+    Entities as (category, text) in order of first appearance, overlaps removed.
+    spans: quality.scan_entities(text), when the caller already has it.
+    """
+    spans = scan_entities(text) if spans is None else list(spans)
+    taken = [(start, end) for start, end, _, _ in spans]
+    for m in _BARE_NUMBER.finditer(text):
+        start, end = m.span()
+        if not any(start < e and s < end for s, e in taken):
+            spans.append((start, end, "numbers", m.group(0)))
+    spans.sort()
+    return [(category, item) for _, _, category, item in spans]
+
+
+def mask_entities(text: str, entities: list[tuple[str, str]] | None = None) -> str:
+    """Replace each entity with its category token (NFC, lowercased, whitespace-collapsed)."""
+    if entities is None:
+        entities = entity_sequence(text)
+    masked = text
+    for category, item in sorted(entities, key=lambda e: len(e[1]), reverse=True):
+        masked = _entity_pattern(item).sub(f" {_MASK_TOKENS[category]} ", masked)
+    masked = unicodedata.normalize("NFC", masked).lower()
+    return " ".join(masked.split())
+
+
+def _entity_pattern(item: str) -> re.Pattern:
+    """Match an entity as a whole token ("2" must not match inside "2024")."""
+    return re.compile(r"(?<![\w.,/-])" + re.escape(item) + r"(?![\w/-]|[.,]\d)")
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(masked_text: str) -> int:
+    """64-bit SimHash over word unigrams + bigrams of already-masked text."""
+    tokens = _WORD.findall(masked_text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return 0
+    weights = [0] * _BITS
+    for feature in features:
+        h = _feature_hash(feature)
+        for bit in range(_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fp = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            fp |= 1 << bit
+    return fp
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def context_key(intent: str, tone: str, platform: str | None, output_language: str | None) -> str:
+    return "|".join((intent, tone, platform or "", output_language or "", prompt_bundle_version()))
+
+
+def substitute_entities(
+    output_text: str,
+    old_entities: list[tuple[str, str]],
+    new_entities: list[tuple[str, str]],
+) -> str | None:
+    """
+    Rewrite a prior output for new entities. Returns None when the entity
+    sequences don't line up or a changed entity can't be found in the output.
+    """
+    if [c for c, _ in old_entities] != [c for c, _ in new_entities]:
+        return None
+    mapping: dict[str, str] = {}
+    for (category, old), (_, new) in zip(old_entities, new_entities):
+        if old == new:
+            continue
+        if not _entity_pattern(old).search(output_text) and category == "names":
+            # Output dropped the honorific ("Hi Hùng") — map the bare name instead
+            old, new = strip_honorific(old)[1], strip_honorific(new)[1]
+        if mapping.get(old, new) != new or not _entity_pattern(old).search(output_text):
+            return None
+        mapping[old] = new
+    if not mapping:
+        return output_text
+    pattern = re.compile(
+        r"(?<![\w.,/-])(?:"
+        + "|".join(re.escape(k) for k in sorted(mapping, key=len, reverse=True))
+        + r")(?![\w/-]|[.,]\d)"
+    )
+    return pattern.sub(lambda m: mapping[m.group(0)], output_text)
+
+
+class NearDuplicateIndex:
+    """Bounded SimHash LSH index: entry id → (context, fingerprint, masked text, payload)."""
+
+    def __init__(self, max_entries: int, max_distance: int = 3):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries: OrderedDict[int, tuple[str, int, str, dict]] = OrderedDict()
+        # Buckets are insertion-ordered dicts used as ordered sets (oldest id first)
+        self._bands: list[dict[tuple[str, int], dict[int, None]]] = [{} for _ in range(_BANDS)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _band_keys(context: str, fp: int) -> list[tuple[str, int]]:
+        return [(context, (fp >> (i * _BAND_BITS)) & _BAND_MASK) for i in range(_BANDS)]
+
+    def add(self, context: str, fp: int, masked: str, payload: dict) -> None:
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (context, fp, masked, payload)
+            for band, key in zip(self._bands, self._band_keys(context, fp)):
+                bucket = band.setdefault(key, {})
+                bucket[entry_id] = None
+                if len(bucket) > _MAX_BUCKET:
+                    del bucket[next(iter(bucket))]
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        entry_id, (context, fp, _, _) = self._entries.popitem(last=False)
+        for band, key in zip(self._bands, self._band_keys(context, fp)):
+            ids = band.get(key)
+            if ids is not None:
+                ids.pop(entry_id, None)
+                if not ids:
+                    del band[key]
+
+    def query(self, context: str, fp: int, masked: str) -> dict | None:
+        """
+        Closest entry within max_distance as
+        {"payload", "distance", "exact_masked"}; exact masked-text matches win ties.
+        """
+        with self._lock:
+            candidates: set[int] = set()
+            for band, key in zip(self._bands, self._band_keys(context, fp)):
+                candidates.update(band.get(key, ()))
+            best = None
+            best_rank = None
+            for entry_id in candidates:
+                _, other_fp, other_masked, payload = self._entries[entry_id]
+                distance = hamming(fp, other_fp)
+                if distance > self.max_distance:
+                    continue
+                rank = (distance, other_masked != masked, -entry_id)
+                if best_rank is None or rank < best_rank:
+                    best_rank = rank
+                    best = (entry_id, distance, other_masked == masked, payload)
+            if best is None:
+                return None
+            self._entries.move_to_end(best[0])
+            return {"payload": best[3], "distance": best[1], "exact_masked": best[2]}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for band in self._bands:
+                band.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_index = NearDuplicateIndex(config.NEAR_DUP_MAX_ENTRIES, config.NEAR_DUP_MAX_DISTANCE)
+
+
+def lookup(
+    input_text: str,
+    intent: str,
+    tone: str,
+    platform: str | None,
+    output_language: str | None,
+    spans: list[EntitySpan] | None = None,
+) -> dict | None:
+    """
+    Find a prior rewrite of a near-duplicate input.
+    Returns {"output_text", "routing_tier", "distance", "reusable"} or None.
+    reusable=True means the masked inputs are identical and the prior output was
+    re-targeted to this input's entities — it can be served as-is. Otherwise
+    output_text is the prior rewrite, useful only as a starting point.
+    """
+    if not config.NEAR_DUP_ENABLED:
+        return None
+    entities = entity_sequence(input_text, spans)
+    masked = mask_entities(input_text, entities)
+    match = _index.query(context_key(intent, tone, platform, output_language), simhash(masked), masked)
+    if match is None:
+        return None
+    payload = match["payload"]
+    output_text = None
+    if match["exact_masked"]:
+        output_text = substitute_entities(payload["output_text"], payload["entities"], entities)
+    return {
+        "output_text": output_text if output_text is not None else payload["output_text"],
+        "routing_tier": payload["routing_tier"],
+        "distance": match["distance"],
+        "reusable": output_text is not None,
+    }
+
+
+def remember(
+    input_text: str,
+    intent: str,
+    tone: str,
+    platform: str | None,
+    output_language: str | None,
+    output_text: str,
+    routing_tier: str,
+    spans: list[EntitySpan] | None = None,
+) -> None:
+    if not config.NEAR_DUP_ENABLED:
+        return
+    entities = entity_sequence(input_text, spans)
+    masked = mask_entities(input_text, entities)
+    _index.add(
+        context_key(intent, tone, platform, output_language),
+        simhash(masked),
+        masked,
+        {"output_text": output_text, "routing_tier": routing_tier, "entities": entities},
+    )
+
+
+def clear() -> None:
+    _index.clear()
+
+
+def simulate_hit_rate(rows, max_entries: int | None = None, max_distance: int | None = None) -> dict:
+    """
+    Replay stored rewrites (dicts with input_text, output_text, detected_intent,
+    tone, platform, output_language, routing_tier; oldest first) through a fresh
+    index and count what each cache layer would have served.
+    """
+    index = NearDuplicateIndex(
+        max_entries or config.NEAR_DUP_MAX_ENTRIES,
+        config.NEAR_DUP_MAX_DISTANCE if max_distance is None else max_distance,
+    )
+    seen_exact: set[tuple[str, str]] = set()
+    counts = {"total": 0, "llm": 0, "exact_hits": 0, "near_reusable": 0, "near_starting_point": 0}
+    for row in rows:
+        if row.get("routing_tier") not in ("haiku", "sonnet"):
+            continue
+        counts["total"] += 1
+        text = row.get("input_text") or ""
+        context = context_key(
+            row.get("detected_intent") or "general", row.get("tone") or "professional",
+            row.get("platform"), row.get("output_language"),
+        )
+        exact_key = (context, " ".join(text.split()))
+        entities = entity_sequence(text)
+        masked = mask_entities(text, entities)
+        fp = simhash(masked)
+        if exact_key in seen_exact:
+            counts["exact_hits"] += 1
+            continue
+        match = index.query(context, fp, masked)
+        if match is not None and match["exact_masked"] and substitute_entities(
+            match["payload"]["output_text"], match["payload"]["entities"], entities
+        ) is not None:
+            counts["near_reusable"] += 1
+        elif match is not None:
+            counts["near_starting_point"] += 1
+        else:
+            counts["llm"] += 1
+        seen_exact.add(exact_key)
+        index.add(context, fp, masked, {"output_text": row.get("output_text") or "", "entities": entities})
+    total = max(counts["total"], 1)
+    return {
+        **counts,
+        "exact_hit_rate": round(counts["exact_hits"] / total, 4),
+        "reusable_hit_rate": round((counts["exact_hits"] + counts["near_reusable"]) / total, 4),
+        "any_match_rate": round(
+            (counts["exact_hits"] + counts["near_reusable"] + counts["near_starting_point"]) / total, 4
+        ),
+    }
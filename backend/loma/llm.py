@@ -1,12 +1,62 @@
 """
 LLM integration — Claude Haiku / Sonnet (Tech Spec 3.5).
 Requires ANTHROPIC_API_KEY in env. Includes timeout, retry, and error handling.
+
+call_claude is the blocking entry used by the Lambda handler; call_claude_async
+is the asyncio equivalent (AsyncAnthropic client, asyncio.sleep between retries)
+for serving many concurrent rewrites from one process.
+
+Retries are bounded by an optional per-request deadline (time.monotonic() value):
+each attempt's timeout is capped to the remaining budget, backoff is exponential
+with jitter, and no retry is started that cannot finish in time. A per-model
+circuit breaker stops retrying into a model that keeps failing so the pipeline
+can fail over (Sonnet → Haiku → rules).
+
+Prompt caching: when the caller passes the static prefix of the system prompt
+(see prompt_assembly.build_system_prompt_parts), it is sent as its own system
+block with an ephemeral cache_control breakpoint — if it reaches the model's
+minimum cacheable length (1024 tokens, 2048 for Haiku). The static prefixes are
+~1000-1800 tokens, so Haiku calls are normally sent without a breakpoint. Cached vs uncached input
+token counts from response.usage are accumulated per model (usage_totals()),
+and each call's usage and cost (loma.usage) is appended to the caller's
+usage_sink list when one is passed.
+
+Concurrency: each model has an adaptive (AIMD) in-flight limit. A call waits
+briefly in a bounded queue for a slot; the limit grows by ~1 per window of
+successful calls and halves on 429 / overload / timeout, so concurrent
+requests in one process settle near the provider's throughput ceiling rather
+than all retrying into a rate limit together (limiter_state()).
+
+Hedging: call_claude_hedged / call_claude_hedged_async send a second request
+(duplicate, or another model) when the primary hasn't answered within the
+model's recent p90 latency; the first non-empty result wins and the loser is
+cancelled (async). A sync loser's request can't be interrupted: it makes no
+further attempts, its limiter slot is released as soon as the winner returns,
+and it is counted in wasted_calls (it is still billed).
+hedge_stats() reports hedge rates, wasted calls and served vs primary-only tail latency.
+
+ANTHROPIC_BASE_URL points both clients at another Messages API endpoint, e.g.
+the local fake (loma.fake_anthropic) for load and latency testing; no real API
+key is needed then. The SDK's own retries are disabled so the retry, deadline
+and breaker logic here is the only one in play.
 """
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
 import os
+import random
+import threading
 import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+from . import usage as usage_module
+from .output_length import estimate_tokens
+from .deadlines import remaining_s
 
 logger = logging.getLogger("loma.llm")
 
@@ -14,8 +64,398 @@ USER_MESSAGE_TEMPLATE = "Rewrite this:\n\n{input_text}"
 
 # Retry config
 MAX_RETRIES = 3
-RETRY_DELAY_S = 1.0
+RETRY_DELAY_S = 1.0  # backoff base: ~1s, 2s, 4s (with jitter)
+RETRY_MAX_DELAY_S = 8.0
 REQUEST_TIMEOUT_S = 20.0
+MIN_ATTEMPT_S = 2.0  # don't start an attempt with less budget than this
+
+# Circuit breaker: open after N consecutive transient failures, probe again after cooldown
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_S = 30.0
+_breakers: dict[str, dict] = {}  # model -> {"failures": int, "opened_at": float | None}
+
+# Adaptive concurrency limit per model (AIMD)
+LIMITER_INITIAL = 8
+LIMITER_MIN = 1
+LIMITER_MAX = 64
+LIMITER_BACKOFF = 0.5  # multiplicative decrease on 429 / overload / timeout
+LIMITER_DECREASE_INTERVAL_S = 1.0  # one decrease per burst of failures from the same window
+LIMITER_LATENCY_FACTOR = 2.0  # no increase while latency runs above this × its moving average
+LIMITER_QUEUE_TIMEOUT_S = 2.0  # longest wait for a slot (also capped by the deadline)
+LIMITER_MAX_QUEUE = 32  # callers waiting beyond this are rejected outright
+
+# Hedged requests: fire the hedge after the primary's recent p90 latency
+HEDGE_QUANTILE = 0.9
+HEDGE_MIN_SAMPLES = 20  # below this, use HEDGE_DEFAULT_DELAY_S
+HEDGE_DEFAULT_DELAY_S = 3.0
+HEDGE_MIN_DELAY_S = 0.5
+_LATENCY_WINDOW = 200
+_latencies: dict[str, deque] = {}  # model -> recent successful attempt latencies (s)
+_hedge_stats: dict[str, dict] = {}
+_hedge_lock = threading.Lock()
+_hedge_executor: ThreadPoolExecutor | None = None
+
+# Shortest prompt prefix the API will cache, in tokens (shorter breakpoints are ignored)
+MIN_CACHEABLE_TOKENS = {"haiku": 2048}
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+
+# Per-model token counters from response.usage (cache hit ratio, cost tracking)
+_USAGE_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+_usage_totals: dict[str, dict[str, int]] = {}
+
+# Shared clients (connection pools reused across requests)
+_client = None
+_client_key: tuple | None = None
+_client_lock = threading.Lock()
+# AsyncAnthropic's connection pool is bound to the event loop that opened it: one client per loop
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# warm_up(): skip when a request went through a shared client (sync or async) this recently (s)
+WARM_IDLE_S = 30.0
+WARM_TIMEOUT_S = 3.0
+_last_used = 0.0
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with equal jitter for retry number `attempt` (0-based)."""
+    cap = min(RETRY_MAX_DELAY_S, RETRY_DELAY_S * (2 ** attempt))
+    return cap / 2 + random.uniform(0, cap / 2)
+
+
+def _attempt_timeout(deadline: float | None) -> float | None:
+    """Timeout for the next attempt, or None if the budget is too small to try."""
+    left = remaining_s(deadline)
+    if left is None:
+        return REQUEST_TIMEOUT_S
+    if left < MIN_ATTEMPT_S:
+        return None
+    return min(REQUEST_TIMEOUT_S, left)
+
+
+class LimiterSlot:
+    """One acquired limiter slot; release() is idempotent, so it may be freed early from another thread."""
+
+    def __init__(self, limiter: "AdaptiveLimiter"):
+        self._limiter = limiter
+        self._lock = threading.Lock()
+        self._held = True
+
+    def release(self, outcome: str, latency_s: float | None = None) -> bool:
+        """Release the slot; False when it was already released."""
+        with self._lock:
+            if not self._held:
+                return False
+            self._held = False
+        self._limiter.release(outcome, latency_s)
+        return True
+
+
+class AdaptiveLimiter:
+    """
+    AIMD in-flight limit for one model, shared by threads and event loops.
+    acquire / acquire_async wait up to a timeout for a slot (False = no slot);
+    every acquired slot must be released with the call's outcome.
+    """
+
+    def __init__(self, initial: float = LIMITER_INITIAL):
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.queued = 0
+        self._latency_avg: float | None = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < max(LIMITER_MIN, int(self.limit))
+
+    def acquire(self, timeout: float) -> bool:
+        with self._cond:
+            if self._has_slot():
+                self.in_flight += 1
+                return True
+            if self.queued >= LIMITER_MAX_QUEUE or timeout <= 0:
+                return False
+            self.queued += 1
+            try:
+                if not self._cond.wait_for(self._has_slot, timeout):
+                    return False
+                self.in_flight += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    async def acquire_async(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        wait_until = time.monotonic() + timeout
+        with self._cond:
+            if self._has_slot():
+                self.in_flight += 1
+                return True
+            if self.queued >= LIMITER_MAX_QUEUE or timeout <= 0:
+                return False
+            self.queued += 1
+        try:
+            while True:
+                event = asyncio.Event()
+                waiter = (loop, event)
+                with self._cond:
+                    if self._has_slot():
+                        self.in_flight += 1
+                        return True
+                    self._async_waiters.append(waiter)
+                left = wait_until - time.monotonic()
+                try:
+                    if left <= 0:
+                        return False
+                    await asyncio.wait_for(event.wait(), left)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._cond:
+                        if waiter in self._async_waiters:
+                            self._async_waiters.remove(waiter)
+        finally:
+            with self._cond:
+                self.queued -= 1
+
+    def release(self, outcome: str, latency_s: float | None = None) -> None:
+        """outcome: "ok" | "rate_limited" | "overloaded" | "timeout" | "error" (no signal)."""
+        with self._cond:
+            self.in_flight -= 1
+            self._adjust(outcome, latency_s)
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _adjust(self, outcome: str, latency_s: float | None) -> None:
+        if outcome == "ok":
+            inflated = (
+                latency_s is not None
+                and self._latency_avg is not None
+                and latency_s > LIMITER_LATENCY_FACTOR * self._latency_avg
+            )
+            if latency_s is not None:
+                self._latency_avg = latency_s if self._latency_avg is None else 0.9 * self._latency_avg + 0.1 * latency_s
+            if not inflated:
+                self.limit = min(LIMITER_MAX, self.limit + 1 / self.limit)
+        elif outcome in ("rate_limited", "overloaded", "timeout"):
+            now = time.monotonic()
+            if now - self._last_decrease >= LIMITER_DECREASE_INTERVAL_S:
+                self.limit = max(LIMITER_MIN, self.limit * LIMITER_BACKOFF)
+                self._last_decrease = now
+
+    def state(self) -> dict:
+        with self._cond:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "queued": self.queued}
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter(model: str) -> AdaptiveLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limiter = _limiters[model] = AdaptiveLimiter()
+        return limiter
+
+
+def limiter_state(model: str) -> dict:
+    """Current concurrency limit, in-flight calls and queue depth for a model."""
+    return {"model": model, **_limiter(model).state()}
+
+
+def limiter_states() -> dict[str, dict]:
+    with _limiters_lock:
+        models = list(_limiters)
+    return {model: limiter_state(model) for model in models}
+
+
+def _queue_timeout(deadline: float | None) -> float:
+    """How long a call may wait for a slot: the queue bound, minus what the attempt itself needs."""
+    left = remaining_s(deadline)
+    if left is None:
+        return LIMITER_QUEUE_TIMEOUT_S
+    return max(0.0, min(LIMITER_QUEUE_TIMEOUT_S, left - MIN_ATTEMPT_S))
+
+
+def _failure_outcome(e: Exception) -> str:
+    """Limiter signal for a failed call: provider pushback vs unrelated errors."""
+    status = getattr(e, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status in (503, 529):
+        return "overloaded"
+    return "error"
+
+
+def circuit_open(model: str) -> bool:
+    """True while the model's breaker is open (calls should fail over, not retry)."""
+    state = _breakers.get(model)
+    if not state or state["opened_at"] is None:
+        return False
+    if time.monotonic() - state["opened_at"] >= BREAKER_COOLDOWN_S:
+        # Half-open: let the next call probe; one more failure re-opens it
+        return False
+    return True
+
+
+def circuit_state(model: str) -> dict:
+    """Breaker snapshot for health/debug output."""
+    state = _breakers.get(model) or {"failures": 0, "opened_at": None}
+    return {"model": model, "open": circuit_open(model), "failures": state["failures"]}
+
+
+def _record_success(model: str) -> None:
+    _breakers.pop(model, None)
+
+
+def _record_failure(model: str) -> None:
+    state = _breakers.setdefault(model, {"failures": 0, "opened_at": None})
+    state["failures"] += 1
+    if state["failures"] >= BREAKER_FAILURE_THRESHOLD:
+        if state["opened_at"] is None or not circuit_open(model):
+            logger.warning("Circuit opened for %s after %d failures", model, state["failures"])
+        state["opened_at"] = time.monotonic()
+
+
+def _is_transient(e: Exception) -> bool:
+    """5xx / overloaded responses are retryable; other API errors are not."""
+    status = getattr(e, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+def _retry_delay(attempt: int, model: str, deadline: float | None, outcome: str = "error") -> float | None:
+    """
+    After a transient failure: record it and return how long to sleep before the
+    next attempt, or None to stop (retries exhausted, breaker open, no budget).
+    A 429 is retried but not counted toward the breaker: the model is healthy,
+    the account is over its rate limit (the limiter backs off instead).
+    """
+    if outcome != "rate_limited":
+        _record_failure(model)
+    if attempt >= MAX_RETRIES or circuit_open(model):
+        return None
+    delay = backoff_delay(attempt)
+    left = remaining_s(deadline)
+    if left is not None and left - delay < MIN_ATTEMPT_S:
+        return None
+    return delay
+
+
+def _log_failure(attempts: int, last_error: Exception | None) -> None:
+    if attempts:
+        logger.error("Claude API failed after %d attempt(s): %s", attempts, last_error)
+    else:
+        logger.error("Claude API not called: %s", last_error)
+
+
+def is_placeholder(text: str) -> bool:
+    """True for the stand-in text returned when no API key / SDK is available."""
+    return text.startswith("[LLM ")
+
+
+def _placeholder(model: str, input_text: str) -> str:
+    return f"[LLM placeholder — set ANTHROPIC_API_KEY to call {model}]\n\nInput length: {len(input_text)} chars."
+
+
+def _client_settings() -> tuple[str | None, str | None]:
+    """
+    (api_key, base_url) from env. A custom ANTHROPIC_BASE_URL (local fake backend)
+    works without a real key; with neither set, callers return the placeholder.
+    """
+    base_url = os.environ.get("ANTHROPIC_BASE_URL") or None
+    api_key = os.environ.get("ANTHROPIC_API_KEY") or ("local-fake" if base_url else None)
+    return api_key, base_url
+
+
+def min_cacheable_tokens(model: str) -> int:
+    for family, tokens in MIN_CACHEABLE_TOKENS.items():
+        if family in model:
+            return tokens
+    return DEFAULT_MIN_CACHEABLE_TOKENS
+
+
+@functools.lru_cache(maxsize=256)
+def _prefix_tokens(cache_prefix: str) -> int:
+    return estimate_tokens(cache_prefix)
+
+
+def _system_blocks(system_prompt: str, cache_prefix: str | None, model: str | None = None) -> str | list[dict]:
+    """
+    Split the system prompt at the end of its static prefix and mark the prefix
+    with a cache breakpoint. Falls back to the plain string when no usable prefix,
+    or when the prefix is shorter than `model`'s minimum cacheable length.
+    """
+    if not cache_prefix or not system_prompt.startswith(cache_prefix):
+        return system_prompt
+    if model and _prefix_tokens(cache_prefix) < min_cacheable_tokens(model):
+        return system_prompt
+    blocks = [{"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}}]
+    suffix = system_prompt[len(cache_prefix):].strip()
+    if suffix:
+        blocks.append({"type": "text", "text": suffix})
+    return blocks
+
+
+def _request_kwargs(
+    system_prompt: str,
+    input_text: str,
+    model: str,
+    max_tokens: int,
+    cache_prefix: str | None = None,
+    stop_sequences: list[str] | None = None,
+) -> dict:
+    """Messages API arguments shared by the sync and async clients."""
+    kwargs = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": _system_blocks(system_prompt, cache_prefix, model),
+        "messages": [{"role": "user", "content": USER_MESSAGE_TEMPLATE.format(input_text=input_text)}],
+    }
+    if stop_sequences:
+        kwargs["stop_sequences"] = stop_sequences
+    return kwargs
+
+
+def _response_text(response) -> str:
+    text = response.content[0].text if response.content else ""
+    return text.strip()
+
+
+def record_usage(model: str, response, sink: list | None = None) -> dict:
+    """
+    Accumulate response.usage for the model and return this call's usage record
+    (token counts, cost_usd, stop_reason); the record is also appended to `sink` if given.
+    """
+    usage = getattr(response, "usage", None)
+    counts = {}
+    for field in _USAGE_FIELDS:
+        value = getattr(usage, field, 0) if usage is not None else 0
+        counts[field] = value if isinstance(value, int) else 0
+    totals = _usage_totals.setdefault(model, {f: 0 for f in _USAGE_FIELDS + ("calls",)})
+    for field, value in counts.items():
+        totals[field] += value
+    totals["calls"] += 1
+    logger.debug(
+        "Claude usage %s: input=%d cache_read=%d cache_write=%d output=%d",
+        model, counts["input_tokens"], counts["cache_read_input_tokens"],
+        counts["cache_creation_input_tokens"], counts["output_tokens"],
+    )
+    record = usage_module.call_record(model, counts)
+    stop_reason = getattr(response, "stop_reason", None)
+    record["stop_reason"] = stop_reason if isinstance(stop_reason, str) else None
+    if sink is not None:
+        sink.append(record)
+    return record
+
+
+def usage_totals() -> dict[str, dict[str, int]]:
+    """Per-model token totals since process start (cached vs uncached input, output, calls)."""
+    return {model: dict(totals) for model, totals in _usage_totals.items()}
 
 
 def call_claude(
@@ -23,48 +463,425 @@ def call_claude(
     input_text: str,
     model: str = "claude-sonnet-4-20250514",
     max_tokens: int = 1024,
+    deadline: float | None = None,
+    cache_prefix: str | None = None,
+    usage_sink: list | None = None,
+    stop_sequences: list[str] | None = None,
+    cancelled: Callable[[], bool] | None = None,
+    slot_sink: list | None = None,
 ) -> str:
     """
     Call Claude API with timeout and retry.
     Returns the rewritten text only.
+    deadline: time.monotonic() value the call must finish by (None = retry budget only).
+    cache_prefix: static leading part of system_prompt to mark for prompt caching.
+    usage_sink: list that receives this call's usage record (tokens, cost_usd, stop_reason;
+    stop_reason "max_tokens" means the text was truncated).
+    stop_sequences: strings that end generation early (not included in the text).
+    cancelled: checked before every attempt; True stops the call (an attempt
+    already sent can't be interrupted on the sync client).
+    slot_sink: list that receives each attempt's LimiterSlot (call_claude_hedged
+    frees a losing call's slot when the winner returns).
+    Raises RuntimeError on failure, immediately if the model's circuit is open.
     """
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    api_key, base_url = _client_settings()
     if not api_key:
-        return f"[LLM placeholder — set ANTHROPIC_API_KEY to call {model}]\n\nInput length: {len(input_text)} chars."
+        return _placeholder(model, input_text)
+    if circuit_open(model):
+        raise RuntimeError(f"LLM call failed: circuit open for {model}")
 
     try:
         from anthropic import Anthropic, APITimeoutError, APIConnectionError, RateLimitError
     except ImportError:
         return "[LLM unavailable — install anthropic package]"
 
-    client = Anthropic(api_key=api_key, timeout=REQUEST_TIMEOUT_S)
-    user_message = USER_MESSAGE_TEMPLATE.format(input_text=input_text)
+    client = _get_client(Anthropic, api_key, base_url)
+    kwargs = _request_kwargs(system_prompt, input_text, model, max_tokens, cache_prefix, stop_sequences)
 
-    last_error = None
+    last_error: Exception | None = None
+    attempts = 0
     for attempt in range(MAX_RETRIES + 1):
+        if cancelled is not None and cancelled():
+            raise RuntimeError("LLM call cancelled")
+        timeout = _attempt_timeout(deadline)
+        if timeout is None:
+            last_error = last_error or TimeoutError("request deadline exceeded")
+            break
+        attempts += 1
+        limiter = _limiter(model)
+        if not limiter.acquire(_queue_timeout(deadline)):
+            raise RuntimeError(f"LLM call failed: concurrency limit reached for {model}")
+        slot = LimiterSlot(limiter)
+        if slot_sink is not None:
+            slot_sink.append(slot)
+        started = time.monotonic()
+        outcome = "error"
         try:
-            response = client.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                system=system_prompt,
-                messages=[{"role": "user", "content": user_message}],
-            )
-            text = response.content[0].text if response.content else ""
-            return text.strip()
+            response = client.messages.create(**kwargs, timeout=timeout)
+            outcome = "ok"
+            _mark_used()
+            _record_success(model)
+            _record_latency(model, time.monotonic() - started)
+            record_usage(model, response, usage_sink)
+            return _response_text(response)
         except RateLimitError as e:
             logger.warning("Claude rate limited (attempt %d): %s", attempt + 1, e)
+            outcome = "rate_limited"
             last_error = e
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_DELAY_S * (attempt + 1))
         except (APITimeoutError, APIConnectionError) as e:
             logger.warning("Claude connection error (attempt %d): %s", attempt + 1, e)
+            outcome = "timeout" if isinstance(e, APITimeoutError) else "error"
             last_error = e
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_DELAY_S)
         except Exception as e:
-            logger.error("Claude API error: %s", e)
             last_error = e
+            outcome = _failure_outcome(e)
+            if not _is_transient(e):
+                logger.error("Claude API error: %s", e)
+                break
+            logger.warning("Claude server error (attempt %d): %s", attempt + 1, e)
+        finally:
+            slot.release(outcome, time.monotonic() - started)
+        delay = _retry_delay(attempt, model, deadline, outcome)
+        if delay is None:
             break
+        time.sleep(delay)
 
-    logger.error("Claude API failed after %d attempts: %s", MAX_RETRIES + 1, last_error)
+    _log_failure(attempts, last_error)
     raise RuntimeError(f"LLM call failed: {last_error}")
+
+
+def _get_client(anthropic_cls, api_key: str, base_url: str | None = None):
+    """
+    Lazy-init the shared sync client, so calls reuse its open connections
+    (re-created if the SDK class, key or endpoint changes).
+    """
+    global _client, _client_key
+    key = (anthropic_cls, api_key, base_url)
+    with _client_lock:
+        if _client is None or _client_key != key:
+            _client = anthropic_cls(api_key=api_key, base_url=base_url, timeout=REQUEST_TIMEOUT_S, max_retries=0)
+            _client_key = key
+        return _client
+
+
+def shared_client():
+    """
+    The shared sync client for callers outside call_claude (background scoring),
+    honouring ANTHROPIC_BASE_URL; None without a key or the SDK. It has no SDK
+    retries, and callers pass their own per-request timeout.
+    """
+    api_key, base_url = _client_settings()
+    if not api_key:
+        return None
+    try:
+        from anthropic import Anthropic
+    except ImportError:
+        return None
+    return _get_client(Anthropic, api_key, base_url)
+
+
+def _mark_used() -> None:
+    global _last_used
+    _last_used = time.monotonic()
+
+
+def warm_up() -> bool:
+    """
+    Create the shared client and open a connection to the API ahead of a
+    request's first model call (one models.list request), unless the client
+    was used within WARM_IDLE_S. Meant to run while auth / quota are in flight;
+    failures are ignored. True when a warm-up request was made.
+    """
+    api_key, base_url = _client_settings()
+    if not api_key or time.monotonic() - _last_used < WARM_IDLE_S:
+        return False
+    try:
+        from anthropic import Anthropic
+
+        _mark_used()
+        _get_client(Anthropic, api_key, base_url).with_options(timeout=WARM_TIMEOUT_S).models.list(limit=1)
+        return True
+    except Exception as e:
+        logger.debug("LLM warm-up failed: %s", e)
+        return False
+
+
+def _get_async_client(api_key: str, base_url: str | None = None):
+    """Lazy-init the running loop's AsyncAnthropic client (re-created if the key or endpoint changes)."""
+    loop = asyncio.get_running_loop()
+    cached = _async_clients.get(loop)
+    if cached is not None and cached[0] == (api_key, base_url):
+        return cached[1]
+    from anthropic import AsyncAnthropic
+
+    client = AsyncAnthropic(
+        api_key=api_key, base_url=base_url, timeout=REQUEST_TIMEOUT_S, max_retries=0
+    )
+    _async_clients[loop] = ((api_key, base_url), client)
+    return client
+
+
+async def call_claude_async(
+    system_prompt: str,
+    input_text: str,
+    model: str = "claude-sonnet-4-20250514",
+    max_tokens: int = 1024,
+    deadline: float | None = None,
+    cache_prefix: str | None = None,
+    usage_sink: list | None = None,
+    stop_sequences: list[str] | None = None,
+    cancelled: Callable[[], bool] | None = None,
+) -> str:
+    """
+    Async variant of call_claude: same request, retry policy and errors,
+    but never blocks the event loop.
+    """
+    api_key, base_url = _client_settings()
+    if not api_key:
+        return _placeholder(model, input_text)
+    if circuit_open(model):
+        raise RuntimeError(f"LLM call failed: circuit open for {model}")
+
+    try:
+        from anthropic import APITimeoutError, APIConnectionError, RateLimitError
+        client = _get_async_client(api_key, base_url)
+    except ImportError:
+        return "[LLM unavailable — install anthropic package]"
+
+    kwargs = _request_kwargs(system_prompt, input_text, model, max_tokens, cache_prefix, stop_sequences)
+
+    last_error: Exception | None = None
+    attempts = 0
+    for attempt in range(MAX_RETRIES + 1):
+        if cancelled is not None and cancelled():
+            raise RuntimeError("LLM call cancelled")
+        timeout = _attempt_timeout(deadline)
+        if timeout is None:
+            last_error = last_error or TimeoutError("request deadline exceeded")
+            break
+        attempts += 1
+        limiter = _limiter(model)
+        if not await limiter.acquire_async(_queue_timeout(deadline)):
+            raise RuntimeError(f"LLM call failed: concurrency limit reached for {model}")
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            response = await client.messages.create(**kwargs, timeout=timeout)
+            outcome = "ok"
+            _mark_used()
+            _record_success(model)
+            _record_latency(model, time.monotonic() - started)
+            record_usage(model, response, usage_sink)
+            return _response_text(response)
+        except RateLimitError as e:
+            logger.warning("Claude rate limited (attempt %d): %s", attempt + 1, e)
+            outcome = "rate_limited"
+            last_error = e
+        except (APITimeoutError, APIConnectionError) as e:
+            logger.warning("Claude connection error (attempt %d): %s", attempt + 1, e)
+            outcome = "timeout" if isinstance(e, APITimeoutError) else "error"
+            last_error = e
+        except Exception as e:
+            last_error = e
+            outcome = _failure_outcome(e)
+            if not _is_transient(e):
+                logger.error("Claude API error: %s", e)
+                break
+            logger.warning("Claude server error (attempt %d): %s", attempt + 1, e)
+        finally:
+            limiter.release(outcome, time.monotonic() - started)
+        delay = _retry_delay(attempt, model, deadline, outcome)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+
+    _log_failure(attempts, last_error)
+    raise RuntimeError(f"LLM call failed: {last_error}")
+
+
+def _record_latency(model: str, seconds: float) -> None:
+    with _hedge_lock:
+        _latencies.setdefault(model, deque(maxlen=_LATENCY_WINDOW)).append(seconds)
+
+
+def _quantile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def hedge_delay_s(model: str) -> float:
+    """How long to wait on the primary before hedging: its recent p90 latency."""
+    with _hedge_lock:
+        samples = list(_latencies.get(model, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_S
+    return max(HEDGE_MIN_DELAY_S, _quantile(samples, HEDGE_QUANTILE))
+
+
+def _hedge_record(model: str, field: str, value=1) -> None:
+    with _hedge_lock:
+        stats = _hedge_stats.setdefault(model, {
+            "calls": 0, "hedged": 0, "hedge_wins": 0, "wasted_calls": 0,
+            "served_s": deque(maxlen=_LATENCY_WINDOW * 5), "primary_s": deque(maxlen=_LATENCY_WINDOW * 5),
+        })
+        if field in ("served_s", "primary_s"):
+            stats[field].append(value)
+        else:
+            stats[field] += value
+
+
+def hedge_stats() -> dict[str, dict]:
+    """
+    Per primary model: hedge_rate, hedge_wins, and p99 of served latency vs the
+    primary alone (cancelled primaries count with their elapsed time, a lower bound).
+    """
+    with _hedge_lock:
+        snapshot = {m: {**s, "served_s": list(s["served_s"]), "primary_s": list(s["primary_s"])}
+                    for m, s in _hedge_stats.items()}
+    result = {}
+    for model, s in snapshot.items():
+        p99_served = _quantile(s["served_s"], 0.99) * 1000 if s["served_s"] else None
+        p99_primary = _quantile(s["primary_s"], 0.99) * 1000 if s["primary_s"] else None
+        result[model] = {
+            "calls": s["calls"],
+            "hedged": s["hedged"],
+            "hedge_rate": round(s["hedged"] / s["calls"], 4) if s["calls"] else 0.0,
+            "hedge_wins": s["hedge_wins"],
+            "wasted_calls": s["wasted_calls"],
+            "p99_served_ms": round(p99_served) if p99_served is not None else None,
+            "p99_primary_ms": round(p99_primary) if p99_primary is not None else None,
+            "p99_improvement_ms": (
+                round(p99_primary - p99_served) if p99_served is not None and p99_primary is not None else None
+            ),
+        }
+    return result
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        _hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="loma-hedge")
+    return _hedge_executor
+
+
+def call_claude_hedged(
+    system_prompt: str,
+    input_text: str,
+    model: str = "claude-sonnet-4-20250514",
+    hedge_model: str | None = None,
+    **kwargs,
+) -> dict:
+    """
+    call_claude with a hedge: if `model` hasn't answered within hedge_delay_s(model),
+    send the same request to `hedge_model` (None = duplicate on `model`).
+    Returns {"text", "model", "hedged": bool, "winner": "primary" | "hedge"}.
+    Raises RuntimeError only if every request sent failed.
+    """
+    hedge_model = hedge_model or model
+    executor = _get_hedge_executor()
+    started = time.monotonic()
+    _hedge_record(model, "calls")
+    outer_cancelled = kwargs.pop("cancelled", None)
+    runs: dict = {}  # future -> (stop event, slot_sink)
+
+    def _run(m: str, stop: threading.Event, slots: list) -> str:
+        text = call_claude(
+            system_prompt, input_text, model=m, slot_sink=slots,
+            cancelled=lambda: stop.is_set() or (outer_cancelled is not None and outer_cancelled()),
+            **kwargs,
+        )
+        if not text:
+            raise RuntimeError(f"LLM call failed: empty response from {m}")
+        return text
+
+    def _submit(m: str):
+        stop, slots = threading.Event(), []
+        future = executor.submit(_run, m, stop, slots)
+        runs[future] = (stop, slots)
+        return future
+
+    primary = _submit(model)
+    primary.add_done_callback(lambda f: _hedge_record(model, "primary_s", time.monotonic() - started))
+    pending = {primary: ("primary", model)}
+    done, _ = wait([primary], timeout=hedge_delay_s(model))
+    hedged = not done
+    if hedged:
+        _hedge_record(model, "hedged")
+        pending[_submit(hedge_model)] = ("hedge", hedge_model)
+
+    last_error: Exception | None = None
+    while pending:
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            role, served_model = pending.pop(future)
+            try:
+                text = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            for other in pending:
+                if other.cancel():  # not started yet → dropped
+                    continue
+                # Running: no further attempts, and its limiter slot is freed now. The
+                # request already sent can't be interrupted — it is billed (wasted_calls).
+                stop, slots = runs[other]
+                stop.set()
+                if slots and slots[-1].release("error"):
+                    _hedge_record(model, "wasted_calls")
+            _hedge_record(model, "served_s", time.monotonic() - started)
+            if role == "hedge":
+                _hedge_record(model, "hedge_wins")
+            return {"text": text, "model": served_model, "hedged": hedged, "winner": role}
+    raise last_error if isinstance(last_error, RuntimeError) else RuntimeError(f"LLM call failed: {last_error}")
+
+
+async def call_claude_hedged_async(
+    system_prompt: str,
+    input_text: str,
+    model: str = "claude-sonnet-4-20250514",
+    hedge_model: str | None = None,
+    **kwargs,
+) -> dict:
+    """Async call_claude_hedged: the losing request is cancelled (its HTTP call is aborted)."""
+    hedge_model = hedge_model or model
+    started = time.monotonic()
+    _hedge_record(model, "calls")
+
+    async def _run(m: str) -> str:
+        text = await call_claude_async(system_prompt, input_text, model=m, **kwargs)
+        if not text:
+            raise RuntimeError(f"LLM call failed: empty response from {m}")
+        return text
+
+    primary = asyncio.create_task(_run(model))
+    pending = {primary: ("primary", model)}
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay_s(model))
+    hedged = not done
+    if hedged:
+        _hedge_record(model, "hedged")
+        pending[asyncio.create_task(_run(hedge_model))] = ("hedge", hedge_model)
+
+    last_error: Exception | None = None
+    try:
+        while pending:
+            done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                role, served_model = pending.pop(task)
+                if role == "primary":
+                    _hedge_record(model, "primary_s", time.monotonic() - started)
+                try:
+                    text = task.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                _hedge_record(model, "served_s", time.monotonic() - started)
+                if role == "hedge":
+                    _hedge_record(model, "hedge_wins")
+                return {"text": text, "model": served_model, "hedged": hedged, "winner": role}
+    finally:
+        for task, (role, _) in pending.items():
+            task.cancel()
+            if role == "primary":
+                # Cancelled primary: its latency is at least what has elapsed
+                _hedge_record(model, "primary_s", time.monotonic() - started)
+    raise last_error if isinstance(last_error, RuntimeError) else RuntimeError(f"LLM call failed: {last_error}")
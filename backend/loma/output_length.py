@@ -0,0 +1,238 @@
+"""
+Output-length prediction — per-request max_tokens, stop sequences and
+predicted generation latency.
+
+Rewrite length tracks input length: the output/input token ratio depends
+mostly on intent and output_language (a Vietnamese draft rewritten as
+English usually takes fewer tokens; công văn output is longer). predict()
+estimates input tokens (Vietnamese syllables with diacritics split into more
+tokens than English words), applies the p50 ratio for the expected length
+and the p99 ratio plus headroom for max_tokens. Ratios and the per-tier
+latency model (base ms + ms per output token) come from a profile compiled
+from stored rewrites (run_calibrate_output.py, OUTPUT_LENGTH_PROFILE_PATH);
+conservative defaults apply without one.
+
+A response that stops on max_tokens is truncated: the pipeline retries it
+once with a larger budget and reports it otherwise.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import re
+import threading
+import time
+
+import config
+
+logger = logging.getLogger("loma.output_length")
+
+PROFILE_VERSION = 1
+
+# Fixed allowance for greeting / sign-off lines the rewrite may add
+BASE_TOKENS = 48
+HEADROOM = 1.25
+MIN_MAX_TOKENS = 128
+MAX_MAX_TOKENS = 4096
+# The fixed budget used before prediction (and when DYNAMIC_MAX_TOKENS is off)
+LEGACY_MAX_TOKENS = 1024
+
+# Output/input token ratios (p50, p99) per output_language when uncalibrated
+DEFAULT_RATIOS = {
+    "en": (0.9, 1.8),
+    "vi_casual": (1.0, 1.8),
+    "vi_formal": (1.1, 2.0),
+    "vi_admin": (1.3, 2.5),
+}
+_FALLBACK_RATIO = (1.0, 2.0)
+# (base ms, ms per output token) per tier when uncalibrated
+DEFAULT_LATENCY = {"haiku": (400.0, 8.0), "sonnet": (900.0, 16.0), "rules": (5.0, 0.0)}
+# Min rewrites behind an (intent, output_language) ratio before it replaces the language ratio
+MIN_CALIBRATION_SAMPLES = 30
+
+# Trailing commentary starts here; everything before it is the rewrite
+STOP_SEQUENCES = ["\n\nNote:", "\n\nExplanation:", "\n\nChanges made:"]
+
+_TOKEN_UNITS = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+_profile: dict | None = None
+_profile_init = False
+_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough Claude token count: ASCII words ~1 token per 6 chars, Vietnamese
+    syllables with diacritics ~2-3 tokens, punctuation 1 each.
+    """
+    total = 0
+    for unit in _TOKEN_UNITS.findall(text or ""):
+        if not unit[0].isalnum() and unit[0] != "_":
+            total += 1
+        elif unit.isascii():
+            total += 1 + len(unit) // 6
+        else:
+            total += 2 + len(unit) // 4
+    return total
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(pct / 100 * len(ordered))) - 1)] if ordered else 0.0
+
+
+def _output_text(row: dict) -> str | None:
+    """The stored output, or one of the same length rebuilt from scores.length_reduction_pct."""
+    if row.get("output_text"):
+        return row["output_text"]
+    scores = row.get("scores") or {}
+    if isinstance(scores, str):
+        try:
+            scores = json.loads(scores)
+        except json.JSONDecodeError:
+            return None
+    pct = scores.get("length_reduction_pct") if isinstance(scores, dict) else None
+    if pct is None:
+        return None
+    text = row.get("input_text") or ""
+    return text[: max(0, round(len(text) * (1 - pct / 100)))]
+
+
+def _fit_latency(points: list[tuple[int, float]]) -> tuple[float, float] | None:
+    """Least-squares response_ms = base + per_token × output_tokens (slope clamped at 0)."""
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return round(mean_y, 1), 0.0
+    slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x)
+    return round(mean_y - slope * mean_x, 1), round(slope, 3)
+
+
+def calibrate(rows) -> dict:
+    """
+    Profile from stored rewrites (input_text, output_text or scores,
+    detected_intent, output_language, routing_tier, response_time_ms):
+    p50/p99 output/input token ratios per (intent, output_language) and per
+    output_language, and a latency fit per LLM tier.
+    """
+    by_cell: dict[str, list[float]] = {}
+    by_language: dict[str, list[float]] = {}
+    latency_points: dict[str, list[tuple[int, float]]] = {}
+    for row in rows:
+        tier = row.get("routing_tier")
+        if tier not in ("haiku", "sonnet"):
+            continue
+        output = _output_text(row)
+        input_tokens = estimate_tokens(row.get("input_text") or "")
+        if output is None or not input_tokens:
+            continue
+        output_tokens = estimate_tokens(output)
+        language = row.get("output_language") or "en"
+        ratio = output_tokens / input_tokens
+        by_cell.setdefault(f"{row.get('detected_intent') or 'general'}|{language}", []).append(ratio)
+        by_language.setdefault(language, []).append(ratio)
+        if row.get("response_time_ms"):
+            latency_points.setdefault(tier, []).append((output_tokens, float(row["response_time_ms"])))
+
+    def _ratios(groups: dict[str, list[float]], min_samples: int) -> dict[str, list]:
+        return {
+            key: [len(v), round(_percentile(v, 50), 3), round(_percentile(v, 99), 3)]
+            for key, v in sorted(groups.items())
+            if len(v) >= min_samples
+        }
+
+    latency = {}
+    for tier, points in latency_points.items():
+        fit = _fit_latency(points)
+        if fit is not None:
+            latency[tier] = list(fit)
+    return {
+        "version": PROFILE_VERSION,
+        "generated_at": int(time.time()),
+        "ratios": _ratios(by_cell, MIN_CALIBRATION_SAMPLES),
+        "languages": _ratios(by_language, 1),
+        "latency": latency,
+    }
+
+
+def load(path: str) -> dict | None:
+    """Read a calibration profile; None (logged) when missing or incompatible."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        logger.warning("Output-length profile %s not found — using default ratios", path)
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error("Failed to load output-length profile %s: %s", path, e)
+        return None
+    if profile.get("version") != PROFILE_VERSION:
+        logger.error("Output-length profile %s has version %s, expected %d", path, profile.get("version"), PROFILE_VERSION)
+        return None
+    return profile
+
+
+def _get_profile() -> dict | None:
+    global _profile, _profile_init
+    if _profile_init:
+        return _profile
+    with _lock:
+        if not _profile_init:
+            _profile = load(config.OUTPUT_LENGTH_PROFILE_PATH) if config.OUTPUT_LENGTH_PROFILE_PATH else None
+            _profile_init = True
+    return _profile
+
+
+def set_profile(profile: dict | None) -> None:
+    """Install a calibration profile explicitly (tests, hot reload). None restores the defaults."""
+    global _profile, _profile_init
+    _profile = profile
+    _profile_init = True
+
+
+def _ratio(intent: str, output_language: str | None) -> tuple[float, float]:
+    language = output_language or "en"
+    profile = _get_profile()
+    if profile:
+        for table, key in ((profile["ratios"], f"{intent}|{language}"), (profile["languages"], language)):
+            entry = table.get(key)
+            if entry:
+                return entry[1], entry[2]
+    return DEFAULT_RATIOS.get(language, _FALLBACK_RATIO)
+
+
+def predict(input_text: str, intent: str, output_language: str | None) -> dict:
+    """{"input_tokens", "expected_tokens", "max_tokens"} for one rewrite."""
+    input_tokens = estimate_tokens(input_text)
+    p50, p99 = _ratio(intent, output_language)
+    expected = math.ceil(BASE_TOKENS / 2 + p50 * input_tokens)
+    if config.DYNAMIC_MAX_TOKENS:
+        max_tokens = math.ceil((BASE_TOKENS + p99 * input_tokens) * HEADROOM)
+        max_tokens = min(MAX_MAX_TOKENS, max(MIN_MAX_TOKENS, max_tokens))
+    else:
+        max_tokens = LEGACY_MAX_TOKENS
+    return {"input_tokens": input_tokens, "expected_tokens": expected, "max_tokens": max_tokens}
+
+
+def extended_max_tokens(max_tokens: int) -> int | None:
+    """Budget for the retry of a truncated response; None when already at the ceiling."""
+    if max_tokens >= MAX_MAX_TOKENS:
+        return None
+    return min(MAX_MAX_TOKENS, max_tokens * 2)
+
+
+def predict_latency_ms(tier: str, expected_tokens: int) -> int:
+    """Predicted generation time of expected_tokens on a tier (calibrated fit or defaults)."""
+    profile = _get_profile()
+    fit = (profile or {}).get("latency", {}).get(tier) or DEFAULT_LATENCY.get(tier, DEFAULT_LATENCY["sonnet"])
+    return int(fit[0] + fit[1] * expected_tokens)
+
+
+def predict_rewrite_latency_ms(tier: str, input_text: str, intent: str, output_language: str | None) -> int:
+    """predict_latency_ms for a request not yet sent — for routing decisions."""
+    return predict_latency_ms(tier, predict(input_text, intent, output_language)["expected_tokens"])
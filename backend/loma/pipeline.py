@@ -1,25 +1,44 @@
 """
 Rewrite pipeline: language → intent → route → rules or LLM → quality score.
 Single entry: run_rewrite(input_text, platform, tone, language_mix?, intent?).
+run_rewrite_async shares every CPU stage and only awaits the LLM call.
 """
 from __future__ import annotations
 
+import asyncio
+import logging
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
+import config
 from . import intent as intent_module
-from . import language, quality, router, rules_engine
+from . import tone_variants as tone_variants_module
+from . import (
+    chunking, deadlines, fingerprint, llm, output_length, rewrite_cache, router, rules_engine, timing, usage,
+)
 from .intent import compute_intent_scores
 from .language import compute_language_mix
-from .llm import call_claude
-from .prompt_assembly import build_system_prompt
-from .quality import extract_entities, score_rewrite
+from .entity_mask import mask_entities, restore_entities
+from .llm import call_claude, call_claude_async, call_claude_hedged, call_claude_hedged_async
+from .prompt_assembly import build_system_prompt_parts
+from .quality import check_output, is_translatable, repair_entities, scan_entities, score_rewrite, strip_honorific
 from .router import route_rewrite
 
+logger = logging.getLogger("loma.pipeline")
+
 # Model IDs (adjust to latest if needed)
 HAIKU_MODEL = "claude-3-5-haiku-20241022"
 SONNET_MODEL = "claude-sonnet-4-20250514"
 
+# Share of the request deadline kept back from Sonnet so a Haiku fail-over can still run
+FALLBACK_RESERVE_S = 6.0
+
+
+class RewriteCancelled(RuntimeError):
+    """The caller's gate refused the model call (e.g. quota denied)."""
+
 
 def run_rewrite(
     input_text: str,
@@ -29,23 +48,409 @@ def run_rewrite(
     intent_override: str | None = None,
     output_language_in: str | None = None,
     output_language_source_in: str | None = None,
+    deadline: float | None = None,
+    regenerate: bool = False,
+    hedge: str | None = None,
+    timings: timing.Timings | None = None,
+    return_timings: bool = False,
+    tone_variants: bool = False,
+    variants_owner: str | None = None,
+    gate: Callable[[], bool] | None = None,
 ) -> dict:
     """
     Full pipeline. Returns dict matching API response shape:
     rewrite_id, output_text, original_text, detected_intent, intent_confidence,
     intent_detection_method, routing_tier, scores, language_mix, response_time_ms,
     output_language, output_language_source (Tech Spec v1.5).
+    routing_tier is the tier that answered: a rules-routed request that no rule
+    matches falls through to Haiku and reports "haiku".
+    deadline: time.monotonic() value the rewrite must finish by; LLM retries and
+    the Sonnet → Haiku → rules fail-over are budgeted against it. With too little
+    budget left for a model call, the rewrite is answered from the cache, the rules
+    engine or a checked near-duplicate, else returns the `deadline_exceeded` error.
+    `fallback` in the response names the fail-over path taken (None when the
+    routed tier answered; "near_duplicate" for a near-duplicate's rewrite).
+    LLM-tier outputs are served from / written to the rewrite cache and the
+    near-duplicate index (`cache_hit`, `cache_match`: "exact" | "near_duplicate");
+    regenerate=True skips both lookups and refreshes the entries.
+    Near-miss entities in LLM output are repaired in place (`entity_repair`); the
+    model is re-asked once only when repair leaves an entity unresolved.
+    `usage` sums tokens and cost over the rewrite's LLM calls (None when none were made).
+    With ROUTING_CASCADE, Sonnet-routed rewrites run on Haiku first (`cascade`:
+    escalated, reasons, served_tier) and only failing outputs go to Sonnet.
+    hedge: "haiku" | "duplicate" hedges slow Sonnet calls (per billing tier,
+    config.HEDGE_POLICY); `hedge` in the response says whether it fired and who won.
+    timings: a caller's timing.Timings to record the pipeline stages into (the
+    caller then emits it); without one the pipeline emits its own. return_timings
+    adds the per-stage milliseconds to the response as `timings`.
+    tone_variants: also generate the other tones in one concurrent call, stored
+    under the rewrite_id for /rewrite/{id}/tone/{tone} (`tone_variants`: tones, ready);
+    only variants_owner (the signed-in user) can read them back.
+    With LONG_INPUT_CHUNKING, inputs over CHUNK_THRESHOLD_CHARS are split into
+    chunks rewritten concurrently and joined (`chunks`: count, per-chunk tiers,
+    cache hits); tone variants are not generated for them.
+    gate: called before the first model call (after the CPU stages and the cache)
+    and again before every later one (fail-over, cascade, entity retry, llm retries
+    and hedges); False cancels the rewrite with the `cancelled` error. The handler
+    passes its in-flight quota check, so those stages overlap the quota round-trip.
+    """
+    ctx = _prepare_rewrite(
+        input_text, platform, tone, language_mix_in, intent_override,
+        output_language_in, output_language_source_in, timings, return_timings, tone_variants, gate,
+        variants_owner,
+    )
+    if "error" in ctx:
+        return ctx
+
+    if ctx["output_text"] is None:
+        try:
+            if chunking.should_chunk(ctx["original_text"]):
+                _rewrite_chunks(ctx, deadline, regenerate, hedge)
+            else:
+                _rewrite_llm(ctx, deadline, regenerate, hedge)
+        except deadlines.DeadlineExceeded as e:
+            logger.warning("Rewrite %s: %s", ctx["rewrite_id"], e)
+            return _error_response("deadline_exceeded", ctx["start_ms"])
+        except RewriteCancelled:
+            return _error_response("cancelled", ctx["start_ms"])
+
+    return _finish_rewrite(ctx)
+
+
+async def run_rewrite_async(
+    input_text: str,
+    platform: str | None = None,
+    tone: str = "professional",
+    language_mix_in: dict | None = None,
+    intent_override: str | None = None,
+    output_language_in: str | None = None,
+    output_language_source_in: str | None = None,
+    deadline: float | None = None,
+    regenerate: bool = False,
+    hedge: str | None = None,
+    timings: timing.Timings | None = None,
+    return_timings: bool = False,
+    tone_variants: bool = False,
+    variants_owner: str | None = None,
+    gate: Callable[[], bool] | None = None,
+) -> dict:
+    """
+    Async variant of run_rewrite for event-loop servers. The CPU stages are
+    shared with the sync path; only the LLM call is awaited.
+    """
+    ctx = _prepare_rewrite(
+        input_text, platform, tone, language_mix_in, intent_override,
+        output_language_in, output_language_source_in, timings, return_timings, tone_variants, gate,
+        variants_owner,
+    )
+    if "error" in ctx:
+        return ctx
+
+    if ctx["output_text"] is None:
+        try:
+            if chunking.should_chunk(ctx["original_text"]):
+                await _rewrite_chunks_async(ctx, deadline, regenerate, hedge)
+            else:
+                await _rewrite_llm_async(ctx, deadline, regenerate, hedge)
+        except deadlines.DeadlineExceeded as e:
+            logger.warning("Rewrite %s: %s", ctx["rewrite_id"], e)
+            return _error_response("deadline_exceeded", ctx["start_ms"])
+        except RewriteCancelled:
+            return _error_response("cancelled", ctx["start_ms"])
+
+    return _finish_rewrite(ctx)
+
+
+# I/O steps yielded by _llm_steps as (op, arg); the drivers run them and send back the result
+_CACHE_LOOKUP = "cache_lookup"
+_CACHE_STORE = "cache_store"
+_GATE = "gate"
+_CALL = "call"
+_HEDGED_CALL = "hedged_call"
+_START_VARIANTS = "start_variants"
+_WAIT_VARIANTS = "wait_variants"
+
+
+def _rewrite_llm(ctx: dict, deadline: float | None, regenerate: bool, hedge: str | None) -> None:
+    """Cache, then the model chain (with fail-over to rules) for a request the rules engine didn't answer."""
+    steps = _llm_steps(ctx, deadline, regenerate, hedge)
+    try:
+        step = next(steps)
+        while True:
+            try:
+                result = _step_io(ctx, *step)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration:
+        pass
+
+
+async def _rewrite_llm_async(ctx: dict, deadline: float | None, regenerate: bool, hedge: str | None) -> None:
+    steps = _llm_steps(ctx, deadline, regenerate, hedge)
+    try:
+        step = next(steps)
+        while True:
+            try:
+                result = await _step_io_async(ctx, *step)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration:
+        pass
+
+
+def _step_io(ctx: dict, op: str, arg):
+    """Run one of _llm_steps' I/O steps, blocking."""
+    if op == _CALL:
+        return call_claude(**arg)
+    if op == _HEDGED_CALL:
+        return call_claude_hedged(**arg)
+    if op == _GATE:
+        return arg()
+    if op == _CACHE_LOOKUP:
+        return rewrite_cache.lookup(arg)
+    if op == _CACHE_STORE:
+        return rewrite_cache.store(*arg)
+    if op == _START_VARIANTS:
+        return _start_tone_variants(ctx, *arg)
+    return tone_variants_module.wait(*arg)
+
+
+async def _step_io_async(ctx: dict, op: str, arg):
+    if op == _CALL:
+        return await call_claude_async(**arg)
+    if op == _HEDGED_CALL:
+        return await call_claude_hedged_async(**arg)
+    if op == _GATE:
+        return await asyncio.to_thread(arg)
+    if op == _CACHE_LOOKUP:
+        return await rewrite_cache.lookup_async(arg)
+    if op == _CACHE_STORE:
+        return await rewrite_cache.store_async(*arg)
+    if op == _START_VARIANTS:
+        return _start_tone_variants_async(ctx, *arg)
+    variants, wait_s = arg
+    try:
+        return await asyncio.wait_for(asyncio.shield(variants), wait_s)
+    except asyncio.TimeoutError:
+        return None
+
+
+def _llm_steps(ctx: dict, deadline: float | None, regenerate: bool, hedge: str | None):
+    """
+    The LLM path, shared by _rewrite_llm and _rewrite_llm_async: a generator that
+    yields each I/O step as (op, arg) and is sent its result (a step that raised
+    is thrown back in), so the sync and async drivers differ only in how they run it.
+    """
+    _mask_input(ctx)
+    key = _cache_key(ctx)
+    t = timing.now()
+    cached = None if regenerate else (yield _CACHE_LOOKUP, key)
+    ctx["timings"].add(timing.CACHE, t)
+    near = _serve_from_cache(ctx, cached, regenerate)
+    if ctx["output_text"] is not None:
+        if ctx["variants_requested"]:
+            _accept_tone_variants(ctx, _cached_tone_variants(ctx))
+        return
+    yield from _check_gate(ctx)
+    if _out_of_budget(deadline):
+        _cheap_fallback(ctx, near, None, deadline)
+        return
+    system_prompt, cache_prefix = _llm_request(ctx, near)
+    chain = _model_chain(ctx)
+    variants = yield _START_VARIANTS, (chain, deadline)
+    last_error: Exception | None = None
+    for i, (model, fallback) in enumerate(chain):
+        if i:
+            yield from _check_gate(ctx)
+        t = timing.now()
+        try:
+            llm_output, served_model = yield from _call_llm(
+                ctx, hedge,
+                system_prompt=system_prompt,
+                input_text=ctx["llm_input"],
+                model=model,
+                deadline=_call_deadline(ctx, model, deadline, has_fallback=i < len(chain) - 1),
+                cache_prefix=cache_prefix,
+                usage_sink=ctx["llm_calls"],
+                cancelled=_gate_closed(ctx),
+            )
+        except RuntimeError as e:
+            last_error = e
+            _escalate(ctx, model, ["error"])
+            continue
+        finally:
+            ctx["timings"].add(timing.LLM, t)
+        _accept_llm_output(ctx, llm_output, served_model, fallback)
+        if _escalate(ctx, model):
+            continue
+        if _needs_entity_retry(ctx, deadline):
+            yield from _check_gate(ctx)
+            t = timing.now()
+            try:
+                retry_output = yield _CALL, {
+                    "system_prompt": system_prompt,
+                    "input_text": ctx["llm_input"],
+                    "model": model,
+                    "deadline": deadline,
+                    "cache_prefix": cache_prefix,
+                    "usage_sink": ctx["llm_calls"],
+                    "cancelled": _gate_closed(ctx),
+                    **_length_kwargs(ctx),
+                }
+            except RuntimeError:
+                retry_output = None
+            ctx["timings"].add(timing.LLM, t)
+            _accept_entity_retry(ctx, retry_output)
+        break
+    _finish_cascade(ctx)
+    if ctx["output_text"] is None:
+        _cheap_fallback(ctx, near, last_error, deadline)
+    if _cacheable(ctx):
+        t = timing.now()
+        yield _CACHE_STORE, (key, _cache_value(ctx))
+        _remember_near_duplicate(ctx)
+        ctx["timings"].add(timing.CACHE, t)
+    if variants is not None:
+        _accept_tone_variants(ctx, (yield _WAIT_VARIANTS, (variants, _variants_wait_s(deadline))))
+
+
+def _rewrite_chunks(ctx: dict, deadline: float | None, regenerate: bool, hedge: str | None) -> None:
+    """Long-document mode: rewrite the input's chunks concurrently, each routed on its own, and join them."""
+    pieces = chunking.split(ctx["original_text"])
+    parts = [_chunk_ctx(ctx, text, i, len(pieces)) for i, (text, _) in enumerate(pieces)]
+
+    def _one(part: dict) -> None:
+        if part["output_text"] is None:
+            _rewrite_llm(part, deadline, regenerate, hedge)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(parts), config.CHUNK_CONCURRENCY)), thread_name_prefix="loma-chunk") as pool:
+        list(pool.map(_one, parts))
+    _join_chunks(ctx, parts, [sep for _, sep in pieces])
+
+
+async def _rewrite_chunks_async(ctx: dict, deadline: float | None, regenerate: bool, hedge: str | None) -> None:
+    pieces = chunking.split(ctx["original_text"])
+    parts = [_chunk_ctx(ctx, text, i, len(pieces)) for i, (text, _) in enumerate(pieces)]
+    slots = asyncio.Semaphore(max(1, config.CHUNK_CONCURRENCY))
+
+    async def _one(part: dict) -> None:
+        if part["output_text"] is None:
+            async with slots:
+                await _rewrite_llm_async(part, deadline, regenerate, hedge)
+
+    await asyncio.gather(*(_one(part) for part in parts))
+    _join_chunks(ctx, parts, [sep for _, sep in pieces])
+
+
+def _chunk_ctx(ctx: dict, text: str, index: int, count: int) -> dict:
+    """
+    Request context for one chunk: the document's intent and output language,
+    its own language mix, route and entities (a rules-tier chunk is answered here).
+    """
+    part = _prepare_rewrite(
+        text, ctx["platform"], ctx["tone"], None, ctx["detected_intent"],
+        ctx["output_language"], ctx["output_language_source"], timing.Timings(), gate=ctx["gate"],
+    )
+    part["part"] = chunking.part_role(index, count)
+    part["document_context"] = chunking.context_header(index, count, ctx["original_text"])
+    return part
+
+
+_TIER_RANK = {"rules": 0, "haiku": 1, "sonnet": 2}
+
+
+def _join_chunks(ctx: dict, parts: list[dict], separators: list[str]) -> None:
+    """Fold the chunks' outputs, tiers, usage and diagnostics into the document's context."""
+    ctx["output_text"] = chunking.join([p["output_text"] for p in parts], separators)
+    ctx["tier"] = max((p["tier"] for p in parts), key=lambda tier: _TIER_RANK.get(tier, 0))
+    ctx["fallback"] = next((p["fallback"] for p in parts if p["fallback"]), None)
+    ctx["cache_hit"] = all(p["cache_hit"] for p in parts)
+    ctx["cache_match"] = "exact" if ctx["cache_hit"] else None
+    for p in parts:
+        ctx["llm_calls"].extend(p["llm_calls"])
+
+    masked = [p["masking"] for p in parts if p["masking"]]
+    if masked:
+        ctx["masking"] = {
+            "placeholders": sum(m["placeholders"] for m in masked),
+            **{k: [v for m in masked for v in m[k]] for k in ("missing", "duplicated", "unknown")},
+        }
+    repaired = [p["repair"] for p in parts if p["repair"]]
+    if repaired:
+        ctx["repair"] = {
+            "repaired": [v for r in repaired for v in r["repaired"]],
+            "unresolved": [v for r in repaired for v in r["unresolved"]],
+            "retried": any(r["retried"] for r in repaired),
+        }
+    cascaded = [p["cascade"] for p in parts if p["cascade"]]
+    if cascaded:
+        ctx["cascade"] = {
+            "escalated": any(c["escalated"] for c in cascaded),
+            "reasons": sorted({r for c in cascaded for r in c["reasons"]}),
+            "served_tier": ctx["tier"],
+        }
+    hedges = [p["hedge"] for p in parts if p["hedge"]]
+    if hedges:
+        ctx["hedge"] = next((h for h in hedges if h["fired"]), hedges[0])
+    lengths = [p["output_length"] for p in parts if p["output_length"]]
+    if lengths:
+        tokens = [o["output_tokens"] for o in lengths if o["output_tokens"] is not None]
+        ctx["output_length"] = {
+            "input_tokens": sum(o["input_tokens"] for o in lengths),
+            "expected_tokens": sum(o["expected_tokens"] for o in lengths),
+            "max_tokens": sum(o["max_tokens"] for o in lengths),
+            "predicted_latency_ms": max(o["predicted_latency_ms"] for o in lengths),
+            "output_tokens": sum(tokens) if tokens else None,
+            "stop_reason": "max_tokens" if any(o["truncated"] for o in lengths) else lengths[-1]["stop_reason"],
+            "truncated": any(o["truncated"] for o in lengths),
+            "retried": any(o["retried"] for o in lengths),
+        }
+    ctx["chunks"] = {
+        "count": len(parts),
+        "tiers": [p["tier"] for p in parts],
+        "cache_hits": sum(p["cache_hit"] for p in parts),
+    }
+    ctx["timings"].add_parallel([p["timings"] for p in parts])
+
+
+def _prepare_rewrite(
+    input_text: str,
+    platform: str | None,
+    tone: str,
+    language_mix_in: dict | None,
+    intent_override: str | None,
+    output_language_in: str | None,
+    output_language_source_in: str | None,
+    timings: timing.Timings | None = None,
+    return_timings: bool = False,
+    variants_requested: bool = False,
+    gate: Callable[[], bool] | None = None,
+    variants_owner: str | None = None,
+) -> dict:
+    """
+    Pre-LLM stages: validation, language mix, intent, output language, routing, rules.
+    Returns an error response or the request context; ctx["output_text"] is set
+    when the rules engine handled the rewrite.
     """
     start_ms = int(time.time() * 1000)
+    owned = timings is None
+    if owned:
+        timings = timing.Timings()
+    t = timing.now()
     original_text = (input_text or "").strip()
     if not original_text:
         return _error_response("text_too_short", start_ms)
 
-    if len(original_text) > 5000:
+    if len(original_text) > chunking.max_input_chars():
         return _error_response("text_too_long", start_ms)
 
     # Language mix (server-side confirmation)
     language_mix = language_mix_in or compute_language_mix(original_text)
+    t = timings.add(timing.LANGUAGE, t)
 
     # Intent
     if intent_override and intent_override in intent_module.INTENT_PATTERNS:
@@ -70,47 +475,489 @@ def run_rewrite(
     else:
         output_language = "en"
         output_language_source = "default"
+    t = timings.add(timing.INTENT, t)
 
     # Routing (output_language-aware: vi_admin → rules)
     tier = route_rewrite(
-        original_text, language_mix, detected_intent, intent_confidence, output_language
+        original_text, language_mix, detected_intent, intent_confidence, output_language, platform
     )
+    t = timings.add(timing.ROUTE, t)
 
-    # Rewrite
+    # Rewrite via rules when routed there (None → fall through to LLM)
     output_text: str | None = None
     if tier == "rules":
         output_text = rules_engine.apply_rules(
             original_text, detected_intent, output_language=output_language
         )
-    if output_text is None:
-        # Extract entities from input to inject into prompt for preservation
-        raw_entities = extract_entities(original_text)
-        entity_list = []
-        for category, items in raw_entities.items():
-            for item in items:
-                entity_list.append({"text": item, "label": category})
-
-        system_prompt = build_system_prompt(
-            intent=detected_intent,
-            tone=tone,
-            language_mix=language_mix,
-            platform=platform,
-            entities=entity_list if entity_list else None,
-            output_language=output_language,
-        )
-        model = SONNET_MODEL if tier == "sonnet" else HAIKU_MODEL
-        output_text = call_claude(
-            system_prompt=system_prompt,
-            input_text=original_text,
-            model=model,
+        t = timings.add(timing.RULES, t)
+
+    # One entity scan per request, shared by masking, the prompt, repair, checks and scoring
+    entities = scan_entities(original_text)
+    timings.add(timing.ENTITIES, t)
+
+    return {
+        "rewrite_id": str(uuid.uuid4()),
+        "start_ms": start_ms,
+        "original_text": original_text,
+        "entities": entities,
+        "timings": timings,
+        "emit_timings": owned,
+        "return_timings": return_timings,
+        "platform": platform,
+        "tone": tone,
+        "language_mix": language_mix,
+        "detected_intent": detected_intent,
+        "intent_confidence": intent_confidence,
+        "intent_method": intent_method,
+        "output_language": output_language,
+        "output_language_source": output_language_source,
+        "tier": tier,
+        "output_text": output_text,
+        "fallback": None,
+        "cache_hit": False,
+        "cache_match": None,
+        "llm_input": original_text,
+        "llm_output": None,
+        "placeholders": {},
+        "masking": None,
+        "repair": None,
+        "llm_calls": [],
+        "cascade": None,
+        "hedge": None,
+        "output_length": None,
+        "prompt_entities": None,
+        "variants_requested": variants_requested,
+        "variants_owner": variants_owner,
+        "variant_usage": None,
+        "tone_variants": None,
+        "gate": gate,
+        "part": None,
+        "document_context": None,
+        "chunks": None,
+    }
+
+
+def _mask_input(ctx: dict) -> None:
+    """Swap entities for placeholders in the text sent to the model (ENTITY_MASKING)."""
+    if not config.ENTITY_MASKING:
+        return
+    t = timing.now()
+    masked = mask_entities(ctx["original_text"], ctx["entities"])
+    ctx["llm_input"] = masked["masked_text"]
+    ctx["placeholders"] = masked["placeholders"]
+    ctx["timings"].add(timing.ENTITIES, t)
+
+
+def _restore_output(ctx: dict) -> None:
+    """Put the original entity values back into the model's (masked) output."""
+    t = timing.now()
+    if not ctx["placeholders"]:
+        ctx["output_text"] = ctx["llm_output"]
+        _repair_output(ctx)
+        ctx["timings"].add(timing.ENTITIES, t)
+        return
+    restored = restore_entities(ctx["llm_output"], ctx["placeholders"], ctx["llm_input"])
+    ctx["output_text"] = restored["text"]
+    ctx["masking"] = {
+        "placeholders": len(ctx["placeholders"]),
+        "missing": [ctx["placeholders"][t] for t in restored["missing"]],
+        "duplicated": [ctx["placeholders"][t] for t in restored["duplicated"]],
+        "unknown": restored["unknown"],
+    }
+    _repair_output(ctx)
+    ctx["timings"].add(timing.ENTITIES, t)
+
+
+def _repair_output(ctx: dict) -> None:
+    """Deterministically patch reformatted / transliterated entities back into the output."""
+    if llm.is_placeholder(ctx["output_text"]):
+        return
+    repair = repair_entities(ctx["original_text"], ctx["output_text"], ctx["entities"])
+    ctx["output_text"] = repair["text"]
+    if repair["repaired"] or repair["unresolved"]:
+        ctx["repair"] = {"repaired": repair["repaired"], "unresolved": repair["unresolved"], "retried": False}
+    else:
+        ctx["repair"] = None
+
+
+def _needs_entity_retry(ctx: dict, deadline: float | None) -> bool:
+    """
+    Re-ask only when repair left a copyable entity unresolved (Vietnamese-worded values
+    like "5 triệu" are translated, not copied) and the deadline leaves room for the call.
+    """
+    if not config.ENTITY_REPAIR_RETRY or not ctx["repair"]:
+        return False
+    if not any(not is_translatable(e.split(":", 1)[1]) for e in ctx["repair"]["unresolved"]):
+        return False
+    left = llm.remaining_s(deadline)
+    return left is None or left >= FALLBACK_RESERVE_S
+
+
+def _accept_entity_retry(ctx: dict, retry_output: str | None) -> None:
+    """Keep the retry only if it leaves fewer unresolved entities than the repaired first output."""
+    first = {k: ctx[k] for k in ("llm_output", "output_text", "masking", "repair")}
+    if retry_output is not None:
+        ctx["llm_output"] = retry_output
+        _restore_output(ctx)
+        if ctx["repair"] is not None and len(ctx["repair"]["unresolved"]) >= len(first["repair"]["unresolved"]):
+            ctx.update(first)
+    if ctx["repair"] is not None:
+        ctx["repair"]["retried"] = True
+
+
+def _accept_llm_output(ctx: dict, llm_output: str, model: str, fallback: str | None) -> None:
+    ctx["llm_output"] = llm_output
+    ctx["tier"] = "sonnet" if model == SONNET_MODEL else "haiku"
+    ctx["fallback"] = fallback
+    _restore_output(ctx)
+
+
+def _cache_key(ctx: dict) -> str:
+    """Keyed on the masked input: messages differing only in masked values share an entry."""
+    return rewrite_cache.cache_key(
+        ctx["llm_input"], ctx["detected_intent"], ctx["tone"], ctx["platform"], ctx["output_language"],
+        part=ctx["part"], language_mix=ctx["language_mix"], placeholders=bool(ctx["placeholders"]),
+    )
+
+
+def _serve_from_cache(ctx: dict, cached: dict | None, regenerate: bool) -> dict | None:
+    """
+    Fill ctx from an exact cache entry (masked output, restored for this input) or a
+    reusable near-duplicate. Returns the near-duplicate match (if any) for prompt hints.
+    """
+    if cached:
+        ctx["llm_output"] = cached["output_text"]
+        _restore_output(ctx)
+        _mark_cached(ctx, cached, "exact")
+        return None
+    t = timing.now()
+    near = None if regenerate or ctx["part"] else _near_duplicate(ctx)
+    ctx["timings"].add(timing.CACHE, t)
+    if near and near["reusable"]:
+        ctx["output_text"] = near["output_text"]
+        _mark_cached(ctx, near, "near_duplicate")
+    return near
+
+
+def _mark_cached(ctx: dict, cached: dict, match: str) -> None:
+    ctx["tier"] = cached.get("routing_tier", ctx["tier"])
+    ctx["cache_hit"] = True
+    ctx["cache_match"] = match
+
+
+def _near_duplicate(ctx: dict) -> dict | None:
+    return fingerprint.lookup(
+        ctx["original_text"], ctx["detected_intent"], ctx["tone"],
+        ctx["platform"], ctx["output_language"], ctx["entities"],
+    )
+
+
+def _remember_near_duplicate(ctx: dict) -> None:
+    if ctx["part"]:
+        return
+    fingerprint.remember(
+        ctx["original_text"], ctx["detected_intent"], ctx["tone"],
+        ctx["platform"], ctx["output_language"], ctx["output_text"], ctx["tier"], ctx["entities"],
+    )
+
+
+def _cacheable(ctx: dict) -> bool:
+    """Only first-choice model outputs are cached — not fail-overs, placeholders or lossy outputs."""
+    return (
+        ctx["fallback"] is None
+        and not (ctx["repair"] and ctx["repair"]["retried"] and ctx["repair"]["unresolved"])
+        and ctx["tier"] in ("haiku", "sonnet")
+        and not llm.is_placeholder(ctx["llm_output"])
+        and not (ctx["output_length"] and ctx["output_length"]["truncated"])
+        and not (ctx["masking"] and (ctx["masking"]["missing"] or ctx["masking"]["unknown"]))
+    )
+
+
+def _cache_value(ctx: dict) -> dict:
+    return {"output_text": ctx["llm_output"], "routing_tier": ctx["tier"]}
+
+
+def _llm_request(ctx: dict, near: dict | None = None) -> tuple[str, str]:
+    """
+    Build (system_prompt, cache_prefix) for the LLM tiers; the prefix is the static part.
+    A non-reusable near-duplicate match is passed as a reference draft when NEAR_DUP_HINTS is on.
+    """
+    t = timing.now()
+    # Entities to inject into the prompt for preservation
+    # (masked values are already placeholders; only the unmasked ones are listed)
+    masked_values = set(ctx["placeholders"].values())
+    entity_list = []
+    for _, _, category, item in ctx["entities"]:
+        value = strip_honorific(item)[1] if category == "names" else item
+        if value not in masked_values:
+            entity_list.append({"text": item, "label": category})
+
+    ctx["prompt_entities"] = entity_list or None
+    static_prefix, dynamic_suffix = build_system_prompt_parts(
+        intent=ctx["detected_intent"],
+        tone=ctx["tone"],
+        language_mix=ctx["language_mix"],
+        platform=ctx["platform"],
+        entities=entity_list if entity_list else None,
+        output_language=ctx["output_language"],
+        placeholders=bool(ctx["placeholders"]),
+        reference_rewrite=near["output_text"] if near and config.NEAR_DUP_HINTS else None,
+        document_context=ctx["document_context"],
+    )
+    system_prompt = "\n\n".join(p for p in (static_prefix, dynamic_suffix) if p)
+
+    prediction = output_length.predict(ctx["llm_input"], ctx["detected_intent"], ctx["output_language"])
+    ctx["output_length"] = {
+        **prediction,
+        "predicted_latency_ms": output_length.predict_latency_ms(
+            "sonnet" if ctx["tier"] == "sonnet" else "haiku", prediction["expected_tokens"]
+        ),
+        "output_tokens": None,
+        "stop_reason": None,
+        "truncated": False,
+        "retried": False,
+    }
+    ctx["timings"].add(timing.PROMPT, t)
+    return system_prompt, static_prefix
+
+
+def _start_tone_variants(ctx: dict, chain: list[tuple[str, str | None]], deadline: float | None):
+    """Start the other tones' call on a worker thread (None when not requested)."""
+    if not ctx["variants_requested"] or not chain:
+        return None
+    return tone_variants_module.start(
+        tone_variants_module.snapshot(ctx), tone_variants_module.other_tones(ctx["tone"]),
+        chain[0][0], deadline, _variant_usage(ctx),
+    )
+
+
+def _start_tone_variants_async(ctx: dict, chain: list[tuple[str, str | None]], deadline: float | None):
+    if not ctx["variants_requested"] or not chain:
+        return None
+    return asyncio.ensure_future(tone_variants_module.generate_and_remember_async(
+        tone_variants_module.snapshot(ctx), tone_variants_module.other_tones(ctx["tone"]),
+        chain[0][0], deadline, _variant_usage(ctx),
+    ))
+
+
+def _variant_usage(ctx: dict) -> tone_variants_module.VariantUsage:
+    ctx["variant_usage"] = tone_variants_module.VariantUsage()
+    return ctx["variant_usage"]
+
+
+def _cached_tone_variants(ctx: dict) -> dict[str, dict]:
+    """Variants for a cache-served rewrite: only those the rewrite cache already holds."""
+    if ctx["tier"] not in ("haiku", "sonnet"):
+        return {}
+    return tone_variants_module.from_cache(tone_variants_module.snapshot(ctx), ctx["tier"])
+
+
+def _variants_wait_s(deadline: float | None) -> float:
+    """How long the response waits for unfinished variants: TONE_VARIANTS_WAIT_S within the deadline."""
+    left = llm.remaining_s(deadline)
+    return config.TONE_VARIANTS_WAIT_S if left is None else min(config.TONE_VARIANTS_WAIT_S, left)
+
+
+def _accept_tone_variants(ctx: dict, variants: dict[str, dict] | None) -> None:
+    """
+    Report the variants (None = still generating; stored when done) and count
+    their call's usage: here when it is done, else when it finishes in the background.
+    """
+    pending = tone_variants_module.other_tones(ctx["tone"])
+    if variants is None:
+        ctx["tone_variants"] = {"tones": pending, "ready": False}
+        if ctx["variant_usage"] is None or ctx["variant_usage"].detach():
+            return
+    else:
+        ctx["tone_variants"] = {"tones": [t for t in pending if t in variants], "ready": True}
+    if ctx["variant_usage"] is not None:
+        ctx["llm_calls"].extend(ctx["variant_usage"].calls)
+
+
+def _length_kwargs(ctx: dict) -> dict:
+    """Predicted max_tokens and the commentary stop sequences for this request's calls."""
+    return {"max_tokens": ctx["output_length"]["max_tokens"], "stop_sequences": output_length.STOP_SEQUENCES}
+
+
+def _note_stop(ctx: dict, model: str) -> None:
+    """Copy the latest call's output tokens / stop_reason for `model` into ctx["output_length"]."""
+    record = next((c for c in reversed(ctx["llm_calls"]) if c.get("model") == model), None)
+    if record is None:
+        return
+    ctx["output_length"]["output_tokens"] = record.get("output_tokens")
+    ctx["output_length"]["stop_reason"] = record.get("stop_reason")
+    ctx["output_length"]["truncated"] = record.get("stop_reason") == "max_tokens"
+
+
+def _extended_budget(ctx: dict, deadline: float | None) -> int | None:
+    """Larger max_tokens for re-running a truncated call, if there is headroom and time for it."""
+    if not ctx["output_length"]["truncated"]:
+        return None
+    left = llm.remaining_s(deadline)
+    if left is not None and left < FALLBACK_RESERVE_S:
+        return None
+    return output_length.extended_max_tokens(ctx["output_length"]["max_tokens"])
+
+
+def _model_chain(ctx: dict) -> list[tuple[str, str | None]]:
+    """
+    Models to try in order as (model, fallback_label). Sonnet requests fail over
+    to Haiku, or in cascade mode run Haiku first and escalate to Sonnet; models
+    whose circuit breaker is open are skipped outright.
+    """
+    cascade = router.use_cascade(ctx["tier"])
+    if cascade:
+        chain = [(HAIKU_MODEL, None), (SONNET_MODEL, None)]
+    elif ctx["tier"] == "sonnet":
+        chain = [(SONNET_MODEL, None), (HAIKU_MODEL, "haiku")]
+    else:
+        chain = [(HAIKU_MODEL, None)]
+    chain = [(m, f) for m, f in chain if not llm.circuit_open(m)]
+    if cascade and len(chain) == 2:
+        ctx["cascade"] = {"escalated": False, "reasons": [], "served_tier": None}
+    return chain
+
+
+def _check_gate(ctx: dict):
+    """Step: RewriteCancelled when the caller's gate refuses a model call (checked before each one)."""
+    if ctx["gate"] is not None and not (yield _GATE, ctx["gate"]):
+        raise RewriteCancelled(ctx["rewrite_id"])
+
+
+def _gate_closed(ctx: dict) -> Callable[[], bool] | None:
+    """The gate as llm's `cancelled` check, so retries and hedges stop once it closes."""
+    gate = ctx["gate"]
+    return None if gate is None else (lambda: not gate())
+
+
+def _call_llm(ctx: dict, hedge: str | None, **kwargs):
+    """
+    Steps for one model call → (text, model that answered); Sonnet calls are hedged when asked.
+    A response cut off at max_tokens is re-run once on the same model with a larger budget.
+    """
+    kwargs.update(_length_kwargs(ctx))
+    if not hedge or kwargs["model"] != SONNET_MODEL:
+        text, served_model = (yield _CALL, kwargs), kwargs["model"]
+    else:
+        result = yield _HEDGED_CALL, {**kwargs, "hedge_model": HAIKU_MODEL if hedge == "haiku" else None}
+        ctx["hedge"] = {"mode": hedge, "fired": result["hedged"], "winner": result["winner"]}
+        text, served_model = result["text"], result["model"]
+    _note_stop(ctx, served_model)
+    budget = _extended_budget(ctx, kwargs["deadline"])
+    if budget is not None:
+        ctx["output_length"].update(max_tokens=budget, retried=True)
+        try:
+            text = yield _CALL, {**kwargs, "model": served_model, "max_tokens": budget}
+            _note_stop(ctx, served_model)
+        except RuntimeError as e:
+            logger.warning("Re-run of truncated %s output failed: %s", served_model, e)
+    return text, served_model
+
+
+def _attempt_deadline(deadline: float | None, has_fallback: bool) -> float | None:
+    """Deadline for one model in the chain: keep time back when another model follows."""
+    if deadline is None or not has_fallback:
+        return deadline
+    return deadline - FALLBACK_RESERVE_S
+
+
+def _call_deadline(ctx: dict, model: str, deadline: float | None, has_fallback: bool) -> float | None:
+    """_attempt_deadline, with the cascade's Haiku attempt held to CASCADE_HAIKU_TIMEOUT_S."""
+    call_deadline = _attempt_deadline(deadline, has_fallback)
+    if ctx["cascade"] is None or model != HAIKU_MODEL:
+        return call_deadline
+    cap = time.monotonic() + config.CASCADE_HAIKU_TIMEOUT_S
+    return cap if call_deadline is None else min(call_deadline, cap)
+
+
+def _escalate(ctx: dict, model: str, reasons: list[str] | None = None) -> bool:
+    """
+    Cascade gate after the Haiku attempt: True (try Sonnet next) when it failed
+    (`reasons` given) or its output fails the deterministic output checks.
+    """
+    if ctx["cascade"] is None or model != HAIKU_MODEL:
+        return False
+    if reasons is None:
+        if llm.is_placeholder(ctx["output_text"]):
+            return False
+        t = timing.now()
+        unresolved = ctx["repair"]["unresolved"] if ctx["repair"] else []
+        reasons = check_output(
+            ctx["original_text"], ctx["output_text"], ctx["output_language"], unresolved, ctx["entities"]
         )
-        if tier != "rules":
-            tier = "sonnet" if model == SONNET_MODEL else "haiku"
+        ctx["timings"].add(timing.QUALITY, t)
+        if ctx["output_length"] and ctx["output_length"]["truncated"]:
+            reasons.append("truncated")
+    if not reasons:
+        return False
+    ctx["cascade"]["escalated"] = True
+    ctx["cascade"]["reasons"] = reasons
+    return True
+
+
+def _finish_cascade(ctx: dict) -> None:
+    """Record the cascade outcome; a failed-check Haiku draft served because Sonnet failed is a fallback."""
+    cascade = ctx["cascade"]
+    if cascade is None:
+        return
+    if cascade["escalated"] and ctx["tier"] == "haiku" and ctx["output_text"] is not None:
+        ctx["fallback"] = "haiku"
+    cascade["served_tier"] = ctx["tier"] if ctx["output_text"] is not None else None
+    router.record_cascade(ctx["detected_intent"], cascade["escalated"], cascade["reasons"])
+
+
+def _out_of_budget(deadline: float | None) -> bool:
+    """Too little of the request's budget left to start a model call."""
+    left = llm.remaining_s(deadline)
+    return left is not None and left < llm.MIN_ATTEMPT_S
+
+
+def _cheap_fallback(ctx: dict, near: dict | None, last_error: Exception | None, deadline: float | None) -> None:
+    """
+    Last resort when no model answered, or the deadline leaves no time to ask one:
+    rules output if a pattern matches, else a near-duplicate input's rewrite that
+    passes the output checks. Otherwise re-raise the model error, or
+    DeadlineExceeded when the budget ran out.
+    """
+    t = timing.now()
+    output_text = rules_engine.apply_rules(
+        ctx["original_text"], ctx["detected_intent"], output_language=ctx["output_language"]
+    )
+    t = ctx["timings"].add(timing.RULES, t)
+    if output_text is not None:
+        ctx["output_text"] = output_text
+        ctx["tier"] = "rules"
+        ctx["fallback"] = "rules"
+        return
+    if near is not None and not check_output(
+        ctx["original_text"], near["output_text"], ctx["output_language"], None, ctx["entities"]
+    ):
+        ctx["timings"].add(timing.QUALITY, t)
+        ctx["output_text"] = near["output_text"]
+        _mark_cached(ctx, near, "near_duplicate")
+        ctx["fallback"] = "near_duplicate"
+        return
+    if _out_of_budget(deadline):
+        raise deadlines.DeadlineExceeded("request deadline reached before a model answered")
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError("LLM call failed: all model circuits open")
+
+
+def _finish_rewrite(ctx: dict) -> dict:
+    """
+    Post-LLM stages: quality scoring, risk flags, response shape. Emits the
+    request's timings when the pipeline owns them.
+    """
+    original_text = ctx["original_text"]
+    output_text = ctx["output_text"]
 
     # Quality
-    scores = score_rewrite(original_text, output_text)
+    t = timing.now()
+    scores = score_rewrite(original_text, output_text, ctx["entities"])
+    ctx["timings"].add(timing.QUALITY, t)
     end_ms = int(time.time() * 1000)
-    response_time_ms = end_ms - start_ms
+    response_time_ms = end_ms - ctx["start_ms"]
 
     # Risk flags: surface entity preservation issues
     risk_flags = []
@@ -119,32 +966,60 @@ def run_rewrite(
             "type": "entity_missing",
             "details": scores["entity_missing"],
         })
+    if ctx["output_length"] and ctx["output_length"]["truncated"]:
+        risk_flags.append({
+            "type": "truncated",
+            "details": {"max_tokens": ctx["output_length"]["max_tokens"]},
+        })
 
-    return {
-        "rewrite_id": str(uuid.uuid4()),
+    response = {
+        "rewrite_id": ctx["rewrite_id"],
         "output_text": output_text,
         "original_text": original_text,
-        "detected_intent": detected_intent,
-        "intent_confidence": round(intent_confidence, 4),
-        "intent_detection_method": intent_method,
+        "detected_intent": ctx["detected_intent"],
+        "intent_confidence": round(ctx["intent_confidence"], 4),
+        "intent_detection_method": ctx["intent_method"],
         "detected_slots": None,
         "ner_entities": None,
-        "routing_tier": tier,
+        "routing_tier": ctx["tier"],
+        "fallback": ctx["fallback"],
+        "cache_hit": ctx["cache_hit"],
+        "cache_match": ctx["cache_match"],
+        "entity_masking": ctx["masking"],
+        "entity_repair": ctx["repair"],
+        "usage": usage.summarize_calls(ctx["llm_calls"]),
+        "cascade": ctx["cascade"],
+        "hedge": ctx["hedge"],
+        "output_length": ctx["output_length"],
+        "tone_variants": ctx["tone_variants"],
+        "chunks": ctx["chunks"],
         "scores": scores,
         "risk_flags": risk_flags,
-        "language_mix": language_mix,
+        "language_mix": ctx["language_mix"],
         "response_time_ms": response_time_ms,
         "payg_balance_remaining": None,
-        "output_language": output_language,
-        "output_language_source": output_language_source,
+        "output_language": ctx["output_language"],
+        "output_language_source": ctx["output_language_source"],
+        "timings": ctx["timings"].as_dict() if ctx["return_timings"] else None,
     }
+    usage.record_rewrite(response, ctx["platform"])
+    if ctx["emit_timings"]:
+        stages = timing.emit(ctx["timings"], response)
+        if ctx["return_timings"]:
+            response["timings"] = stages
+    return response
 
 
 def _error_response(error: str, start_ms: int) -> dict:
     end_ms = int(time.time() * 1000)
     messages = {
         "text_too_short": ("Input text is required.", "Vui lòng nhập nội dung."),
-        "text_too_long": ("Input text must be 5000 characters or less.", "Nội dung tối đa 5000 ký tự."),
+        "text_too_long": (
+            f"Input text must be {chunking.max_input_chars()} characters or less.",
+            f"Nội dung tối đa {chunking.max_input_chars()} ký tự.",
+        ),
+        "cancelled": ("Rewrite cancelled.", "Đã hủy yêu cầu viết lại."),
+        "deadline_exceeded": ("The rewrite ran out of time. Please try again.", "Hết thời gian xử lý. Vui lòng thử lại."),
     }
     msg, msg_vi = messages.get(error, ("Service error.", "Lỗi dịch vụ."))
     return {
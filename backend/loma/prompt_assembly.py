@@ -4,6 +4,7 @@ Loads prompts from backend/prompts/ (or env/path relative to package).
 """
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import random
@@ -44,6 +45,8 @@ _INTENT_TO_CATEGORY: dict[str, list[str]] = {
 
 _MAX_EXAMPLES = 3
 
+_BUNDLE_VERSION: str | None = None
+
 
 def _load_prompts() -> None:
     global PERSONA, INTENTS, MODIFIERS, _CULTURAL_PATTERNS
@@ -81,6 +84,26 @@ def _load_cultural_patterns() -> None:
             return
 
 
+def prompt_bundle_version() -> str:
+    """
+    Short content hash of every prompt file plus the cultural pattern library.
+    Changes whenever any prompt input changes; used to version cached rewrites.
+    """
+    global _BUNDLE_VERSION
+    if _BUNDLE_VERSION is not None:
+        return _BUNDLE_VERSION
+    digest = hashlib.sha256()
+    files = sorted(_PROMPTS_DIR.rglob("*.json")) if _PROMPTS_DIR.exists() else []
+    patterns = Path(__file__).resolve().parent.parent.parent / "docs" / "Loma_Cultural_Patterns_v0.1.json"
+    if patterns.exists():
+        files.append(patterns)
+    for path in files:
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    _BUNDLE_VERSION = digest.hexdigest()[:12]
+    return _BUNDLE_VERSION
+
+
 def _select_cultural_examples(intent: str, code_switched: bool | None = None) -> str:
     """Select up to _MAX_EXAMPLES cultural pattern examples for the given intent.
 
@@ -131,6 +154,44 @@ def build_system_prompt(
     output_language: str | None = None,
 ) -> str:
     """Assemble the full system prompt for a rewrite request (Tech Spec v1.5: output_language for Vietnamese)."""
+    static_prefix, dynamic_suffix = build_system_prompt_parts(
+        intent, tone, language_mix, platform, entities, output_language
+    )
+    return "\n\n".join(p for p in (static_prefix, dynamic_suffix) if p)
+
+
+def is_code_switched(language_mix: dict[str, float]) -> bool:
+    """Mixed Vietnamese/English input (vi_ratio between 0.1 and 0.9) — selects the code-switch prompt blocks."""
+    return 0.1 < language_mix.get("vi_ratio", 0) < 0.9
+
+
+def build_system_prompt_parts(
+    intent: str,
+    tone: str,
+    language_mix: dict[str, float],
+    platform: str | None = None,
+    entities: list[dict] | None = None,
+    output_language: str | None = None,
+    placeholders: bool = False,
+    reference_rewrite: str | None = None,
+    tone_variants: list[str] | None = None,
+    document_context: str | None = None,
+) -> tuple[str, str]:
+    """
+    Assemble the system prompt as (static_prefix, dynamic_suffix).
+
+    Sections are ordered static-first so the prefix is byte-identical for every
+    request with the same intent / tone / platform / output language / code-switch
+    bucket — that prefix is what call_claude marks for Anthropic prompt caching
+    (on models whose minimum it reaches: Sonnet, not Haiku — see llm._system_blocks).
+    Only per-input blocks (entities, optional reference draft) go in the suffix.
+    placeholders: the input was entity-masked (loma.entity_mask) — add the
+    placeholder-copying rules, which are static, to the prefix.
+    tone_variants: ask for one rewrite per listed tone in a single JSON reply
+    (loma.tone_variants) instead of one rewrite in `tone`.
+    document_context: the input is one chunk of a longer message (loma.chunking);
+    the header saying so goes in the suffix.
+    """
     _load_prompts()
     parts = []
 
@@ -143,8 +204,18 @@ def build_system_prompt(
         logger.warning("No prompt file for intent '%s' — falling back to 'general'", intent)
         intent_data = INTENTS.get("general", {})
     tones = intent_data.get("tones", {})
-    tone_key = tone if tone in tones else "professional"
-    parts.append(tones.get(tone_key, "Produce clear, professional English."))
+    if tone_variants:
+        blocks = [
+            f"TONE VARIANT \"{t}\":\n{tones.get(t if t in tones else 'professional', 'Produce clear, professional English.')}"
+            for t in tone_variants
+        ]
+        parts.append(
+            f"Write {len(tone_variants)} rewrites of the same input, one per tone variant below. "
+            "Every other instruction in this prompt applies to each of them.\n\n" + "\n\n".join(blocks)
+        )
+    else:
+        tone_key = tone if tone in tones else "professional"
+        parts.append(tones.get(tone_key, "Produce clear, professional English."))
 
     # 2b. Cultural context (top-level field from intent JSON)
     cultural_ctx = intent_data.get("cultural_context", "")
@@ -152,8 +223,7 @@ def build_system_prompt(
         parts.append(f"CULTURAL CONTEXT:\n{cultural_ctx}")
 
     # 2c. Few-shot cultural pattern examples from the pattern library
-    vi_ratio = language_mix.get("vi_ratio", 0)
-    code_switched = 0.1 < vi_ratio < 0.9
+    code_switched = is_code_switched(language_mix)
     examples_block = _select_cultural_examples(intent, code_switched=code_switched)
     if examples_block:
         parts.append(examples_block)
@@ -171,16 +241,41 @@ def build_system_prompt(
     if code_switched and "code_switch" in MODIFIERS:
         parts.append(MODIFIERS["code_switch"].get("instruction", ""))
 
-    # 4. Entity preservation (Phase 2+)
-    if entities and "entity_preservation" in MODIFIERS:
-        entity_block = MODIFIERS["entity_preservation"].get("instruction", "")
-        entity_list = ", ".join(f'{e.get("text", "")} ({e.get("label", "")})' for e in entities)
-        entity_block = entity_block.replace("{entity_list}", entity_list)
-        parts.append(entity_block)
+    # 3b. Entity placeholders (input masked before the call)
+    if placeholders and "entity_placeholders" in MODIFIERS:
+        parts.append(MODIFIERS["entity_placeholders"].get("instruction", ""))
 
-    # 5. Platform override
+    # 4. Platform override
     overrides = MODIFIERS.get("platform_overrides", {}).get("platforms", {})
     if platform and platform in overrides:
         parts.append(overrides[platform])
 
-    return "\n\n".join(p for p in parts if p)
+    # 4b. Reply format for multi-tone generation
+    if tone_variants:
+        keys = ", ".join(f'"{t}": "<rewrite>"' for t in tone_variants)
+        parts.append(
+            f"OUTPUT FORMAT: reply with one JSON object only, no commentary: {{{keys}}}. "
+            "Each value is the complete rewrite in that tone."
+        )
+
+    # 5. Entity preservation (Phase 2+) — per-input, so it stays after the cached prefix
+    dynamic_suffix = ""
+    if entities and "entity_preservation" in MODIFIERS:
+        entity_block = MODIFIERS["entity_preservation"].get("instruction", "")
+        entity_list = ", ".join(f'{e.get("text", "")} ({e.get("label", "")})' for e in entities)
+        dynamic_suffix = entity_block.replace("{entity_list}", entity_list)
+
+    # 6. Reference draft from a near-duplicate earlier input (fingerprint index)
+    if reference_rewrite:
+        reference_block = (
+            "REFERENCE: a very similar message was previously rewritten as below. "
+            "Reuse its structure and phrasing where it fits, but rewrite THIS input "
+            "and keep this input's names, numbers and dates.\n\n" + reference_rewrite
+        )
+        dynamic_suffix = "\n\n".join(p for p in (dynamic_suffix, reference_block) if p)
+
+    # 7. Long-document chunk: where this part sits in the message
+    if document_context:
+        dynamic_suffix = "\n\n".join(p for p in (dynamic_suffix, document_context) if p)
+
+    return "\n\n".join(p for p in parts if p), dynamic_suffix
@@ -2,7 +2,11 @@
 Quality scorer — length reduction, entity preservation check, and semantic scoring.
 
 Improvements over v1:
-- Entity post-check: verifies names, numbers, amounts survive the rewrite
+- Entity post-check: verifies names, numbers, amounts survive the rewrite,
+  matching equivalent forms ("15/3" / "March 15") through a canonical index
+- Entity repair: patches reformatted / transliterated entities back in place
+  deterministically, so a missing entity rarely costs a second LLM call
+- Output checks: cheap deterministic gate for cascade routing (Haiku → Sonnet)
 - Semantic quality score via Haiku (optional, background)
 """
 from __future__ import annotations
@@ -10,6 +14,10 @@ from __future__ import annotations
 import logging
 import re
 import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+
+from .language import contains_vietnamese
 
 logger = logging.getLogger("loma.quality")
 
@@ -64,52 +72,301 @@ _COMMON_WORDS = frozenset({
 })
 
 
-def extract_entities(text: str) -> dict[str, list[str]]:
-    """Extract entities that should be preserved through rewriting."""
-    entities: dict[str, list[str]] = {
-        "money": [],
-        "numbers": [],
-        "dates": [],
-        "names": [],
-        "identifiers": [],
-    }
-    entities["money"] = _MONEY_PATTERN.findall(text)
-    entities["numbers"] = [n for n in _NUMBER_PATTERN.findall(text) if len(n) > 1]
-    entities["dates"] = _DATE_PATTERN.findall(text)
-
-    # Names: filter out common English words and very short matches
-    raw_names = _PROPER_NAME_PATTERN.findall(text)
-    entities["names"] = [
-        n for n in raw_names
-        if n.split()[0] not in _COMMON_WORDS and len(n) > 2
-    ]
-
-    entities["identifiers"] = _IDENTIFIER_PATTERN.findall(text)
+# Overlap priority: earlier categories claim a span first ("$5,000" is money, not a number)
+ENTITY_PRIORITY = ("identifiers", "money", "dates", "names", "numbers")
+_CATEGORY_ORDER = ("money", "numbers", "dates", "names", "identifiers")
+_CATEGORY_PATTERNS = {
+    "identifiers": _IDENTIFIER_PATTERN,
+    "money": _MONEY_PATTERN,
+    "dates": _DATE_PATTERN,
+    "names": _PROPER_NAME_PATTERN,
+    "numbers": _NUMBER_PATTERN,
+}
+
+
+EntitySpan = tuple[int, int, str, str]
+
+
+def _keep(category: str, item: str) -> bool:
+    if category == "numbers":
+        return len(item) > 1
+    if category == "names":
+        # Filter out common English words and very short matches
+        return item.split()[0] not in _COMMON_WORDS and len(item) > 2
+    return True
+
+
+def scan_entities(text: str) -> list[EntitySpan]:
+    """
+    Entities that should be preserved through rewriting, as non-overlapping
+    (start, end, category, text) spans in text order. Within a category
+    matches don't overlap (as findall); across categories the higher-priority
+    one wins ("$5,000" is money only, "INV-2024-031" is not also the number
+    2024), then the longer match.
+    """
+    candidates: list[tuple[int, int, int, str, str]] = []
+    for rank, category in enumerate(ENTITY_PRIORITY):
+        for m in _CATEGORY_PATTERNS[category].finditer(text):
+            item = m.group(0)
+            if item and _keep(category, item):
+                candidates.append((rank, m.start() - m.end(), m.start(), category, item))
+    candidates.sort()
+
+    # Claimed spans, kept sorted by start and non-overlapping: one bisect per candidate
+    starts: list[int] = []
+    ends: list[int] = []
+    spans: list[EntitySpan] = []
+    for _, neg_len, start, category, item in candidates:
+        end = start - neg_len
+        i = bisect_left(starts, start)
+        if (i < len(starts) and starts[i] < end) or (i and ends[i - 1] > start):
+            continue
+        starts.insert(i, start)
+        ends.insert(i, end)
+        spans.append((start, end, category, item))
+    spans.sort()
+    return spans
+
+
+def entities_by_category(spans: list[EntitySpan]) -> dict[str, list[str]]:
+    """Group scan_entities() spans as {category: [text, ...]} (occurrences, text order)."""
+    entities: dict[str, list[str]] = {c: [] for c in _CATEGORY_ORDER}
+    for _, _, category, item in spans:
+        entities[category].append(item)
     return entities
 
 
+def extract_entities(text: str) -> dict[str, list[str]]:
+    """Extract entities that should be preserved through rewriting, by category."""
+    return entities_by_category(scan_entities(text))
+
+
+# Canonical entity index: equivalent surface forms ("1.000.000 đồng" / "1,000,000 VND",
+# "15/3" / "March 15", "Q4" / "fourth quarter") reduce to the same key
+_MONTHS = {
+    name: i + 1
+    for i, names in enumerate((
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+        ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+        ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"), ("december", "dec"),
+    ))
+    for name in names
+}
+_MONTH_NAME = "(?:" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?"
+_ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "1st": 1, "2nd": 2, "3rd": 3, "4th": 4,
+             "i": 1, "ii": 2, "iii": 3, "iv": 4}
+# Spelled-out scales only: "k" / "m" are too ambiguous to count as the same amount
+_SCALES = {"thousand": 3, "nghìn": 3, "ngàn": 3, "million": 6, "triệu": 6, "billion": 9, "tỷ": 9}
+_CURRENCIES = {
+    "$": "USD", "usd": "USD", "dollar": "USD", "dollars": "USD",
+    "vnd": "VND", "đồng": "VND", "dong": "VND", "đ": "VND",
+    "€": "EUR", "eur": "EUR", "euro": "EUR", "euros": "EUR",
+    "£": "GBP", "gbp": "GBP", "pound": "GBP", "pounds": "GBP",
+}
+
+_AMOUNT = re.compile(
+    r"(?<![\w.,])(?P<pre>[$€£])?\s*(?P<num>\d{1,3}(?:[ .,]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?)(?![\w]|[.,]\d)"
+    r"(?:\s*(?P<pct>%|percent\b|phần trăm))?"
+    r"(?:\s*(?P<scale>thousand|million|billion|nghìn|ngàn|triệu|tỷ)\b)?"
+    r"(?:\s*(?P<cur>USD|VND|EUR|GBP|dollars?|euros?|pounds?|đồng|dong|đ)(?!\w))?",
+    re.IGNORECASE,
+)
+_NAMED_DATE = re.compile(
+    rf"\b(?:(?P<mon1>{_MONTH_NAME})\s+(?P<d1>\d{{1,2}})(?:st|nd|rd|th)?"
+    rf"|(?P<d2>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<mon2>{_MONTH_NAME}))"
+    r"(?:,?\s+(?P<year>\d{4}))?\b",
+    re.IGNORECASE,
+)
+_NUMERIC_DATE = re.compile(r"(?<![\w/])(?P<a>\d{1,2})/(?P<b>\d{1,2})(?:/(?P<year>\d{2,4}))?(?![\w/])")
+_VI_DATE = re.compile(r"\bngày\s+(?P<d>\d{1,2})\s+tháng\s+(?P<m>\d{1,2})(?:\s+năm\s+(?P<year>\d{4}))?", re.IGNORECASE)
+# Bare month names only when capitalized and spelled out ("may" is usually a verb)
+_MONTH_ONLY = re.compile(
+    r"\btháng\s+(?P<m>\d{1,2})\b|\b(?-i:(?P<name>January|February|March|April|May|June|July|August"
+    r"|September|October|November|December))\b",
+    re.IGNORECASE,
+)
+_QUARTER = re.compile(
+    r"\bQ(?P<q>[1-4])\b|\b(?P<ord>first|second|third|fourth|1st|2nd|3rd|4th)\s+quarter\b"
+    r"|\bquarter\s+(?P<n>[1-4])\b|\bquý\s+(?P<vi>[1-4]|iv|i{1,3})\b",
+    re.IGNORECASE,
+)
+_WORDS = re.compile(r"\w+")
+_MAX_NAME_WORDS = 5
+
+
+def _number_value(token: str, scale: int = 0) -> str | None:
+    """
+    Canonical decimal string of a grouped number: a separator followed by exactly
+    three digits groups thousands ("1.000.000", "1,000,000"), a final differing one
+    is the decimal point ("1,000.50", "1,5"). None for shapes like "1.2.3".
+    """
+    token = token.replace(" ", "")
+    seps = [c for c in token if c in ".,"]
+    groups = re.split(r"[.,]", token)
+    if not seps:
+        integer, fraction = token, ""
+    elif len(set(seps)) == 1 and all(len(g) == 3 for g in groups[1:]):
+        integer, fraction = "".join(groups), ""
+    elif len(set(seps)) == 2 and seps[-1] != seps[0] and seps.count(seps[-1]) == 1:
+        integer, fraction = "".join(groups[:-1]), groups[-1]
+    elif len(seps) == 1:
+        integer, fraction = groups
+    else:
+        return None
+    digits = (integer.lstrip("0") or "0") + fraction.ljust(scale, "0")
+    split = len(digits) - max(len(fraction) - scale, 0)
+    integer, fraction = digits[:split].lstrip("0") or "0", digits[split:].rstrip("0")
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def _amount_keys(m: re.Match) -> set[str]:
+    scale = _SCALES.get((m.group("scale") or "").lower(), 0)
+    value = _number_value(m.group("num"), scale)
+    if value is None:
+        return set()
+    keys = {f"num:{value}", f"money:*:{value}"}
+    currency = _CURRENCIES.get((m.group("pre") or m.group("cur") or "").lower())
+    if currency:
+        keys.add(f"money:{currency}:{value}")
+    if m.group("pct"):
+        keys.add(f"pct:{value}")
+    return keys
+
+
+def _year(value: str | None) -> int | None:
+    if not value:
+        return None
+    year = int(value)
+    return year + 2000 if year < 100 else year
+
+
+def _date_keys(month: int, day: int, year: int | None) -> set[str]:
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return set()
+    keys = {f"date:{month}-{day}", f"month:{month}"}
+    if year:
+        keys.add(f"date:{year}-{month}-{day}")
+    return keys
+
+
+def _quarter(m: re.Match) -> int:
+    if m.group("q") or m.group("n"):
+        return int(m.group("q") or m.group("n"))
+    word = (m.group("ord") or m.group("vi")).lower()
+    return int(word) if word.isdigit() else _ORDINALS[word]
+
+
+def _name_key(text: str) -> str:
+    return "name:" + " ".join(_WORDS.findall(unicodedata.normalize("NFC", text).lower()))
+
+
+def build_entity_index(text: str) -> set[str]:
+    """
+    Canonical keys of every number, amount, date, quarter, identifier and
+    capitalized word sequence in text — built once per output, in a fixed
+    number of linear passes, so each entity check is a set lookup.
+    """
+    index: set[str] = set()
+    for m in _AMOUNT.finditer(text):
+        index |= _amount_keys(m)
+    for m in _NAMED_DATE.finditer(text):
+        month = _MONTHS[(m.group("mon1") or m.group("mon2")).lower().rstrip(".")]
+        index |= _date_keys(month, int(m.group("d1") or m.group("d2")), _year(m.group("year")))
+    for m in _NUMERIC_DATE.finditer(text):
+        a, b, year = int(m.group("a")), int(m.group("b")), _year(m.group("year"))
+        # Day/month and month/day readings are both indexed; the entity side decides
+        index |= _date_keys(b, a, year) | _date_keys(a, b, year)
+    for m in _VI_DATE.finditer(text):
+        index |= _date_keys(int(m.group("m")), int(m.group("d")), _year(m.group("year")))
+    for m in _MONTH_ONLY.finditer(text):
+        month = int(m.group("m")) if m.group("m") else _MONTHS[m.group("name").lower().rstrip(".")]
+        index.add(f"month:{month}")
+    for m in _QUARTER.finditer(text):
+        index.add(f"quarter:{_quarter(m)}")
+    for m in _IDENTIFIER_PATTERN.finditer(text):
+        index.add("id:" + "-".join(re.findall(r"[A-Za-z]+|\d+", m.group(0))).upper())
+    words = _WORDS.findall(unicodedata.normalize("NFC", text).lower())
+    for size in range(2, _MAX_NAME_WORDS + 1):
+        for i in range(len(words) - size + 1):
+            index.add("name:" + " ".join(words[i:i + size]))
+    return index
+
+
+@lru_cache(maxsize=4096)
+def canonical_keys(category: str, item: str) -> frozenset[str]:
+    """Index keys an entity is preserved under (any one present is enough); empty when unparseable."""
+    return frozenset(_canonical_keys(category, item))
+
+
+def _canonical_keys(category: str, item: str) -> set[str]:
+    if category == "names":
+        return {_name_key(item)}
+    if category == "identifiers":
+        return {"id:" + "-".join(re.findall(r"[A-Za-z]+|\d+", item)).upper()}
+    if category == "dates":
+        m = _QUARTER.fullmatch(item)
+        if m:
+            return {f"quarter:{_quarter(m)}"}
+        m = _NUMERIC_DATE.fullmatch(item)
+        if m:
+            # Vietnamese day/month first; month/day only when that reading is impossible
+            a, b, year = int(m.group("a")), int(m.group("b")), _year(m.group("year"))
+            keys = _date_keys(b, a, year) or _date_keys(a, b, year)
+            return {k for k in keys if not k.startswith("month:") and (not year or k.count("-") == 2)}
+        m = _NAMED_DATE.fullmatch(item)
+        if m:
+            month = _MONTHS[(m.group("mon1") or m.group("mon2")).lower().rstrip(".")]
+            return {f"date:{month}-{int(m.group('d1') or m.group('d2'))}"}
+        m = _MONTH_ONLY.fullmatch(item)
+        if m:
+            month = int(m.group("m")) if m.group("m") else _MONTHS[m.group("name").lower().rstrip(".")]
+            return {f"month:{month}"}
+        return set()
+    m = _AMOUNT.fullmatch(item.strip())
+    if not m:
+        return set()
+    keys = _amount_keys(m)
+    if category == "money":
+        currency = _CURRENCIES.get((m.group("pre") or m.group("cur") or "").lower(), "*")
+        return {k for k in keys if k.startswith(f"money:{currency}:")}
+    # A bare number must come back as a number; "15%" as a percentage
+    return {k for k in keys if k.startswith("pct:" if m.group("pct") else "num:")}
+
+
+def _is_preserved(item: str, output_lower: str) -> bool:
+    """Case/NFC-insensitive containment; money also matches without comma formatting."""
+    normalized = unicodedata.normalize("NFC", item.strip().lower())
+    return normalized in output_lower or normalized.replace(",", "") in output_lower
+
+
+def is_preserved(category: str, item: str, index: set[str], output_lower: str) -> bool:
+    """Entity present in the output under its canonical form (substring fallback when unparseable)."""
+    keys = canonical_keys(category, item)
+    if keys:
+        return not keys.isdisjoint(index)
+    return _is_preserved(item, output_lower)
+
+
 def check_entity_preservation(
-    original_text: str, output_text: str
+    original_text: str, output_text: str, entities: list[EntitySpan] | None = None
 ) -> dict:
     """
-    Check which entities from the original are missing in the output.
+    Check which entities from the original are missing in the output, by
+    canonical form ("1.000.000 đồng" survives as "1,000,000 VND").
+    entities: scan_entities(original_text), when the caller already has it.
     Returns {"missing": [...], "total_checked": int, "preserved_pct": float}.
     """
-    entities = extract_entities(original_text)
+    entities = entities_by_category(scan_entities(original_text) if entities is None else entities)
     output_lower = unicodedata.normalize("NFC", output_text.lower())
+    index = build_entity_index(output_text)
     missing = []
     total = 0
 
     for category, items in entities.items():
         for item in items:
             total += 1
-            # Normalize for comparison: Unicode NFC, strip whitespace, lowercase
-            normalized = unicodedata.normalize("NFC", item.strip().lower())
-            if normalized not in output_lower:
-                # For money: also check without comma formatting
-                alt = normalized.replace(",", "")
-                if alt not in output_lower:
-                    missing.append(f"{category}:{item}")
+            if not is_preserved(category, item, index, output_lower):
+                missing.append(f"{category}:{item}")
 
     preserved_pct = ((total - len(missing)) / total * 100) if total > 0 else 100.0
     return {
@@ -119,14 +376,214 @@ def check_entity_preservation(
     }
 
 
-def score_rewrite(original_text: str, output_text: str) -> dict:
+# Entity repair: near-miss forms of an entity the model reformatted instead of copying
+_NUMBER_CORE = r"\d{1,3}(?:[ ,.]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
+_CURRENCY_PREFIX = r"(?:[$€£]\s*)?"
+_CURRENCY_SUFFIX = r"(?:\s*(?:USD|VND|EUR|GBP|đồng|đ)\b)?"
+_NUMBER_NEAR_MISS = re.compile(
+    rf"(?<![\w.,]){_CURRENCY_PREFIX}(?:{_NUMBER_CORE}){_CURRENCY_SUFFIX}(?![\w]|[.,]\d)",
+    re.IGNORECASE,
+)
+# A scale word after the number means the model converted units ("5 million"); never patch those
+_SCALE_AFTER = re.compile(r"\s*(?:k|m|bn|thousand|million|billion|nghìn|ngàn|triệu|tỷ)\b", re.IGNORECASE)
+_CURRENCY_MARK = re.compile(r"[$€£]|USD|VND|EUR|GBP|đồng|đ", re.IGNORECASE)
+# Vietnamese-worded values the model translates rather than copies ("tháng 3", "5 triệu")
+_TRANSLATABLE = re.compile(r"tháng|đồng|triệu|tỷ|ngày", re.IGNORECASE)
+
+
+def is_translatable(item: str) -> bool:
+    """Vietnamese-worded value ("tháng 3", "5 triệu") — the model must translate, not copy it."""
+    return bool(_TRANSLATABLE.search(item))
+
+
+# Vietnamese kinship honorifics captured as part of a name
+HONORIFICS = frozenset({"Anh", "Chị", "Em", "Bác", "Cô", "Chú", "Ông", "Bà", "Bạn"})
+
+
+def strip_honorific(name: str) -> tuple[str, str]:
+    """Split "Anh Hùng" into ("Anh ", "Hùng"); names without an honorific return ("", name)."""
+    first, _, rest = name.partition(" ")
+    if first in HONORIFICS and rest:
+        return first + " ", rest
+    return "", name
+
+
+def _fold(text: str) -> str:
+    """
+    Diacritic-free lowercase form, one character per input character, so
+    offsets in the folded text are offsets in the (NFC) original.
+    """
+    folded = []
+    for ch in text:
+        base = unicodedata.normalize("NFD", ch)[0]
+        folded.append("d" if base in "đĐ" else base.lower())
+    return "".join(folded)
+
+
+def _find_folded(needle: str, haystack: str) -> tuple[int, int] | None:
+    """Span of `needle` in `haystack` compared without case or diacritics, on word boundaries."""
+    m = re.search(r"(?<!\w)" + re.escape(_fold(needle)) + r"(?!\w)", _fold(haystack))
+    return m.span() if m else None
+
+
+def _repair_number(item: str, output_text: str) -> tuple[tuple[int, int], str] | None:
+    """Same digits in a different grouping or currency notation ("$5.000", "5000 USD")."""
+    digits = re.sub(r"\D", "", item)
+    if len(digits) < 2:
+        # Single digits are too ambiguous to align
+        return None
+    for m in _NUMBER_NEAR_MISS.finditer(output_text):
+        if re.sub(r"\D", "", m.group(0)) != digits or _SCALE_AFTER.match(output_text, m.end()):
+            continue
+        if _CURRENCY_MARK.sub("", m.group(0)).strip() == _CURRENCY_MARK.sub("", item).strip():
+            method = "currency"
+        else:
+            method = "number_format"
+        return m.span(), method
+    return None
+
+
+def _repair_name(item: str, output_text: str) -> tuple[tuple[int, int], str, str] | None:
+    """Transliterated name ("Nguyen Van Duc"); a dropped kinship honorific is not a loss."""
+    span = _find_folded(item, output_text)
+    if span:
+        return span, item, "transliteration"
+    honorific, bare = strip_honorific(item)
+    if not honorific:
+        return None
+    if bare in output_text:
+        return None
+    span = _find_folded(bare, output_text)
+    if span:
+        return span, bare, "transliteration"
+    return None
+
+
+def _repair_identifier(item: str, output_text: str) -> tuple[int, int] | None:
+    """Same identifier with different separators or case ("PR 347", "inv 2024-031")."""
+    chunks = re.findall(r"[A-Za-z]+|\d+", item)
+    if len(chunks) < 2:
+        return None
+    pattern = r"(?<!\w)" + r"[\s#_-]*".join(re.escape(c) for c in chunks) + r"(?!\w)"
+    m = re.search(pattern, output_text, re.IGNORECASE)
+    return m.span() if m else None
+
+
+def repair_entities(original_text: str, output_text: str, entities: list[EntitySpan] | None = None) -> dict:
+    """
+    Patch near-miss entities in the output back to their original form, without
+    another model call. Returns
+    {"text": str, "repaired": [{"entity", "found", "method"}], "unresolved": [str]}
+    where entities use the "category:item" form of check_entity_preservation.
+    method: number_format | currency | transliteration | identifier_format | honorific.
+    Translatable (Vietnamese-worded) entities are never patched, only checked.
+    """
+    text = unicodedata.normalize("NFC", output_text)
+    repaired: list[dict] = []
+    unresolved: list[str] = []
+    if entities is None:
+        entities = scan_entities(original_text)
+    # Same canonical comparison as check_entity_preservation: "1,000,000 VND" for
+    # "1.000.000 VND" is preserved and left alone; rebuilt after every patch
+    index = build_entity_index(text)
+    for category, items in entities_by_category(entities).items():
+        for item in items:
+            entity = f"{category}:{item}"
+            if is_preserved(category, item, index, text.lower()):
+                continue
+            if is_translatable(item):
+                # "1.000.000 đồng", "tháng 3": the model translates these; patching the
+                # source wording back would put Vietnamese into the output
+                unresolved.append(entity)
+                continue
+            fix = None
+            if category in ("money", "numbers"):
+                found = _repair_number(item, text)
+                if found:
+                    fix = (found[0], item, found[1])
+            elif category == "names":
+                honorific, bare = strip_honorific(item)
+                if honorific and bare in text:
+                    # "Anh Hùng" → "Hi Hùng": the honorific is rendered by the tone, not copied
+                    repaired.append({"entity": entity, "found": bare, "method": "honorific"})
+                    continue
+                fix = _repair_name(item, text)
+            elif category == "identifiers":
+                span = _repair_identifier(item, text)
+                if span:
+                    fix = (span, item, "identifier_format")
+            if fix is None:
+                unresolved.append(entity)
+                continue
+            (start, end), replacement, method = fix
+            repaired.append({"entity": entity, "found": text[start:end], "method": method})
+            text = text[:start] + replacement + text[end:]
+            index = build_entity_index(text)
+    return {"text": text, "repaired": repaired, "unresolved": unresolved}
+
+
+# Output checks (cascade routing): length ratio bounds and model meta-commentary
+_MIN_LENGTH_RATIO = 0.2
+_MAX_LENGTH_RATIO = 3.0
+_MIN_RATIO_CHECK_CHARS = 40  # very short inputs legitimately expand a lot
+_META_COMMENTARY = re.compile(
+    r"^\s*(?:here(?:'s| is| are)\b|sure[,!.]|certainly[,!.]|of course[,!.]"
+    r"|i(?:'ve| have) (?:rewritten|revised)|rewritten (?:version|text|message)\s*:)"
+    r"|\b(?:as an ai|rewrite this:)"
+    r"|^\s*(?:note|explanation|changes made)\s*:",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def check_output(
+    original_text: str,
+    output_text: str,
+    output_language: str | None = "en",
+    unresolved_entities: list[str] | None = None,
+    entities: list[EntitySpan] | None = None,
+) -> list[str]:
+    """
+    Deterministic checks a cheap-tier output must pass before it is served.
+    Returns the failed check names (empty = pass):
+    entity_missing | language_mismatch | length_ratio | meta_commentary.
+    unresolved_entities: entities still missing after repair (see repair_entities);
+    Vietnamese-worded values ("5 triệu") are expected to be translated and don't count.
+    entities: scan_entities(original_text), when the caller already has it.
+    """
+    failures = []
+    if entities is None:
+        entities = scan_entities(original_text)
+    if unresolved_entities is None:
+        unresolved_entities = repair_entities(original_text, output_text, entities)["unresolved"]
+    if any(not is_translatable(e) for e in unresolved_entities):
+        failures.append("entity_missing")
+
+    # Preserved names ("Nguyễn Văn Đức") carry diacritics; drop entities before detecting language
+    prose = output_text
+    for _, _, _, item in entities:
+        prose = prose.replace(item, " ")
+    wants_vietnamese = (output_language or "en").startswith("vi")
+    if contains_vietnamese(prose) != wants_vietnamese:
+        failures.append("language_mismatch")
+
+    if len(original_text) >= _MIN_RATIO_CHECK_CHARS:
+        ratio = len(output_text) / len(original_text)
+        if not _MIN_LENGTH_RATIO <= ratio <= _MAX_LENGTH_RATIO:
+            failures.append("length_ratio")
+
+    if _META_COMMENTARY.search(output_text):
+        failures.append("meta_commentary")
+    return failures
+
+
+def score_rewrite(original_text: str, output_text: str, entities: list[EntitySpan] | None = None) -> dict:
     """
     Returns quality metrics:
     - length_reduction_pct: percentage shorter (negative = longer)
     - entity_preserved_pct: percentage of entities preserved (0-100)
     - entity_missing: list of missing entities (empty = good)
     """
-    entity_check = check_entity_preservation(original_text, output_text)
+    entity_check = check_entity_preservation(original_text, output_text, entities)
 
     return {
         "length_reduction_pct": compute_length_reduction_pct(original_text, output_text),
@@ -142,18 +599,13 @@ def score_semantic_quality(
 ) -> dict | None:
     """
     Use Haiku to score semantic preservation (1-5).
-    Returns {"meaning_score": int, "tone_score": int, "issues": [str]} or None on failure.
+    Returns {"meaning_score": int, "tone_score": int, "issues": [str], "usage": {...}} or None on failure.
     This is optional and designed to run as a background check, not blocking the response.
     """
-    import os
-
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        return None
+    from . import llm
 
-    try:
-        from anthropic import Anthropic
-    except ImportError:
+    client = llm.shared_client()
+    if client is None:
         return None
 
     prompt = (
@@ -172,15 +624,78 @@ def score_semantic_quality(
     )
 
     try:
-        client = Anthropic(api_key=api_key, timeout=10.0)
+        model = "claude-3-5-haiku-20241022"
         response = client.messages.create(
-            model="claude-3-5-haiku-20241022",
+            model=model,
             max_tokens=256,
             messages=[{"role": "user", "content": prompt}],
+            timeout=10.0,
         )
+        call_usage = llm.record_usage(model, response)
         import json
         text = response.content[0].text.strip()
-        return json.loads(text)
+        result = json.loads(text)
+        if isinstance(result, dict):
+            result["usage"] = call_usage
+        return result
     except Exception as e:
         logger.warning("Semantic quality scoring failed: %s", e)
         return None
+
+
+def score_semantic_quality_batch(items: list[dict]) -> list[dict | None]:
+    """
+    Score several rewrites ({"original_text", "output_text", "intent"}) with one
+    Haiku call. Returns one {"meaning_score", "tone_score", "issues"} per item, in
+    order; entries are None when the call failed or the item was not scored.
+    """
+    from . import llm
+
+    if not items:
+        return []
+    client = llm.shared_client()
+    if client is None:
+        return [None] * len(items)
+
+    blocks = "\n\n".join(
+        f"[{i}] Detected intent: {item['intent']}\n"
+        f"Original (Vietnamese/mixed): {item['original_text']}\n"
+        f"Rewrite: {item['output_text']}"
+        for i, item in enumerate(items)
+    )
+    prompt = (
+        f"You are a quality checker for a Vietnamese-to-English rewriting tool.\n\n"
+        f"{blocks}\n\n"
+        f"Score each rewrite on two dimensions (1-5 each):\n"
+        f"1. meaning_score: Did the rewrite preserve all key information and intent? "
+        f"(5=perfect, 1=lost critical info)\n"
+        f"2. tone_score: Is the tone appropriate for the intent? "
+        f"(5=perfect, 1=completely wrong tone)\n\n"
+        f"Also list any specific issues (max 3 per rewrite).\n\n"
+        f"Respond in JSON only, one object per rewrite: "
+        f'[{{"index": N, "meaning_score": N, "tone_score": N, "issues": ["...", ...]}}, ...]'
+    )
+
+    try:
+        model = "claude-3-5-haiku-20241022"
+        response = client.messages.create(
+            model=model,
+            max_tokens=96 * len(items) + 64,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=30.0,
+        )
+        llm.record_usage(model, response)
+        import json
+        parsed = json.loads(response.content[0].text.strip())
+    except Exception as e:
+        logger.warning("Batch semantic quality scoring failed: %s", e)
+        return [None] * len(items)
+
+    results: list[dict | None] = [None] * len(items)
+    for entry in parsed if isinstance(parsed, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.pop("index", None)
+        if isinstance(index, int) and 0 <= index < len(items) and "meaning_score" in entry:
+            results[index] = entry
+    return results
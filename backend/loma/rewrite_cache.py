@@ -0,0 +1,275 @@
+"""
+Rewrite result cache — content-addressed, two tiers.
+
+Key: sha256 of (normalized input, intent, tone, platform, output_language,
+prompt bundle version, and the other inputs that change the system prompt:
+code-switch bucket, entity placeholders, chunk role), so editing any prompt
+file invalidates old entries.
+Tier 1 is an in-process LRU (bounded entries + TTL). Tier 2 is an optional
+shared backend selected by REWRITE_CACHE_BACKEND: "sqlite" (local file, by
+default in the temp dir, pruned to 10 × REWRITE_CACHE_MAX_ENTRIES) or "redis" (any Redis-compatible server;
+size is bounded by the server's maxmemory policy, entries expire via TTL).
+A misconfigured shared tier (unknown backend, missing URL, redis not
+installed) raises on first use; runtime get/set failures are logged and
+treated as misses.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import config
+from .prompt_assembly import is_code_switched, prompt_bundle_version
+
+logger = logging.getLogger("loma.rewrite_cache")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_input(text: str) -> str:
+    """NFC + collapsed whitespace; case and punctuation are kept (they change the rewrite)."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def cache_key(
+    input_text: str,
+    intent: str,
+    tone: str,
+    platform: str | None,
+    output_language: str | None,
+    part: str | None = None,
+    language_mix: dict[str, float] | None = None,
+    placeholders: bool = False,
+) -> str:
+    """
+    part: a long-document chunk's role (loma.chunking.part_role) — its rewrite depends on it.
+    language_mix / placeholders: as passed to build_system_prompt_parts (code-switch
+    modifier and examples, placeholder-copying rules).
+    """
+    fields = [normalize_input(input_text), intent, tone, platform or "", output_language or "", prompt_bundle_version()]
+    if part:
+        fields.append(part)
+    if language_mix and is_code_switched(language_mix):
+        fields.append("code_switch")
+    if placeholders:
+        fields.append("placeholders")
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryLRU:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    Shared tier for local/dev: one table, expiry column. Every max_entries/10
+    writes, expired rows and all but the newest max_entries (by rowid — INSERT
+    OR REPLACE gives a rewritten key a new one) are deleted.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._prune_every = max(1, max_entries // 10)
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rewrite_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM rewrite_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rewrite_cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl_s, now),
+            )
+            self._writes += 1
+            if self._writes % self._prune_every == 0:
+                self._conn.execute("DELETE FROM rewrite_cache WHERE expires_at < ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM rewrite_cache WHERE rowid <= "
+                    "(SELECT rowid FROM rewrite_cache ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+
+class RedisBackend:
+    """Shared tier for prod: SETEX JSON values under a namespaced key."""
+
+    def __init__(self, url: str, ttl_s: float, prefix: str = "loma:rw:"):
+        import redis
+
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> dict | None:
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: dict) -> None:
+        self._client.setex(self.prefix + key, int(self.ttl_s), json.dumps(value, ensure_ascii=False))
+
+
+_memory = MemoryLRU(config.REWRITE_CACHE_MAX_ENTRIES, config.REWRITE_CACHE_TTL_S)
+_shared = None
+_shared_init = False
+_stats = {"hits_memory": 0, "hits_shared": 0, "misses": 0, "stores": 0}
+
+
+def _get_shared():
+    """
+    Lazy-init the shared tier from config. Returns None when not configured;
+    raises RuntimeError when REWRITE_CACHE_BACKEND names a tier that can't be built.
+    """
+    global _shared, _shared_init
+    if _shared_init:
+        return _shared
+    backend = config.REWRITE_CACHE_BACKEND
+    if backend == "sqlite":
+        _shared = SQLiteBackend(
+            config.REWRITE_CACHE_URL or os.path.join(tempfile.gettempdir(), "loma_rewrite_cache.sqlite3"),
+            config.REWRITE_CACHE_MAX_ENTRIES * 10,
+            config.REWRITE_CACHE_TTL_S,
+        )
+    elif backend == "redis":
+        if not config.REWRITE_CACHE_URL:
+            raise RuntimeError("REWRITE_CACHE_BACKEND=redis needs REWRITE_CACHE_URL (redis://...)")
+        try:
+            _shared = RedisBackend(config.REWRITE_CACHE_URL, config.REWRITE_CACHE_TTL_S)
+        except ImportError as e:
+            raise RuntimeError("REWRITE_CACHE_BACKEND=redis needs the redis package (requirements.txt)") from e
+    elif backend:
+        raise RuntimeError(f"Unknown REWRITE_CACHE_BACKEND {backend!r} (expected sqlite or redis)")
+    _shared_init = True
+    return _shared
+
+
+def set_shared_backend(backend) -> None:
+    """Install a shared tier explicitly (tests, custom deployments). None disables it."""
+    global _shared, _shared_init
+    _shared = backend
+    _shared_init = True
+
+
+def lookup(key: str) -> dict | None:
+    """Memory tier first, then the shared tier (hits are promoted into memory)."""
+    if not config.REWRITE_CACHE_ENABLED:
+        return None
+    value = _memory.get(key)
+    if value is not None:
+        _stats["hits_memory"] += 1
+        return value
+    shared = _get_shared()
+    if shared is not None:
+        try:
+            value = shared.get(key)
+        except Exception as e:
+            logger.warning("Shared rewrite cache get failed: %s", e)
+            value = None
+        if value is not None:
+            _memory.set(key, value)
+            _stats["hits_shared"] += 1
+            return value
+    _stats["misses"] += 1
+    return None
+
+
+def store(key: str, value: dict) -> None:
+    if not config.REWRITE_CACHE_ENABLED:
+        return
+    _memory.set(key, value)
+    _stats["stores"] += 1
+    shared = _get_shared()
+    if shared is not None:
+        try:
+            shared.set(key, value)
+        except Exception as e:
+            logger.warning("Shared rewrite cache set failed: %s", e)
+
+
+async def lookup_async(key: str) -> dict | None:
+    """Async lookup: memory hits return inline; shared-tier I/O runs off the event loop."""
+    if not config.REWRITE_CACHE_ENABLED:
+        return None
+    value = _memory.get(key)
+    if value is not None:
+        _stats["hits_memory"] += 1
+        return value
+    if _get_shared() is None:
+        _stats["misses"] += 1
+        return None
+    return await asyncio.to_thread(lookup, key)
+
+
+async def store_async(key: str, value: dict) -> None:
+    if _get_shared() is None:
+        store(key, value)
+        return
+    await asyncio.to_thread(store, key, value)
+
+
+def clear() -> None:
+    """Drop the memory tier (the shared tier expires on its own)."""
+    _memory.clear()
+
+
+def stats() -> dict:
+    return {**_stats, "memory_entries": len(_memory)}
@@ -0,0 +1,326 @@
+"""
+Learned routing policy — per-cell outcome table compiled offline from stored
+traffic, consulted by route_rewrite before the hand-written rules.
+
+A cell is (intent, length bucket, vi_ratio bucket, platform, output_language).
+build_table() joins stored rewrites with their loma_rewrite / loma_use /
+loma_dismiss / loma_user_edit events and, per cell and tier, aggregates
+acceptance (uses vs dismisses), mean edit distance, p50 latency and mean cost.
+Every rewrite also counts toward its platform-wildcard cell ("*"), which is
+used when the exact cell has too little data.
+
+compile_policy() keeps only tiers with enough feedback and writes a compact
+JSON artifact (run_train_router.py). At runtime choose_tier() picks the
+cheapest — then fastest — tier whose acceptance meets ROUTING_QUALITY_TARGET
+(and whose edit distance stays under ROUTING_MAX_EDIT_PCT); None means no
+tier qualifies and the caller falls back to the rules.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from bisect import bisect_right
+import statistics
+import threading
+import time
+
+import config
+from .usage import TOKEN_FIELDS
+
+logger = logging.getLogger("loma.route_policy")
+
+ARTIFACT_VERSION = 1
+TIERS = ("rules", "haiku", "sonnet")
+# Upper bucket edges: chars of input, vi_ratio of the language mix
+LENGTH_EDGES = (100, 150, 200, 400, 1000)
+VI_RATIO_EDGES = (0.1, 0.3, 0.6)
+WILDCARD = "*"
+
+# Per-tier stat columns stored in the artifact
+_FIELDS = ("samples", "feedback", "acceptance", "edit_pct", "p50_ms", "cost_usd")
+
+_policy: dict | None = None
+_policy_init = False
+_decisions = {"learned": 0, "fallback": 0}
+_lock = threading.Lock()
+
+
+def bucket(value: float, edges: tuple) -> int:
+    """Index of the first edge above value (len(edges) when above all of them)."""
+    return bisect_right(edges, value)
+
+
+def cell_key(
+    intent: str,
+    length: int,
+    vi_ratio: float,
+    platform: str | None,
+    output_language: str | None,
+    length_edges: tuple = LENGTH_EDGES,
+    vi_edges: tuple = VI_RATIO_EDGES,
+) -> str:
+    return "|".join((
+        intent or "general",
+        f"L{bucket(length, length_edges)}",
+        f"V{bucket(vi_ratio, vi_edges)}",
+        platform or "generic",
+        output_language or "en",
+    ))
+
+
+def wildcard_key(key: str) -> str:
+    """The platform-wildcard cell a cell key rolls up into."""
+    parts = key.split("|")
+    parts[3] = WILDCARD
+    return "|".join(parts)
+
+
+def row_language_mix(row: dict) -> dict:
+    """A stored row's language_mix (JSON column or already-decoded dict)."""
+    mix = row.get("language_mix") or {}
+    if isinstance(mix, str):
+        try:
+            mix = json.loads(mix)
+        except json.JSONDecodeError:
+            mix = {}
+    return mix if isinstance(mix, dict) else {}
+
+
+def collect_outcomes(events) -> dict[str, dict]:
+    """rewrite_id → {"cost_usd", "tokens", "cache_hit", "used", "dismissed", "edit_pct"} from event rows."""
+    outcomes: dict[str, dict] = {}
+    for event in events:
+        data = event.get("event_data") or {}
+        rewrite_id = data.get("rewrite_id")
+        if not rewrite_id:
+            continue
+        outcome = outcomes.setdefault(rewrite_id, {})
+        name = event.get("event_name")
+        if name == "loma_rewrite":
+            usage = data.get("usage") or {}
+            outcome["cost_usd"] = usage.get("cost_usd")
+            outcome["tokens"] = sum(usage.get(f, 0) for f in TOKEN_FIELDS) if usage else None
+            outcome["cache_hit"] = bool(data.get("cache_hit"))
+        elif name == "loma_use":
+            outcome["used"] = True
+        elif name == "loma_dismiss":
+            outcome["dismissed"] = True
+        elif name == "loma_user_edit" and data.get("edit_distance_pct") is not None:
+            outcome["edit_pct"] = float(data["edit_distance_pct"])
+    return outcomes
+
+
+def build_table(rewrites, outcomes: dict[str, dict]) -> dict[str, dict[str, dict]]:
+    """
+    Aggregate stored rewrites (rows of the rewrites table) and their outcomes
+    into cell → tier → {"samples", "feedback", "acceptance", "edit_pct", "p50_ms", "cost_usd"}.
+    Cache hits are skipped: their latency and cost say nothing about the tier.
+    """
+    raw: dict[str, dict[str, dict]] = {}
+    for row in rewrites:
+        tier = row.get("routing_tier")
+        if tier not in TIERS:
+            continue
+        outcome = outcomes.get(row.get("id") or "", {})
+        if outcome.get("cache_hit"):
+            continue
+        key = cell_key(
+            row.get("detected_intent"), len(row.get("input_text") or ""),
+            row_language_mix(row).get("vi_ratio", 0.0), row.get("platform"), row.get("output_language"),
+        )
+        for k in (key, wildcard_key(key)):
+            acc = raw.setdefault(k, {}).setdefault(
+                tier, {"samples": 0, "uses": 0, "dismisses": 0, "edits": [], "latencies": [], "costs": []}
+            )
+            acc["samples"] += 1
+            if outcome.get("used"):
+                acc["uses"] += 1
+            elif outcome.get("dismissed"):
+                acc["dismisses"] += 1
+            if outcome.get("edit_pct") is not None:
+                acc["edits"].append(outcome["edit_pct"])
+            if row.get("response_time_ms") is not None:
+                acc["latencies"].append(row["response_time_ms"])
+            if tier == "rules":
+                acc["costs"].append(0.0)
+            elif outcome.get("cost_usd") is not None:
+                acc["costs"].append(outcome["cost_usd"])
+
+    table: dict[str, dict[str, dict]] = {}
+    for key, tiers in raw.items():
+        for tier, acc in tiers.items():
+            feedback = acc["uses"] + acc["dismisses"]
+            table.setdefault(key, {})[tier] = {
+                "samples": acc["samples"],
+                "feedback": feedback,
+                "acceptance": round(acc["uses"] / feedback, 4) if feedback else None,
+                "edit_pct": round(statistics.fmean(acc["edits"]), 1) if acc["edits"] else 0.0,
+                "p50_ms": int(statistics.median(acc["latencies"])) if acc["latencies"] else None,
+                "cost_usd": round(statistics.fmean(acc["costs"]), 8) if acc["costs"] else None,
+            }
+    return table
+
+
+def _tier_costs(table: dict[str, dict[str, dict]]) -> dict[str, float]:
+    """Mean measured cost per tier across wildcard cells — fills cells with no usage data."""
+    costs: dict[str, list[float]] = {}
+    for key, tiers in table.items():
+        if key.split("|")[3] != WILDCARD:
+            continue
+        for tier, stats in tiers.items():
+            if stats["cost_usd"] is not None:
+                costs.setdefault(tier, []).append(stats["cost_usd"])
+    return {tier: round(statistics.fmean(values), 8) for tier, values in costs.items()}
+
+
+def compile_policy(table: dict[str, dict[str, dict]], min_feedback: int | None = None) -> dict:
+    """
+    Compact artifact: bucket edges plus, per cell, rows of
+    [tier, samples, feedback, acceptance, edit_pct, p50_ms, cost_usd] for tiers
+    with at least min_feedback uses + dismisses. Cells left empty are dropped.
+    """
+    min_feedback = config.ROUTING_POLICY_MIN_FEEDBACK if min_feedback is None else min_feedback
+    fill_costs = _tier_costs(table)
+    cells = {}
+    for key in sorted(table):
+        rows = []
+        for tier in TIERS:
+            stats = table[key].get(tier)
+            if stats is None or stats["feedback"] < min_feedback:
+                continue
+            cost = stats["cost_usd"]
+            if cost is None:
+                cost = fill_costs.get(tier, 0.0)
+            rows.append([tier, *(stats[f] for f in _FIELDS[:-1]), cost])
+        if rows:
+            cells[key] = rows
+    return {
+        "version": ARTIFACT_VERSION,
+        "generated_at": int(time.time()),
+        "length_edges": list(LENGTH_EDGES),
+        "vi_ratio_edges": list(VI_RATIO_EDGES),
+        "min_feedback": min_feedback,
+        "cells": cells,
+    }
+
+
+def choose_tier(
+    cell_rows: list[list],
+    quality_target: float | None = None,
+    max_edit_pct: float | None = None,
+) -> str | None:
+    """Cheapest, then fastest, tier meeting the quality target; None when none does."""
+    quality_target = config.ROUTING_QUALITY_TARGET if quality_target is None else quality_target
+    max_edit_pct = config.ROUTING_MAX_EDIT_PCT if max_edit_pct is None else max_edit_pct
+    eligible = []
+    for tier, *values in cell_rows:
+        stats = dict(zip(_FIELDS, values))
+        if stats["acceptance"] is None or stats["acceptance"] < quality_target:
+            continue
+        if stats["edit_pct"] > max_edit_pct:
+            continue
+        latency = stats["p50_ms"] if stats["p50_ms"] is not None else float("inf")
+        eligible.append((stats["cost_usd"], latency, TIERS.index(tier), tier))
+    return min(eligible)[3] if eligible else None
+
+
+def load(path: str) -> dict | None:
+    """Read and validate an artifact; None (logged) when missing or incompatible."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            policy = json.load(f)
+    except FileNotFoundError:
+        logger.warning("Routing policy %s not found — using rule-based routing", path)
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error("Failed to load routing policy %s: %s", path, e)
+        return None
+    if policy.get("version") != ARTIFACT_VERSION:
+        logger.error("Routing policy %s has version %s, expected %d", path, policy.get("version"), ARTIFACT_VERSION)
+        return None
+    logger.info("Loaded routing policy %s (%d cells)", path, len(policy.get("cells") or {}))
+    return policy
+
+
+def preload() -> None:
+    """Load the configured artifact now (process start) instead of on first lookup."""
+    _get_policy()
+
+
+def _get_policy() -> dict | None:
+    """Lazy-load the artifact named by ROUTING_POLICY_PATH (once per process)."""
+    global _policy, _policy_init
+    if _policy_init:
+        return _policy
+    with _lock:
+        if not _policy_init:
+            _policy = load(config.ROUTING_POLICY_PATH) if config.ROUTING_POLICY_PATH else None
+            _policy_init = True
+    return _policy
+
+
+def set_policy(policy: dict | None) -> None:
+    """Install a compiled policy explicitly (tests, hot reload). None disables learned routing."""
+    global _policy, _policy_init
+    _policy = policy
+    _policy_init = True
+
+
+def tier_for(
+    policy: dict,
+    intent: str,
+    length: int,
+    vi_ratio: float,
+    platform: str | None,
+    output_language: str | None,
+    quality_target: float | None = None,
+) -> str | None:
+    """Learned tier from a given artifact (exact platform cell, then wildcard), or None."""
+    key = cell_key(
+        intent, length, vi_ratio, platform, output_language,
+        tuple(policy["length_edges"]), tuple(policy["vi_ratio_edges"]),
+    )
+    for k in (key, wildcard_key(key)):
+        rows = policy["cells"].get(k)
+        if rows:
+            tier = choose_tier(rows, quality_target)
+            if tier is not None:
+                return tier
+    return None
+
+
+def lookup(
+    intent: str,
+    length: int,
+    vi_ratio: float,
+    platform: str | None,
+    output_language: str | None,
+) -> str | None:
+    """Learned tier for this request under the loaded artifact, or None."""
+    policy = _get_policy()
+    if policy is None:
+        return None
+    tier = tier_for(policy, intent, length, vi_ratio, platform, output_language)
+    with _lock:
+        _decisions["learned" if tier else "fallback"] += 1
+    return tier
+
+
+def info() -> dict:
+    """Loaded artifact summary and learned vs rule-based decision counts."""
+    policy = _get_policy()
+    with _lock:
+        decisions = dict(_decisions)
+    return {
+        "loaded": policy is not None,
+        "generated_at": policy.get("generated_at") if policy else None,
+        "cells": len(policy["cells"]) if policy else 0,
+        "quality_target": config.ROUTING_QUALITY_TARGET,
+        "decisions": decisions,
+    }
+
+
+def clear_stats() -> None:
+    with _lock:
+        for k in _decisions:
+            _decisions[k] = 0
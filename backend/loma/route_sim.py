@@ -0,0 +1,254 @@
+"""
+Offline routing-policy simulator — replay stored traffic through candidate
+routing policies and estimate cost, latency and acceptance before shipping a
+router change.
+
+prepare() turns stored rewrites plus their outcome events into compact rows
+and measured per-(cell, tier) distributions: latency samples, mean cost, mean
+tokens and acceptance, with platform-wildcard and per-tier global fallbacks
+(cells as in route_policy). simulate() assigns a tier to every row with the
+policy; rows that keep their recorded tier replay their measured outcome, and
+the rest are priced from the distribution of the tier they were moved to.
+Rows are grouped by (distribution, count) before aggregation, so the cost of
+a run is one policy call per row plus one pass per distribution — a month of
+traffic takes seconds. A "rules" assignment whose rules engine finds no match
+is counted as Haiku, as in the pipeline; cache hits replay as-is because the
+cache key does not depend on the tier.
+"""
+from __future__ import annotations
+
+import importlib
+import statistics
+from typing import Callable
+
+from . import route_policy, router, rules_engine
+
+# Minimum samples before a cell's own distribution is trusted over the wildcard / global one
+MIN_CELL_SAMPLES = 20
+GLOBAL = "*"
+
+Policy = Callable[[dict], str]
+
+
+def prepare(rewrites, outcomes: dict[str, dict]) -> dict:
+    """Compact rows and measured distributions from rewrites rows + collect_outcomes() output."""
+    rows: list[dict] = []
+    acc: dict[tuple[str, str], dict] = {}
+    for r in rewrites:
+        tier = r.get("routing_tier")
+        if tier not in route_policy.TIERS:
+            continue
+        outcome = outcomes.get(r.get("id") or "", {})
+        language_mix = route_policy.row_language_mix(r)
+        text = r.get("input_text") or ""
+        cell = route_policy.cell_key(
+            r.get("detected_intent"), len(text), language_mix.get("vi_ratio", 0.0),
+            r.get("platform"), r.get("output_language"),
+        )
+        accepted = True if outcome.get("used") else False if outcome.get("dismissed") else None
+        row = {
+            "input_text": text,
+            "language_mix": language_mix,
+            "detected_intent": r.get("detected_intent") or "general",
+            "intent_confidence": r.get("intent_confidence") or 0.0,
+            "platform": r.get("platform"),
+            "output_language": r.get("output_language"),
+            "tier": tier,
+            "cache_hit": bool(outcome.get("cache_hit")),
+            "latency_ms": r.get("response_time_ms"),
+            "cost_usd": 0.0 if tier == "rules" else outcome.get("cost_usd"),
+            "tokens": 0 if tier == "rules" else outcome.get("tokens"),
+            "accepted": accepted,
+            "rules_ok": True if tier == "rules" else None,
+            "cell": cell,
+            "wildcard": route_policy.wildcard_key(cell),
+        }
+        rows.append(row)
+        if row["cache_hit"]:
+            continue
+        for key in (row["cell"], row["wildcard"], GLOBAL):
+            a = acc.setdefault((key, tier), {"latencies": [], "costs": [], "tokens": [], "uses": 0, "feedback": 0})
+            if row["latency_ms"] is not None:
+                a["latencies"].append(row["latency_ms"])
+            if row["cost_usd"] is not None:
+                a["costs"].append(row["cost_usd"])
+            if row["tokens"] is not None:
+                a["tokens"].append(row["tokens"])
+            if accepted is not None:
+                a["feedback"] += 1
+                a["uses"] += accepted
+
+    dists = {
+        key: {
+            "samples": len(a["latencies"]),
+            "latencies": sorted(a["latencies"]),
+            "cost_usd": statistics.fmean(a["costs"]) if a["costs"] else None,
+            "tokens": statistics.fmean(a["tokens"]) if a["tokens"] else None,
+            "acceptance": a["uses"] / a["feedback"] if a["feedback"] else None,
+        }
+        for key, a in acc.items()
+    }
+    return {"rows": rows, "dists": dists}
+
+
+def _dist_key(traffic: dict, row: dict, tier: str) -> tuple[str, str] | None:
+    """Most specific distribution for tier with enough samples (global accepts any)."""
+    dists = traffic["dists"]
+    for key in (row["cell"], row["wildcard"]):
+        dist = dists.get((key, tier))
+        if dist is not None and dist["samples"] >= MIN_CELL_SAMPLES:
+            return key, tier
+    return (GLOBAL, tier) if (GLOBAL, tier) in dists and dists[(GLOBAL, tier)]["samples"] else None
+
+
+def _rules_match(row: dict) -> bool:
+    if row["rules_ok"] is None:
+        row["rules_ok"] = rules_engine.apply_rules(
+            row["input_text"], row["detected_intent"], output_language=row["output_language"]
+        ) is not None
+    return row["rules_ok"]
+
+
+def _weighted_percentile(points: list[tuple[float, float]], pct: float) -> float:
+    if not points:
+        return 0.0
+    points.sort()
+    threshold = pct / 100 * sum(w for _, w in points)
+    cumulative = 0.0
+    for value, weight in points:
+        cumulative += weight
+        if cumulative >= threshold:
+            return value
+    return points[-1][0]
+
+
+def simulate(traffic: dict, policy: Policy) -> dict:
+    """Estimated cost, tokens, p50/p95 latency and acceptance of traffic routed by policy."""
+    dists = traffic["dists"]
+    tiers: dict[str, int] = {}
+    groups: dict[tuple[str, str], int] = {}
+    latencies: list[tuple[float, float]] = []
+    cost = tokens = accepted = feedback = 0.0
+    replayed = unmeasured = 0
+
+    for row in traffic["rows"]:
+        tier = row["tier"] if row["cache_hit"] else policy(row)
+        if tier == "rules" and not _rules_match(row):
+            tier = "haiku"
+        tiers[tier] = tiers.get(tier, 0) + 1
+        if tier == row["tier"] and row["latency_ms"] is not None:
+            own = dists.get((row["wildcard"], tier)) or {}
+            replayed += 1
+            latencies.append((row["latency_ms"], 1.0))
+            cost += row["cost_usd"] if row["cost_usd"] is not None else own.get("cost_usd") or 0.0
+            tokens += row["tokens"] if row["tokens"] is not None else own.get("tokens") or 0.0
+            if row["accepted"] is not None:
+                accepted += row["accepted"]
+                feedback += 1
+            continue
+        key = _dist_key(traffic, row, tier)
+        if key is None:
+            unmeasured += 1
+            continue
+        groups[key] = groups.get(key, 0) + 1
+
+    for key, count in groups.items():
+        dist = dists[key]
+        weight = count / len(dist["latencies"])
+        latencies.extend((value, weight) for value in dist["latencies"])
+        cost += count * (dist["cost_usd"] or 0.0)
+        tokens += count * (dist["tokens"] or 0.0)
+        if dist["acceptance"] is not None:
+            accepted += count * dist["acceptance"]
+            feedback += count
+
+    total = len(traffic["rows"])
+    return {
+        "rewrites": total,
+        "tiers": dict(sorted(tiers.items())),
+        "replayed": replayed,
+        "estimated": sum(groups.values()),
+        "unmeasured": unmeasured,
+        "cost_usd": round(cost, 6),
+        "avg_cost_usd": round(cost / total, 8) if total else 0.0,
+        "tokens": int(tokens),
+        "p50_ms": _weighted_percentile(latencies, 50),
+        "p95_ms": _weighted_percentile(latencies, 95),
+        "expected_acceptance": round(accepted / feedback, 4) if feedback else None,
+    }
+
+
+def compare(traffic: dict, policies: dict[str, Policy], baseline: str = "live") -> dict:
+    """simulate() every policy and report each one's deltas against the baseline policy."""
+    reports = {name: simulate(traffic, policy) for name, policy in policies.items()}
+    base = reports[baseline]
+    deltas = {}
+    for name, report in reports.items():
+        if name == baseline:
+            continue
+        acceptance = None
+        if report["expected_acceptance"] is not None and base["expected_acceptance"] is not None:
+            acceptance = round(report["expected_acceptance"] - base["expected_acceptance"], 4)
+        deltas[name] = {
+            "cost_pct": round((report["cost_usd"] - base["cost_usd"]) / base["cost_usd"] * 100, 1)
+            if base["cost_usd"] else None,
+            "p50_ms": report["p50_ms"] - base["p50_ms"],
+            "p95_ms": report["p95_ms"] - base["p95_ms"],
+            "acceptance": acceptance,
+        }
+    return {"baseline": baseline, "policies": reports, "deltas": deltas}
+
+
+# ---------- Candidate policies ----------
+
+def recorded_policy(row: dict) -> str:
+    """The tier each rewrite was actually served on."""
+    return row["tier"]
+
+
+def live_policy(row: dict) -> str:
+    """route_rewrite as configured in this process (learned artifact, if loaded, then rules)."""
+    return router.route_rewrite(
+        row["input_text"], row["language_mix"], row["detected_intent"], row["intent_confidence"],
+        row["output_language"], row["platform"],
+    )
+
+
+def rules_policy(row: dict) -> str:
+    """The hand-written rules only."""
+    return router.route_by_rules(row["input_text"], row["language_mix"], row["detected_intent"], row["output_language"])
+
+
+def learned_policy(policy: dict, quality_target: float | None = None) -> Policy:
+    """A compiled route_policy artifact (with rules fallback), independent of the loaded one."""
+    def route(row: dict) -> str:
+        if row["output_language"] == "vi_admin":
+            return "rules"
+        tier = route_policy.tier_for(
+            policy, row["detected_intent"], len(row["input_text"]), row["language_mix"].get("vi_ratio", 0.0),
+            row["platform"], row["output_language"], quality_target,
+        )
+        return tier or rules_policy(row)
+    return route
+
+
+def policy_from_spec(spec: str) -> Policy:
+    """
+    recorded | live | rules | haiku | sonnet | learned:<artifact>[@<quality target>]
+    | <module>:<callable> (called with each row dict, returns a tier).
+    """
+    named = {"recorded": recorded_policy, "live": live_policy, "rules": rules_policy}
+    if spec in named:
+        return named[spec]
+    if spec in ("haiku", "sonnet"):
+        return lambda row: spec
+    if spec.startswith("learned:"):
+        path, _, target = spec[len("learned:"):].partition("@")
+        policy = route_policy.load(path)
+        if policy is None:
+            raise ValueError(f"cannot load routing policy {path}")
+        return learned_policy(policy, float(target) if target else None)
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"unknown policy {spec!r}")
+    return getattr(importlib.import_module(module_name), attr)
@@ -1,8 +1,21 @@
 """
 Cost router — route to rules | haiku | sonnet (Tech Spec 3.5, v1.5 output_language).
+
+Cascade mode (ROUTING_CASCADE): a Sonnet-routed rewrite runs on Haiku first and
+is escalated to Sonnet only when the Haiku output fails the deterministic
+output checks; per-intent escalation rates are kept in cascade_stats().
+
+Learned policy (ROUTING_POLICY_PATH): when a compiled route_policy artifact is
+loaded, its per-cell choice wins; cells without a qualifying tier fall back to
+the rules below.
 """
 from __future__ import annotations
 
+import threading
+
+import config
+from . import route_policy
+
 # Intents that can be handled by rules for very short/simple text
 LOW_COMPLEXITY_INTENTS = frozenset({"follow_up", "say_no", "apologize", "general"})
 
@@ -31,6 +44,7 @@ def route_rewrite(
     intent: str,
     intent_confidence: float,
     output_language: str | None = None,
+    platform: str | None = None,
 ) -> str:
     """
     Returns "rules" | "haiku" | "sonnet".
@@ -40,6 +54,25 @@ def route_rewrite(
     if output_language == "vi_admin":
         return "rules"
 
+    learned = route_policy.lookup(
+        intent, len(input_text), language_mix.get("vi_ratio", 0.0), platform, output_language
+    )
+    if learned is not None:
+        return learned
+
+    return route_by_rules(input_text, language_mix, intent, output_language)
+
+
+def route_by_rules(
+    input_text: str,
+    language_mix: dict[str, float],
+    intent: str,
+    output_language: str | None = None,
+) -> str:
+    """The hand-written routing rules alone (the fallback when no learned tier applies)."""
+    if output_language == "vi_admin":
+        return "rules"
+
     if can_rules_handle(input_text, intent):
         return "rules"
 
@@ -59,3 +92,40 @@ def route_rewrite(
 
     # Vietnamese or code-switched, or complex intents → Sonnet
     return "sonnet"
+
+
+_cascade_stats: dict[str, dict] = {}
+_cascade_lock = threading.Lock()
+
+
+def use_cascade(tier: str) -> bool:
+    """True when a rewrite routed to `tier` should try Haiku first."""
+    return config.ROUTING_CASCADE and tier == "sonnet"
+
+
+def record_cascade(intent: str, escalated: bool, reasons: list[str]) -> None:
+    with _cascade_lock:
+        stats = _cascade_stats.setdefault(intent, {"cascaded": 0, "escalated": 0, "reasons": {}})
+        stats["cascaded"] += 1
+        if escalated:
+            stats["escalated"] += 1
+            for reason in reasons:
+                stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+
+
+def cascade_stats() -> dict[str, dict]:
+    """Per intent: cascaded rewrites, escalations to Sonnet, escalation_rate, failed-check counts."""
+    with _cascade_lock:
+        return {
+            intent: {
+                **stats,
+                "reasons": dict(stats["reasons"]),
+                "escalation_rate": round(stats["escalated"] / stats["cascaded"], 4),
+            }
+            for intent, stats in _cascade_stats.items()
+        }
+
+
+def clear_cascade_stats() -> None:
+    with _cascade_lock:
+        _cascade_stats.clear()
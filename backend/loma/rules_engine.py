@@ -6,11 +6,13 @@ Công văn (vi_admin) template for write_to_gov (Tech Spec v1.5).
 from __future__ import annotations
 
 import json
+from functools import lru_cache
 from pathlib import Path
 
 
+@lru_cache(maxsize=1)
 def _load_patterns() -> list[dict]:
-    """Load cultural patterns from repo docs (or bundled copy)."""
+    """Load cultural patterns from repo docs (or bundled copy) — read once per process."""
     root = Path(__file__).resolve().parent.parent.parent
     paths = [
         root / "docs" / "Loma_Cultural_Patterns_v0.1.json",
@@ -101,14 +103,8 @@ def apply_rules(
             if result:
                 return result
 
-    patterns = _load_patterns()
     text_stripped = input_text.strip().lower()
-    for p in patterns:
-        if p.get("category") != intent and _category_to_intent(p.get("category")) != intent:
-            continue
-        vi = (p.get("vietnamese_pattern") or "").lower()
-        if not vi:
-            continue
+    for vi, p in _patterns_for_intent(intent):
         # Exact match: use loma_mapping (may contain [name], [date], etc. — keep as-is for now)
         if vi in text_stripped or text_stripped in vi:
             mapping = p.get("loma_mapping") or ""
@@ -122,6 +118,17 @@ def apply_rules(
     return None
 
 
+@lru_cache(maxsize=64)
+def _patterns_for_intent(intent: str) -> tuple[tuple[str, dict], ...]:
+    """(lowercased vietnamese_pattern, pattern) pairs for an intent, in file order."""
+    return tuple(
+        ((p.get("vietnamese_pattern") or "").lower(), p)
+        for p in _load_patterns()
+        if (p.get("category") == intent or _category_to_intent(p.get("category")) == intent)
+        and p.get("vietnamese_pattern")
+    )
+
+
 def _category_to_intent(category: str | None) -> str | None:
     """Map cultural pattern category to intent name."""
     if not category:
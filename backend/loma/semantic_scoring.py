@@ -0,0 +1,329 @@
+"""
+Background semantic quality scoring — sampled rewrites are spooled and scored
+by Haiku off the response path.
+
+submit() is called after a rewrite is stored. It samples by rewrite id at the
+rate configured for the rewrite's intent / tier (SEMANTIC_SAMPLE_RATES, then
+SEMANTIC_SAMPLE_RATE) and appends the rewrite to a local SQLite spool. The
+insert never waits: when the spool lock is busy or SEMANTIC_QUEUE_MAX rows are
+pending, the sample is dropped and counted (backpressure). The spool is a
+file local to the process (the temp dir by default, writable on Lambda), so it
+is drained inside that process: worker threads (SEMANTIC_WORKERS, also on
+Lambda, where they run while the instance serves invocations and the spool
+lasts as long as the instance) lease batches of SEMANTIC_BATCH_SIZE rows,
+score each batch with one Haiku call and write {"meaning_score", "tone_score",
+"issues"} to the rewrite's semantic_scores column. Failed batches are retried
+with backoff, up to MAX_ATTEMPTS. stats() reports queue depth, oldest pending age and
+enqueue-to-scored lag.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import statistics
+import threading
+import time
+from collections import deque
+
+import config
+from . import db
+from .quality import score_semantic_quality_batch
+
+logger = logging.getLogger("loma.semantic_scoring")
+
+MAX_ATTEMPTS = 3
+# A leased batch not completed within this long is handed to another worker
+LEASE_S = 120.0
+RETRY_BACKOFF_S = 30.0
+# How long submit() may wait for the spool lock before dropping the sample
+_SUBMIT_LOCK_TIMEOUT_S = 0.05
+_IDLE_POLL_S = 2.0
+_LAG_WINDOW = 1000
+
+_counters = {
+    "submitted": 0, "sampled_out": 0, "dropped": 0, "scored": 0,
+    "unscored": 0, "retried": 0, "failed": 0, "batches": 0,
+}
+_lags: deque[float] = deque(maxlen=_LAG_WINDOW)
+_stats_lock = threading.Lock()
+
+_spool: Spool | None = None
+_spool_init = False
+_init_lock = threading.Lock()
+_workers: list[threading.Thread] = []
+_stop = threading.Event()
+
+
+class Spool:
+    """Durable FIFO of rewrites awaiting scoring, with per-row leases for concurrent workers."""
+
+    def __init__(self, path: str, max_pending: int):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=1.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_queue ("
+            "rewrite_id TEXT PRIMARY KEY, payload TEXT NOT NULL, enqueued_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, leased INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_semantic_queue_available ON semantic_queue (available_at)"
+        )
+
+    def put(self, rewrite_id: str, payload: dict, lock_timeout: float = -1) -> bool:
+        """Append a row; False when the spool is full or its lock isn't free within lock_timeout."""
+        if not self._lock.acquire(timeout=lock_timeout):
+            return False
+        try:
+            if self._conn.execute("SELECT COUNT(*) FROM semantic_queue").fetchone()[0] >= self.max_pending:
+                return False
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR IGNORE INTO semantic_queue (rewrite_id, payload, enqueued_at, available_at) "
+                "VALUES (?, ?, ?, ?)",
+                (rewrite_id, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+            return True
+        finally:
+            self._lock.release()
+
+    def lease(self, limit: int, lease_s: float = LEASE_S) -> list[dict]:
+        """Claim up to `limit` available rows (oldest first) for lease_s seconds."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT rewrite_id, payload, enqueued_at, attempts FROM semantic_queue "
+                    "WHERE available_at <= ? ORDER BY enqueued_at LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE semantic_queue SET available_at = ?, leased = 1 WHERE rewrite_id = ?",
+                    [(now + lease_s, r[0]) for r in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            {"rewrite_id": r[0], **json.loads(r[1]), "enqueued_at": r[2], "attempts": r[3]}
+            for r in rows
+        ]
+
+    def complete(self, rewrite_ids: list[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM semantic_queue WHERE rewrite_id = ?", [(i,) for i in rewrite_ids])
+
+    def retry(self, rewrite_id: str, delay_s: float) -> None:
+        """Release a leased row for another attempt after delay_s."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE semantic_queue SET attempts = attempts + 1, available_at = ?, leased = 0 WHERE rewrite_id = ?",
+                (time.time() + delay_s, rewrite_id),
+            )
+
+    def depth(self) -> dict:
+        """{"pending", "leased", "oldest_enqueued_at"} — leased rows are in a worker's hands."""
+        now = time.time()
+        with self._lock:
+            pending, leased, oldest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(leased = 1 AND available_at > ?), 0), MIN(enqueued_at) "
+                "FROM semantic_queue",
+                (now,),
+            ).fetchone()
+        return {"pending": pending, "leased": leased, "oldest_enqueued_at": oldest}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _counters[name] += n
+
+
+def sample_rate(intent: str | None, tier: str | None) -> float:
+    """SEMANTIC_SAMPLE_RATES entry for "intent/tier", then intent, then tier; else SEMANTIC_SAMPLE_RATE."""
+    rates = config.SEMANTIC_SAMPLE_RATES
+    for key in (f"{intent}/{tier}", intent, tier):
+        if key in rates:
+            return rates[key]
+    return config.SEMANTIC_SAMPLE_RATE
+
+
+def sampled(rewrite_id: str, rate: float) -> bool:
+    """Deterministic per-rewrite coin flip, so a replayed or retried rewrite samples the same way."""
+    if rate <= 0:
+        return False
+    digest = hashlib.sha256(rewrite_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64 < rate
+
+
+def _get_spool() -> Spool | None:
+    """Lazy-open the spool named by SEMANTIC_SPOOL_PATH. Returns None when scoring is off or it can't open."""
+    global _spool, _spool_init
+    if _spool_init:
+        return _spool
+    with _init_lock:
+        if not _spool_init:
+            if config.SEMANTIC_SCORING:
+                try:
+                    _spool = Spool(config.SEMANTIC_SPOOL_PATH, config.SEMANTIC_QUEUE_MAX)
+                except Exception as e:
+                    logger.error("Failed to open semantic scoring spool %s: %s", config.SEMANTIC_SPOOL_PATH, e)
+            _spool_init = True
+    return _spool
+
+
+def set_spool(spool: Spool | None) -> None:
+    """Install a spool explicitly (tests, custom deployments). None disables scoring."""
+    global _spool, _spool_init
+    _spool = spool
+    _spool_init = True
+
+
+def submit(result: dict) -> bool:
+    """
+    Spool a finished rewrite (pipeline response) for scoring if it is sampled.
+    Never blocks the caller: a busy or full spool drops the sample. True when queued.
+    """
+    if not config.SEMANTIC_SCORING or not result.get("rewrite_id") or result.get("cache_hit"):
+        return False
+    if not sampled(result["rewrite_id"], sample_rate(result.get("detected_intent"), result.get("routing_tier"))):
+        _count("sampled_out")
+        return False
+    spool = _get_spool()
+    if spool is None:
+        return False
+    payload = {
+        "original_text": result.get("original_text", ""),
+        "output_text": result.get("output_text", ""),
+        "intent": result.get("detected_intent") or "general",
+    }
+    try:
+        queued = spool.put(result["rewrite_id"], payload, lock_timeout=_SUBMIT_LOCK_TIMEOUT_S)
+    except Exception as e:
+        logger.warning("Semantic scoring spool write failed: %s", e)
+        queued = False
+    _count("submitted" if queued else "dropped")
+    if queued:
+        start_workers()
+    return queued
+
+
+def process_batch(spool: Spool, batch_size: int | None = None) -> int:
+    """Lease, score and write back one batch. Returns the number of rows leased (0 = spool idle)."""
+    rows = spool.lease(batch_size or config.SEMANTIC_BATCH_SIZE)
+    if not rows:
+        return 0
+    results = score_semantic_quality_batch(rows)
+    _count("batches")
+    done: list[str] = []
+    for row, scores in zip(rows, results):
+        if scores is None:
+            if row["attempts"] + 1 >= MAX_ATTEMPTS:
+                logger.warning("Giving up semantic scoring of %s after %d attempts", row["rewrite_id"], MAX_ATTEMPTS)
+                _count("failed")
+                done.append(row["rewrite_id"])
+            else:
+                _count("retried")
+                spool.retry(row["rewrite_id"], RETRY_BACKOFF_S * 2 ** row["attempts"])
+            continue
+        semantic = {
+            "meaning_score": scores.get("meaning_score"),
+            "tone_score": scores.get("tone_score"),
+            "issues": scores.get("issues") or [],
+        }
+        if db.update_rewrite_semantic_scores(row["rewrite_id"], semantic):
+            _count("scored")
+        else:
+            _count("unscored")
+        with _stats_lock:
+            _lags.append(time.time() - row["enqueued_at"])
+        done.append(row["rewrite_id"])
+    spool.complete(done)
+    return len(rows)
+
+
+def drain(max_batches: int | None = None) -> int:
+    """Process batches on this thread until the spool is idle (or max_batches). Returns rows leased."""
+    spool = _get_spool()
+    if spool is None:
+        return 0
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        n = process_batch(spool)
+        if not n:
+            break
+        total += n
+        batches += 1
+    return total
+
+
+def _worker_loop(spool: Spool) -> None:
+    while not _stop.is_set():
+        try:
+            if process_batch(spool):
+                continue
+        except Exception as e:
+            logger.error("Semantic scoring worker error: %s", e)
+        _stop.wait(_IDLE_POLL_S)
+
+
+def start_workers() -> None:
+    """Start SEMANTIC_WORKERS daemon threads once per process (no-op when 0 or already running)."""
+    if _workers or config.SEMANTIC_WORKERS <= 0:
+        return
+    spool = _get_spool()
+    if spool is None:
+        return
+    with _init_lock:
+        if _workers:
+            return
+        _stop.clear()
+        for i in range(config.SEMANTIC_WORKERS):
+            thread = threading.Thread(target=_worker_loop, args=(spool,), name=f"loma-semantic-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def stop_workers(timeout: float = 5.0) -> None:
+    _stop.set()
+    with _init_lock:
+        for thread in _workers:
+            thread.join(timeout)
+        _workers.clear()
+
+
+def stats() -> dict:
+    """Sampling / queue counters, spool depth and lag (oldest pending age, enqueue → scored)."""
+    with _stats_lock:
+        counters = dict(_counters)
+        lags = list(_lags)
+    spool = _get_spool() if config.SEMANTIC_SCORING else None
+    depth = None
+    if spool is not None:
+        try:
+            depth = spool.depth()
+        except Exception as e:
+            logger.warning("Semantic scoring spool stats failed: %s", e)
+    oldest = depth["oldest_enqueued_at"] if depth else None
+    return {
+        "enabled": config.SEMANTIC_SCORING,
+        "workers": len(_workers),
+        **counters,
+        "pending": depth["pending"] if depth else 0,
+        "leased": depth["leased"] if depth else 0,
+        "oldest_pending_s": round(time.time() - oldest, 1) if oldest else None,
+        "lag_p50_s": round(statistics.median(lags), 1) if lags else None,
+        "lag_max_s": round(max(lags), 1) if lags else None,
+    }
+
+
+def clear_stats() -> None:
+    with _stats_lock:
+        for k in _counters:
+            _counters[k] = 0
+        _lags.clear()
@@ -0,0 +1,142 @@
+"""
+Per-stage request timings — where a rewrite's time went.
+
+A Timings holds one fixed slot per stage in STAGES. Stages are timed with the
+monotonic perf_counter: `t = timings.add(INTENT, t)` adds the time since t to
+the stage and returns the new reading, so consecutive stages chain without
+allocating. A stage timed more than once in a request (the LLM call and its
+retries, entity repair per model answer) accumulates.
+
+run_rewrite fills the pipeline stages; the handler passes in its own Timings
+so auth, quota, db_store and analytics land in the same record. Whoever owns
+the Timings calls emit() once the request is done: one structured log line
+(`rewrite_timings {json}`) and a sample per stage for the in-process
+percentiles in stats() (GET /api/v1/stats/usage → stage_timings).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("loma.timing")
+
+STAGES = (
+    "language", "intent", "route", "rules", "entities", "cache", "prompt",
+    "llm", "quality", "auth", "quota", "db_store", "analytics",
+)
+(
+    LANGUAGE, INTENT, ROUTE, RULES, ENTITIES, CACHE, PROMPT,
+    LLM, QUALITY, AUTH, QUOTA, DB_STORE, ANALYTICS,
+) = range(len(STAGES))
+
+# Samples kept per stage for stats()
+MAX_SAMPLES = 2048
+
+_samples: tuple[deque[float], ...] = tuple(deque(maxlen=MAX_SAMPLES) for _ in STAGES)
+_totals: deque[float] = deque(maxlen=MAX_SAMPLES)
+_lock = threading.Lock()
+
+now = time.perf_counter
+
+
+class Timings:
+    """Accumulated seconds per stage for one request, plus when the request started."""
+
+    __slots__ = ("started", "_seconds", "_seen")
+
+    def __init__(self, started: float | None = None):
+        self.started = now() if started is None else started
+        self._seconds = [0.0] * len(STAGES)
+        self._seen = 0
+
+    def add(self, stage: int, since: float) -> float:
+        """Add the time since `since` (a now() reading) to a stage; returns the current reading."""
+        t = now()
+        self._seconds[stage] += t - since
+        self._seen |= 1 << stage
+        return t
+
+    def ms(self, stage: int) -> float | None:
+        """Milliseconds spent in a stage; None when it didn't run."""
+        if not self._seen & (1 << stage):
+            return None
+        return self._seconds[stage] * 1000
+
+    def add_parallel(self, parts: list["Timings"]) -> None:
+        """Add parts that ran concurrently: per stage, the longest part's time."""
+        for i in range(len(STAGES)):
+            ran = [part._seconds[i] for part in parts if part._seen & (1 << i)]
+            if ran:
+                self._seconds[i] += max(ran)
+                self._seen |= 1 << i
+
+    def as_dict(self) -> dict[str, float]:
+        """{stage: ms} for the stages that ran (in STAGES order), plus "total" since the start."""
+        out = {
+            name: round(self._seconds[i] * 1000, 2)
+            for i, name in enumerate(STAGES)
+            if self._seen & (1 << i)
+        }
+        out["total"] = round((now() - self.started) * 1000, 2)
+        return out
+
+
+def emit(timings: Timings, result: dict | None = None) -> dict[str, float]:
+    """
+    Log the request's timings as one structured line and add them to the
+    per-stage percentiles. result (the rewrite response) adds rewrite_id,
+    tier and intent to the log line. Returns the timings dict.
+    """
+    stages = timings.as_dict()
+    with _lock:
+        for i, samples in enumerate(_samples):
+            ms = timings.ms(i)
+            if ms is not None:
+                samples.append(ms)
+        _totals.append(stages["total"])
+    if logger.isEnabledFor(logging.INFO):
+        result = result or {}
+        logger.info("rewrite_timings %s", json.dumps({
+            "rewrite_id": result.get("rewrite_id"),
+            "routing_tier": result.get("routing_tier"),
+            "detected_intent": result.get("detected_intent"),
+            "timings_ms": stages,
+        }))
+    return stages
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(math.ceil(pct / 100 * len(ordered))) - 1)]
+
+
+def _summary(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(_percentile(ordered, 50), 2),
+        "p95_ms": round(_percentile(ordered, 95), 2),
+        "p99_ms": round(_percentile(ordered, 99), 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def stats() -> dict:
+    """Percentiles per stage over the last MAX_SAMPLES requests that ran it, and of the total."""
+    with _lock:
+        per_stage = [list(s) for s in _samples]
+        totals = list(_totals)
+    out = {name: _summary(values) for name, values in zip(STAGES, per_stage) if values}
+    if totals:
+        out["total"] = _summary(totals)
+    return out
+
+
+def clear_stats() -> None:
+    with _lock:
+        for samples in _samples:
+            samples.clear()
+        _totals.clear()
@@ -0,0 +1,402 @@
+"""
+Tone variants — the other tones of a rewrite, generated alongside it so a
+tone switch in the extension is a lookup instead of a new rewrite.
+
+With tone variants requested (TONE_VARIANTS or "tone_variants": true), the
+pipeline starts one structured LLM call for the remaining TONES as soon as the
+prompt inputs are known, concurrently with the call for the requested tone.
+The call shares the masked input, intent, platform and output-language prompt
+sections and returns a JSON object keyed by tone; each variant is restored,
+repaired and scored like a normal output. One call for three tones sends the
+prompt once, where three parallel rewrites would send it three times.
+
+Variants are kept under the rewrite_id (in-process LRU plus the rewrite cache's
+shared tier) and each one is also written to the rewrite cache under its own
+tone's key, so a plain /rewrite with that tone hits as well. On a cache hit the
+primary call is skipped and variants come from the rewrite cache only.
+GET /api/v1/rewrite/{id}/tone/{tone} serves them without a quota debit, to
+the user who made the rewrite only. Without a shared cache tier the variants
+live in one process, so a switch served by another instance (most of them, on
+Lambda) misses and the client regenerates: switches are best-effort.
+The variant call's usage is counted once (VariantUsage): in the rewrite's
+`usage` when the response waited for it, else in the rolling usage stats
+when the background call finishes.
+stats() compares tone-switch latency served from variants against switches
+that needed a full rewrite.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import statistics
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import config
+from . import llm, output_length, usage
+from .entity_mask import restore_entities
+from .prompt_assembly import build_system_prompt_parts
+from .quality import repair_entities, score_rewrite
+from .rewrite_cache import MemoryLRU
+
+logger = logging.getLogger("loma.tone_variants")
+
+TONES = ("professional", "direct", "warm", "formal")
+
+_SHARED_PREFIX = "tones:"
+# How long a tone switch waits for a generation still running in this process
+LOOKUP_WAIT_S = 2.0
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_LATENCY_WINDOW = 1000
+
+_memory = MemoryLRU(config.TONE_VARIANTS_MAX_ENTRIES, config.TONE_VARIANTS_TTL_S)
+_pending: dict[str, Future] = {}
+_pending_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+_counters = {"generated": 0, "failed": 0, "from_cache": 0, "hits": 0, "misses": 0}
+_switch_ms: dict[str, deque[float]] = {
+    "variant": deque(maxlen=_LATENCY_WINDOW),
+    "rewrite": deque(maxlen=_LATENCY_WINDOW),
+}
+_stats_lock = threading.Lock()
+
+
+class VariantUsage:
+    """
+    Usage records of one variant call (`calls` is its usage_sink). The response
+    takes them into the rewrite's usage if the call finished in time; after
+    detach() the call records them itself when it finishes.
+    """
+
+    def __init__(self):
+        self.calls: list[dict] = []
+        self._lock = threading.Lock()
+        self._finished = False
+        self._detached = False
+
+    def finish(self, request: dict, tier: str) -> None:
+        """The call is done: record its usage now if the response has already gone without it."""
+        with self._lock:
+            self._finished = True
+            detached = self._detached
+        if detached:
+            usage.record_background_calls(self.calls, tier, request["detected_intent"], request["platform"])
+
+    def detach(self) -> bool:
+        """The response won't wait: True when the call will record its own usage, False if it is already done."""
+        with self._lock:
+            self._detached = not self._finished
+            return self._detached
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _counters[name] += n
+
+
+def other_tones(tone: str) -> list[str]:
+    return [t for t in TONES if t != tone]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="loma-tones")
+    return _executor
+
+
+def _request(request: dict, tones: list[str]) -> tuple[str, str, dict]:
+    """(system_prompt, cache_prefix, length kwargs) for one call covering `tones`."""
+    static_prefix, dynamic_suffix = build_system_prompt_parts(
+        intent=request["detected_intent"],
+        tone=request["tone"],
+        language_mix=request["language_mix"],
+        platform=request["platform"],
+        entities=request["prompt_entities"],
+        output_language=request["output_language"],
+        placeholders=bool(request["placeholders"]),
+        tone_variants=tones,
+    )
+    system_prompt = "\n\n".join(p for p in (static_prefix, dynamic_suffix) if p)
+    max_tokens = min(output_length.MAX_MAX_TOKENS, request["max_tokens"] * len(tones))
+    return system_prompt, static_prefix, {"max_tokens": max_tokens}
+
+
+def parse_variants(text: str, tones: list[str]) -> dict[str, str]:
+    """{tone: rewrite} from the model's JSON reply (code fences / stray text tolerated)."""
+    match = _JSON_OBJECT.search(text or "")
+    if not match:
+        return {}
+    try:
+        parsed = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {t: parsed[t].strip() for t in tones if isinstance(parsed.get(t), str) and parsed[t].strip()}
+
+
+def _finish_variant(request: dict, masked_output: str) -> dict | None:
+    """Restore placeholders, repair and score one variant; None when it can't be served."""
+    if llm.is_placeholder(masked_output):
+        return None
+    clean = True
+    text = masked_output
+    if request["placeholders"]:
+        restored = restore_entities(masked_output, request["placeholders"], request["llm_input"])
+        text = restored["text"]
+        clean = not (restored["missing"] or restored["unknown"])
+    repair = repair_entities(request["original_text"], text, request["entities"])
+    return {
+        "output_text": repair["text"],
+        "masked_output": masked_output,
+        "cacheable": clean and not repair["unresolved"],
+        "scores": score_rewrite(request["original_text"], repair["text"], request["entities"]),
+    }
+
+
+def _finish(request: dict, tones: list[str], reply: str | None) -> dict[str, dict]:
+    variants = {}
+    for tone, masked_output in parse_variants(reply or "", tones).items():
+        variant = _finish_variant(request, masked_output)
+        if variant is not None:
+            variants[tone] = variant
+    _count("generated" if variants else "failed")
+    return variants
+
+
+def generate(request: dict, tones: list[str], model: str, deadline: float | None, usage_sink: list) -> dict[str, dict]:
+    """
+    One LLM call for `tones` of a prepared request (pipeline ctx snapshot, see
+    snapshot()). Returns {tone: {"output_text", "masked_output", "cacheable", "scores"}}
+    for the tones that came back usable; {} on failure.
+    """
+    system_prompt, cache_prefix, length = _request(request, tones)
+    try:
+        reply = llm.call_claude(
+            system_prompt=system_prompt,
+            input_text=request["llm_input"],
+            model=model,
+            deadline=deadline,
+            cache_prefix=cache_prefix,
+            usage_sink=usage_sink,
+            **length,
+        )
+    except RuntimeError as e:
+        logger.warning("Tone variant generation failed: %s", e)
+        reply = None
+    return _finish(request, tones, reply)
+
+
+async def generate_async(
+    request: dict, tones: list[str], model: str, deadline: float | None, usage_sink: list,
+) -> dict[str, dict]:
+    system_prompt, cache_prefix, length = _request(request, tones)
+    try:
+        reply = await llm.call_claude_async(
+            system_prompt=system_prompt,
+            input_text=request["llm_input"],
+            model=model,
+            deadline=deadline,
+            cache_prefix=cache_prefix,
+            usage_sink=usage_sink,
+            **length,
+        )
+    except RuntimeError as e:
+        logger.warning("Tone variant generation failed: %s", e)
+        reply = None
+    return _finish(request, tones, reply)
+
+
+def snapshot(ctx: dict) -> dict:
+    """The parts of a pipeline ctx variant generation reads (safe to hand to another thread)."""
+    return {
+        "rewrite_id": ctx["rewrite_id"],
+        "owner": ctx.get("variants_owner"),
+        "original_text": ctx["original_text"],
+        "llm_input": ctx["llm_input"],
+        "placeholders": dict(ctx["placeholders"]),
+        "entities": ctx["entities"],
+        "prompt_entities": ctx.get("prompt_entities"),
+        "tone": ctx["tone"],
+        "platform": ctx["platform"],
+        "language_mix": ctx["language_mix"],
+        "detected_intent": ctx["detected_intent"],
+        "output_language": ctx["output_language"],
+        "max_tokens": (ctx["output_length"] or {}).get("max_tokens", output_length.LEGACY_MAX_TOKENS),
+    }
+
+
+def remember(request: dict, tier: str, variants: dict[str, dict]) -> None:
+    """
+    Keep a rewrite's variants under its rewrite_id for tone switches, and write
+    the cacheable ones to the rewrite cache under their own tone's key.
+    """
+    if not variants:
+        return
+    from . import rewrite_cache
+    entry = {
+        "owner": request.get("owner"),
+        "detected_intent": request["detected_intent"],
+        "routing_tier": tier,
+        "output_language": request["output_language"],
+        "original_text": request["original_text"],
+        "tones": {tone: {"output_text": v["output_text"], "scores": v["scores"]} for tone, v in variants.items()},
+    }
+    _memory.set(request["rewrite_id"], entry)
+    shared = rewrite_cache._get_shared()
+    if shared is not None:
+        try:
+            shared.set(_SHARED_PREFIX + request["rewrite_id"], entry)
+        except Exception as e:
+            logger.warning("Shared tone variant store failed: %s", e)
+    for tone, v in variants.items():
+        if v["cacheable"] and tier in ("haiku", "sonnet"):
+            key = rewrite_cache.cache_key(
+                request["llm_input"], request["detected_intent"], tone, request["platform"], request["output_language"],
+                language_mix=request["language_mix"], placeholders=bool(request["placeholders"]),
+            )
+            rewrite_cache.store(key, {"output_text": v["masked_output"], "routing_tier": tier})
+
+
+def _generate_and_remember(
+    request: dict, tones: list[str], model: str, deadline: float | None, variant_usage: VariantUsage,
+) -> dict[str, dict]:
+    try:
+        variants = generate(request, tones, model, deadline, variant_usage.calls)
+        remember(request, _tier(model), variants)
+        return variants
+    finally:
+        variant_usage.finish(request, _tier(model))
+        with _pending_lock:
+            _pending.pop(request["rewrite_id"], None)
+
+
+async def generate_and_remember_async(
+    request: dict, tones: list[str], model: str, deadline: float | None, variant_usage: VariantUsage,
+) -> dict[str, dict]:
+    try:
+        variants = await generate_async(request, tones, model, deadline, variant_usage.calls)
+        remember(request, _tier(model), variants)
+        return variants
+    finally:
+        variant_usage.finish(request, _tier(model))
+
+
+def _tier(model: str) -> str:
+    return "sonnet" if "sonnet" in model else "haiku"
+
+
+def start(request: dict, tones: list[str], model: str, deadline: float | None, variant_usage: VariantUsage) -> Future:
+    """Generate on a worker thread; variants are stored under the rewrite_id when done."""
+    with _pending_lock:
+        future = _get_executor().submit(_generate_and_remember, request, tones, model, deadline, variant_usage)
+        if not future.done():
+            _pending[request["rewrite_id"]] = future
+    return future
+
+
+def wait(future: Future, timeout_s: float) -> dict[str, dict] | None:
+    """The variants if generation finishes within timeout_s; None while it is still running."""
+    try:
+        return future.result(timeout=max(0.0, timeout_s))
+    except FutureTimeout:
+        return None
+
+
+def from_cache(request: dict, tier: str) -> dict[str, dict]:
+    """Variants of a cache-served rewrite that the rewrite cache already holds (no LLM call)."""
+    from . import rewrite_cache
+    variants = {}
+    for tone in other_tones(request["tone"]):
+        key = rewrite_cache.cache_key(
+            request["llm_input"], request["detected_intent"], tone, request["platform"], request["output_language"],
+            language_mix=request["language_mix"], placeholders=bool(request["placeholders"]),
+        )
+        cached = rewrite_cache.lookup(key)
+        variant = _finish_variant(request, cached["output_text"]) if cached else None
+        if variant is not None:
+            variant["cacheable"] = False  # already cached
+            variants[tone] = variant
+    if variants:
+        _count("from_cache")
+        remember(request, tier, variants)
+    return variants
+
+
+def lookup(rewrite_id: str, tone: str, owner: str | None, wait_s: float = LOOKUP_WAIT_S) -> dict | None:
+    """
+    {"output_text", "scores", "detected_intent", "routing_tier", ...} of a stored
+    variant. Waits up to wait_s for a generation still running in this process.
+    None when the rewrite has no variant in that tone, or was not made by `owner`
+    (anonymous rewrites, owner None, are never served).
+    """
+    entry = _memory.get(rewrite_id)
+    if entry is None:
+        with _pending_lock:
+            future = _pending.get(rewrite_id)
+        if future is not None:
+            wait(future, wait_s)
+            entry = _memory.get(rewrite_id)
+    if entry is None:
+        from . import rewrite_cache
+        shared = rewrite_cache._get_shared()
+        if shared is not None:
+            try:
+                entry = shared.get(_SHARED_PREFIX + rewrite_id)
+            except Exception as e:
+                logger.warning("Shared tone variant lookup failed: %s", e)
+            if entry is not None:
+                _memory.set(rewrite_id, entry)
+    if entry is not None and (owner is None or entry.get("owner") != owner):
+        entry = None
+    variant = (entry or {}).get("tones", {}).get(tone)
+    _count("hits" if variant else "misses")
+    if variant is None:
+        return None
+    return {**variant, **{k: entry[k] for k in ("detected_intent", "routing_tier", "output_language", "original_text")}}
+
+
+def record_switch(path: str, ms: float) -> None:
+    """Latency of one tone switch: "variant" (served from stored variants) or "rewrite" (full rewrite)."""
+    with _stats_lock:
+        _switch_ms[path].append(ms)
+
+
+def _latency(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0, "p50_ms": None, "p95_ms": None}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 1),
+    }
+
+
+def stats() -> dict:
+    """Generation / lookup counters and tone-switch latency per path."""
+    with _stats_lock:
+        counters = dict(_counters)
+        switches = {path: list(v) for path, v in _switch_ms.items()}
+    return {
+        "enabled": config.TONE_VARIANTS,
+        **counters,
+        "stored": len(_memory),
+        "switch_latency": {path: _latency(v) for path, v in switches.items()},
+    }
+
+
+def clear() -> None:
+    _memory.clear()
+    with _pending_lock:
+        _pending.clear()
+    with _stats_lock:
+        for k in _counters:
+            _counters[k] = 0
+        for v in _switch_ms.values():
+            v.clear()
@@ -0,0 +1,157 @@
+"""
+Token usage and cost accounting — per LLM call, per rewrite, and rolling
+aggregates per routing tier, intent and platform.
+
+Each successful LLM call yields a usage record (llm.record_usage): model,
+input / cache write / cache read / output tokens and its USD cost. The
+pipeline sums a rewrite's calls into result["usage"] and adds the rewrite to
+a rolling window here; stats() backs GET /api/v1/stats/usage so router or
+prompt changes can be checked against cost and latency.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+
+# USD per million tokens. Cache writes cost 1.25× input, cache reads 0.1× input.
+MODEL_PRICING = {
+    "claude-3-5-haiku-20241022": {"input": 0.80, "output": 4.00},
+    "claude-sonnet-4-20250514": {"input": 3.00, "output": 15.00},
+}
+_DEFAULT_PRICING = {"input": 3.00, "output": 15.00}
+_CACHE_WRITE_MULTIPLIER = 1.25
+_CACHE_READ_MULTIPLIER = 0.10
+
+TOKEN_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+# Rolling window of recent rewrites for stats()
+WINDOW_S = 3600
+MAX_WINDOW_ENTRIES = 20000
+_DIMENSIONS = {"tier": "routing_tier", "intent": "detected_intent", "platform": "platform"}
+
+_window: deque[dict] = deque(maxlen=MAX_WINDOW_ENTRIES)
+_lock = threading.Lock()
+
+
+def cost_usd(model: str, counts: dict) -> float:
+    """Cost of one call from its token counts (unknown models priced as Sonnet)."""
+    price = MODEL_PRICING.get(model, _DEFAULT_PRICING)
+    dollars = (
+        counts.get("input_tokens", 0) * price["input"]
+        + counts.get("cache_creation_input_tokens", 0) * price["input"] * _CACHE_WRITE_MULTIPLIER
+        + counts.get("cache_read_input_tokens", 0) * price["input"] * _CACHE_READ_MULTIPLIER
+        + counts.get("output_tokens", 0) * price["output"]
+    ) / 1_000_000
+    return round(dollars, 8)
+
+
+def call_record(model: str, counts: dict) -> dict:
+    """Usage record for one LLM call."""
+    return {"model": model, **{f: counts.get(f, 0) for f in TOKEN_FIELDS}, "cost_usd": cost_usd(model, counts)}
+
+
+def summarize_calls(calls: list[dict]) -> dict | None:
+    """Totals over a rewrite's LLM calls; None when the rewrite made no calls."""
+    if not calls:
+        return None
+    totals = {f: sum(c.get(f, 0) for c in calls) for f in TOKEN_FIELDS}
+    return {
+        "calls": len(calls),
+        **totals,
+        "cost_usd": round(sum(c.get("cost_usd", 0.0) for c in calls), 8),
+        "models": sorted({c["model"] for c in calls}),
+    }
+
+
+def record_rewrite(result: dict, platform: str | None = None) -> None:
+    """Add a finished rewrite (pipeline response shape) to the rolling window."""
+    usage = result.get("usage") or {}
+    entry = {
+        "ts": time.time(),
+        "routing_tier": result.get("routing_tier") or "unknown",
+        "detected_intent": result.get("detected_intent") or "unknown",
+        "platform": platform or "unknown",
+        "cache_hit": bool(result.get("cache_hit")),
+        "response_time_ms": result.get("response_time_ms") or 0,
+        "calls": usage.get("calls", 0),
+        **{f: usage.get(f, 0) for f in TOKEN_FIELDS},
+        "cost_usd": usage.get("cost_usd", 0.0),
+    }
+    with _lock:
+        _window.append(entry)
+
+
+def record_background_calls(
+    calls: list[dict], routing_tier: str | None, detected_intent: str | None, platform: str | None = None,
+) -> None:
+    """
+    Add LLM calls made for a rewrite after its response was returned (tone
+    variants finishing in the background) to the rolling window: they count
+    toward tokens and cost, not toward rewrites or latency.
+    """
+    summary = summarize_calls(calls)
+    if summary is None:
+        return
+    entry = {
+        "ts": time.time(),
+        "background": True,
+        "routing_tier": routing_tier or "unknown",
+        "detected_intent": detected_intent or "unknown",
+        "platform": platform or "unknown",
+        "cache_hit": False,
+        "response_time_ms": 0,
+        "calls": summary["calls"],
+        **{f: summary[f] for f in TOKEN_FIELDS},
+        "cost_usd": summary["cost_usd"],
+    }
+    with _lock:
+        _window.append(entry)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _aggregate(entries: list[dict]) -> dict:
+    served = [e for e in entries if not e.get("background")]
+    rewrites = len(served)
+    latencies = [e["response_time_ms"] for e in served]
+    totals = {f: sum(e[f] for e in entries) for f in TOKEN_FIELDS}
+    cost = sum(e["cost_usd"] for e in entries)
+    input_total = totals["input_tokens"] + totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+    return {
+        "rewrites": rewrites,
+        "llm_calls": sum(e["calls"] for e in entries),
+        "cache_hits": sum(1 for e in entries if e["cache_hit"]),
+        **totals,
+        "cache_read_ratio": round(totals["cache_read_input_tokens"] / input_total, 4) if input_total else 0.0,
+        "avg_input_tokens": round(input_total / rewrites, 1) if rewrites else 0.0,
+        "cost_usd": round(cost, 6),
+        "avg_cost_usd": round(cost / rewrites, 8) if rewrites else 0.0,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+    }
+
+
+def stats(window_s: float | None = None) -> dict:
+    """Aggregates over rewrites in the last window_s seconds: overall and per tier / intent / platform."""
+    window_s = WINDOW_S if window_s is None else window_s
+    cutoff = time.time() - window_s
+    with _lock:
+        entries = [e for e in _window if e["ts"] >= cutoff]
+    result = {"window_s": window_s, "overall": _aggregate(entries)}
+    for name, field in _DIMENSIONS.items():
+        groups: dict[str, list[dict]] = {}
+        for e in entries:
+            groups.setdefault(e[field], []).append(e)
+        result[f"by_{name}"] = {key: _aggregate(group) for key, group in sorted(groups.items())}
+    return result
+
+
+def clear() -> None:
+    with _lock:
+        _window.clear()
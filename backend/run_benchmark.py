@@ -4,10 +4,17 @@ Run Loma benchmark: all 50 scenarios through the rewrite pipeline.
 Updates each scenario with loma_output, detected_intent, routing_tier, response_time_ms.
 Optionally writes results to a new JSON file.
 
+Every run also prints quality / latency per intent, stores a run artifact
+(benchmark_runs/<timestamp>.json) and, given --baseline, diffs against an
+earlier run and exits 1 when a metric regresses past its tolerance.
+
 Usage:
   cd backend && python run_benchmark.py
   python run_benchmark.py --limit 5
   python run_benchmark.py --output ../docs/Loma_Benchmark_v1_results.json
+  python run_benchmark.py --concurrency 8 --run-out runs/candidate.json --baseline runs/main.json -t p95_ms=0.5
+  python run_benchmark.py --fake-llm                      # in-process fake Anthropic backend
+  python run_benchmark.py --fake-llm --fake-profile fake_profile.json --fake-recordings fake_recordings.jsonl
 """
 from __future__ import annotations
 
@@ -15,6 +22,7 @@ import argparse
 import json
 import os
 import sys
+import time
 
 # Ensure backend is on path
 _backend_dir = os.path.dirname(os.path.abspath(__file__))
@@ -25,7 +33,42 @@ os.chdir(_backend_dir)
 from dotenv import load_dotenv
 load_dotenv()
 
+import config
 from handler import handler
+from loma import benchmark
+from loma.prompt_assembly import prompt_bundle_version
+
+
+def _print_summary(summary: dict) -> None:
+    print(f"{'intent':<22} {'n':>3} {'err':>3} {'intent%':>7} {'entity%':>7} {'shorter%':>8} {'p50ms':>6} {'p95ms':>6}  tiers")
+    rows = [("overall", summary["overall"])] + list(summary["by_intent"].items())
+    for name, m in rows:
+        acc = f"{100 * m['intent_accuracy']:.0f}" if m["intent_accuracy"] is not None else "-"
+        tiers = ",".join(f"{t}={n}" for t, n in m["tiers"].items()) or "-"
+        print(
+            f"{name:<22} {m['scenarios']:>3} {m['errors']:>3} {acc:>7} {_fmt(m['entity_preserved_pct']):>7} "
+            f"{_fmt(m['length_reduction_pct']):>8} {_fmt(m['p50_ms']):>6} {_fmt(m['p95_ms']):>6}  {tiers}"
+        )
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:g}"
+
+
+def _print_diff(result: dict, baseline_path: str) -> None:
+    print(f"--- Diff vs {baseline_path} ---")
+    for c in result["checks"]:
+        if c["scope"] != "overall" and c["ok"]:
+            continue
+        status = "ok" if c["ok"] else ("FAIL" if c["gated"] else "worse")
+        print(
+            f"{status:<5} {c['scope']:<22} {c['metric']:<21} {_fmt(c['baseline']):>8} -> {_fmt(c['current']):<8}"
+            f" (delta {c['delta']:+g}, allowed {c['allowed']:g})"
+        )
+    shift = {t: n for t, n in result["tier_shift"].items() if n}
+    if shift:
+        print("Tier shift:", ", ".join(f"{t} {n:+d}" for t, n in shift.items()))
+    print("Result:", "PASS" if result["passed"] else "FAIL")
 
 
 def main() -> None:
@@ -34,8 +77,36 @@ def main() -> None:
     ap.add_argument("--output", "-o", default=None, help="Write updated scenarios to this JSON file")
     ap.add_argument("--limit", "-n", type=int, default=0, help="Run only first N scenarios (0 = all)")
     ap.add_argument("--quiet", "-q", action="store_true", help="Less stdout")
+    ap.add_argument("--concurrency", "-c", type=int, default=4, help="Scenarios in flight at once")
+    ap.add_argument("--run-out", default=None, help="Run artifact path (default: benchmark_runs/<timestamp>.json)")
+    ap.add_argument("--baseline", "-b", default=None, help="Diff against this run artifact; exit 1 on regression")
+    ap.add_argument("--threshold", "-t", action="append", default=[], metavar="METRIC=TOL",
+                    help="Override a regression tolerance, e.g. p95_ms=0.5 (repeatable)")
+    ap.add_argument("--gate-per-intent", action="store_true", help="Fail on per-intent regressions too")
+    ap.add_argument("--use-cache", action="store_true", help="Keep the rewrite / near-duplicate caches on")
+    ap.add_argument("--fake-llm", action="store_true", help="Run against a local fake Anthropic backend")
+    ap.add_argument("--fake-profile", default=None, help="Latency / fault profile JSON for --fake-llm")
+    ap.add_argument("--fake-recordings", default=None, help="Recorded responses (JSONL) for --fake-llm")
     args = ap.parse_args()
 
+    try:
+        thresholds = dict(benchmark.parse_threshold(t) for t in args.threshold)
+    except ValueError as e:
+        ap.error(str(e))
+
+    if not args.use_cache:
+        # A cached rewrite says nothing about the current prompts and router
+        config.REWRITE_CACHE_ENABLED = False
+        config.NEAR_DUP_ENABLED = False
+
+    fake_server = None
+    if args.fake_llm:
+        from loma import fake_anthropic
+
+        fake_server = fake_anthropic.start(profile_path=args.fake_profile, recordings_path=args.fake_recordings)
+        os.environ["ANTHROPIC_BASE_URL"] = fake_server.url
+        print("Using fake Anthropic backend at", fake_server.url)
+
     benchmark_path = args.benchmark or os.path.join(_backend_dir, "..", "docs", "Loma_Benchmark_v1.json")
     if not os.path.isfile(benchmark_path):
         print("Benchmark file not found:", benchmark_path, file=sys.stderr)
@@ -47,72 +118,77 @@ def main() -> None:
     scenarios = data.get("scenarios", [])
     if args.limit:
         scenarios = scenarios[: args.limit]
-    total = len(scenarios)
-    intent_match = 0
-    errors = 0
-    total_ms = 0
-
-    for i, scenario in enumerate(scenarios):
-        sid = scenario.get("id", "?")
-        expected_intent = scenario.get("intent", "")
-        input_text = scenario.get("input", "")
-        platform = scenario.get("platform") or "gmail"
 
+    def _rewrite(scenario: dict) -> dict:
         payload = {
-            "input_text": input_text,
-            "platform": platform,
+            "input_text": scenario.get("input", ""),
+            "platform": scenario.get("platform") or "gmail",
             "tone": scenario.get("tone", "professional"),
         }
         if scenario.get("output_language"):
             payload["output_language"] = scenario["output_language"]
-        event = {"body": json.dumps(payload)}
-        try:
-            result = handler(event, None)
-            body = json.loads(result["body"])
-        except Exception as e:
-            if not args.quiet:
-                print(f"[{sid}] ERROR: {e}", file=sys.stderr)
-            scenario["loma_output"] = ""
-            scenario["loma_error"] = str(e)
-            errors += 1
-            continue
-
-        if "error" in body:
-            if not args.quiet:
-                print(f"[{sid}] API error: {body.get('message', body['error'])}", file=sys.stderr)
-            scenario["loma_output"] = ""
-            scenario["loma_error"] = body.get("message", body["error"])
-            errors += 1
-            continue
+        return json.loads(handler({"body": json.dumps(payload)}, None)["body"])
 
-        scenario["loma_output"] = body.get("output_text", "")
-        scenario["loma_detected_intent"] = body.get("detected_intent", "")
-        scenario["loma_routing_tier"] = body.get("routing_tier", "")
-        scenario["loma_response_time_ms"] = body.get("response_time_ms", 0)
-        scenario["loma_length_reduction_pct"] = (body.get("scores") or {}).get("length_reduction_pct")
+    def _progress(row: dict) -> None:
+        if args.quiet:
+            return
+        if row["error"]:
+            print(f"[{row['id']}] ERROR: {row['error']}", file=sys.stderr)
+        else:
+            print(f"[{row['id']}] {row['detected_intent']} ({row['routing_tier']}) {row['response_time_ms']}ms")
 
-        if scenario["loma_detected_intent"] == expected_intent:
-            intent_match += 1
-        total_ms += scenario.get("loma_response_time_ms", 0)
+    rows = benchmark.run_scenarios(scenarios, _rewrite, args.concurrency, _progress)
 
-        if not args.quiet:
-            print(f"[{sid}] {scenario['loma_detected_intent']} ({scenario['loma_routing_tier']}) {scenario.get('loma_response_time_ms', 0)}ms")
+    for scenario, row in zip(scenarios, rows):
+        if row["error"]:
+            scenario["loma_output"] = ""
+            scenario["loma_error"] = row["error"]
+            continue
+        scenario["loma_output"] = row["output_text"] or ""
+        scenario["loma_detected_intent"] = row["detected_intent"] or ""
+        scenario["loma_routing_tier"] = row["routing_tier"] or ""
+        scenario["loma_response_time_ms"] = row["response_time_ms"] or 0
+        scenario["loma_length_reduction_pct"] = row["length_reduction_pct"]
+
+    run = benchmark.build_run(rows, {
+        "benchmark": os.path.relpath(benchmark_path, _backend_dir),
+        "prompt_bundle_version": prompt_bundle_version(),
+        "concurrency": args.concurrency,
+        "fake_llm": args.fake_llm,
+        "routing_cascade": config.ROUTING_CASCADE,
+        "routing_policy": config.ROUTING_POLICY_PATH or None,
+        "entity_masking": config.ENTITY_MASKING,
+    })
 
-    # Summary
     print()
     print("--- Summary ---")
-    print(f"Scenarios run: {total}")
-    print(f"Errors:        {errors}")
-    if total - errors > 0:
-        print(f"Intent match:  {intent_match}/{total} ({100 * intent_match / total:.0f}%)")
-        print(f"Avg latency:   {total_ms / (total - errors):.0f} ms")
+    _print_summary(run["summary"])
     print()
 
+    if fake_server is not None:
+        print("Fake backend outcomes:", json.dumps(fake_server.backend.stats))
+        fake_server.stop()
+
+    run_out = args.run_out or os.path.join("benchmark_runs", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(run_out) or ".", exist_ok=True)
+    with open(run_out, "w", encoding="utf-8") as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    print("Run artifact:", run_out)
+
     if args.output:
         with open(args.output, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         print("Wrote", args.output)
 
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        result = benchmark.diff(run, baseline, thresholds, args.gate_per_intent)
+        _print_diff(result, args.baseline)
+        if not result["passed"]:
+            sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
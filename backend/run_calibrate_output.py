@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Calibrate output-length prediction from stored rewrites: p50/p99
+output/input token ratios per (intent, output_language) and a latency fit
+per tier, written to the profile loaded via OUTPUT_LENGTH_PROFILE_PATH.
+
+Usage:
+  cd backend && python run_calibrate_output.py                       # rewrites table (Supabase)
+  python run_calibrate_output.py --jsonl rewrites_export.jsonl --out output_length_profile.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+os.chdir(_backend_dir)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from loma import db, output_length
+
+_COLUMNS = "input_text,output_text,detected_intent,output_language,routing_tier,scores,response_time_ms,created_at"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Calibrate output-length prediction")
+    ap.add_argument("--jsonl", default=None, help="Read rows from a JSONL export instead of the rewrites table")
+    ap.add_argument("--since", default=None, help="Only rewrites created at/after this ISO date (table mode)")
+    ap.add_argument("--limit", "-n", type=int, default=None, help="Max rows to read")
+    ap.add_argument("--out", "-o", default="output_length_profile.json", help="Profile path")
+    args = ap.parse_args()
+
+    try:
+        rows = db.rewrite_rows(_COLUMNS, args.jsonl, since=args.since, limit=args.limit)
+    except ValueError as e:
+        ap.error(str(e))
+    profile = output_length.calibrate(rows)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=1)
+
+    print("--- Output-length profile ---")
+    for language, (n, p50, p99) in profile["languages"].items():
+        print(f"{language:<10} n={n:<7} ratio p50={p50:.2f} p99={p99:.2f}")
+    print(f"(intent, language) cells: {len(profile['ratios'])}")
+    for tier, (base_ms, per_token) in sorted(profile["latency"].items()):
+        print(f"{tier:<10} latency ≈ {base_ms:.0f} ms + {per_token:.2f} ms/token")
+    print(f"Written to: {args.out}")
+    if not profile["languages"]:
+        print("(no rows — is Supabase configured, or pass --jsonl)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
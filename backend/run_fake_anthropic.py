@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Local fake Anthropic Messages API for load and latency testing (loma/fake_anthropic.py).
+
+Usage:
+  cd backend && python run_fake_anthropic.py --port 8765
+  python run_fake_anthropic.py --profile fake_profile.json --recordings fake_recordings.jsonl
+  python run_fake_anthropic.py --record --recordings fake_recordings.jsonl   # proxy to the real API, save replies
+
+Then point the pipeline at it:
+  ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python run_benchmark.py
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+os.chdir(_backend_dir)
+
+from loma.fake_anthropic import UPSTREAM_URL, FakeAnthropicServer, FakeBackend, load_profile
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--profile", default=None, help="JSON latency / fault profile (overlays the defaults)")
+    ap.add_argument("--recordings", default=None, help="JSONL recordings to replay (and append to with --record)")
+    ap.add_argument("--record", action="store_true", help=f"Forward to {UPSTREAM_URL} and record replies")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    backend = FakeBackend(load_profile(args.profile), args.recordings, UPSTREAM_URL if args.record else None)
+    server = FakeAnthropicServer(backend, host=args.host, port=args.port)
+    print(f"Fake Anthropic backend on {server.url} — set ANTHROPIC_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate cache report: replay stored rewrites through the SimHash index
+and print the hit rate each cache layer would have achieved.
+
+Usage:
+  cd backend && python run_near_dup_report.py                 # rewrites table (Supabase)
+  python run_near_dup_report.py --jsonl rewrites_export.jsonl  # exported rows, oldest first
+  python run_near_dup_report.py --max-distance 4 --max-entries 2000 --since 2026-01-01
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+os.chdir(_backend_dir)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from loma import db
+from loma.fingerprint import simulate_hit_rate
+
+_COLUMNS = "input_text,output_text,detected_intent,tone,platform,output_language,routing_tier,created_at"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Near-duplicate cache hit-rate report")
+    ap.add_argument("--jsonl", default=None, help="Read rows from a JSONL export instead of the rewrites table")
+    ap.add_argument("--since", default=None, help="Only rewrites created at/after this ISO date (table mode)")
+    ap.add_argument("--limit", "-n", type=int, default=None, help="Max rows to replay")
+    ap.add_argument("--max-distance", type=int, default=None, help="Hamming threshold (default: config)")
+    ap.add_argument("--max-entries", type=int, default=None, help="Index size bound (default: config)")
+    args = ap.parse_args()
+
+    try:
+        rows = db.rewrite_rows(_COLUMNS, args.jsonl, since=args.since, limit=args.limit)
+    except ValueError as e:
+        ap.error(str(e))
+
+    report = simulate_hit_rate(rows, max_entries=args.max_entries, max_distance=args.max_distance)
+
+    print("--- Near-duplicate cache report ---")
+    print(f"LLM-tier rewrites replayed: {report['total']}")
+    print(f"Exact cache hits:           {report['exact_hits']} ({100 * report['exact_hit_rate']:.1f}%)")
+    print(f"Reusable near-duplicates:   {report['near_reusable']}")
+    print(f"Reusable hit rate:          {100 * report['reusable_hit_rate']:.1f}%")
+    print(f"Starting-point matches:     {report['near_starting_point']}")
+    print(f"Any match:                  {100 * report['any_match_rate']:.1f}%")
+    print(f"Would still call the LLM:   {report['llm']}")
+    if report["total"] == 0:
+        print("(no rows — is Supabase configured, or pass --jsonl)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
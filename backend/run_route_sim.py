@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Routing-policy simulator: replay stored rewrites through candidate routing
+policies and compare estimated cost, p50/p95 latency and acceptance against
+the live policy.
+
+Usage:
+  cd backend && python run_route_sim.py                                   # tables (Supabase), rules vs live
+  python run_route_sim.py --rewrites-jsonl rewrites.jsonl --events-jsonl events.jsonl
+  python run_route_sim.py --policy learned:routing_policy.json@0.7 --policy haiku --since 2026-01-01
+  python run_route_sim.py --policy my_router:route --json                 # custom callable(row) -> tier
+
+Policies: recorded | live | rules | haiku | sonnet | learned:<artifact>[@target] | <module>:<callable>
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+os.chdir(_backend_dir)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from loma import db, route_policy, route_sim
+from loma.analytics import EVENT_DISMISS, EVENT_REWRITE, EVENT_USE, EVENT_USER_EDIT
+
+_COLUMNS = (
+    "id,input_text,detected_intent,intent_confidence,routing_tier,platform,output_language,"
+    "language_mix,response_time_ms,created_at"
+)
+_EVENTS = [EVENT_REWRITE, EVENT_USE, EVENT_DISMISS, EVENT_USER_EDIT]
+
+
+def _fmt_delta(value, unit: str = "") -> str:
+    if value is None:
+        return "-"
+    return f"{value:+.1f}{unit}" if isinstance(value, float) else f"{value:+d}{unit}"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Simulate routing policies over stored traffic")
+    ap.add_argument("--rewrites-jsonl", default=None, help="Read rewrites from a JSONL export instead of the table")
+    ap.add_argument("--events-jsonl", default=None, help="Read events from a JSONL export instead of the table")
+    ap.add_argument("--since", default=None, help="Only rows created at/after this ISO date (table mode)")
+    ap.add_argument("--limit", "-n", type=int, default=None, help="Max rewrites to replay")
+    ap.add_argument("--policy", "-p", action="append", default=None, help="Candidate policy (repeatable)")
+    ap.add_argument("--baseline", default="live", help="Policy the candidates are compared against")
+    ap.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = ap.parse_args()
+
+    names = [args.baseline] + [p for p in (args.policy or ["recorded", "rules"]) if p != args.baseline]
+    try:
+        policies = {name: route_sim.policy_from_spec(name) for name in names}
+    except (ValueError, ImportError, AttributeError) as e:
+        ap.error(str(e))
+
+    started = time.perf_counter()
+    try:
+        events = db.event_rows(_EVENTS, args.events_jsonl, since=args.since)
+        rewrites = db.rewrite_rows(_COLUMNS, args.rewrites_jsonl, since=args.since, limit=args.limit)
+    except ValueError as e:
+        ap.error(str(e))
+    outcomes = route_policy.collect_outcomes(events)
+    traffic = route_sim.prepare(rewrites, outcomes)
+    loaded = time.perf_counter()
+    report = route_sim.compare(traffic, policies, baseline=args.baseline)
+    simulated = time.perf_counter()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"--- Routing simulation: {len(traffic['rows'])} rewrites "
+          f"(load {loaded - started:.1f}s, simulate {simulated - loaded:.1f}s) ---")
+    print(f"{'policy':<28} {'cost $':>10} {'p50 ms':>8} {'p95 ms':>8} {'accept':>7} "
+          f"{'Δcost':>8} {'Δp50':>7} {'Δp95':>7} {'Δacc pp':>8}  tiers")
+    for name, r in report["policies"].items():
+        d = report["deltas"].get(name, {})
+        acceptance = f"{r['expected_acceptance']:.3f}" if r["expected_acceptance"] is not None else "-"
+        acc_pp = d.get("acceptance")
+        print(
+            f"{name:<28} {r['cost_usd']:>10.4f} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {acceptance:>7} "
+            f"{_fmt_delta(d.get('cost_pct'), '%'):>8} {_fmt_delta(d.get('p50_ms')):>7} "
+            f"{_fmt_delta(d.get('p95_ms')):>7} {_fmt_delta(acc_pp * 100 if acc_pp is not None else None):>8}  "
+            + ", ".join(f"{t}={n}" for t, n in r["tiers"].items())
+        )
+        if r["unmeasured"]:
+            print(f"  ({r['unmeasured']} rewrites moved to a tier with no measurements — excluded)")
+    if not traffic["rows"]:
+        print("(no rows — is Supabase configured, or pass --rewrites-jsonl/--events-jsonl)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
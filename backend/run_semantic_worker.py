@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Drain the semantic scoring spool: score queued rewrites in batches with Haiku
+and write meaning / tone scores to the rewrites table. The spool is a local
+file, so this only reaches the spool of a server on the same host that runs
+no in-process workers (SEMANTIC_WORKERS=0) — run it on a schedule, or with
+--loop as a long-lived worker. Lambda instances drain their own spools.
+
+Usage:
+  cd backend && SEMANTIC_SCORING=true python run_semantic_worker.py             # until the spool is idle
+  python run_semantic_worker.py --max-batches 50 --batch-size 16
+  python run_semantic_worker.py --loop --interval 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+os.chdir(_backend_dir)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import config
+from loma import semantic_scoring
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Score spooled rewrites for semantic quality")
+    ap.add_argument("--spool", default=None, help="Spool path (default: SEMANTIC_SPOOL_PATH)")
+    ap.add_argument("--batch-size", type=int, default=None, help="Rewrites per Haiku call (default: config)")
+    ap.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches")
+    ap.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when idle")
+    ap.add_argument("--interval", type=float, default=10.0, help="Idle poll interval with --loop (s)")
+    args = ap.parse_args()
+
+    config.SEMANTIC_SCORING = True
+    if args.batch_size:
+        config.SEMANTIC_BATCH_SIZE = args.batch_size
+    semantic_scoring.set_spool(semantic_scoring.Spool(args.spool or config.SEMANTIC_SPOOL_PATH, config.SEMANTIC_QUEUE_MAX))
+
+    total = 0
+    while True:
+        total += semantic_scoring.drain(args.max_batches)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+    stats = semantic_scoring.stats()
+    print(f"Rewrites processed: {total}")
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Train the learned routing policy: join stored rewrites with their outcome
+events, aggregate per (intent, length, vi_ratio, platform, output_language)
+cell and tier, and write the compact artifact loaded via ROUTING_POLICY_PATH.
+
+Usage:
+  cd backend && python run_train_router.py                        # rewrites + events tables (Supabase)
+  python run_train_router.py --rewrites-jsonl rewrites.jsonl --events-jsonl events.jsonl
+  python run_train_router.py --since 2026-01-01 --min-feedback 50 --out routing_policy.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+os.chdir(_backend_dir)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from loma import db, route_policy
+from loma.analytics import EVENT_DISMISS, EVENT_REWRITE, EVENT_USE, EVENT_USER_EDIT
+
+_COLUMNS = "id,input_text,detected_intent,routing_tier,platform,output_language,language_mix,response_time_ms,created_at"
+_EVENTS = [EVENT_REWRITE, EVENT_USE, EVENT_DISMISS, EVENT_USER_EDIT]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compile the learned routing policy artifact")
+    ap.add_argument("--rewrites-jsonl", default=None, help="Read rewrites from a JSONL export instead of the table")
+    ap.add_argument("--events-jsonl", default=None, help="Read events from a JSONL export instead of the table")
+    ap.add_argument("--since", default=None, help="Only rows created at/after this ISO date (table mode)")
+    ap.add_argument("--min-feedback", type=int, default=None, help="Min uses + dismisses per cell tier (default: config)")
+    ap.add_argument("--out", "-o", default="routing_policy.json", help="Artifact path")
+    args = ap.parse_args()
+
+    try:
+        events = db.event_rows(_EVENTS, args.events_jsonl, since=args.since)
+        rewrites = db.rewrite_rows(_COLUMNS, args.rewrites_jsonl, since=args.since)
+    except ValueError as e:
+        ap.error(str(e))
+    outcomes = route_policy.collect_outcomes(events)
+
+    table = route_policy.build_table(rewrites, outcomes)
+
+    policy = route_policy.compile_policy(table, min_feedback=args.min_feedback)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(policy, f, ensure_ascii=False, separators=(",", ":"))
+
+    picks: dict[str, int] = {}
+    for rows in policy["cells"].values():
+        tier = route_policy.choose_tier(rows) or "fallback"
+        picks[tier] = picks.get(tier, 0) + 1
+
+    print("--- Routing policy ---")
+    print(f"Outcomes joined:   {len(outcomes)}")
+    print(f"Cells observed:    {len(table)}")
+    print(f"Cells compiled:    {len(policy['cells'])} (min feedback {policy['min_feedback']})")
+    print(f"Picks at target:   {', '.join(f'{t}={n}' for t, n in sorted(picks.items())) or '-'}")
+    print(f"Written to:        {args.out} ({os.path.getsize(args.out)} bytes)")
+    if not table:
+        print("(no rows — is Supabase configured, or pass --rewrites-jsonl/--events-jsonl)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
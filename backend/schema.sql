@@ -38,6 +38,7 @@ CREATE TABLE IF NOT EXISTS rewrites (
     tone TEXT,
     language_mix JSONB,
     scores JSONB,
+    semantic_scores JSONB,  -- background Haiku scoring of sampled rewrites (meaning / tone)
     response_time_ms INTEGER,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
@@ -45,6 +46,7 @@ CREATE TABLE IF NOT EXISTS rewrites (
 CREATE INDEX IF NOT EXISTS idx_rewrites_user ON rewrites (user_id);
 CREATE INDEX IF NOT EXISTS idx_rewrites_created ON rewrites (created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_rewrites_intent ON rewrites (detected_intent);
+ALTER TABLE rewrites ADD COLUMN IF NOT EXISTS semantic_scores JSONB;
 
 -- ============================================================
 -- Events table (analytics)
@@ -122,6 +124,42 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+-- Batch variant: reserve p_count credits for a whole /rewrite/batch request,
+-- all or nothing. Returns FALSE (no rows changed) when the balance can't cover it.
+CREATE OR REPLACE FUNCTION debit_payg_and_count(
+    p_user_id UUID,
+    p_count INTEGER,
+    p_new_count INTEGER,
+    p_date DATE
+) RETURNS BOOLEAN AS $$
+BEGIN
+    UPDATE users
+    SET payg_balance = payg_balance - p_count,
+        rewrites_today = p_new_count,
+        last_rewrite_date = p_date,
+        updated_at = NOW()
+    WHERE id = p_user_id
+      AND payg_balance >= p_count;
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Give back credits reserved for batch items that failed
+CREATE OR REPLACE FUNCTION refund_payg_and_count(
+    p_user_id UUID,
+    p_count INTEGER,
+    p_date DATE
+) RETURNS VOID AS $$
+BEGIN
+    UPDATE users
+    SET payg_balance = payg_balance + p_count,
+        rewrites_today = GREATEST(rewrites_today - p_count, 0),
+        updated_at = NOW()
+    WHERE id = p_user_id
+      AND last_rewrite_date = p_date;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
 -- Service role can do everything (backend uses service key)
 CREATE POLICY service_all_users ON users FOR ALL
     USING (auth.role() = 'service_role');
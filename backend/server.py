@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Local API server for the Loma extension.
-Serves POST /api/v1/rewrite, /api/v1/events, GET /health.
+Serves POST /api/v1/rewrite, /api/v1/rewrite/batch, GET /api/v1/rewrite/{id}/tone/{tone},
+POST /api/v1/events, GET /api/v1/stats/usage, /health.
 Run: cd backend && python server.py
 Default: http://127.0.0.1:3000
 """
@@ -48,6 +49,7 @@ def _dispatch():
         "headers": headers,
         "rawPath": request.path,
         "path": request.path,
+        "queryStringParameters": request.args.to_dict() or None,
     }
     result = handler(event, None)
     status = result.get("statusCode", 200)
@@ -63,11 +65,26 @@ def rewrite():
     return _dispatch()
 
 
+@app.route("/api/v1/rewrite/batch", methods=["POST", "OPTIONS"])
+def rewrite_batch():
+    return _dispatch()
+
+
+@app.route("/api/v1/rewrite/<rewrite_id>/tone/<tone>", methods=["GET", "OPTIONS"])
+def rewrite_tone(rewrite_id, tone):
+    return _dispatch()
+
+
 @app.route("/api/v1/events", methods=["POST", "OPTIONS"])
 def events():
     return _dispatch()
 
 
+@app.route("/api/v1/stats/usage", methods=["GET"])
+def usage_stats():
+    return _dispatch()
+
+
 @app.route("/health", methods=["GET"])
 def health():
     return {"ok": True, "service": "loma-rewrite", "env": cfg.ENV}, 200
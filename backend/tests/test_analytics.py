@@ -39,6 +39,7 @@ class TestTrack:
             user_id="user-1",
             event_name="test_event",
             event_data={"key": "val"},
+            deadline=None,
         )
 
     @patch("loma.analytics.db")
@@ -48,6 +49,7 @@ class TestTrack:
             user_id="user-1",
             event_name="test_event",
             event_data=None,
+            deadline=None,
         )
 
     @patch("loma.analytics.db")
@@ -81,6 +83,19 @@ class TestTrackRewrite:
         assert event_data["rewrite_id"] == "r-1"
         assert event_data["detected_intent"] == "follow_up"
 
+    @patch("loma.analytics.db")
+    def test_includes_usage(self, mock_db):
+        usage = {"calls": 1, "input_tokens": 900, "output_tokens": 120, "cost_usd": 0.0012}
+        track_rewrite("user-1", {"rewrite_id": "r-2", "usage": usage})
+        assert mock_db.log_event.call_args.kwargs["event_data"]["usage"] == usage
+
+    @patch("loma.analytics.db")
+    def test_batch_is_one_bulk_insert(self, mock_db):
+        analytics.track_rewrites("user-1", [{"rewrite_id": "r-1"}, {"rewrite_id": "r-2"}])
+        mock_db.log_event.assert_not_called()
+        events = mock_db.log_events.call_args.args[1]
+        assert [(name, data["rewrite_id"]) for name, data in events] == [(EVENT_REWRITE, "r-1"), (EVENT_REWRITE, "r-2")]
+
 
 class TestTrackUserEdit:
     @patch("loma.analytics.db")
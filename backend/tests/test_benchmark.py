@@ -0,0 +1,89 @@
+"""Tests for loma.benchmark — benchmark run summaries and baseline diffs."""
+import pytest
+
+from loma import benchmark
+
+
+def _scenario(i, intent="follow_up"):
+    return {"id": f"S{i:02d}", "intent": intent, "platform": "gmail", "input": f"input {i}"}
+
+
+def _body(intent="follow_up", tier="haiku", ms=400, entity=100.0, shorter=30):
+    return {
+        "output_text": "out",
+        "detected_intent": intent,
+        "routing_tier": tier,
+        "response_time_ms": ms,
+        "scores": {"length_reduction_pct": shorter, "entity_preserved_pct": entity, "entity_missing": []},
+    }
+
+
+def _run(bodies, intents=None):
+    scenarios = [_scenario(i, (intents or {}).get(i, "follow_up")) for i in range(len(bodies))]
+    rows = benchmark.run_scenarios(scenarios, lambda s: bodies[int(s["id"][1:])], concurrency=4)
+    return benchmark.build_run(rows, {"benchmark": "test"})
+
+
+class TestRunScenarios:
+    def test_rows_in_order_with_errors(self):
+        def rewrite(scenario):
+            if scenario["id"] == "S01":
+                raise RuntimeError("boom")
+            if scenario["id"] == "S02":
+                return {"error": "text_too_long", "message": "Too long"}
+            return _body()
+
+        rows = benchmark.run_scenarios([_scenario(i) for i in range(4)], rewrite, concurrency=3)
+        assert [r["id"] for r in rows] == ["S00", "S01", "S02", "S03"]
+        assert rows[1]["error"] == "boom"
+        assert rows[2]["error"] == "Too long"
+        assert rows[3]["entity_preserved_pct"] == 100.0
+
+
+class TestSummarize:
+    def test_overall_and_per_intent(self):
+        run = _run(
+            [_body(ms=100), _body(ms=200, tier="sonnet"), _body("say_no", ms=300, entity=50.0), _body("say_no", "rules", 5)],
+            intents={2: "say_no", 3: "disagree"},
+        )
+        overall = run["summary"]["overall"]
+        assert overall["intent_accuracy"] == 0.75
+        assert overall["tiers"] == {"haiku": 2, "rules": 1, "sonnet": 1}
+        assert overall["sonnet_share"] == 0.25
+        assert overall["entity_preserved_pct"] == 87.5
+        assert overall["p50_ms"] == 100 and overall["p95_ms"] == 300
+        assert run["summary"]["by_intent"]["disagree"]["intent_accuracy"] == 0.0
+
+
+class TestDiff:
+    def test_identical_runs_pass(self):
+        run = _run([_body() for _ in range(4)])
+        result = benchmark.diff(run, run)
+        assert result["passed"] is True
+        assert all(c["ok"] for c in result["checks"])
+
+    def test_entity_regression_fails(self):
+        baseline = _run([_body() for _ in range(4)])
+        current = _run([_body(entity=90.0) for _ in range(4)])
+        result = benchmark.diff(current, baseline)
+        failed = [(c["scope"], c["metric"]) for c in result["checks"] if not c["ok"]]
+        assert ("overall", "entity_preserved_pct") in failed
+        assert result["passed"] is False
+
+    def test_latency_tolerance_is_relative_with_floor(self):
+        baseline = _run([_body(ms=1000) for _ in range(4)])
+        assert benchmark.diff(_run([_body(ms=1200) for _ in range(4)]), baseline)["passed"] is True
+        assert benchmark.diff(_run([_body(ms=1300) for _ in range(4)]), baseline)["passed"] is False
+        fast = _run([_body(ms=10) for _ in range(4)])
+        assert benchmark.diff(_run([_body(ms=40) for _ in range(4)]), fast)["passed"] is True
+
+    def test_threshold_override_and_per_intent_gate(self):
+        baseline = _run([_body(), _body("say_no")], intents={1: "say_no"})
+        current = _run([_body(), _body("follow_up")], intents={1: "say_no"})
+        loose = dict([benchmark.parse_threshold("intent_accuracy=0.6")])
+        assert benchmark.diff(current, baseline, loose)["passed"] is True
+        assert benchmark.diff(current, baseline, loose, gate_per_intent=True)["passed"] is False
+
+    def test_unknown_threshold(self):
+        with pytest.raises(ValueError):
+            benchmark.parse_threshold("bogus=1")
@@ -14,3 +14,10 @@ class TestCheckQuota:
         assert "tier" in result
         assert "remaining" in result
         assert "reason" in result
+
+    def test_async_anonymous_user_allowed(self):
+        import asyncio
+        from loma.billing import check_quota_async
+        result = asyncio.run(check_quota_async(None))
+        assert result["allowed"] is True
+        assert result["tier"] == "anonymous"
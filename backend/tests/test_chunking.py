@@ -0,0 +1,47 @@
+"""Tests for loma.chunking — long-document splitting and reassembly."""
+from unittest.mock import patch
+
+from loma import chunking
+
+
+class TestSplit:
+    def test_paragraphs_packed_up_to_target(self):
+        text = "\n\n".join(["a" * 300, "b" * 300, "c" * 300, "d" * 100])
+        chunks = chunking.split(text, 700)
+        assert [c for c, _ in chunks] == ["a" * 300 + "\n\n" + "b" * 300, "c" * 300 + "\n\n" + "d" * 100]
+        assert [sep for _, sep in chunks] == ["\n\n", ""]
+
+    def test_long_paragraph_split_at_sentences(self):
+        sentence = "Em gửi anh báo cáo tuần này. "
+        paragraph = (sentence * 40).strip()
+        chunks = chunking.split(paragraph, 300)
+        assert all(len(c) <= 300 for c, _ in chunks)
+        assert all(c.endswith(".") for c, _ in chunks)
+        assert chunking.join([c for c, _ in chunks], [s for _, s in chunks]) == paragraph
+
+    def test_run_on_sentence_split_at_whitespace(self):
+        words = " ".join(["word"] * 200)
+        chunks = chunking.split(words, 100)
+        assert all(len(c) <= 100 for c, _ in chunks)
+        assert " ".join(c for c, _ in chunks) == words
+
+    def test_join_keeps_original_separators(self):
+        assert chunking.join(["One. ", "Two.", "Three."], ["\n\n", " ", ""]) == "One.\n\nTwo. Three."
+
+
+class TestLimits:
+    def test_limit_and_threshold_follow_config(self):
+        with patch("config.LONG_INPUT_CHUNKING", False):
+            assert chunking.max_input_chars() == 5000
+            assert not chunking.should_chunk("x" * 4000)
+        with patch("config.LONG_INPUT_CHUNKING", True), patch("config.LONG_INPUT_MAX_CHARS", 20000), \
+             patch("config.CHUNK_THRESHOLD_CHARS", 1500):
+            assert chunking.max_input_chars() == 20000
+            assert chunking.should_chunk("x" * 1501)
+            assert not chunking.should_chunk("x" * 1500)
+
+    def test_context_header_by_position(self):
+        assert "Do not add a sign-off" in chunking.context_header(0, 3, "Hi team")
+        middle = chunking.context_header(1, 3, "Hi team")
+        assert "part 2 of 3" in middle and "Hi team" in middle
+        assert "Do not add a greeting;" in chunking.context_header(2, 3, "Hi team")
@@ -131,6 +131,49 @@ class TestIncrementRewriteCount:
             assert params["p_new_count"] == 1
             assert isinstance(params["p_date"], str)
 
+    def test_payg_batch_debited_in_one_rpc(self):
+        mock_client = MagicMock()
+        with patch.object(db, "_get_client", return_value=mock_client), \
+             patch.object(db, "get_user_subscription", return_value={
+                 "tier": "payg", "payg_balance": 10, "rewrites_today": 2
+             }):
+            db.increment_rewrite_count("user-123", 3)
+        name, params = mock_client.rpc.call_args[0]
+        assert name == "debit_payg_and_count"
+        assert params["p_count"] == 3
+        assert params["p_new_count"] == 5
+
+    def test_uncovered_batch_debit_reports_failure(self):
+        mock_client = MagicMock()
+        mock_client.rpc.return_value.execute.return_value.data = False
+        with patch.object(db, "_get_client", return_value=mock_client), \
+             patch.object(db, "get_user_subscription", return_value={
+                 "tier": "payg", "payg_balance": 2, "rewrites_today": 0
+             }):
+            assert db.increment_rewrite_count("user-123", 3) is False
+
+
+class TestRefundRewriteCount:
+    def test_payg_refund_uses_rpc(self):
+        mock_client = MagicMock()
+        with patch.object(db, "_get_client", return_value=mock_client), \
+             patch.object(db, "get_user_subscription", return_value={
+                 "tier": "payg", "payg_balance": 2, "rewrites_today": 5
+             }):
+            db.refund_rewrite_count("user-123", 2)
+        name, params = mock_client.rpc.call_args[0]
+        assert name == "refund_payg_and_count"
+        assert params["p_count"] == 2
+
+    def test_free_refund_lowers_daily_count(self):
+        mock_client = MagicMock()
+        with patch.object(db, "_get_client", return_value=mock_client), \
+             patch.object(db, "get_user_subscription", return_value={
+                 "tier": "free", "payg_balance": 0, "rewrites_today": 4
+             }):
+            db.refund_rewrite_count("user-123", 3)
+        assert mock_client.table.return_value.update.call_args[0][0] == {"rewrites_today": 1}
+
     def test_payg_deduction_fallback(self):
         mock_client = MagicMock()
         mock_client.rpc.side_effect = Exception("RPC not found")
@@ -177,6 +220,32 @@ class TestStoreRewrite:
             mock_client.table.return_value.insert.assert_called_once()
 
 
+class TestBulkInserts:
+    def test_store_rewrites_single_insert(self):
+        mock_client = MagicMock()
+        with patch.object(db, "_get_client", return_value=mock_client):
+            db.store_rewrites("user-123", [{"rewrite_id": "r-1"}, {"rewrite_id": "r-2"}])
+        rows = mock_client.table.return_value.insert.call_args.args[0]
+        assert [r["id"] for r in rows] == ["r-1", "r-2"]
+        assert all(r["user_id"] == "user-123" for r in rows)
+
+    def test_log_events_single_insert(self):
+        mock_client = MagicMock()
+        with patch.object(db, "_get_client", return_value=mock_client):
+            db.log_events(None, [("a", {"k": 1}), ("b", None)])
+        rows = mock_client.table.return_value.insert.call_args.args[0]
+        assert rows == [
+            {"user_id": None, "event_name": "a", "event_data": {"k": 1}},
+            {"user_id": None, "event_name": "b", "event_data": {}},
+        ]
+
+    def test_empty_batch_skipped(self):
+        mock_client = MagicMock()
+        with patch.object(db, "_get_client", return_value=mock_client):
+            db.store_rewrites("user-123", [])
+        mock_client.table.assert_not_called()
+
+
 class TestLogEvent:
     def test_noop_without_client(self):
         with patch.object(db, "_get_client", return_value=None):
@@ -200,3 +269,64 @@ class TestLogEvent:
 
         with patch.object(db, "_get_client", return_value=mock_client):
             db.log_event("user-123", "test_event")  # Should not raise
+
+
+class TestIterRewrites:
+    def test_empty_without_client(self):
+        with patch.object(db, "_get_client", return_value=None):
+            assert list(db.iter_rewrites()) == []
+
+    def test_pages_until_short_batch(self):
+        mock_client = MagicMock()
+        query = mock_client.table.return_value.select.return_value.order.return_value
+        query.range.return_value.execute.side_effect = [
+            MagicMock(data=[{"id": 1}, {"id": 2}]),
+            MagicMock(data=[{"id": 3}]),
+        ]
+        with patch.object(db, "_get_client", return_value=mock_client):
+            rows = list(db.iter_rewrites(batch_size=2))
+        assert [r["id"] for r in rows] == [1, 2, 3]
+        assert query.range.call_args_list[1].args == (2, 3)
+
+
+class TestIterEvents:
+    def test_empty_without_client(self):
+        with patch.object(db, "_get_client", return_value=None):
+            assert list(db.iter_events(["loma_use"])) == []
+
+    def test_filters_by_name_and_pages(self):
+        mock_client = MagicMock()
+        select = mock_client.table.return_value.select.return_value
+        query = select.in_.return_value.order.return_value
+        query.range.return_value.execute.side_effect = [
+            MagicMock(data=[{"event_name": "loma_use"}, {"event_name": "loma_dismiss"}]),
+            MagicMock(data=[]),
+        ]
+        with patch.object(db, "_get_client", return_value=mock_client):
+            rows = list(db.iter_events(["loma_use", "loma_dismiss"], batch_size=2))
+        assert len(rows) == 2
+        select.in_.assert_called_with("event_name", ["loma_use", "loma_dismiss"])
+
+
+class TestOfflineRows:
+    def _export(self, tmp_path):
+        path = tmp_path / "rewrites.jsonl"
+        path.write_text('{"id": 1}\n\n{"id": 2}\n{"id": 3}\n', encoding="utf-8")
+        return str(path)
+
+    def test_jsonl_export_respects_limit(self, tmp_path):
+        rows = db.rewrite_rows("id", self._export(tmp_path), limit=2)
+        assert [r["id"] for r in rows] == [1, 2]
+        assert [r["id"] for r in db.rewrite_rows("id", self._export(tmp_path))] == [1, 2, 3]
+
+    def test_since_with_jsonl_rejected(self, tmp_path):
+        import pytest
+        with pytest.raises(ValueError):
+            db.rewrite_rows("id", self._export(tmp_path), since="2026-01-01")
+        with pytest.raises(ValueError):
+            db.event_rows(["loma_use"], self._export(tmp_path), since="2026-01-01")
+
+    def test_table_used_without_jsonl(self):
+        with patch.object(db, "iter_rewrites", return_value=iter([{"id": 9}])) as table:
+            assert list(db.rewrite_rows("id", None, since="2026-01-01", limit=5)) == [{"id": 9}]
+        table.assert_called_once_with(columns="id", since="2026-01-01", limit=5)
@@ -0,0 +1,65 @@
+"""Tests for loma.deadlines — request deadlines and deadline-bounded calls."""
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from loma import billing, db, deadlines
+
+
+class TestDeadlines:
+    def test_from_context_and_default(self):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 4_000
+        assert abs(deadlines.from_context(context, 30) - (time.monotonic() + 4)) < 0.5
+        assert abs(deadlines.from_context(None, 30) - (time.monotonic() + 30)) < 0.5
+
+    def test_no_deadline_calls_directly(self):
+        caller = threading.current_thread()
+        assert deadlines.call_within(None, lambda: threading.current_thread()) is caller
+
+    def test_overrun_returns_default_without_waiting(self):
+        release = threading.Event()
+        start = time.monotonic()
+        result = deadlines.call_within(time.monotonic() + 0.05, release.wait, 5, default={"ok": False})
+        release.set()
+        assert result == {"ok": False}
+        assert time.monotonic() - start < 1
+
+    def test_refuses_calls_while_every_thread_is_held(self):
+        release = threading.Event()
+        try:
+            for _ in range(deadlines._MAX_WORKERS):
+                deadlines.call_within(time.monotonic() + 0.01, release.wait, 5)
+            fn = MagicMock()
+            assert deadlines.call_within(time.monotonic() + 5, fn, default="skipped") == "skipped"
+            fn.assert_not_called()
+            assert deadlines.stats()["in_flight"] == deadlines._MAX_WORKERS
+            with pytest.raises(deadlines.DeadlineExceeded):
+                deadlines.call_within(time.monotonic() + 5, fn, required=True)
+        finally:
+            release.set()
+        deadline = time.monotonic() + 2
+        while deadlines.stats()["in_flight"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert deadlines.call_within(time.monotonic() + 5, lambda: "ran") == "ran"
+
+    def test_passed_deadline_skips_call(self):
+        fn = MagicMock()
+        assert deadlines.call_within(time.monotonic() - 1, fn, default=0) == 0
+        fn.assert_not_called()
+
+
+class TestDbWithinDeadline:
+    def test_subscription_read_fails_closed_past_deadline(self):
+        client = MagicMock()
+        client.table.return_value.select.return_value.eq.return_value.single.return_value.execute.side_effect = (
+            lambda: time.sleep(1)
+        )
+        with patch("loma.db._get_client", return_value=client):
+            with pytest.raises(deadlines.DeadlineExceeded):
+                db.get_user_subscription("user-1", deadline=time.monotonic() + 0.05)
+            quota = billing.check_quota("user-1", deadline=time.monotonic() + 0.05)
+        assert quota["allowed"] is False
+        assert quota["reason"] == billing.QUOTA_UNAVAILABLE
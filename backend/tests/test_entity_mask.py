@@ -0,0 +1,59 @@
+"""Tests for loma.entity_mask — placeholder masking and deterministic restoration."""
+from loma.entity_mask import mask_entities, restore_entities
+
+
+class TestMaskEntities:
+    def test_masks_language_neutral_entities(self):
+        result = mask_entities("Em nhờ Nguyễn Văn Đức review PR #347 trước Q4, deadline 15/3")
+        assert result["masked_text"] == "Em nhờ ⟦NAME_1⟧ review ⟦ID_2⟧ trước ⟦DATE_3⟧, deadline ⟦DATE_4⟧"
+        assert result["placeholders"]["⟦ID_2⟧"] == "PR #347"
+
+    def test_keeps_honorific_outside_placeholder(self):
+        result = mask_entities("Anh Hùng ơi, invoice $5,000 quá hạn")
+        assert result["masked_text"].startswith("Anh ⟦NAME_1⟧ ơi")
+        assert result["placeholders"]["⟦NAME_1⟧"] == "Hùng"
+
+    def test_vietnamese_worded_values_not_masked(self):
+        result = mask_entities("Cái invoice tháng 1 còn 5 triệu đồng chưa trả")
+        assert "tháng 1" in result["masked_text"]
+        assert "triệu đồng" in result["masked_text"]
+
+    def test_repeated_value_same_placeholder(self):
+        result = mask_entities("Invoice $5,000 — yes, $5,000 is overdue")
+        assert result["masked_text"].count("⟦AMT_1⟧") == 2
+        assert len(result["placeholders"]) == 1
+
+    def test_money_not_double_counted_as_number(self):
+        result = mask_entities("Invoice for $5,000 USD")
+        assert list(result["placeholders"]) == ["⟦AMT_1⟧"]
+
+    def test_no_entities(self):
+        result = mask_entities("em muốn hỏi thăm anh")
+        assert result == {"masked_text": "em muốn hỏi thăm anh", "placeholders": {}}
+
+
+class TestRestoreEntities:
+    _PH = {"⟦NAME_1⟧": "Hùng", "⟦AMT_2⟧": "$5,000"}
+    _MASKED = "Anh ⟦NAME_1⟧ ơi, invoice ⟦AMT_2⟧ quá hạn"
+
+    def test_restores_all(self):
+        result = restore_entities("Hi ⟦NAME_1⟧, the ⟦AMT_2⟧ invoice is overdue.", self._PH, self._MASKED)
+        assert result["text"] == "Hi Hùng, the $5,000 invoice is overdue."
+        assert result["missing"] == [] and result["duplicated"] == [] and result["unknown"] == []
+
+    def test_tolerates_ascii_brackets_and_spaces(self):
+        result = restore_entities("Hi [[NAME_1]], ⟦ AMT_2 ⟧ is due.", self._PH, self._MASKED)
+        assert result["text"] == "Hi Hùng, $5,000 is due."
+
+    def test_detects_missing(self):
+        result = restore_entities("Hi ⟦NAME_1⟧, the invoice is overdue.", self._PH, self._MASKED)
+        assert result["missing"] == ["⟦AMT_2⟧"]
+
+    def test_detects_duplicated(self):
+        result = restore_entities("⟦AMT_2⟧ ⟦NAME_1⟧ ⟦AMT_2⟧", self._PH, self._MASKED)
+        assert result["duplicated"] == ["⟦AMT_2⟧"]
+
+    def test_unknown_placeholders_removed(self):
+        result = restore_entities("Hi ⟦NAME_1⟧ ⟦ID_9⟧, ⟦AMT_2⟧ due.", self._PH, self._MASKED)
+        assert result["unknown"] == ["⟦ID_9⟧"]
+        assert "⟦" not in result["text"]
@@ -0,0 +1,153 @@
+"""Tests for loma.fake_anthropic — local Messages API stand-in."""
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from loma import fake_anthropic
+from loma.fake_anthropic import FakeAnthropicServer, FakeBackend, load_profile, prompt_key, synthesize
+
+_FAST = {
+    "default": {"latency_ms": {"median": 1, "sigma": 0}, "ms_per_output_token": 0},
+    "models": {},
+    "min_cacheable_tokens": 10,
+    "seed": 7,
+}
+
+
+def _profile(**overrides) -> dict:
+    profile = load_profile()
+    profile.update({k: v for k, v in _FAST.items() if k != "default"})
+    profile["models"] = {}
+    profile["default"] = {**profile["default"], **_FAST["default"], **overrides}
+    return profile
+
+
+def _body(text="Rewrite this:\n\nAnh ⟦NAME_1⟧ ơi, invoice ⟦AMT_2⟧ quá hạn rồi", system="You are Loma.", **extra):
+    return {
+        "model": "claude-3-5-haiku-20241022",
+        "max_tokens": 1024,
+        "system": system,
+        "messages": [{"role": "user", "content": text}],
+        **extra,
+    }
+
+
+def _post(url: str, body: dict) -> tuple[int, dict]:
+    request = urllib.request.Request(
+        url + "/v1/messages", data=json.dumps(body).encode("utf-8"),
+        headers={"content-type": "application/json"}, method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+class TestSynthesize:
+    def test_keeps_placeholders_and_is_deterministic(self):
+        out = synthesize(_body())
+        assert "⟦NAME_1⟧" in out and "⟦AMT_2⟧" in out
+        assert out == synthesize(_body())
+
+
+class TestFakeBackend:
+    def test_replays_recording_by_prompt_key(self, tmp_path):
+        body = _body()
+        path = tmp_path / "rec.jsonl"
+        path.write_text(json.dumps({"key": prompt_key(body), "model": body["model"], "text": "Recorded"}) + "\n")
+        backend = FakeBackend(_profile(), str(path))
+        status, _, payload = backend.respond(body)
+        assert status == 200
+        assert payload["content"][0]["text"] == "Recorded"
+        assert backend.stats[body["model"]] == {"replay": 1}
+
+    def test_prompt_key_ignores_cache_layout(self):
+        blocks = [{"type": "text", "text": "You are Loma.", "cache_control": {"type": "ephemeral"}}]
+        assert prompt_key(_body(system=blocks)) == prompt_key(_body())
+
+    def test_injected_rate_limit(self):
+        status, headers, payload = FakeBackend(_profile(rate_limit_rate=1.0)).respond(_body())
+        assert status == 429
+        assert "retry-after" in headers
+        assert payload["error"]["type"] == "rate_limit_error"
+
+    def test_unreachable_record_upstream_is_bad_gateway(self):
+        backend = FakeBackend(_profile(), record_upstream="http://127.0.0.1:9")
+        status, _, payload = backend.record(_body(), {})
+        assert status == 502
+        assert payload["type"] == "error"
+        assert backend.recordings == {}
+
+    def test_injected_overload(self):
+        status, _, payload = FakeBackend(_profile(overload_rate=1.0)).respond(_body())
+        assert status == 529
+        assert payload["error"]["type"] == "overloaded_error"
+
+    def test_latency_follows_model_profile(self):
+        profile = _profile()
+        profile["models"]["slow"] = {"latency_ms": {"median": 2000, "sigma": 0}}
+        backend = FakeBackend(profile)
+        assert backend.sample_latency_s("slow") == pytest.approx(2.0)
+        assert backend.sample_latency_s("other") == pytest.approx(0.001)
+
+    def test_prompt_cache_written_then_read(self):
+        system = [
+            {"type": "text", "text": "Static persona " * 20, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": "Entities: ⟦AMT_2⟧"},
+        ]
+        backend = FakeBackend(_profile())
+        first = backend.respond(_body(system=system))[2]["usage"]
+        second = backend.respond(_body(system=system))[2]["usage"]
+        assert first["cache_creation_input_tokens"] > 0 and first["cache_read_input_tokens"] == 0
+        assert second["cache_read_input_tokens"] == first["cache_creation_input_tokens"]
+
+    def test_max_tokens_truncates(self):
+        payload = FakeBackend(_profile()).respond(_body(max_tokens=2))[2]
+        assert payload["stop_reason"] == "max_tokens"
+        assert len(payload["content"][0]["text"]) == 8
+
+    def test_stop_sequence_cuts_text(self):
+        backend = FakeBackend(_profile())
+        full = backend.respond(_body())[2]["content"][0]["text"]
+        word = full.split()[1]
+        payload = backend.respond(_body(stop_sequences=[word]))[2]
+        assert payload["stop_reason"] == "stop_sequence"
+        assert payload["stop_sequence"] == word
+        assert payload["content"][0]["text"] == full[: full.index(word)]
+
+
+class TestFakeServer:
+    def test_serves_messages_api(self):
+        server = FakeAnthropicServer(FakeBackend(_profile())).start()
+        try:
+            status, payload = _post(server.url, _body())
+            assert status == 200
+            assert payload["type"] == "message"
+            assert "⟦AMT_2⟧" in payload["content"][0]["text"]
+            with urllib.request.urlopen(server.url + "/stats", timeout=5) as resp:
+                assert json.loads(resp.read()) == {"claude-3-5-haiku-20241022": {"synth": 1}}
+        finally:
+            server.stop()
+
+    def test_lists_models_for_warm_up(self):
+        server = FakeAnthropicServer(FakeBackend(load_profile())).start()
+        try:
+            with urllib.request.urlopen(server.url + "/v1/models?limit=1", timeout=5) as resp:
+                payload = json.loads(resp.read())
+            assert [m["id"] for m in payload["data"]] == ["claude-3-5-haiku-20241022"]
+            assert payload["data"][0]["type"] == "model"
+        finally:
+            server.stop()
+
+    def test_start_with_profile_file(self, tmp_path):
+        path = tmp_path / "profile.json"
+        path.write_text(json.dumps({"default": {"rate_limit_rate": 1.0, "latency_ms": {"median": 1}}}))
+        server = fake_anthropic.start(profile_path=str(path))
+        try:
+            status, payload = _post(server.url, _body())
+            assert status == 429
+        finally:
+            server.stop()
@@ -0,0 +1,118 @@
+"""Tests for loma.fingerprint — entity masking, SimHash, near-duplicate index."""
+from loma import fingerprint
+from loma.fingerprint import (
+    NearDuplicateIndex,
+    entity_sequence,
+    hamming,
+    mask_entities,
+    simhash,
+    simulate_hit_rate,
+    substitute_entities,
+)
+
+_A = "Anh Hùng ơi, invoice INV-2024-031 $5,000 quá hạn 2 tuần rồi, anh check giúp em nhé"
+_B = "Anh Minh ơi, invoice INV-2024-044 $7,200 quá hạn 3 tuần rồi, anh check giúp em nhé"
+_OUT_A = "Hi Hùng, invoice INV-2024-031 for $5,000 is 2 weeks overdue."
+
+
+class TestMasking:
+    def test_templated_inputs_mask_identically(self):
+        assert mask_entities(_A) == mask_entities(_B)
+
+    def test_entity_order_and_no_overlap(self):
+        seq = entity_sequence(_A)
+        assert [c for c, _ in seq] == ["names", "identifiers", "money", "numbers"]
+        # "$5,000" is money only, not also a number
+        assert ("numbers", "5,000") not in seq
+
+    def test_digit_inside_identifier_not_masked_separately(self):
+        assert "2024" not in mask_entities(_A)
+
+
+class TestSimHash:
+    def test_identical_masked_text_same_fingerprint(self):
+        assert simhash(mask_entities(_A)) == simhash(mask_entities(_B))
+
+    def test_small_edit_small_distance(self):
+        edited = _B.replace("nhé", "với nhé")
+        d = hamming(simhash(mask_entities(_A)), simhash(mask_entities(edited)))
+        assert d <= 8
+
+    def test_unrelated_text_far(self):
+        other = "Em xin nghỉ phép thứ sáu để đi khám bệnh, mong anh duyệt giúp"
+        d = hamming(simhash(mask_entities(_A)), simhash(mask_entities(other)))
+        assert d > 10
+
+
+class TestSubstituteEntities:
+    def test_retargets_output(self):
+        out = substitute_entities(_OUT_A, entity_sequence(_A), entity_sequence(_B))
+        assert out == "Hi Minh, invoice INV-2024-044 for $7,200 is 3 weeks overdue."
+
+    def test_refuses_when_entity_missing_from_output(self):
+        assert substitute_entities("Hi, the invoice is overdue.", entity_sequence(_A), entity_sequence(_B)) is None
+
+    def test_refuses_on_category_mismatch(self):
+        assert substitute_entities(_OUT_A, [("money", "$5")], [("dates", "Q4")]) is None
+
+
+class TestNearDuplicateIndex:
+    def test_bounded_with_eviction(self):
+        index = NearDuplicateIndex(max_entries=3, max_distance=6)
+        for i in range(10):
+            index.add("ctx", i * 0x0101010101010101, f"m{i}", {"i": i})
+        assert len(index) == 3
+        assert index.query("ctx", 0, "m0") is None
+
+    def test_context_scoped(self):
+        index = NearDuplicateIndex(max_entries=10, max_distance=6)
+        index.add("ask_payment", 42, "m", {"v": 1})
+        assert index.query("follow_up", 42, "m") is None
+        assert index.query("ask_payment", 42, "m")["exact_masked"] is True
+
+    def test_distance_threshold(self):
+        index = NearDuplicateIndex(max_entries=10, max_distance=3)
+        index.add("ctx", 0, "m", {"v": 1})
+        assert index.query("ctx", 0b111, "x")["distance"] == 3
+        assert index.query("ctx", 0b1111, "x") is None
+
+
+class TestLookup:
+    def setup_method(self):
+        fingerprint.clear()
+
+    def teardown_method(self):
+        fingerprint.clear()
+
+    def test_reusable_match(self):
+        fingerprint.remember(_A, "ask_payment", "professional", "gmail", "en", _OUT_A, "sonnet")
+        hit = fingerprint.lookup(_B, "ask_payment", "professional", "gmail", "en")
+        assert hit["reusable"] is True
+        assert "$7,200" in hit["output_text"]
+        assert hit["routing_tier"] == "sonnet"
+
+    def test_starting_point_match(self):
+        fingerprint.remember(_A, "ask_payment", "professional", "gmail", "en", _OUT_A, "sonnet")
+        hit = fingerprint.lookup(_B.replace("nhé", "với nhé"), "ask_payment", "professional", "gmail", "en")
+        assert hit is not None
+        assert hit["reusable"] is False
+        assert hit["output_text"] == _OUT_A
+
+
+class TestSimulateHitRate:
+    def test_counts_layers(self):
+        row = {"detected_intent": "ask_payment", "tone": "professional", "platform": "gmail",
+               "output_language": "en", "routing_tier": "sonnet"}
+        rows = [
+            {**row, "input_text": _A, "output_text": _OUT_A},
+            {**row, "input_text": _A, "output_text": _OUT_A},
+            {**row, "input_text": _B, "output_text": "x"},
+            {**row, "input_text": "Em xin nghỉ phép thứ sáu", "output_text": "y"},
+            {**row, "input_text": "rules row", "routing_tier": "rules"},
+        ]
+        report = simulate_hit_rate(rows)
+        assert report["total"] == 4
+        assert report["exact_hits"] == 1
+        assert report["near_reusable"] == 1
+        assert report["llm"] == 2
+        assert report["reusable_hit_rate"] == 0.5
@@ -1,6 +1,6 @@
 """Tests for handler.py — request routing, input validation, security headers, rate limiting."""
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import call, patch, MagicMock
 
 import handler
 from handler import _json_response, _check_anon_rate_limit, _extract_client_ip, _anon_ip_counts
@@ -39,6 +39,48 @@ class TestHealthEndpoint:
         assert body["service"] == "loma-rewrite"
 
 
+class TestUsageStatsEndpoint:
+    _ADMIN = {"x-admin-key": "ops-key"}
+
+    def setup_method(self):
+        self._key = patch("handler.config.STATS_ADMIN_KEY", "ops-key")
+        self._key.start()
+
+    def teardown_method(self):
+        self._key.stop()
+
+    def test_returns_rolling_aggregates(self):
+        from loma import usage
+        usage.clear()
+        usage.record_rewrite(
+            {"routing_tier": "haiku", "detected_intent": "follow_up", "response_time_ms": 400,
+             "usage": {"calls": 1, "input_tokens": 1000, "output_tokens": 100, "cost_usd": 0.0012}},
+            platform="slack",
+        )
+        resp = handler.handler({"rawPath": "/api/v1/stats/usage", "headers": self._ADMIN}, None)
+        assert resp["statusCode"] == 200
+        body = json.loads(resp["body"])
+        assert body["overall"]["rewrites"] == 1
+        assert body["by_tier"]["haiku"]["cost_usd"] == 0.0012
+        assert body["by_platform"]["slack"]["input_tokens"] == 1000
+        assert "models" in body and "rewrite_cache" in body
+        usage.clear()
+
+    def test_invalid_window_returns_400(self):
+        event = {"rawPath": "/api/v1/stats/usage", "headers": self._ADMIN, "queryStringParameters": {"window_s": "abc"}}
+        assert handler.handler(event, None)["statusCode"] == 400
+
+    def test_requires_admin_key(self):
+        assert handler.handler({"rawPath": "/api/v1/stats/usage", "headers": {}}, None)["statusCode"] == 401
+        wrong = {"rawPath": "/api/v1/stats/usage", "headers": {"X-Admin-Key": "guess"}}
+        assert handler.handler(wrong, None)["statusCode"] == 401
+
+    def test_disabled_without_configured_key(self):
+        with patch("handler.config.STATS_ADMIN_KEY", ""):
+            event = {"rawPath": "/api/v1/stats/usage", "headers": {"x-admin-key": ""}}
+            assert handler.handler(event, None)["statusCode"] == 401
+
+
 class TestInputValidation:
     def _make_event(self, body_dict):
         return {
@@ -175,6 +217,24 @@ class TestQuotaCheck:
         body = json.loads(resp["body"])
         assert "PAYG" in body["message"]
 
+    @patch("handler.analytics")
+    @patch("handler.auth")
+    def test_quota_unavailable_returns_503(self, mock_auth, mock_analytics):
+        mock_auth.get_bearer_token.return_value = "token"
+        mock_auth.extract_user_id.return_value = "user-123"
+        unavailable = {"allowed": False, "tier": None, "remaining": None, "reason": "quota_unavailable"}
+
+        event = {
+            "rawPath": "/api/v1/rewrite",
+            "headers": {"Authorization": "Bearer token"},
+            "body": json.dumps({"input_text": "hello"}),
+        }
+        with patch("handler.billing.check_quota", return_value=unavailable), \
+             patch("handler.run_rewrite", return_value={"output_text": "hi"}):
+            resp = handler.handler(event, None)
+        assert resp["statusCode"] == 503
+        assert json.loads(resp["body"])["error"] == "quota_unavailable"
+
 
 class TestExtractClientIp:
     def test_http_api_v2_format(self):
@@ -282,3 +342,314 @@ class TestCreatePaymentEndpoint:
         assert resp["statusCode"] == 401
         body = json.loads(resp["body"])
         assert body["error"] == "auth_required"
+
+
+class TestRequestDeadline:
+    def test_uses_lambda_remaining_time(self):
+        import time
+        import config
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 10_000
+        request_deadline, deadline = handler._request_deadlines(context)
+        assert abs(request_deadline - (time.monotonic() + 10)) < 0.5
+        assert deadline == request_deadline - config.POST_PIPELINE_RESERVE_S
+
+    def test_defaults_to_configured_budget(self):
+        import time
+        import config
+        _, deadline = handler._request_deadlines(None)
+        expected = time.monotonic() + config.REQUEST_BUDGET_S - config.POST_PIPELINE_RESERVE_S
+        assert abs(deadline - expected) < 0.5
+
+    def test_quota_and_writes_get_the_deadlines(self):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 10_000
+        with patch("handler.run_rewrite", return_value={"rewrite_id": "rw-1", "output_text": "ok"}) as run, \
+             patch("handler.auth.extract_user_id", return_value="user-1"), \
+             patch("handler.billing.check_quota", return_value={"allowed": True, "tier": "pro", "remaining": None}) as quota, \
+             patch("handler.db") as db, patch("handler.analytics") as analytics, \
+             patch("handler.semantic_scoring.submit"):
+            handler.handler({"rawPath": "/api/v1/rewrite", "headers": {}, "body": '{"input_text": "x"}'}, context)
+        deadline = run.call_args.kwargs["deadline"]
+        assert quota.call_args.kwargs["deadline"] == deadline
+        assert db.store_rewrite.call_args.kwargs["deadline"] > deadline
+        assert analytics.track_rewrite.call_args.kwargs["deadline"] > deadline
+
+    def test_deadline_exceeded_is_503(self):
+        with patch("handler.run_rewrite", return_value={"error": "deadline_exceeded", "message": "m", "message_vi": "m"}), \
+             patch("handler.billing.check_quota", return_value={"allowed": True, "tier": "free", "remaining": 4}):
+            resp = handler.handler({"rawPath": "/api/v1/rewrite", "headers": {}, "body": '{"input_text": "x"}'}, None)
+        assert resp["statusCode"] == 503
+
+
+class TestStageTimings:
+    def test_handler_stages_recorded_and_returned(self):
+        result = {"rewrite_id": "rw-1", "output_text": "ok", "timings": {"llm": 1.0, "total": 2.0}}
+        with patch("handler.run_rewrite", return_value=result) as run, \
+             patch("handler.billing.check_quota", return_value={"allowed": True, "tier": "free", "remaining": 4}), \
+             patch("handler.db.store_rewrite"), patch("handler.analytics.track_rewrite"), \
+             patch("handler.semantic_scoring.submit"):
+            resp = handler.handler({"rawPath": "/api/v1/rewrite", "headers": {}, "body": '{"input_text": "x", "timings": true}'}, None)
+        assert run.call_args.kwargs["return_timings"] is True
+        timings = json.loads(resp["body"])["timings"]
+        for stage in ("auth", "quota", "db_store", "analytics", "total"):
+            assert stage in timings
+
+
+class TestRewriteBatch:
+    def setup_method(self):
+        _anon_ip_counts.clear()
+
+    def _event(self, body):
+        return {"rawPath": "/api/v1/rewrite/batch", "headers": {}, "body": json.dumps(body)}
+
+    def _run(self, body, quota=None, user_id="user-1", run=None):
+        quota = quota or {"allowed": True, "tier": "pro", "remaining": None, "reason": None}
+        run = run or (lambda **kw: {"rewrite_id": "rw-" + kw["input_text"], "output_text": kw["input_text"].upper()})
+        with patch("handler.auth.extract_user_id", return_value=user_id), \
+             patch("handler.billing.check_quota", return_value=quota) as check, \
+             patch("handler.run_rewrite", side_effect=run) as rewrite, \
+             patch("handler.db") as db, patch("handler.analytics") as analytics, \
+             patch("handler.semantic_scoring.submit"):
+            resp = handler.handler(self._event(body), None)
+        return resp, json.loads(resp["body"]), {"check": check, "rewrite": rewrite, "db": db, "analytics": analytics}
+
+    def test_results_in_order_with_one_quota_check_and_bulk_writes(self):
+        resp, body, mocks = self._run({"items": [{"input_text": t} for t in "abcde"], "tone": "warm"})
+        assert resp["statusCode"] == 200
+        assert [r["output_text"] for r in body["results"]] == list("ABCDE")
+        assert mocks["check"].call_count == 1
+        assert all(c.kwargs["tone"] == "warm" for c in mocks["rewrite"].call_args_list)
+        mocks["db"].increment_rewrite_count.assert_called_once()
+        assert mocks["db"].increment_rewrite_count.call_args == call("user-1", 5)
+        assert len(mocks["db"].store_rewrites.call_args.args[1]) == 5
+        assert len(mocks["analytics"].track_rewrites.call_args.args[1]) == 5
+        mocks["db"].store_rewrite.assert_not_called()
+
+    def test_per_item_errors_do_not_fail_the_batch(self):
+        def run(**kw):
+            if kw["input_text"] == "boom":
+                raise RuntimeError("LLM down")
+            return {"rewrite_id": "rw", "output_text": "ok"}
+        items = [{"input_text": "a"}, {"input_text": "b", "tone": "rude"}, {"input_text": "boom"}]
+        _, body, mocks = self._run({"items": items}, run=run)
+        assert [r.get("error") for r in body["results"]] == [None, "invalid_tone", "pipeline_error"]
+        assert body["succeeded"] == 1 and body["failed"] == 2
+        # The invalid item is never reserved; the failed one is refunded
+        assert mocks["db"].increment_rewrite_count.call_args == call("user-1", 2)
+        assert mocks["db"].refund_rewrite_count.call_args == call("user-1", 1)
+
+    def test_items_past_remaining_quota_are_not_run(self):
+        quota = {"allowed": True, "tier": "free", "remaining": 2, "reason": None}
+        _, body, mocks = self._run({"items": [{"input_text": t} for t in "abc"]}, quota=quota)
+        assert mocks["rewrite"].call_count == 2
+        assert body["results"][2]["error"] == "free_limit_reached"
+        assert body["remaining"] == 0
+
+    def test_invalid_items_do_not_use_up_quota(self):
+        quota = {"allowed": True, "tier": "free", "remaining": 2, "reason": None}
+        items = [{"input_text": "a", "tone": "rude"}, {"input_text": "b"}, {"input_text": "c"}]
+        _, body, mocks = self._run({"items": items}, quota=quota)
+        assert [r.get("error") for r in body["results"]] == ["invalid_tone", None, None]
+        assert mocks["rewrite"].call_count == 2
+
+    def test_uncovered_debit_serves_nothing(self):
+        quota = {"allowed": True, "tier": "payg", "remaining": 3, "reason": None}
+        with patch("handler.auth.extract_user_id", return_value="user-1"), \
+             patch("handler.billing.check_quota", return_value=quota), \
+             patch("handler.run_rewrite") as rewrite, \
+             patch("handler.db") as db, patch("handler.analytics"):
+            db.increment_rewrite_count.return_value = False
+            resp = handler.handler(self._event({"items": [{"input_text": t} for t in "abc"]}), None)
+        assert resp["statusCode"] == 429
+        assert json.loads(resp["body"])["error"] == "payg_exhausted"
+        rewrite.assert_not_called()
+
+    def test_exhausted_quota_returns_429(self):
+        quota = {"allowed": False, "tier": "payg", "remaining": 0, "reason": "payg_exhausted"}
+        resp, body, mocks = self._run({"items": [{"input_text": "a"}]}, quota=quota)
+        assert resp["statusCode"] == 429
+        assert body["error"] == "payg_exhausted"
+        mocks["rewrite"].assert_not_called()
+
+    def test_invalid_and_oversized_batches_rejected(self):
+        import config
+        assert self._run({"items": []})[0]["statusCode"] == 400
+        too_many = {"items": [{"input_text": "a"}] * (config.BATCH_MAX_ITEMS + 1)}
+        assert self._run(too_many)[1]["error"] == "batch_too_large"
+
+    def test_anonymous_batch_counts_each_item(self):
+        event = self._event({"items": [{"input_text": "a"}] * 15})
+        event["requestContext"] = {"http": {"sourceIp": "10.0.0.9"}}
+        quota = {"allowed": True, "tier": "anonymous", "remaining": None, "reason": None}
+        with patch("handler.auth.extract_user_id", return_value=None), \
+             patch("handler.billing.check_quota", return_value=quota), \
+             patch("handler.run_rewrite", return_value={"rewrite_id": "rw", "output_text": "ok"}), \
+             patch("handler.db"), patch("handler.analytics"), patch("handler.semantic_scoring.submit"):
+            assert handler.handler(event, None)["statusCode"] == 200
+            assert handler.handler(event, None)["statusCode"] == 429
+
+
+class TestToneSwitch:
+    _AUTH = {"authorization": "Bearer t"}
+
+    def setup_method(self):
+        from loma import tone_variants
+        tone_variants.clear()
+
+    def _store(self):
+        from loma import tone_variants
+        request = {"rewrite_id": "0b6f5c1e-aaaa-bbbb-cccc-000000000001", "owner": "user-1",
+                   "detected_intent": "follow_up", "output_language": "en", "original_text": "Anh ơi",
+                   "llm_input": "Anh ơi", "platform": None}
+        variant = {"output_text": "Please review.", "masked_output": "Please review.",
+                   "cacheable": False, "scores": {"length_reduction_pct": 10}}
+        tone_variants.remember(request, "haiku", {"direct": variant})
+        return request["rewrite_id"]
+
+    def _switch(self, rewrite_id, tone, user_id="user-1"):
+        with patch("handler.auth.extract_user_id", return_value=user_id):
+            return handler.handler({"rawPath": f"/api/v1/rewrite/{rewrite_id}/tone/{tone}", "headers": self._AUTH}, None)
+
+    def test_stored_variant_served_without_quota(self):
+        rewrite_id = self._store()
+        with patch("handler.billing.check_quota") as quota, patch("handler.analytics.track") as track:
+            resp = self._switch(rewrite_id, "direct")
+        assert resp["statusCode"] == 200
+        body = json.loads(resp["body"])
+        assert body["output_text"] == "Please review."
+        assert body["cache_match"] == "tone_variant"
+        quota.assert_not_called()
+        assert track.call_args.args[0] == "loma_tone_change"
+
+    def test_missing_variant_404_and_invalid_tone_400(self):
+        rewrite_id = self._store()
+        with patch("handler.analytics.track"):
+            resp = self._switch(rewrite_id, "warm")
+            assert resp["statusCode"] == 404
+            assert json.loads(resp["body"])["regenerate"]["body"] == {"tone": "warm", "tone_switch": True}
+            assert self._switch(rewrite_id, "rude")["statusCode"] == 400
+
+    def test_other_users_rewrite_is_not_found(self):
+        rewrite_id = self._store()
+        with patch("handler.analytics.track"):
+            assert self._switch(rewrite_id, "direct", user_id="user-2")["statusCode"] == 404
+            assert self._switch(rewrite_id, "direct", user_id=None)["statusCode"] == 401
+
+    def test_rewrite_request_passes_tone_variants_flag(self):
+        with patch("handler.run_rewrite", return_value={"rewrite_id": "rw-1", "output_text": "ok"}) as run, \
+             patch("handler.auth.extract_user_id", return_value="user-1"), \
+             patch("handler.billing.check_quota", return_value={"allowed": True, "tier": "free", "remaining": 4}), \
+             patch("handler.db"), patch("handler.analytics"), patch("handler.semantic_scoring.submit"):
+            handler.handler({"rawPath": "/api/v1/rewrite", "headers": self._AUTH,
+                             "body": '{"input_text": "x", "tone_variants": true, "tone_switch": true}'}, None)
+        assert run.call_args.kwargs["tone_variants"] is True
+        assert run.call_args.kwargs["variants_owner"] == "user-1"
+        from loma import tone_variants
+        assert tone_variants.stats()["switch_latency"]["rewrite"]["count"] == 1
+
+    def test_anonymous_rewrite_gets_no_variants(self):
+        quota = {"allowed": True, "tier": "anonymous", "remaining": None, "reason": None}
+        with patch("handler.run_rewrite", return_value={"rewrite_id": "rw-1", "output_text": "ok"}) as run, \
+             patch("handler.auth.extract_user_id", return_value=None), \
+             patch("handler.billing.check_quota", return_value=quota), \
+             patch("handler.db"), patch("handler.analytics"), patch("handler.semantic_scoring.submit"):
+            handler.handler({"rawPath": "/api/v1/rewrite", "headers": {},
+                             "body": '{"input_text": "x", "tone_variants": true}'}, None)
+        assert run.call_args.kwargs["tone_variants"] is False
+
+
+class TestOptimisticQuota:
+    _EVENT = {"rawPath": "/api/v1/rewrite", "headers": {"authorization": "Bearer t"}, "body": '{"input_text": "x"}'}
+
+    def setup_method(self):
+        handler._known_quota.clear()
+
+    def _slow_quota(self, quota, done):
+        import time
+
+        def check(user_id, deadline=None):
+            time.sleep(0.2)
+            done.set()
+            return quota
+        return check
+
+    def _run(self, quota, run):
+        import threading
+        done = threading.Event()
+        with patch("handler.auth.extract_user_id", return_value="user-1"), \
+             patch("handler.billing.check_quota", side_effect=self._slow_quota(quota, done)), \
+             patch("handler.run_rewrite", side_effect=lambda **kw: run(done, **kw)), \
+             patch("handler.db") as db, patch("handler.analytics"), patch("handler.semantic_scoring.submit"):
+            resp = handler.handler(self._EVENT, None)
+        return resp, db
+
+    def test_pipeline_starts_before_quota_returns(self):
+        seen = {}
+
+        def run(done, gate, **kwargs):
+            seen["started_before_quota"] = not done.is_set()
+            seen["gate"] = gate()
+            seen["gate_after_quota"] = done.is_set()
+            return {"rewrite_id": "rw-1", "output_text": "ok", "usage": {"calls": 1}}
+        resp, db = self._run({"allowed": True, "tier": "free", "remaining": 3, "reason": None}, run)
+        assert resp["statusCode"] == 200
+        assert seen == {"started_before_quota": True, "gate": True, "gate_after_quota": True}
+        assert db.store_rewrite.called
+
+    def test_denied_request_cancelled_before_llm(self):
+        def run(done, gate, **kwargs):
+            assert gate() is False
+            return {"error": "cancelled", "message": "m", "message_vi": "m"}
+        resp, db = self._run({"allowed": False, "tier": "free", "remaining": 0, "reason": "free_limit_reached"}, run)
+        assert resp["statusCode"] == 429
+        assert json.loads(resp["body"])["error"] == "free_limit_reached"
+        db.store_rewrite.assert_not_called()
+        db.increment_rewrite_count.assert_not_called()
+
+    def test_known_paid_user_starts_llm_speculatively(self):
+        import time
+        handler._remember_quota("user-1", {"allowed": True, "tier": "pro", "remaining": None, "reason": None})
+        seen = {}
+
+        def run(done, gate, hedge=None, **kwargs):
+            start = time.monotonic()
+            seen["gate"] = gate()
+            seen["gate_s"] = time.monotonic() - start
+            return {"rewrite_id": "rw-1", "output_text": "ok", "usage": {"calls": 1}}
+        before = handler._overlap_stats()["speculative"]
+        resp, _ = self._run({"allowed": True, "tier": "pro", "remaining": None, "reason": None}, run)
+        assert resp["statusCode"] == 200
+        assert seen["gate"] is True and seen["gate_s"] < 0.1
+        stats = handler._overlap_stats()
+        assert stats["speculative"] == before + 1
+        assert stats["saved_ms_p50"] is not None
+
+    def test_speculative_result_discarded_when_denied(self):
+        handler._remember_quota("user-1", {"allowed": True, "tier": "payg", "remaining": 5, "reason": None})
+
+        def run(done, gate, **kwargs):
+            assert gate() is True
+            return {"rewrite_id": "rw-1", "output_text": "ok", "usage": {"calls": 1}}
+        resp, db = self._run({"allowed": False, "tier": "payg", "remaining": 0, "reason": "payg_exhausted"}, run)
+        assert resp["statusCode"] == 429
+        db.store_rewrite.assert_not_called()
+        assert "user-1" not in handler._known_quota
+
+    def test_known_quota_evicts_least_recently_checked(self):
+        quota = {"allowed": True, "tier": "pro", "remaining": None, "reason": None}
+        with patch("handler._KNOWN_QUOTA_MAX", 2):
+            handler._remember_quota("a", quota)
+            handler._remember_quota("b", quota)
+            handler._remember_quota("a", quota)
+            handler._remember_quota("c", quota)
+        assert list(handler._known_quota) == ["a", "c"]
+
+    def test_disabled_checks_quota_first(self):
+        with patch("handler.config.OPTIMISTIC_QUOTA", False), \
+             patch("handler.auth.extract_user_id", return_value="user-1"), \
+             patch("handler.billing.check_quota", return_value={"allowed": False, "tier": "free", "remaining": 0, "reason": "free_limit_reached"}), \
+             patch("handler.run_rewrite") as run, patch("handler.analytics"):
+            resp = handler.handler(self._EVENT, None)
+        assert resp["statusCode"] == 429
+        run.assert_not_called()
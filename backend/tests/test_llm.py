@@ -1,8 +1,12 @@
 """Tests for loma.llm — Claude API integration, retry, timeout."""
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
 import os
 
-from loma.llm import call_claude, MAX_RETRIES, RETRY_DELAY_S, REQUEST_TIMEOUT_S
+import pytest
+
+from loma import llm
+from loma.llm import call_claude, call_claude_async, MAX_RETRIES, RETRY_DELAY_S, REQUEST_TIMEOUT_S
 
 
 class TestRetryConfig:
@@ -54,6 +58,23 @@ class TestCallClaudeWithApiKey:
             result = call_claude("system prompt", "hello")
             assert result == "Rewritten text"
 
+    @patch.dict(os.environ, {"ANTHROPIC_BASE_URL": "http://127.0.0.1:8765"}, clear=True)
+    def test_base_url_points_client_at_fake_backend_without_key(self):
+        mock_content = MagicMock()
+        mock_content.text = "Fake output"
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = MagicMock(content=[mock_content])
+
+        mock_module = self._make_mock_anthropic_module()
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            result = call_claude("system", "input")
+        assert result == "Fake output"
+        kwargs = mock_module.Anthropic.call_args.kwargs
+        assert kwargs["base_url"] == "http://127.0.0.1:8765"
+        assert kwargs["max_retries"] == 0
+
     @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
     def test_empty_content_returns_empty(self):
         mock_client = MagicMock()
@@ -103,12 +124,329 @@ class TestCallClaudeWithApiKey:
         mock_module.Anthropic = MagicMock(return_value=mock_client)
 
         with patch.dict("sys.modules", {"anthropic": mock_module}), \
-             patch("loma.llm.time"):
+             patch("loma.llm.time.sleep"):
             result = call_claude("system", "input")
             assert result == "success"
             assert mock_client.messages.create.call_count == 3
 
 
+class TestCancelled:
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_cancelled_call_sends_nothing(self):
+        mock_client = MagicMock()
+        mock_module = MagicMock()
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            with pytest.raises(RuntimeError, match="cancelled"):
+                call_claude("system", "input", cancelled=lambda: True)
+        mock_client.messages.create.assert_not_called()
+
+
+class TestWarmUp:
+    def teardown_method(self):
+        llm._client = None
+        llm._client_key = None
+        llm._last_used = 0.0
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_opens_connection_once_then_reuses_client(self):
+        mock_client = MagicMock()
+        mock_module = MagicMock()
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+        llm._last_used = 0.0
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            assert llm.warm_up() is True
+            assert llm.warm_up() is False
+            mock_client.messages.create.return_value = MagicMock(content=[MagicMock(text="ok")])
+            assert call_claude("system prompt", "hello") == "ok"
+        assert mock_module.Anthropic.call_count == 1
+        mock_client.with_options.return_value.models.list.assert_called_once()
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_no_key_is_a_no_op(self):
+        assert llm.warm_up() is False
+
+
+class TestCallClaudeAsync:
+    def _make_mock_anthropic_module(self, create):
+        mock_module = MagicMock()
+        mock_module.APITimeoutError = type("APITimeoutError", (Exception,), {})
+        mock_module.APIConnectionError = type("APIConnectionError", (Exception,), {})
+        mock_module.RateLimitError = type("RateLimitError", (Exception,), {})
+        mock_client = MagicMock()
+        mock_client.messages.create = create
+        mock_module.AsyncAnthropic = MagicMock(return_value=mock_client)
+        return mock_module
+
+    def setup_method(self):
+        llm._async_clients.clear()
+
+    def teardown_method(self):
+        llm._async_clients.clear()
+
+    def test_placeholder_without_key(self):
+        with patch.dict(os.environ, {}, clear=True):
+            result = asyncio.run(call_claude_async("system", "input text"))
+            assert "[LLM placeholder" in result
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_successful_call(self):
+        mock_content = MagicMock()
+        mock_content.text = "  Rewritten async  "
+        mock_response = MagicMock()
+        mock_response.content = [mock_content]
+        mock_module = self._make_mock_anthropic_module(AsyncMock(return_value=mock_response))
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            result = asyncio.run(call_claude_async("system", "hello"))
+            assert result == "Rewritten async"
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_client_reused_within_a_loop_not_across_loops(self):
+        mock_response = MagicMock(content=[MagicMock(text="ok")])
+        mock_module = self._make_mock_anthropic_module(AsyncMock(return_value=mock_response))
+
+        async def two_calls():
+            await call_claude_async("system", "one")
+            await call_claude_async("system", "two")
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            asyncio.run(two_calls())
+            assert mock_module.AsyncAnthropic.call_count == 1
+            asyncio.run(call_claude_async("system", "three"))
+            assert mock_module.AsyncAnthropic.call_count == 2
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_successful_call_marks_client_used(self):
+        mock_response = MagicMock(content=[MagicMock(text="ok")])
+        mock_module = self._make_mock_anthropic_module(AsyncMock(return_value=mock_response))
+        llm._last_used = 0.0
+        try:
+            with patch.dict("sys.modules", {"anthropic": mock_module}):
+                asyncio.run(call_claude_async("system", "hello"))
+                assert llm.warm_up() is False
+        finally:
+            llm._last_used = 0.0
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_retries_on_rate_limit_without_blocking(self):
+        mock_content = MagicMock()
+        mock_content.text = "success"
+        mock_response = MagicMock()
+        mock_response.content = [mock_content]
+        create = AsyncMock()
+        mock_module = self._make_mock_anthropic_module(create)
+        create.side_effect = [mock_module.RateLimitError("rate limited"), mock_response]
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}), \
+             patch("loma.llm.asyncio.sleep", new=AsyncMock()) as mock_sleep, \
+             patch("loma.llm.time.sleep") as mock_time_sleep:
+            result = asyncio.run(call_claude_async("system", "input"))
+            assert result == "success"
+            assert create.call_count == 2
+            mock_sleep.assert_awaited_once()
+            mock_time_sleep.assert_not_called()
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_raises_on_api_error(self):
+        mock_module = self._make_mock_anthropic_module(AsyncMock(side_effect=Exception("API error")))
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            try:
+                asyncio.run(call_claude_async("system", "input"))
+                assert False, "Should have raised"
+            except RuntimeError as e:
+                assert "LLM call failed" in str(e)
+
+
+class TestBackoffAndDeadline:
+    def test_backoff_grows_exponentially_with_jitter(self):
+        for attempt in range(3):
+            cap = min(llm.RETRY_MAX_DELAY_S, llm.RETRY_DELAY_S * 2 ** attempt)
+            for _ in range(20):
+                delay = llm.backoff_delay(attempt)
+                assert cap / 2 <= delay <= cap
+
+    def test_backoff_is_capped(self):
+        assert llm.backoff_delay(10) <= llm.RETRY_MAX_DELAY_S
+
+    def test_attempt_timeout_capped_by_deadline(self):
+        import time
+        timeout = llm._attempt_timeout(time.monotonic() + 5)
+        assert timeout is not None and timeout <= 5
+
+    def test_attempt_timeout_none_when_budget_exhausted(self):
+        import time
+        assert llm._attempt_timeout(time.monotonic() + 0.5) is None
+
+    def test_no_deadline_uses_request_timeout(self):
+        assert llm._attempt_timeout(None) == REQUEST_TIMEOUT_S
+
+
+class TestCircuitBreaker:
+    def setup_method(self):
+        llm._breakers.clear()
+
+    def teardown_method(self):
+        llm._breakers.clear()
+
+    def test_opens_after_threshold(self):
+        for _ in range(llm.BREAKER_FAILURE_THRESHOLD):
+            llm._record_failure("model-x")
+        assert llm.circuit_open("model-x") is True
+        assert llm.circuit_state("model-x")["open"] is True
+
+    def test_success_resets(self):
+        for _ in range(llm.BREAKER_FAILURE_THRESHOLD):
+            llm._record_failure("model-x")
+        llm._record_success("model-x")
+        assert llm.circuit_open("model-x") is False
+
+    def test_half_open_after_cooldown(self):
+        for _ in range(llm.BREAKER_FAILURE_THRESHOLD):
+            llm._record_failure("model-x")
+        llm._breakers["model-x"]["opened_at"] -= llm.BREAKER_COOLDOWN_S + 1
+        assert llm.circuit_open("model-x") is False
+
+    def test_rate_limits_do_not_open_circuit(self):
+        for attempt in range(llm.BREAKER_FAILURE_THRESHOLD):
+            llm._retry_delay(attempt, "model-x", None, "rate_limited")
+        assert llm.circuit_open("model-x") is False
+        llm._retry_delay(0, "model-x", None, "overloaded")
+        assert llm.circuit_state("model-x")["failures"] == 1
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_expired_deadline_logs_no_attempt(self, caplog):
+        import time
+        mock_module = MagicMock()
+        mock_module.Anthropic = MagicMock(return_value=MagicMock())
+        with patch.dict("sys.modules", {"anthropic": mock_module}), pytest.raises(RuntimeError):
+            call_claude("system", "input", deadline=time.monotonic() - 1)
+        assert "not called" in caplog.text
+        assert "after" not in caplog.text
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_open_circuit_fails_fast(self):
+        for _ in range(llm.BREAKER_FAILURE_THRESHOLD):
+            llm._record_failure("claude-sonnet-4-20250514")
+        try:
+            call_claude("system", "input")
+            assert False, "Should have raised"
+        except RuntimeError as e:
+            assert "circuit open" in str(e)
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_stops_retrying_when_deadline_too_close(self):
+        import time
+        mock_module = MagicMock()
+        mock_module.APITimeoutError = type("APITimeoutError", (Exception,), {})
+        mock_module.APIConnectionError = type("APIConnectionError", (Exception,), {})
+        mock_module.RateLimitError = type("RateLimitError", (Exception,), {})
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = mock_module.RateLimitError("rate limited")
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}), \
+             patch("loma.llm.time.sleep") as mock_sleep:
+            try:
+                call_claude("system", "input", deadline=time.monotonic() + 2.5)
+                assert False, "Should have raised"
+            except RuntimeError:
+                pass
+            assert mock_client.messages.create.call_count == 1
+            mock_sleep.assert_not_called()
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_retries_server_errors(self):
+        mock_module = MagicMock()
+        mock_module.APITimeoutError = type("APITimeoutError", (Exception,), {})
+        mock_module.APIConnectionError = type("APIConnectionError", (Exception,), {})
+        mock_module.RateLimitError = type("RateLimitError", (Exception,), {})
+        overloaded = Exception("overloaded")
+        overloaded.status_code = 529
+        mock_content = MagicMock()
+        mock_content.text = "ok"
+        mock_response = MagicMock()
+        mock_response.content = [mock_content]
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [overloaded, mock_response]
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}), \
+             patch("loma.llm.time.sleep"):
+            assert call_claude("system", "input") == "ok"
+            assert mock_client.messages.create.call_count == 2
+
+
+class TestPromptCaching:
+    def setup_method(self):
+        llm._usage_totals.clear()
+
+    def teardown_method(self):
+        llm._usage_totals.clear()
+
+    def test_prefix_marked_with_cache_breakpoint(self):
+        blocks = llm._system_blocks("STATIC PART\n\nentities: $5", "STATIC PART")
+        assert blocks[0] == {"type": "text", "text": "STATIC PART", "cache_control": {"type": "ephemeral"}}
+        assert blocks[1] == {"type": "text", "text": "entities: $5"}
+
+    def test_prefix_only(self):
+        blocks = llm._system_blocks("STATIC PART", "STATIC PART")
+        assert len(blocks) == 1
+
+    def test_no_prefix_keeps_plain_string(self):
+        assert llm._system_blocks("system", None) == "system"
+        assert llm._system_blocks("system", "other") == "system"
+
+    def test_prefix_below_model_minimum_not_marked(self):
+        prefix = "Static rewriting rule. " * 250  # ~1500 tokens
+        assert llm._system_blocks(prefix, prefix, "claude-3-5-haiku-20241022") == prefix
+        assert llm._system_blocks(prefix, prefix, "claude-sonnet-4-20250514")[0]["cache_control"]
+
+    def test_records_cached_and_uncached_tokens(self):
+        response = MagicMock()
+        response.usage.input_tokens = 40
+        response.usage.cache_read_input_tokens = 1800
+        response.usage.cache_creation_input_tokens = 0
+        response.usage.output_tokens = 90
+        llm.record_usage("model-x", response)
+        llm.record_usage("model-x", response)
+        totals = llm.usage_totals()["model-x"]
+        assert totals["calls"] == 2
+        assert totals["cache_read_input_tokens"] == 3600
+        assert totals["input_tokens"] == 80
+
+    def test_usage_record_carries_stop_reason(self):
+        response = MagicMock()
+        response.usage.input_tokens = 40
+        response.usage.output_tokens = 256
+        response.stop_reason = "max_tokens"
+        assert llm.record_usage("model-x", response)["stop_reason"] == "max_tokens"
+
+    def test_stop_sequences_only_sent_when_given(self):
+        assert "stop_sequences" not in llm._request_kwargs("s", "t", "m", 256)
+        kwargs = llm._request_kwargs("s", "t", "m", 256, stop_sequences=["\n\nNote:"])
+        assert kwargs["stop_sequences"] == ["\n\nNote:"]
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_call_sends_cache_blocks(self):
+        mock_module = MagicMock()
+        mock_module.APITimeoutError = type("APITimeoutError", (Exception,), {})
+        mock_module.APIConnectionError = type("APIConnectionError", (Exception,), {})
+        mock_module.RateLimitError = type("RateLimitError", (Exception,), {})
+        mock_client = MagicMock()
+        mock_content = MagicMock()
+        mock_content.text = "ok"
+        mock_client.messages.create.return_value.content = [mock_content]
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+
+        prefix = "PREFIX " * 600
+        with patch.dict("sys.modules", {"anthropic": mock_module}):
+            call_claude(prefix + "\n\nSUFFIX", "input", cache_prefix=prefix)
+        system = mock_client.messages.create.call_args.kwargs["system"]
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
+        assert system[1]["text"] == "SUFFIX"
+
+
 class TestUserMessageTemplate:
     def test_template_contains_placeholder(self):
         from loma.llm import USER_MESSAGE_TEMPLATE
@@ -119,3 +457,214 @@ class TestUserMessageTemplate:
         formatted = USER_MESSAGE_TEMPLATE.format(input_text="test input")
         assert "test input" in formatted
         assert "Rewrite" in formatted
+
+
+class TestAdaptiveLimiter:
+    def setup_method(self):
+        llm._limiters.clear()
+
+    def teardown_method(self):
+        llm._limiters.clear()
+
+    def test_additive_increase_on_success(self):
+        limiter = llm.AdaptiveLimiter(initial=4)
+        for _ in range(4):
+            assert limiter.acquire(0)
+            limiter.release("ok", 0.5)
+        assert 4.9 < limiter.limit < 5.1
+
+    def test_multiplicative_decrease_once_per_burst(self):
+        limiter = llm.AdaptiveLimiter(initial=8)
+        for _ in range(3):
+            limiter.acquire(0)
+            limiter.release("rate_limited")
+        assert limiter.limit == 4
+
+    def test_inflated_latency_holds_limit(self):
+        limiter = llm.AdaptiveLimiter(initial=4)
+        limiter.acquire(0)
+        limiter.release("ok", 0.5)
+        before = limiter.limit
+        limiter.acquire(0)
+        limiter.release("ok", 5.0)
+        assert limiter.limit == before
+
+    def test_full_limiter_times_out(self):
+        limiter = llm.AdaptiveLimiter(initial=1)
+        assert limiter.acquire(0)
+        assert not limiter.acquire(0.01)
+        assert limiter.state() == {"limit": 1, "in_flight": 1, "queued": 0}
+
+    def test_queued_thread_gets_released_slot(self):
+        import threading
+        limiter = llm.AdaptiveLimiter(initial=1)
+        limiter.acquire(0)
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(limiter.acquire(2)))
+        waiter.start()
+        limiter.release("ok", 0.1)
+        waiter.join(2)
+        assert got == [True]
+
+    def test_async_waiter_gets_released_slot(self):
+        limiter = llm.AdaptiveLimiter(initial=1)
+
+        async def _run():
+            limiter.acquire(0)
+            waiter = asyncio.create_task(limiter.acquire_async(2))
+            await asyncio.sleep(0.01)
+            assert limiter.state()["queued"] == 1
+            limiter.release("ok", 0.1)
+            return await waiter
+
+        assert asyncio.run(_run()) is True
+
+    def test_queue_bound_rejects(self):
+        limiter = llm.AdaptiveLimiter(initial=1)
+        limiter.acquire(0)
+        limiter.queued = llm.LIMITER_MAX_QUEUE
+        assert not limiter.acquire(1)
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_rate_limit_lowers_model_limit(self):
+        mock_module = MagicMock()
+        mock_module.APITimeoutError = type("APITimeoutError", (Exception,), {})
+        mock_module.APIConnectionError = type("APIConnectionError", (Exception,), {})
+        mock_module.RateLimitError = type("RateLimitError", (Exception,), {})
+        mock_content = MagicMock()
+        mock_content.text = "ok"
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [
+            mock_module.RateLimitError("rate limited"), MagicMock(content=[mock_content]),
+        ]
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+
+        with patch.dict("sys.modules", {"anthropic": mock_module}), patch("loma.llm.time.sleep"):
+            assert call_claude("system", "input", model="model-x") == "ok"
+        state = llm.limiter_state("model-x")
+        assert state["in_flight"] == 0
+        assert state["limit"] < llm.LIMITER_INITIAL
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_no_slot_raises_without_calling_api(self):
+        mock_module = MagicMock()
+        mock_client = MagicMock()
+        mock_module.Anthropic = MagicMock(return_value=mock_client)
+        limiter = llm._limiter("model-y")
+        limiter.limit = 1
+        limiter.acquire(0)
+        with patch.dict("sys.modules", {"anthropic": mock_module}), \
+             patch("loma.llm.LIMITER_QUEUE_TIMEOUT_S", 0.01):
+            try:
+                call_claude("system", "input", model="model-y")
+                assert False, "Should have raised"
+            except RuntimeError as e:
+                assert "concurrency limit" in str(e)
+        mock_client.messages.create.assert_not_called()
+
+
+class TestHedging:
+    def setup_method(self):
+        llm._latencies.clear()
+        llm._hedge_stats.clear()
+
+    def teardown_method(self):
+        llm._latencies.clear()
+        llm._hedge_stats.clear()
+
+    def test_delay_defaults_until_enough_samples(self):
+        assert llm.hedge_delay_s("m") == llm.HEDGE_DEFAULT_DELAY_S
+        for i in range(100):
+            llm._record_latency("m", 1.0 + i / 100)
+        assert 1.85 <= llm.hedge_delay_s("m") <= 1.95
+
+    def _slow_fake(self, delays, calls):
+        import time as _time
+
+        def _fake(system_prompt, input_text, model, **kwargs):
+            calls.append(model)
+            _time.sleep(delays[model])
+            return f"from {model}"
+        return _fake
+
+    def test_slow_primary_is_hedged_and_hedge_wins(self):
+        calls = []
+        with patch("loma.llm.call_claude", side_effect=self._slow_fake({"sonnet": 0.5, "haiku": 0.01}, calls)), \
+             patch("loma.llm.HEDGE_DEFAULT_DELAY_S", 0.05):
+            result = llm.call_claude_hedged("sys", "in", model="sonnet", hedge_model="haiku")
+        assert result == {"text": "from haiku", "model": "haiku", "hedged": True, "winner": "hedge"}
+        stats = llm.hedge_stats()["sonnet"]
+        assert stats["hedge_rate"] == 1.0 and stats["hedge_wins"] == 1
+
+    def test_sync_loser_frees_its_slot_and_is_counted(self):
+        import threading
+        limiter = llm.AdaptiveLimiter()
+        release = threading.Event()
+
+        def _fake(system_prompt, input_text, model, slot_sink, cancelled, **kwargs):
+            limiter.acquire(1)
+            slot_sink.append(llm.LimiterSlot(limiter))
+            if model == "sonnet":
+                release.wait(2)
+                slot_sink[-1].release("ok")
+                assert cancelled()
+                return "late sonnet"
+            slot_sink[-1].release("ok")
+            return "from haiku"
+
+        try:
+            with patch("loma.llm.call_claude", side_effect=_fake), patch("loma.llm.HEDGE_DEFAULT_DELAY_S", 0.05):
+                result = llm.call_claude_hedged("sys", "in", model="sonnet", hedge_model="haiku")
+            assert result["winner"] == "hedge"
+            assert limiter.in_flight == 0  # the still-running primary's slot was freed
+            assert llm.hedge_stats()["sonnet"]["wasted_calls"] == 1
+        finally:
+            release.set()
+
+    def test_fast_primary_is_not_hedged(self):
+        calls = []
+        with patch("loma.llm.call_claude", side_effect=self._slow_fake({"sonnet": 0.0}, calls)), \
+             patch("loma.llm.HEDGE_DEFAULT_DELAY_S", 0.5):
+            result = llm.call_claude_hedged("sys", "in", model="sonnet")
+        assert calls == ["sonnet"]
+        assert result["hedged"] is False and result["winner"] == "primary"
+
+    def test_failed_hedge_falls_back_to_primary(self):
+        import time as _time
+
+        def _fake(system_prompt, input_text, model, **kwargs):
+            if model == "haiku":
+                raise RuntimeError("LLM call failed: haiku")
+            _time.sleep(0.1)
+            return "from sonnet"
+
+        with patch("loma.llm.call_claude", side_effect=_fake), patch("loma.llm.HEDGE_DEFAULT_DELAY_S", 0.01):
+            result = llm.call_claude_hedged("sys", "in", model="sonnet", hedge_model="haiku")
+        assert result["text"] == "from sonnet" and result["hedged"] is True
+
+    def test_async_loser_is_cancelled(self):
+        cancelled = []
+
+        async def _fake(system_prompt, input_text, model, **kwargs):
+            try:
+                await asyncio.sleep(0.5 if model == "sonnet" else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            return f"from {model}"
+
+        with patch("loma.llm.call_claude_async", side_effect=_fake), patch("loma.llm.HEDGE_DEFAULT_DELAY_S", 0.05):
+            result = asyncio.run(llm.call_claude_hedged_async("sys", "in", model="sonnet", hedge_model="haiku"))
+        assert result["winner"] == "hedge"
+        assert cancelled == ["sonnet"]
+        stats = llm.hedge_stats()["sonnet"]
+        assert stats["p99_primary_ms"] >= stats["p99_served_ms"]
+
+    def test_all_requests_failing_raises(self):
+        with patch("loma.llm.call_claude", side_effect=RuntimeError("LLM call failed: down")), \
+             patch("loma.llm.HEDGE_DEFAULT_DELAY_S", 0.01):
+            try:
+                llm.call_claude_hedged("sys", "in", model="sonnet")
+                assert False, "Should have raised"
+            except RuntimeError as e:
+                assert "down" in str(e)
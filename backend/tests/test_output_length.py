@@ -0,0 +1,74 @@
+"""Tests for loma.output_length — max_tokens prediction and calibration."""
+from unittest.mock import patch
+
+from loma import output_length
+
+
+class TestEstimateTokens:
+    def test_vietnamese_costs_more_than_english(self):
+        vi = output_length.estimate_tokens("Anh ơi, em gửi lại báo cáo được không ạ")
+        en = output_length.estimate_tokens("Hi, could I resend the report to you now")
+        assert vi > en > 0
+
+    def test_empty(self):
+        assert output_length.estimate_tokens("") == 0
+
+
+class TestPredict:
+    def teardown_method(self):
+        output_length.set_profile(None)
+
+    def test_short_input_gets_floor_budget(self):
+        prediction = output_length.predict("ping lại về proposal", "follow_up", "en")
+        assert prediction["max_tokens"] == output_length.MIN_MAX_TOKENS
+        assert prediction["expected_tokens"] < prediction["max_tokens"]
+
+    def test_budget_grows_with_input_and_is_capped(self):
+        medium = output_length.predict("Anh ơi dự án trễ rồi " * 20, "escalate", "en")["max_tokens"]
+        huge = output_length.predict("Anh ơi dự án trễ rồi " * 400, "escalate", "en")["max_tokens"]
+        assert output_length.MIN_MAX_TOKENS < medium < output_length.MAX_MAX_TOKENS
+        assert huge == output_length.MAX_MAX_TOKENS
+
+    def test_legacy_budget_when_disabled(self):
+        with patch("config.DYNAMIC_MAX_TOKENS", False):
+            assert output_length.predict("short", "general", "en")["max_tokens"] == 1024
+
+    def test_extended_budget_doubles_up_to_ceiling(self):
+        assert output_length.extended_max_tokens(256) == 512
+        assert output_length.extended_max_tokens(3000) == output_length.MAX_MAX_TOKENS
+        assert output_length.extended_max_tokens(output_length.MAX_MAX_TOKENS) is None
+
+
+class TestCalibrate:
+    def teardown_method(self):
+        output_length.set_profile(None)
+
+    def _rows(self, n=40):
+        rows = []
+        for i in range(n):
+            text = "Anh ơi, dự án bị trễ deadline rồi ạ. " * (1 + i % 5)
+            rows.append({
+                "input_text": text, "output_text": "The project deadline has slipped. " * (1 + i % 5),
+                "detected_intent": "escalate", "output_language": "en", "routing_tier": "sonnet",
+                "response_time_ms": 1000 + 20 * output_length.estimate_tokens("The project deadline has slipped. " * (1 + i % 5)),
+            })
+        return rows
+
+    def test_ratios_and_latency_fit(self):
+        profile = output_length.calibrate(self._rows())
+        n, p50, p99 = profile["ratios"]["escalate|en"]
+        assert n == 40
+        assert 0 < p50 <= p99 < 1
+        base_ms, per_token = profile["latency"]["sonnet"]
+        assert abs(base_ms - 1000) < 1 and abs(per_token - 20) < 0.01
+
+    def test_profile_tightens_budget(self):
+        text = "Anh ơi, dự án bị trễ deadline rồi ạ. " * 30
+        default = output_length.predict(text, "escalate", "en")["max_tokens"]
+        output_length.set_profile(output_length.calibrate(self._rows()))
+        assert output_length.predict(text, "escalate", "en")["max_tokens"] < default
+        assert output_length.predict_latency_ms("sonnet", 100) == 3000
+
+    def test_length_reduction_pct_used_without_output_text(self):
+        rows = [{**r, "output_text": None, "scores": {"length_reduction_pct": 50}} for r in self._rows()]
+        assert output_length.calibrate(rows)["ratios"]["escalate|en"][0] == 40
@@ -1,7 +1,10 @@
 """Tests for loma.pipeline — end-to-end pipeline (no LLM calls)."""
+import asyncio
 import os
+from unittest.mock import MagicMock, patch
+
 import pytest
-from loma.pipeline import run_rewrite
+from loma.pipeline import run_rewrite, run_rewrite_async
 
 
 class TestRunRewrite:
@@ -127,3 +130,800 @@ class TestRunRewriteAuth:
         result = run_rewrite("Anh ơi, em nhờ anh review giúp cái PR này")
         # payg_balance_remaining is set by handler, not pipeline
         assert result.get("payg_balance_remaining") is None
+
+
+class TestRunRewriteAsync:
+    def test_empty_input(self):
+        result = asyncio.run(run_rewrite_async(""))
+        assert result["error"] == "text_too_short"
+
+    def test_matches_sync_pipeline(self):
+        text = "Anh ơi, cái invoice tháng 1 chưa thanh toán, 5000 USD quá hạn 2 tuần rồi"
+        sync_result = run_rewrite(text, platform="gmail")
+        async_result = asyncio.run(run_rewrite_async(text, platform="gmail"))
+        for key in ("output_text", "detected_intent", "routing_tier", "scores",
+                    "output_language", "language_mix"):
+            assert async_result[key] == sync_result[key], key
+
+    def test_rules_tier(self):
+        result = asyncio.run(run_rewrite_async(
+            "Cần xin giấy phép kinh doanh", output_language_in="vi_admin",
+        ))
+        assert result.get("routing_tier") == "rules"
+
+    def test_concurrent_rewrites(self):
+        async def _many():
+            return await asyncio.gather(*(
+                run_rewrite_async(f"Anh ơi, em nhờ anh review giúp cái PR #{i}") for i in range(5)
+            ))
+        results = asyncio.run(_many())
+        assert len({r["rewrite_id"] for r in results}) == 5
+
+
+class TestModelFailover:
+    _TEXT = "Anh ơi, cái invoice tháng 1 chưa thanh toán, 5000 USD quá hạn 2 tuần rồi, anh check giúp em"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+        # Stub outputs drop the amount; keep the entity retry out of call counts
+        self._no_retry = patch("config.ENTITY_REPAIR_RETRY", False)
+        self._no_retry.start()
+
+    def teardown_method(self):
+        self._no_retry.stop()
+
+    def test_no_fallback_by_default(self):
+        result = run_rewrite(self._TEXT)
+        assert result["fallback"] is None
+
+    def test_sonnet_failure_falls_back_to_haiku(self):
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+
+        def _fake(system_prompt, input_text, model, **kwargs):
+            if model == SONNET_MODEL:
+                raise RuntimeError("LLM call failed: overloaded")
+            return "Haiku output"
+
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude", side_effect=_fake) as mock_call:
+            result = run_rewrite(self._TEXT)
+        assert result["output_text"] == "Haiku output"
+        assert result["routing_tier"] == "haiku"
+        assert result["fallback"] == "haiku"
+        assert mock_call.call_args_list[-1].kwargs["model"] == HAIKU_MODEL
+
+    def test_open_sonnet_circuit_skips_sonnet(self):
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.llm.circuit_open", side_effect=lambda m: m == SONNET_MODEL), \
+             patch("loma.pipeline.call_claude", return_value="Haiku output") as mock_call:
+            result = run_rewrite(self._TEXT)
+        assert mock_call.call_count == 1
+        assert mock_call.call_args.kwargs["model"] == HAIKU_MODEL
+        assert result["fallback"] == "haiku"
+
+    def test_unmatched_rules_route_reports_haiku(self):
+        from loma.pipeline import HAIKU_MODEL
+
+        with patch("loma.pipeline.route_rewrite", return_value="rules"), \
+             patch("loma.pipeline.rules_engine.apply_rules", return_value=None), \
+             patch("loma.pipeline.call_claude", return_value="Haiku output") as mock_call:
+            result = run_rewrite(self._TEXT)
+        assert mock_call.call_args.kwargs["model"] == HAIKU_MODEL
+        assert result["routing_tier"] == "haiku"
+        assert result["fallback"] is None
+
+    def test_all_models_failing_uses_rules_when_possible(self):
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", side_effect=RuntimeError("LLM call failed")):
+            result = run_rewrite("Em ping lại về cái proposal tuần trước", intent_override="follow_up")
+        assert result["routing_tier"] == "rules"
+        assert result["fallback"] == "rules"
+
+    def test_all_models_failing_without_rules_raises(self):
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude", side_effect=RuntimeError("LLM call failed")):
+            with pytest.raises(RuntimeError):
+                run_rewrite(self._TEXT, intent_override="escalate")
+
+    def test_primary_keeps_budget_for_fallback(self):
+        import time
+        from loma.pipeline import FALLBACK_RESERVE_S, SONNET_MODEL
+        deadline = time.monotonic() + 25
+
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude", return_value="ok") as mock_call:
+            run_rewrite(self._TEXT, deadline=deadline)
+        kwargs = mock_call.call_args.kwargs
+        assert kwargs["model"] == SONNET_MODEL
+        assert kwargs["deadline"] == deadline - FALLBACK_RESERVE_S
+
+
+class TestRewriteCache:
+    _TEXT = "Anh ơi, em gửi lại proposal cho dự án mới, anh xem giúp em phần timeline với budget nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def teardown_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_second_request_served_from_cache(self):
+        with patch("loma.pipeline.call_claude", return_value="Cached rewrite") as mock_call:
+            first = run_rewrite(self._TEXT, platform="gmail")
+            second = run_rewrite(self._TEXT + "  ", platform="gmail")
+        assert mock_call.call_count == 1
+        assert first["cache_hit"] is False
+        assert second["cache_hit"] is True
+        assert second["output_text"] == "Cached rewrite"
+        assert second["routing_tier"] == first["routing_tier"]
+        assert second["rewrite_id"] != first["rewrite_id"]
+
+    def test_regenerate_bypasses_cache(self):
+        with patch("loma.pipeline.call_claude", side_effect=["First", "Second"]) as mock_call:
+            run_rewrite(self._TEXT)
+            result = run_rewrite(self._TEXT, regenerate=True)
+            again = run_rewrite(self._TEXT)
+        assert mock_call.call_count == 2
+        assert result["cache_hit"] is False
+        assert result["output_text"] == "Second"
+        assert again["output_text"] == "Second"
+
+    def test_different_tone_misses(self):
+        with patch("loma.pipeline.call_claude", return_value="x") as mock_call:
+            run_rewrite(self._TEXT, tone="professional")
+            run_rewrite(self._TEXT, tone="warm")
+        assert mock_call.call_count == 2
+
+    def test_placeholder_not_cached(self):
+        first = run_rewrite(self._TEXT)
+        second = run_rewrite(self._TEXT)
+        assert first["cache_hit"] is False
+        assert second["cache_hit"] is False
+
+    def test_async_path_shares_cache(self):
+        with patch("loma.pipeline.call_claude", return_value="Sync rewrite"):
+            run_rewrite(self._TEXT)
+        result = asyncio.run(run_rewrite_async(self._TEXT))
+        assert result["cache_hit"] is True
+        assert result["output_text"] == "Sync rewrite"
+
+
+class TestNearDuplicateReuse:
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def teardown_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_templated_input_reuses_prior_rewrite(self):
+        first_in = "Anh Hùng ơi, invoice INV-2024-031 $5,000 quá hạn 2 tuần rồi, anh check giúp em nhé"
+        second_in = "Anh Minh ơi, invoice INV-2024-044 $7,200 quá hạn 3 tuần rồi, anh check giúp em nhé"
+        first_out = "Hi ⟦NAME_1⟧, invoice ⟦ID_2⟧ for ⟦AMT_3⟧ is 2 weeks overdue."
+        with patch("loma.pipeline.call_claude", return_value=first_out) as mock_call:
+            run_rewrite(first_in, intent_override="ask_payment")
+            result = run_rewrite(second_in, intent_override="ask_payment")
+        assert mock_call.call_count == 1
+        assert result["cache_hit"] is True
+        assert result["cache_match"] == "near_duplicate"
+        assert result["output_text"] == "Hi Minh, invoice INV-2024-044 for $7,200 is 3 weeks overdue."
+
+    def test_regenerate_skips_near_duplicate(self):
+        text = "Anh Hùng ơi, invoice INV-2024-031 $5,000 quá hạn 2 tuần rồi, anh check giúp em nhé"
+        with patch("config.ENTITY_REPAIR_RETRY", False), \
+             patch("loma.pipeline.call_claude", return_value="Hi Hùng, INV-2024-031 $5,000 2") as mock_call:
+            run_rewrite(text, intent_override="ask_payment")
+            run_rewrite(text.replace("Hùng", "Minh"), intent_override="ask_payment", regenerate=True)
+        assert mock_call.call_count == 2
+
+
+class TestEntityMasking:
+    _TEXT = "Anh Hùng ơi, invoice INV-2024-031 $5,000 quá hạn rồi, anh check giúp em nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def teardown_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_model_sees_placeholders_and_output_is_restored(self):
+        with patch("loma.pipeline.call_claude",
+                   return_value="Hi ⟦NAME_1⟧, invoice ⟦ID_2⟧ for ⟦AMT_3⟧ is overdue.") as mock_call:
+            result = run_rewrite(self._TEXT, intent_override="ask_payment")
+        sent = mock_call.call_args.kwargs["input_text"]
+        assert "$5,000" not in sent and "⟦AMT_3⟧" in sent
+        assert "Anh ⟦NAME_1⟧" in sent
+        assert "⟦" in mock_call.call_args.kwargs["system_prompt"]
+        assert result["output_text"] == "Hi Hùng, invoice INV-2024-031 for $5,000 is overdue."
+        assert result["entity_masking"]["missing"] == []
+
+    def test_dropped_placeholder_detected(self):
+        with patch("loma.pipeline.call_claude", return_value="Hi ⟦NAME_1⟧, the invoice is overdue."):
+            result = run_rewrite(self._TEXT, intent_override="ask_payment")
+        assert set(result["entity_masking"]["missing"]) == {"INV-2024-031", "$5,000"}
+        assert any(f["type"] == "entity_missing" for f in result["risk_flags"])
+
+    def test_exact_cache_hit_across_different_amounts(self):
+        masked_out = "Hi ⟦NAME_1⟧, invoice ⟦ID_2⟧ for ⟦AMT_3⟧ is overdue."
+        other = self._TEXT.replace("Hùng", "Minh").replace("$5,000", "$7,200").replace("031", "044")
+        with patch("loma.pipeline.call_claude", return_value=masked_out) as mock_call:
+            run_rewrite(self._TEXT, intent_override="ask_payment")
+            result = run_rewrite(other, intent_override="ask_payment")
+        assert mock_call.call_count == 1
+        assert result["cache_match"] == "exact"
+        assert result["output_text"] == "Hi Minh, invoice INV-2024-044 for $7,200 is overdue."
+
+    def test_masking_disabled(self):
+        with patch("config.ENTITY_MASKING", False), \
+             patch("loma.pipeline.call_claude", return_value="Hi Hùng") as mock_call:
+            result = run_rewrite(self._TEXT, intent_override="ask_payment")
+        assert mock_call.call_args.kwargs["input_text"] == self._TEXT
+        assert result["entity_masking"] is None
+
+
+class TestEntityRepair:
+    _TEXT = "Em nhờ Nguyễn Văn Đức review PR #347, invoice 15.000 USD nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_near_miss_entities_repaired_without_retry(self):
+        with patch("config.ENTITY_MASKING", False), \
+             patch("loma.pipeline.call_claude",
+                   return_value="Please ask Nguyen Van Duc to review PR 347 and the $15,000 invoice.") as mock_call:
+            result = run_rewrite(self._TEXT, intent_override="request_senior")
+        assert mock_call.call_count == 1
+        # "PR 347" and "$15,000" already match canonically; only the name is patched
+        assert result["output_text"] == "Please ask Nguyễn Văn Đức to review PR 347 and the $15,000 invoice."
+        assert {r["method"] for r in result["entity_repair"]["repaired"]} == {"transliteration"}
+        assert result["entity_repair"]["retried"] is False
+        assert result["scores"]["entity_missing"] == []
+
+    def test_retry_only_when_repair_fails(self):
+        outputs = iter([
+            "Please ask Đức to review the invoice.",
+            "Please ask Nguyễn Văn Đức to review PR #347 and the 15.000 USD invoice.",
+        ])
+        with patch("config.ENTITY_MASKING", False), \
+             patch("loma.pipeline.call_claude", side_effect=lambda **kw: next(outputs)) as mock_call:
+            result = run_rewrite(self._TEXT, intent_override="request_senior")
+        assert mock_call.call_count == 2
+        assert result["entity_repair"] is None
+        assert "PR #347" in result["output_text"]
+
+    def test_worse_retry_keeps_first_output(self):
+        outputs = iter(["Please ask Nguyễn Văn Đức to review it.", "Review it."])
+        with patch("config.ENTITY_MASKING", False), \
+             patch("loma.pipeline.call_claude", side_effect=lambda **kw: next(outputs)):
+            result = run_rewrite(self._TEXT, intent_override="request_senior")
+        assert result["output_text"] == "Please ask Nguyễn Văn Đức to review it."
+        assert result["entity_repair"]["retried"] is True
+        assert result["cache_hit"] is False
+
+    def test_translated_vietnamese_amount_is_preserved(self):
+        with patch("loma.pipeline.call_claude", return_value="The cost is 5 million VND.") as mock_call:
+            result = run_rewrite("Chi phí dự án là 5 triệu nhé anh", intent_override="request_senior")
+        assert mock_call.call_count == 1
+        assert result["entity_repair"] is None
+        assert result["scores"]["entity_missing"] == []
+
+    def test_lost_vietnamese_amount_does_not_retry(self):
+        with patch("loma.pipeline.call_claude", return_value="The cost is a few million.") as mock_call:
+            result = run_rewrite("Chi phí dự án là 5 triệu nhé anh", intent_override="request_senior")
+        assert mock_call.call_count == 1
+        assert result["entity_repair"]["unresolved"] == ["money:5 triệu"]
+
+    def test_no_retry_without_budget(self):
+        import time
+        with patch("config.ENTITY_MASKING", False), \
+             patch("loma.pipeline.call_claude", return_value="Review it.") as mock_call:
+            run_rewrite(self._TEXT, intent_override="request_senior", deadline=time.monotonic() + 3)
+        assert mock_call.call_count == 1
+
+
+class TestUsageAccounting:
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache, usage
+        rewrite_cache.clear()
+        fingerprint.clear()
+        usage.clear()
+
+    def test_llm_usage_attached_and_aggregated(self):
+        from loma import usage
+
+        def _fake(**kwargs):
+            kwargs["usage_sink"].append(usage.call_record(
+                kwargs["model"], {"input_tokens": 1200, "cache_read_input_tokens": 800, "output_tokens": 150},
+            ))
+            return "Could you review the proposal timeline and budget?"
+
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", side_effect=_fake):
+            result = run_rewrite("Anh ơi, anh xem giúp em proposal timeline với budget nhé", platform="slack")
+        assert result["usage"]["calls"] == 1
+        assert result["usage"]["cache_read_input_tokens"] == 800
+        assert result["usage"]["cost_usd"] > 0
+        stats = usage.stats()
+        assert stats["by_tier"]["haiku"]["llm_calls"] == 1
+        assert stats["by_platform"]["slack"]["rewrites"] == 1
+
+    def test_rules_rewrite_has_no_usage(self):
+        with patch("loma.pipeline.route_rewrite", return_value="rules"):
+            result = run_rewrite("Em ping lại về cái proposal tuần trước", intent_override="follow_up")
+        assert result["routing_tier"] == "rules"
+        assert result["usage"] is None
+
+
+class TestCascadeRouting:
+    _TEXT = "Anh ơi, em gửi lại proposal cho dự án mới, anh xem giúp em phần timeline với budget nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache, router
+        rewrite_cache.clear()
+        fingerprint.clear()
+        router.clear_cascade_stats()
+        self._cascade = patch("config.ROUTING_CASCADE", True)
+        self._cascade.start()
+
+    def teardown_method(self):
+        self._cascade.stop()
+
+    def _run(self, outputs):
+        calls = []
+
+        def _fake(**kwargs):
+            calls.append(kwargs)
+            out = outputs[kwargs["model"]]
+            if isinstance(out, Exception):
+                raise out
+            return out
+
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude", side_effect=_fake):
+            result = run_rewrite(self._TEXT, intent_override="request_senior")
+        return result, calls
+
+    def test_passing_haiku_output_is_served(self):
+        from loma import router
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+        result, calls = self._run({
+            HAIKU_MODEL: "Could you review the timeline and budget in the new project proposal?",
+            SONNET_MODEL: "unused",
+        })
+        assert [c["model"] for c in calls] == [HAIKU_MODEL]
+        assert result["routing_tier"] == "haiku"
+        assert result["cascade"] == {"escalated": False, "reasons": [], "served_tier": "haiku"}
+        assert result["fallback"] is None
+        assert router.cascade_stats()["request_senior"]["escalation_rate"] == 0
+
+    def test_failed_checks_escalate_to_sonnet(self):
+        from loma import router
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+        result, calls = self._run({
+            HAIKU_MODEL: "Here is the rewrite: anh ơi, xem giúp em nhé",
+            SONNET_MODEL: "Could you review the timeline and budget in the new project proposal?",
+        })
+        assert [c["model"] for c in calls] == [HAIKU_MODEL, SONNET_MODEL]
+        assert result["routing_tier"] == "sonnet"
+        assert set(result["cascade"]["reasons"]) >= {"meta_commentary", "language_mismatch"}
+        stats = router.cascade_stats()["request_senior"]
+        assert stats["escalated"] == 1 and stats["reasons"]["meta_commentary"] == 1
+
+    def test_haiku_deadline_is_capped(self):
+        import time
+        from loma.pipeline import HAIKU_MODEL
+        _, calls = self._run({HAIKU_MODEL: "Could you review the timeline and budget in the proposal?"})
+        assert calls[0]["deadline"] <= time.monotonic() + 6
+
+    def test_failing_draft_served_as_fallback_when_sonnet_fails(self):
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+        result, _ = self._run({
+            HAIKU_MODEL: "Sure! Could you review the timeline and budget in the proposal?",
+            SONNET_MODEL: RuntimeError("LLM call failed"),
+        })
+        assert result["routing_tier"] == "haiku"
+        assert result["fallback"] == "haiku"
+        assert result["cascade"]["escalated"] is True
+
+    def test_cascade_off_by_default(self):
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+        self._cascade.stop()
+        self._cascade = patch("config.ROUTING_CASCADE", False)
+        self._cascade.start()
+        result, calls = self._run({SONNET_MODEL: "Could you review the proposal?", HAIKU_MODEL: "unused"})
+        assert [c["model"] for c in calls] == [SONNET_MODEL]
+        assert result["cascade"] is None
+
+
+class TestHedgedRewrite:
+    _TEXT = "Anh ơi, em gửi lại proposal cho dự án mới, anh xem giúp em phần timeline với budget nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_sonnet_call_hedged_with_haiku(self):
+        from loma.pipeline import HAIKU_MODEL, SONNET_MODEL
+        hedged = {"text": "Could you review the proposal?", "model": HAIKU_MODEL, "hedged": True, "winner": "hedge"}
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude_hedged", return_value=hedged) as mock_hedged, \
+             patch("loma.pipeline.call_claude") as mock_call:
+            result = run_rewrite(self._TEXT, hedge="haiku")
+        assert mock_hedged.call_args.kwargs["model"] == SONNET_MODEL
+        assert mock_hedged.call_args.kwargs["hedge_model"] == HAIKU_MODEL
+        mock_call.assert_not_called()
+        assert result["routing_tier"] == "haiku"
+        assert result["hedge"] == {"mode": "haiku", "fired": True, "winner": "hedge"}
+
+    def test_duplicate_mode_and_async(self):
+        from loma.pipeline import SONNET_MODEL
+
+        async def _hedged(**kwargs):
+            return {"text": "Could you review it?", "model": SONNET_MODEL, "hedged": False, "winner": "primary"}
+
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude_hedged_async", side_effect=_hedged) as mock_hedged:
+            result = asyncio.run(run_rewrite_async(self._TEXT, hedge="duplicate"))
+        assert mock_hedged.call_args.kwargs["hedge_model"] is None
+        assert result["routing_tier"] == "sonnet"
+        assert result["hedge"]["fired"] is False
+
+    def test_no_hedge_by_default(self):
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.call_claude", return_value="Could you review it?"), \
+             patch("loma.pipeline.call_claude_hedged") as mock_hedged:
+            result = run_rewrite(self._TEXT)
+        mock_hedged.assert_not_called()
+        assert result["hedge"] is None
+
+
+class TestOutputLength:
+    _TEXT = "Anh ơi, em gửi lại proposal cho dự án mới, anh xem giúp em phần timeline với budget nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def _fake(self, stop_reasons):
+        from loma import usage
+        calls = []
+
+        def _call(**kwargs):
+            calls.append(kwargs)
+            record = usage.call_record(kwargs["model"], {"input_tokens": 300, "output_tokens": 40})
+            record["stop_reason"] = stop_reasons[len(calls) - 1]
+            kwargs["usage_sink"].append(record)
+            return "Could you review the proposal timeline and budget?"
+        return _call, calls
+
+    def test_predicted_budget_and_stop_sequences_passed(self):
+        from loma import output_length
+        fake, calls = self._fake(["end_turn"])
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", side_effect=fake):
+            result = run_rewrite(self._TEXT)
+        assert calls[0]["max_tokens"] < 1024
+        assert calls[0]["stop_sequences"] == output_length.STOP_SEQUENCES
+        assert result["output_length"]["truncated"] is False
+        assert result["output_length"]["output_tokens"] == 40
+
+    def test_truncated_output_rerun_with_larger_budget(self):
+        fake, calls = self._fake(["max_tokens", "end_turn"])
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", side_effect=fake):
+            result = run_rewrite(self._TEXT)
+        assert len(calls) == 2
+        assert calls[1]["max_tokens"] == 2 * calls[0]["max_tokens"]
+        assert result["output_length"]["retried"] is True
+        assert result["output_length"]["truncated"] is False
+
+    def test_still_truncated_is_flagged_and_not_cached(self):
+        from loma import rewrite_cache
+        fake, calls = self._fake(["max_tokens", "max_tokens"])
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", side_effect=fake):
+            result = run_rewrite(self._TEXT)
+        assert result["output_length"]["truncated"] is True
+        assert any(f["type"] == "truncated" for f in result["risk_flags"])
+        assert rewrite_cache.stats()["memory_entries"] == 0
+
+
+class TestEntityScan:
+    _TEXT = "Anh Hùng ơi, invoice INV-2024-031 for $5,000 is overdue since 15/3, em nhắc giúp nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_entities_scanned_once_per_request(self):
+        from loma import quality
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.scan_entities", wraps=quality.scan_entities) as scan, \
+             patch("loma.quality.scan_entities", side_effect=AssertionError("rescanned")), \
+             patch("loma.pipeline.call_claude", return_value="Anh Hùng, invoice INV-2024-031 for $5,000 is overdue since 15/3."):
+            result = run_rewrite(self._TEXT)
+        assert scan.call_count == 1
+        assert result["scores"]["entity_preserved_pct"] == 100.0
+
+    def test_masked_entities_not_listed_in_prompt(self):
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.config.ENTITY_MASKING", True), \
+             patch("loma.pipeline.build_system_prompt_parts", return_value=("prefix", "")) as build, \
+             patch("loma.pipeline.call_claude", return_value="Hi ⟦NAME_1⟧, invoice ⟦ID_2⟧ for ⟦AMT_3⟧ is overdue since ⟦DATE_4⟧."):
+            run_rewrite(self._TEXT)
+        assert build.call_args.kwargs["entities"] is None
+
+
+class TestStageTimings:
+    _TEXT = "Anh ơi, em gửi lại proposal cho dự án mới, anh xem giúp em phần timeline với budget nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def test_timings_returned_on_request(self):
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", return_value="Could you review the proposal timeline and budget?"):
+            result = run_rewrite(self._TEXT, return_timings=True)
+            plain = run_rewrite(self._TEXT + " với", regenerate=True)
+        for stage in ("language", "intent", "route", "entities", "cache", "prompt", "llm", "quality", "total"):
+            assert stage in result["timings"]
+        assert "rules" not in result["timings"]
+        assert plain["timings"] is None
+
+    def test_pipeline_emits_its_own_timings(self):
+        with patch("loma.pipeline.timing.emit", return_value={}) as emit:
+            run_rewrite(self._TEXT)
+        assert emit.call_count == 1
+
+    def test_caller_timings_filled_not_emitted(self):
+        from loma import timing
+        timings = timing.Timings()
+        with patch("loma.pipeline.timing.emit") as emit:
+            run_rewrite("Cần xin giấy phép kinh doanh cho công ty mới", output_language_in="vi_admin", timings=timings)
+        emit.assert_not_called()
+        assert timings.ms(timing.RULES) is not None
+        assert timings.ms(timing.LLM) is None
+
+
+class TestToneVariants:
+    _TEXT = "Anh ơi, em follow up cái proposal gửi tuần trước, anh xem giúp em nhé"
+    _REPLY = '{"direct": "Please review the proposal.", "warm": "Hope you are well! Could you look at the proposal?", "formal": "I would appreciate your review of the proposal."}'
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache, tone_variants
+        rewrite_cache.clear()
+        fingerprint.clear()
+        tone_variants.clear()
+
+    def test_variants_generated_in_one_extra_call(self):
+        from loma import tone_variants
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.config.TONE_VARIANTS_WAIT_S", 5.0), \
+             patch("loma.pipeline.call_claude", return_value="Could you review the proposal?"), \
+             patch("loma.tone_variants.llm.call_claude", return_value=self._REPLY) as variant_call:
+            result = run_rewrite(self._TEXT, tone="professional", tone_variants=True, variants_owner="user-1")
+        assert variant_call.call_count == 1
+        assert result["tone_variants"] == {"tones": ["direct", "warm", "formal"], "ready": True}
+        assert tone_variants.lookup(result["rewrite_id"], "direct", "user-1")["output_text"] == "Please review the proposal."
+
+    def test_response_does_not_wait_by_default(self):
+        from loma import tone_variants
+        import threading
+        release = threading.Event()
+
+        def slow(**kwargs):
+            release.wait(5)
+            return self._REPLY
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", return_value="Could you review the proposal?"), \
+             patch("loma.tone_variants.llm.call_claude", side_effect=slow):
+            result = run_rewrite(self._TEXT, tone="warm", tone_variants=True, variants_owner="user-1")
+            assert result["tone_variants"] == {"tones": ["professional", "direct", "formal"], "ready": False}
+            release.set()
+            assert tone_variants.lookup(result["rewrite_id"], "formal", "user-1", wait_s=5) is not None
+
+    def test_background_variants_usage_recorded_when_done(self):
+        from loma import usage
+        import threading
+        import time
+        usage.clear()
+        release = threading.Event()
+        record = usage.call_record("claude-3-5-haiku-20241022", {"input_tokens": 900, "output_tokens": 300})
+
+        def slow(**kwargs):
+            release.wait(5)
+            kwargs["usage_sink"].append(record)
+            return self._REPLY
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", return_value="Could you review the proposal?"), \
+             patch("loma.tone_variants.llm.call_claude", side_effect=slow):
+            result = run_rewrite(self._TEXT, tone="warm", tone_variants=True, variants_owner="user-1")
+            assert result["tone_variants"]["ready"] is False
+            assert result["usage"] is None
+            assert usage.stats()["overall"]["llm_calls"] == 0
+            release.set()
+            for _ in range(100):
+                if usage.stats()["overall"]["llm_calls"]:
+                    break
+                time.sleep(0.02)
+        overall = usage.stats()["overall"]
+        assert overall["llm_calls"] == 1
+        assert overall["cost_usd"] == round(record["cost_usd"], 6)
+        assert overall["rewrites"] == 1  # the background call adds cost, not a rewrite
+        usage.clear()
+
+    def test_not_requested_no_extra_call(self):
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", return_value="Could you review the proposal?"), \
+             patch("loma.tone_variants.llm.call_claude") as variant_call:
+            result = run_rewrite(self._TEXT)
+        variant_call.assert_not_called()
+        assert result["tone_variants"] is None
+
+    def test_async_variants(self):
+        async def primary(**kwargs):
+            return "Could you review the proposal?"
+
+        async def variants(**kwargs):
+            return self._REPLY
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.config.TONE_VARIANTS_WAIT_S", 5.0), \
+             patch("loma.pipeline.call_claude_async", side_effect=primary), \
+             patch("loma.tone_variants.llm.call_claude_async", side_effect=variants):
+            result = asyncio.run(run_rewrite_async(self._TEXT, tone_variants=True))
+        assert result["tone_variants"]["ready"] is True
+        assert len(result["tone_variants"]["tones"]) == 3
+
+
+class TestLongInput:
+    _PARAGRAPH = "Anh ơi, em gửi anh bản cập nhật dự án tuần này, team đã xong phần thiết kế và đang chờ review từ phía khách hàng. "
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def _text(self, paragraphs=4):
+        return "\n\n".join(f"Phần {i + 1}: " + (self._PARAGRAPH * 4).strip() for i in range(paragraphs))
+
+    def test_too_long_without_chunking(self):
+        with patch("loma.pipeline.config.LONG_INPUT_CHUNKING", False):
+            assert run_rewrite("x " * 3000)["error"] == "text_too_long"
+
+    def test_chunks_rewritten_concurrently_and_joined(self):
+        import threading
+        seen = []
+        lock = threading.Lock()
+
+        def fake(**kwargs):
+            with lock:
+                seen.append(kwargs["system_prompt"])
+            return f"Part {len(seen)}."
+        text = self._text()
+        with patch("loma.pipeline.config.LONG_INPUT_CHUNKING", True), \
+             patch("loma.pipeline.config.CHUNK_THRESHOLD_CHARS", 1000), \
+             patch("loma.pipeline.config.CHUNK_TARGET_CHARS", 500), \
+             patch("loma.pipeline.call_claude", side_effect=fake):
+            result = run_rewrite(text, return_timings=True)
+        assert result["chunks"]["count"] == 4
+        assert len(seen) == 4
+        assert all("DOCUMENT CONTEXT: this input is part" in prompt for prompt in seen)
+        assert result["output_text"].count("\n\n") == 3
+        assert result["original_text"] == text
+        assert result["routing_tier"] in ("haiku", "sonnet")
+        assert "llm" in result["timings"]
+
+    def test_unchanged_chunks_served_from_cache(self):
+        text = self._text()
+        with patch("loma.pipeline.config.LONG_INPUT_CHUNKING", True), \
+             patch("loma.pipeline.config.CHUNK_THRESHOLD_CHARS", 1000), \
+             patch("loma.pipeline.config.CHUNK_TARGET_CHARS", 500), \
+             patch("loma.pipeline.call_claude", return_value="Here is this week's update."), \
+             patch("loma.pipeline.llm.is_placeholder", return_value=False):
+            run_rewrite(text)
+            edited = text + "\n\nEm cảm ơn anh."
+            result = run_rewrite(edited)
+        assert result["chunks"]["count"] == 4
+        assert result["chunks"]["cache_hits"] == 3
+        assert result["cache_hit"] is False
+
+    def test_async_chunks(self):
+        async def fake(**kwargs):
+            return "Rewritten part."
+        with patch("loma.pipeline.config.LONG_INPUT_CHUNKING", True), \
+             patch("loma.pipeline.config.CHUNK_THRESHOLD_CHARS", 1000), \
+             patch("loma.pipeline.config.CHUNK_TARGET_CHARS", 500), \
+             patch("loma.pipeline.call_claude_async", side_effect=fake):
+            result = asyncio.run(run_rewrite_async(self._text()))
+        assert result["chunks"]["count"] == 4
+        assert result["output_text"].count("Rewritten part.") == 4
+
+
+class TestDeadlineFallback:
+    _TEXT = "Anh ơi, em follow up cái proposal gửi tuần trước, anh xem giúp em nhé"
+
+    def setup_method(self):
+        from loma import fingerprint, rewrite_cache
+        rewrite_cache.clear()
+        fingerprint.clear()
+
+    def _run(self, rules_output=None, **kwargs):
+        import time
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.rules_engine.apply_rules", return_value=rules_output), \
+             patch("loma.pipeline.call_claude") as call:
+            result = run_rewrite(self._TEXT, deadline=time.monotonic() + 0.5, **kwargs)
+        return result, call
+
+    def test_rules_answer_when_budget_too_small(self):
+        result, call = self._run("Following up on the proposal I sent last week.")
+        call.assert_not_called()
+        assert result["routing_tier"] == "rules"
+        assert result["fallback"] == "rules"
+
+    def test_exact_cache_still_served(self):
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude", return_value="Could you review the proposal I sent last week?"), \
+             patch("loma.pipeline.llm.is_placeholder", return_value=False):
+            run_rewrite(self._TEXT)
+        result, call = self._run()
+        call.assert_not_called()
+        assert result["cache_hit"] is True
+
+    def test_deadline_exceeded_error_instead_of_raising(self):
+        result, call = self._run()
+        call.assert_not_called()
+        assert result["error"] == "deadline_exceeded"
+
+
+class TestGate:
+    def test_closed_gate_cancels_before_model_call(self):
+        from loma import rewrite_cache
+        rewrite_cache.clear()
+        with patch("loma.pipeline.route_rewrite", return_value="haiku"), \
+             patch("loma.pipeline.call_claude") as call:
+            result = run_rewrite("Anh ơi, em gửi lại cái báo cáo tuần nhé", gate=lambda: False)
+        call.assert_not_called()
+        assert result["error"] == "cancelled"
+
+    def test_gate_closing_mid_chain_stops_fail_over(self):
+        from loma import rewrite_cache
+        rewrite_cache.clear()
+        gate = MagicMock(side_effect=[True, False, False])
+        with patch("loma.pipeline.route_rewrite", return_value="sonnet"), \
+             patch("loma.pipeline.router.use_cascade", return_value=False), \
+             patch("loma.pipeline.call_claude", side_effect=RuntimeError("overloaded")) as call:
+            result = run_rewrite("Anh ơi, em gửi lại cái báo cáo tuần nhé", gate=gate)
+        assert call.call_count == 1
+        assert callable(call.call_args.kwargs["cancelled"])
+        assert result["error"] == "cancelled"
+
+    def test_gate_not_consulted_for_rules(self):
+        gate = MagicMock(return_value=False)
+        with patch("loma.pipeline.route_rewrite", return_value="rules"), \
+             patch("loma.pipeline.rules_engine.apply_rules", return_value="Following up."):
+            result = run_rewrite("Anh ơi follow up nhé", gate=gate)
+        gate.assert_not_called()
+        assert result["output_text"] == "Following up."
@@ -1,6 +1,7 @@
 """Tests for loma.prompt_assembly — system prompt construction, cultural examples."""
 from loma.prompt_assembly import (
     build_system_prompt,
+    build_system_prompt_parts,
     _select_cultural_examples,
     _INTENT_TO_CATEGORY,
     _load_prompts,
@@ -198,3 +199,72 @@ class TestIntentToCategoryMapping:
     def test_categories_are_lists(self):
         for intent, categories in _INTENT_TO_CATEGORY.items():
             assert isinstance(categories, list), f"Intent '{intent}' categories is not a list"
+
+
+class TestStaticPrefixLayout:
+    _MIX = {"vi_ratio": 0.5, "en_ratio": 0.5}
+
+    def test_prefix_identical_across_entities(self):
+        prefix_a, suffix_a = build_system_prompt_parts(
+            "ask_payment", "professional", self._MIX, platform="gmail",
+            entities=[{"text": "$7,777", "label": "money"}],
+        )
+        prefix_b, suffix_b = build_system_prompt_parts(
+            "ask_payment", "professional", self._MIX, platform="gmail",
+            entities=[{"text": "INV-2024-031", "label": "identifiers"}],
+        )
+        assert prefix_a == prefix_b
+        assert suffix_a != suffix_b
+        assert "$7,777" in suffix_a and "$7,777" not in prefix_a
+
+    def test_entity_block_comes_last(self):
+        prompt = build_system_prompt(
+            "ask_payment", "professional", self._MIX, platform="slack",
+            entities=[{"text": "$7,777", "label": "money"}],
+        )
+        assert prompt.index("PLATFORM:") < prompt.index("$7,777")
+
+    def test_full_prompt_is_prefix_plus_suffix(self):
+        prefix, suffix = build_system_prompt_parts(
+            "follow_up", "warm", self._MIX, entities=[{"text": "Q4", "label": "dates"}],
+        )
+        prompt = build_system_prompt(
+            "follow_up", "warm", self._MIX, entities=[{"text": "Q4", "label": "dates"}],
+        )
+        assert prompt == f"{prefix}\n\n{suffix}"
+
+    def test_no_entities_empty_suffix(self):
+        _, suffix = build_system_prompt_parts("general", "professional", self._MIX)
+        assert suffix == ""
+
+
+class TestStaticPrefixSize:
+    def test_english_prefixes_cacheable_on_sonnet_not_haiku(self):
+        # llm marks the prefix for caching only above the model's minimum: the
+        # English intents' prefixes clear Sonnet's 1024 tokens but not Haiku's 2048
+        from loma.llm import min_cacheable_tokens
+        from loma.output_length import estimate_tokens
+        for intent in ("general", "follow_up", "escalate", "ask_payment", "apologize"):
+            prefix, _ = build_system_prompt_parts(intent, "professional", {"vi_ratio": 0.0})
+            tokens = estimate_tokens(prefix)
+            assert min_cacheable_tokens("claude-sonnet-4-20250514") <= tokens, intent
+            assert tokens < min_cacheable_tokens("claude-3-5-haiku-20241022"), intent
+
+
+class TestToneVariantsPrompt:
+    _MIX = {"vi_ratio": 0.5, "en_ratio": 0.5}
+
+    def test_every_requested_tone_and_json_format(self):
+        _load_prompts()
+        tones = INTENTS["follow_up"]["tones"]
+        prefix, _ = build_system_prompt_parts("follow_up", "professional", self._MIX, tone_variants=["direct", "warm"])
+        assert tones["direct"] in prefix and tones["warm"] in prefix
+        assert tones["professional"] not in prefix
+        assert '{"direct": "<rewrite>", "warm": "<rewrite>"}' in prefix
+
+    def test_entities_stay_in_suffix(self):
+        _, suffix = build_system_prompt_parts(
+            "follow_up", "professional", self._MIX,
+            entities=[{"text": "Q4", "label": "dates"}], tone_variants=["direct"],
+        )
+        assert "Q4" in suffix
@@ -1,9 +1,18 @@
 """Tests for loma.quality — quality scoring with entity preservation."""
+import os
+from unittest.mock import MagicMock, patch
+
 from loma.quality import (
     compute_length_reduction_pct,
     score_rewrite,
     extract_entities,
     check_entity_preservation,
+    repair_entities,
+    check_output,
+    scan_entities,
+    build_entity_index,
+    canonical_keys,
+    score_semantic_quality_batch,
 )
 
 
@@ -57,6 +66,33 @@ class TestExtractEntities:
             assert name.split()[0] not in ("The", "Please")
 
 
+class TestScanEntities:
+    def test_spans_carry_offsets(self):
+        text = "Invoice #INV-2024-031 amount $8,500 due 15/3"
+        for start, end, _, item in scan_entities(text):
+            assert text[start:end] == item
+
+    def test_overlaps_resolved_by_priority(self):
+        spans = scan_entities("Invoice INV-2024-031 for $5,000 USD")
+        assert [(c, t) for _, _, c, t in spans] == [("identifiers", "INV-2024-031"), ("money", "$5,000")]
+
+    def test_amount_not_double_counted(self):
+        entities = extract_entities("Payment of $5,000 received")
+        assert entities["money"] == ["$5,000"]
+        assert entities["numbers"] == []
+
+    def test_repeated_entity_reported_per_occurrence(self):
+        spans = scan_entities("please call Nguyễn Văn Đức, then Nguyễn Văn Đức again")
+        assert [t for _, _, c, t in spans if c == "names"] == ["Nguyễn Văn Đức", "Nguyễn Văn Đức"]
+
+    def test_spans_reused_by_checks(self):
+        original = "Invoice $5,000 from Nguyễn Văn Đức for Q4"
+        spans = scan_entities(original)
+        output = "Invoice for $5,000 from Nguyễn Văn Đức regarding Q4"
+        assert check_entity_preservation(original, output, spans) == check_entity_preservation(original, output)
+        assert score_rewrite(original, output, spans)["entity_preserved_pct"] == 100.0
+
+
 class TestEntityPreservation:
     def test_all_preserved(self):
         original = "Invoice $5,000 from Nguyễn Văn Đức for Q4"
@@ -80,6 +116,37 @@ class TestEntityPreservation:
         assert result["preserved_pct"] == 100.0
 
 
+class TestCanonicalPreservation:
+    def test_vietnamese_grouping_and_currency(self):
+        result = check_entity_preservation("Thanh toán 1.000.000 đồng nhé", "Please pay 1,000,000 VND")
+        assert result["missing"] == []
+
+    def test_numeric_date_as_month_name(self):
+        assert check_entity_preservation("Deadline 15/3 nhé", "The deadline is March 15")["missing"] == []
+        assert check_entity_preservation("Deadline 15/3 nhé", "The deadline is March 16")["missing"] == ["dates:15/3"]
+
+    def test_quarter_spelled_out(self):
+        assert check_entity_preservation("Report Q4 xong chưa", "Is the fourth quarter report done?")["missing"] == []
+
+    def test_different_amount_still_missing(self):
+        result = check_entity_preservation("Invoice $5,000 quá hạn", "The $5,500 invoice is overdue")
+        assert result["missing"] == ["money:$5,000"]
+
+    def test_currency_must_match(self):
+        assert canonical_keys("money", "$5,000").isdisjoint(build_entity_index("5,000 EUR"))
+
+    def test_decimal_comma(self):
+        assert "num:1.5" in build_entity_index("growth of 1,5 points")
+        assert canonical_keys("numbers", "1.5") == {"num:1.5"}
+
+    def test_identifier_separators(self):
+        assert canonical_keys("identifiers", "PR #347") <= build_entity_index("see pr 347")
+
+    def test_equivalent_date_not_unresolved_by_repair(self):
+        result = repair_entities("Deadline 15/3 nhé", "The deadline is March 15")
+        assert result == {"text": "The deadline is March 15", "repaired": [], "unresolved": []}
+
+
 class TestScoreRewrite:
     def test_returns_dict(self):
         result = score_rewrite("original text here", "shorter")
@@ -99,3 +166,120 @@ class TestScoreRewrite:
         )
         assert isinstance(result["entity_preserved_pct"], float)
         assert isinstance(result["entity_missing"], list)
+
+
+class TestRepairEntities:
+    def test_number_regrouped(self):
+        result = repair_entities("Invoice $12,500 quá hạn", "The invoice for $125.00 is overdue")
+        assert result["text"] == "The invoice for $12,500 is overdue"
+        assert result["repaired"][0]["method"] == "number_format"
+
+    def test_currency_suffix_dropped(self):
+        result = repair_entities("Thanh toán 15,000 USD giúp em", "Please pay 15,000 by Friday")
+        assert result["text"] == "Please pay 15,000 USD by Friday"
+        assert result["repaired"][0]["method"] == "currency"
+
+    def test_transliterated_name(self):
+        result = repair_entities("Em gửi Nguyễn Văn Đức", "To Nguyen Van Duc")
+        assert result["text"] == "To Nguyễn Văn Đức"
+        assert result["repaired"][0]["method"] == "transliteration"
+
+    def test_dropped_honorific_not_patched(self):
+        result = repair_entities("Anh Hùng ơi", "Hi Hùng,")
+        assert result["text"] == "Hi Hùng,"
+        assert result["repaired"][0]["method"] == "honorific"
+        assert result["unresolved"] == []
+
+    def test_equivalent_identifier_not_reformatted(self):
+        result = repair_entities("Review PR #347 giúp em", "Please review pr 347")
+        assert result == {"text": "Please review pr 347", "repaired": [], "unresolved": []}
+
+    def test_scaled_amount_not_patched(self):
+        result = repair_entities("Invoice $12,500", "Invoice for $12.5k")
+        assert result["text"] == "Invoice for $12.5k"
+        assert "money:$12,500" in result["unresolved"]
+
+    def test_preserved_output_untouched(self):
+        result = repair_entities("Invoice $5,000 for Q4", "The Q4 invoice of $5,000")
+        assert result == {"text": "The Q4 invoice of $5,000", "repaired": [], "unresolved": []}
+
+    def test_translated_amount_not_patched_back(self):
+        result = repair_entities("Anh chuyển giúp em 1.000.000 đồng nhé", "Please transfer 1,000,000 VND.")
+        assert result == {"text": "Please transfer 1,000,000 VND.", "repaired": [], "unresolved": []}
+
+    def test_canonically_preserved_amount_untouched(self):
+        result = repair_entities("Anh chuyển giúp em 1.000.000 VND nhé", "Please transfer 1,000,000 VND.")
+        assert result == {"text": "Please transfer 1,000,000 VND.", "repaired": [], "unresolved": []}
+
+
+class TestCheckOutput:
+    _VI = "Anh ơi, em gửi lại proposal cho dự án mới, anh xem giúp em phần timeline với budget nhé"
+
+    def test_clean_output_passes(self):
+        assert check_output(self._VI, "Could you review the timeline and budget in the new proposal?") == []
+
+    def test_meta_commentary(self):
+        assert "meta_commentary" in check_output(self._VI, "Here's the rewritten message: Please review it.")
+
+    def test_language_mismatch_english_target(self):
+        assert "language_mismatch" in check_output(self._VI, "Anh ơi, em gửi lại proposal nhé, anh xem giúp em")
+
+    def test_vietnamese_target_expects_vietnamese(self):
+        out = "Kính gửi anh, em xin gửi lại đề xuất dự án mới để anh xem xét phần tiến độ và ngân sách."
+        assert check_output(self._VI, out, output_language="vi_formal") == []
+        assert "language_mismatch" in check_output(self._VI, "Please review the proposal.", "vi_formal")
+
+    def test_preserved_vietnamese_name_is_not_a_mismatch(self):
+        original = "Em nhờ Nguyễn Văn Đức review proposal giúp em trước thứ sáu nhé anh"
+        assert check_output(original, "Could you ask Nguyễn Văn Đức to review the proposal before Friday?") == []
+
+    def test_length_ratio(self):
+        assert "length_ratio" in check_output(self._VI, "OK.")
+
+    def test_missing_entity(self):
+        original = "Anh check giúp em invoice INV-2024-031 nhé, quá hạn 2 tuần rồi"
+        assert "entity_missing" in check_output(original, "Could you check the overdue invoice?")
+
+    def test_translated_vietnamese_amount_is_fine(self):
+        original = "Chi phí dự án khoảng 5 triệu, anh duyệt giúp em nhé"
+        assert check_output(original, "The project costs about 5 million VND. Could you approve it?") == []
+
+
+class TestSemanticQualityBatch:
+    def _anthropic(self, text):
+        client = MagicMock()
+        client.messages.create.return_value = MagicMock(content=[MagicMock(text=text)], usage=None)
+        module = MagicMock()
+        module.Anthropic = MagicMock(return_value=client)
+        return module, client
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_one_call_results_in_item_order(self):
+        module, client = self._anthropic(
+            '[{"index": 1, "meaning_score": 3, "tone_score": 4, "issues": ["x"]},'
+            ' {"index": 0, "meaning_score": 5, "tone_score": 5, "issues": []}]'
+        )
+        items = [{"original_text": f"o{i}", "output_text": f"r{i}", "intent": "general"} for i in range(3)]
+        with patch.dict("sys.modules", {"anthropic": module}):
+            results = score_semantic_quality_batch(items)
+        assert client.messages.create.call_count == 1
+        assert results[0] == {"meaning_score": 5, "tone_score": 5, "issues": []}
+        assert results[1]["meaning_score"] == 3
+        assert results[2] is None
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"})
+    def test_unparseable_response(self):
+        module, _ = self._anthropic("not json")
+        with patch.dict("sys.modules", {"anthropic": module}):
+            assert score_semantic_quality_batch([{"original_text": "a", "output_text": "b", "intent": "g"}]) == [None]
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "", "ANTHROPIC_BASE_URL": "http://127.0.0.1:8765"})
+    def test_reuses_llm_client_and_base_url(self):
+        module, client = self._anthropic('[{"index": 0, "meaning_score": 4, "tone_score": 4, "issues": []}]')
+        item = {"original_text": "a", "output_text": "b", "intent": "g"}
+        with patch.dict("sys.modules", {"anthropic": module}):
+            score_semantic_quality_batch([item])
+            score_semantic_quality_batch([item])
+        module.Anthropic.assert_called_once()
+        assert module.Anthropic.call_args.kwargs["base_url"] == "http://127.0.0.1:8765"
+        assert client.messages.create.call_args.kwargs["timeout"] == 30.0
@@ -0,0 +1,123 @@
+"""Tests for loma.rewrite_cache — keying, LRU tier, SQLite shared tier."""
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from loma import rewrite_cache
+from loma.rewrite_cache import MemoryLRU, SQLiteBackend, cache_key, normalize_input
+
+
+class TestCacheKey:
+    def test_whitespace_and_unicode_normalized(self):
+        composed = "Anh ơi,  em   cần\nreview"
+        decomposed = "Anh ơi, em cần review".replace("ơ", "ơ")
+        assert normalize_input(composed) == normalize_input(decomposed)
+
+    def test_same_inputs_same_key(self):
+        k1 = cache_key("hello  world", "general", "professional", "gmail", "en")
+        k2 = cache_key(" hello world ", "general", "professional", "gmail", "en")
+        assert k1 == k2
+
+    def test_each_field_changes_key(self):
+        base = ("hello", "general", "professional", "gmail", "en")
+        keys = {cache_key(*base)}
+        for i, alt in enumerate(("hi", "follow_up", "warm", "slack", "vi_formal")):
+            args = list(base)
+            args[i] = alt
+            keys.add(cache_key(*args))
+        assert len(keys) == 6
+
+    def test_prompt_affecting_inputs_change_key(self):
+        base = cache_key("hello", "general", "professional", None, "en")
+        english = cache_key("hello", "general", "professional", None, "en", language_mix={"vi_ratio": 0.0})
+        mixed = cache_key("hello", "general", "professional", None, "en", language_mix={"vi_ratio": 0.5})
+        masked = cache_key("hello", "general", "professional", None, "en", placeholders=True)
+        assert base == english
+        assert len({base, mixed, masked}) == 3
+
+    def test_prompt_bundle_version_in_key(self):
+        k1 = cache_key("hello", "general", "professional", None, "en")
+        with patch("loma.rewrite_cache.prompt_bundle_version", return_value="other"):
+            k2 = cache_key("hello", "general", "professional", None, "en")
+        assert k1 != k2
+
+
+class TestMemoryLRU:
+    def test_evicts_least_recently_used(self):
+        lru = MemoryLRU(max_entries=2, ttl_s=60)
+        lru.set("a", {"v": 1})
+        lru.set("b", {"v": 2})
+        lru.get("a")
+        lru.set("c", {"v": 3})
+        assert lru.get("b") is None
+        assert lru.get("a") == {"v": 1}
+        assert len(lru) == 2
+
+    def test_expired_entries_miss(self):
+        lru = MemoryLRU(max_entries=2, ttl_s=-1)
+        lru.set("a", {"v": 1})
+        assert lru.get("a") is None
+
+
+class TestSQLiteBackend:
+    def test_roundtrip_and_prune(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=2, ttl_s=60)
+        backend.set("a", {"output_text": "Xin chào"})
+        assert backend.get("a") == {"output_text": "Xin chào"}
+        backend.set("b", {"v": 2})
+        backend.set("c", {"v": 3})
+        count = backend._conn.execute("SELECT COUNT(*) FROM rewrite_cache").fetchone()[0]
+        assert count == 2
+
+    def test_prunes_every_tenth_of_max_entries(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=20, ttl_s=60)
+        for i in range(21):
+            backend.set(str(i), {"v": i})
+        count = backend._conn.execute("SELECT COUNT(*) FROM rewrite_cache").fetchone()[0]
+        assert count == 21  # next prune at write 22
+        backend.set("21", {"v": 21})
+        keys = [r[0] for r in backend._conn.execute("SELECT key FROM rewrite_cache")]
+        assert len(keys) == 20 and "0" not in keys and "1" not in keys
+
+    def test_expired_miss(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=10, ttl_s=-1)
+        backend.set("a", {"v": 1})
+        assert backend.get("a") is None
+
+
+class TestTwoTierLookup:
+    def setup_method(self):
+        rewrite_cache.clear()
+
+    def teardown_method(self):
+        rewrite_cache.clear()
+        rewrite_cache.set_shared_backend(None)
+
+    def test_shared_hit_promoted_to_memory(self):
+        shared = MagicMock()
+        shared.get.return_value = {"output_text": "cached"}
+        rewrite_cache.set_shared_backend(shared)
+        assert rewrite_cache.lookup("k") == {"output_text": "cached"}
+        assert rewrite_cache.lookup("k") == {"output_text": "cached"}
+        assert shared.get.call_count == 1
+
+    def test_shared_errors_are_misses(self):
+        shared = MagicMock()
+        shared.get.side_effect = ConnectionError("down")
+        shared.set.side_effect = ConnectionError("down")
+        rewrite_cache.set_shared_backend(shared)
+        rewrite_cache.store("k", {"output_text": "x"})  # Should not raise
+        rewrite_cache.clear()
+        assert rewrite_cache.lookup("k") is None
+
+    def test_misconfigured_backend_raises(self):
+        for backend, url in (("memcached", "x"), ("redis", "")):
+            with patch.object(rewrite_cache, "_shared_init", False), \
+                 patch("config.REWRITE_CACHE_BACKEND", backend), patch("config.REWRITE_CACHE_URL", url):
+                with pytest.raises(RuntimeError):
+                    rewrite_cache.lookup("k")
+
+    def test_disabled(self):
+        with patch("config.REWRITE_CACHE_ENABLED", False):
+            rewrite_cache.store("k", {"output_text": "x"})
+            assert rewrite_cache.lookup("k") is None
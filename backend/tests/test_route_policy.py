@@ -0,0 +1,110 @@
+"""Tests for loma.route_policy — learned per-cell routing table."""
+import json
+from unittest.mock import patch
+
+from loma import route_policy
+
+
+def _rewrite(rid, tier, intent="follow_up", length=80, vi_ratio=0.0, platform="gmail", ms=500):
+    return {
+        "id": rid, "routing_tier": tier, "detected_intent": intent, "input_text": "x" * length,
+        "language_mix": json.dumps({"vi_ratio": vi_ratio}), "platform": platform,
+        "output_language": "en", "response_time_ms": ms,
+    }
+
+
+def _traffic(tier, n, used, cost, ms, edit_pct=None, start=0, **kwargs):
+    """n rewrites on one tier; the first `used` are accepted, the rest dismissed."""
+    rewrites, events = [], []
+    for i in range(start, start + n):
+        rid = f"{tier}-{i}"
+        rewrites.append(_rewrite(rid, tier, ms=ms, **kwargs))
+        events.append({"event_name": "loma_rewrite", "event_data": {"rewrite_id": rid, "usage": {"cost_usd": cost}}})
+        events.append({"event_name": "loma_use" if i - start < used else "loma_dismiss", "event_data": {"rewrite_id": rid}})
+        if edit_pct is not None:
+            events.append({"event_name": "loma_user_edit", "event_data": {"rewrite_id": rid, "edit_distance_pct": edit_pct}})
+    return rewrites, events
+
+
+def _policy(*traffic, min_feedback=5):
+    rewrites = [r for t in traffic for r in t[0]]
+    events = [e for t in traffic for e in t[1]]
+    table = route_policy.build_table(rewrites, route_policy.collect_outcomes(events))
+    return route_policy.compile_policy(table, min_feedback=min_feedback)
+
+
+class TestBuildTable:
+    def test_cell_key_buckets(self):
+        assert route_policy.cell_key("say_no", 120, 0.45, None, None) == "say_no|L1|V2|generic|en"
+        assert route_policy.cell_key("say_no", 5000, 1.0, "slack", "vi_casual") == "say_no|L5|V3|slack|vi_casual"
+
+    def test_aggregates_acceptance_latency_cost_and_edits(self):
+        rewrites, events = _traffic("haiku", 10, used=8, cost=0.001, ms=400, edit_pct=10.0)
+        table = route_policy.build_table(rewrites, route_policy.collect_outcomes(events))
+        stats = table["follow_up|L0|V0|gmail|en"]["haiku"]
+        assert stats["samples"] == 10
+        assert stats["acceptance"] == 0.8
+        assert stats["edit_pct"] == 10.0
+        assert stats["p50_ms"] == 400
+        assert stats["cost_usd"] == 0.001
+        assert table["follow_up|L0|V0|*|en"]["haiku"]["samples"] == 10
+
+    def test_skips_cache_hits(self):
+        rewrites, events = _traffic("sonnet", 3, used=3, cost=0.01, ms=3000)
+        events[0]["event_data"]["cache_hit"] = True
+        table = route_policy.build_table(rewrites, route_policy.collect_outcomes(events))
+        assert table["follow_up|L0|V0|gmail|en"]["sonnet"]["samples"] == 2
+
+    def test_compile_drops_tiers_without_enough_feedback(self):
+        policy = _policy(
+            _traffic("haiku", 10, used=9, cost=0.001, ms=400),
+            _traffic("sonnet", 2, used=2, cost=0.01, ms=3000),
+        )
+        tiers = [row[0] for row in policy["cells"]["follow_up|L0|V0|gmail|en"]]
+        assert tiers == ["haiku"]
+
+
+class TestChooseTier:
+    def test_cheapest_tier_meeting_target(self):
+        policy = _policy(
+            _traffic("haiku", 10, used=7, cost=0.001, ms=400),
+            _traffic("sonnet", 10, used=9, cost=0.01, ms=3000),
+        )
+        rows = policy["cells"]["follow_up|L0|V0|gmail|en"]
+        assert route_policy.choose_tier(rows, quality_target=0.6, max_edit_pct=100) == "haiku"
+        assert route_policy.choose_tier(rows, quality_target=0.8, max_edit_pct=100) == "sonnet"
+        assert route_policy.choose_tier(rows, quality_target=0.95, max_edit_pct=100) is None
+
+    def test_heavy_edits_disqualify_a_tier(self):
+        policy = _policy(
+            _traffic("haiku", 10, used=9, cost=0.001, ms=400, edit_pct=60.0),
+            _traffic("sonnet", 10, used=9, cost=0.01, ms=3000, edit_pct=5.0),
+        )
+        rows = policy["cells"]["follow_up|L0|V0|gmail|en"]
+        assert route_policy.choose_tier(rows, quality_target=0.6, max_edit_pct=40) == "sonnet"
+
+
+class TestLookup:
+    def teardown_method(self):
+        route_policy.set_policy(None)
+        route_policy.clear_stats()
+
+    def test_no_policy_means_no_learned_tier(self):
+        route_policy.set_policy(None)
+        assert route_policy.lookup("follow_up", 80, 0.0, "gmail", "en") is None
+
+    def test_falls_back_to_platform_wildcard(self):
+        route_policy.set_policy(_policy(_traffic("haiku", 10, used=9, cost=0.001, ms=400)))
+        with patch("config.ROUTING_QUALITY_TARGET", 0.6):
+            assert route_policy.lookup("follow_up", 80, 0.0, "slack", "en") == "haiku"
+            assert route_policy.lookup("say_no", 80, 0.0, "gmail", "en") is None
+        assert route_policy.info()["decisions"] == {"learned": 1, "fallback": 1}
+
+    def test_load_round_trip_and_version_check(self, tmp_path):
+        path = tmp_path / "policy.json"
+        policy = _policy(_traffic("haiku", 10, used=9, cost=0.001, ms=400))
+        path.write_text(json.dumps(policy))
+        assert route_policy.load(str(path))["cells"] == policy["cells"]
+        path.write_text(json.dumps({**policy, "version": 99}))
+        assert route_policy.load(str(path)) is None
+        assert route_policy.load(str(tmp_path / "missing.json")) is None
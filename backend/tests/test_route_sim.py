@@ -0,0 +1,81 @@
+"""Tests for loma.route_sim — offline routing-policy simulator."""
+import json
+
+import pytest
+
+from loma import route_policy, route_sim
+
+
+def _traffic(n_haiku=30, n_sonnet=30):
+    """Two tiers in one cell: Haiku cheap/fast/70% accepted, Sonnet dear/slow/90% accepted."""
+    rewrites, events = [], []
+    for tier, n, cost, ms, used in (("haiku", n_haiku, 0.001, 500, 0.7), ("sonnet", n_sonnet, 0.01, 3000, 0.9)):
+        for i in range(n):
+            rid = f"{tier}-{i}"
+            rewrites.append({
+                "id": rid, "routing_tier": tier, "detected_intent": "escalate",
+                "input_text": "Anh ơi, dự án bị trễ deadline rồi " * 6, "language_mix": json.dumps({"vi_ratio": 0.7}),
+                "platform": "slack", "output_language": "en", "response_time_ms": ms,
+            })
+            events.append({"event_name": "loma_rewrite", "event_data": {
+                "rewrite_id": rid, "usage": {"cost_usd": cost, "input_tokens": 900, "output_tokens": 100}}})
+            name = "loma_use" if i < used * n else "loma_dismiss"
+            events.append({"event_name": name, "event_data": {"rewrite_id": rid}})
+    return route_sim.prepare(rewrites, route_policy.collect_outcomes(events))
+
+
+class TestSimulate:
+    def test_recorded_policy_replays_measurements(self):
+        report = route_sim.simulate(_traffic(), route_sim.recorded_policy)
+        assert report["replayed"] == 60
+        assert report["estimated"] == 0
+        assert report["cost_usd"] == pytest.approx(30 * 0.001 + 30 * 0.01)
+        assert report["tokens"] == 60 * 1000
+        assert report["expected_acceptance"] == pytest.approx(0.8)
+        assert report["p95_ms"] == 3000
+
+    def test_moving_traffic_uses_target_tier_distribution(self):
+        report = route_sim.simulate(_traffic(), lambda row: "haiku")
+        assert report["tiers"] == {"haiku": 60}
+        assert report["estimated"] == 30
+        assert report["cost_usd"] == pytest.approx(60 * 0.001)
+        assert report["p95_ms"] == 500
+        assert report["expected_acceptance"] == pytest.approx(0.7)
+
+    def test_unmeasured_tier_is_reported(self):
+        report = route_sim.simulate(_traffic(n_sonnet=0), lambda row: "sonnet")
+        assert report["unmeasured"] == 30
+
+    def test_unmatched_rules_assignment_counts_as_haiku(self):
+        report = route_sim.simulate(_traffic(), lambda row: "rules")
+        assert report["tiers"] == {"haiku": 60}
+
+    def test_compare_reports_deltas_against_baseline(self):
+        report = route_sim.compare(
+            _traffic(), {"recorded": route_sim.recorded_policy, "sonnet": lambda row: "sonnet"}, baseline="recorded",
+        )
+        delta = report["deltas"]["sonnet"]
+        assert delta["cost_pct"] == pytest.approx((0.6 - 0.33) / 0.33 * 100, abs=0.1)
+        assert delta["acceptance"] == pytest.approx(0.1)
+        assert delta["p50_ms"] > 0
+
+
+class TestPolicySpecs:
+    def test_builtin_specs(self):
+        row = {"tier": "sonnet", "output_language": "en"}
+        assert route_sim.policy_from_spec("recorded")(row) == "sonnet"
+        assert route_sim.policy_from_spec("haiku")(row) == "haiku"
+
+    def test_learned_artifact_spec(self, tmp_path):
+        traffic_rows = _traffic()["rows"]
+        path = tmp_path / "policy.json"
+        path.write_text(json.dumps({
+            "version": 1, "length_edges": [100, 150, 200, 400, 1000], "vi_ratio_edges": [0.1, 0.3, 0.6],
+            "cells": {traffic_rows[0]["wildcard"]: [["haiku", 30, 30, 0.7, 0.0, 500, 0.001]]},
+        }))
+        assert route_sim.policy_from_spec(f"learned:{path}@0.6")(traffic_rows[0]) == "haiku"
+        assert route_sim.policy_from_spec(f"learned:{path}@0.8")(traffic_rows[0]) == "sonnet"
+
+    def test_unknown_spec_rejected(self):
+        with pytest.raises(ValueError):
+            route_sim.policy_from_spec("cheapest")
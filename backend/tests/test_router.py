@@ -54,3 +54,55 @@ class TestRouteRewrite:
         """Short Vietnamese proposal intent routes to haiku."""
         tier = route_rewrite("Đề xuất ngân sách", {"vi_ratio": 1.0, "en_ratio": 0.0}, "write_proposal_vn", 0.7, "vi_formal")
         assert tier == "haiku"
+
+
+class TestCascade:
+    def setup_method(self):
+        from loma import router
+        router.clear_cascade_stats()
+
+    def test_use_cascade_only_for_sonnet_when_enabled(self):
+        from unittest.mock import patch
+        from loma.router import use_cascade
+        with patch("config.ROUTING_CASCADE", True):
+            assert use_cascade("sonnet")
+            assert not use_cascade("haiku")
+        with patch("config.ROUTING_CASCADE", False):
+            assert not use_cascade("sonnet")
+
+    def test_escalation_rate_per_intent(self):
+        from loma import router
+        router.record_cascade("escalate", False, [])
+        router.record_cascade("escalate", True, ["entity_missing"])
+        router.record_cascade("escalate", True, ["entity_missing", "length_ratio"])
+        stats = router.cascade_stats()["escalate"]
+        assert stats["cascaded"] == 3
+        assert stats["escalation_rate"] == 0.6667
+        assert stats["reasons"] == {"entity_missing": 2, "length_ratio": 1}
+
+
+class TestLearnedPolicy:
+    def teardown_method(self):
+        from loma import route_policy
+        route_policy.set_policy(None)
+
+    def _install(self, tier, acceptance):
+        from loma import route_policy
+        route_policy.set_policy({
+            "version": 1, "length_edges": [100, 150, 200, 400, 1000], "vi_ratio_edges": [0.1, 0.3, 0.6],
+            "cells": {"escalate|L2|V3|*|en": [[tier, 100, 100, acceptance, 5.0, 800, 0.001]]},
+        })
+
+    def test_learned_tier_overrides_rules(self):
+        self._install("haiku", 0.9)
+        tier = route_rewrite("A" * 180, {"vi_ratio": 0.7}, "escalate", 0.8, "en", "gmail")
+        assert tier == "haiku"
+
+    def test_falls_back_when_no_tier_meets_target(self):
+        self._install("haiku", 0.2)
+        tier = route_rewrite("A" * 180, {"vi_ratio": 0.7}, "escalate", 0.8, "en", "gmail")
+        assert tier == "sonnet"
+
+    def test_vi_admin_stays_on_rules(self):
+        self._install("haiku", 0.9)
+        assert route_rewrite("A" * 180, {"vi_ratio": 0.7}, "escalate", 0.8, "vi_admin") == "rules"
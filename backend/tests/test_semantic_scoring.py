@@ -0,0 +1,143 @@
+"""Tests for loma.semantic_scoring — sampled, spooled background semantic scoring."""
+import time
+from unittest.mock import patch
+
+from loma import semantic_scoring
+from loma.semantic_scoring import Spool
+
+
+def _result(rewrite_id="rw-1", intent="follow_up", tier="haiku", **extra):
+    return {
+        "rewrite_id": rewrite_id,
+        "original_text": "Anh ơi, em follow up cái proposal nhé",
+        "output_text": "Just following up on the proposal.",
+        "detected_intent": intent,
+        "routing_tier": tier,
+        **extra,
+    }
+
+
+class TestSampling:
+    def test_rate_precedence(self):
+        rates = {"follow_up/sonnet": 0.9, "follow_up": 0.5, "haiku": 0.2}
+        with patch("config.SEMANTIC_SAMPLE_RATES", rates), patch("config.SEMANTIC_SAMPLE_RATE", 0.01):
+            assert semantic_scoring.sample_rate("follow_up", "sonnet") == 0.9
+            assert semantic_scoring.sample_rate("follow_up", "haiku") == 0.5
+            assert semantic_scoring.sample_rate("greeting", "haiku") == 0.2
+            assert semantic_scoring.sample_rate("greeting", "rules") == 0.01
+
+    def test_deterministic_and_close_to_rate(self):
+        ids = [f"rw-{i}" for i in range(4000)]
+        picked = [i for i in ids if semantic_scoring.sampled(i, 0.25)]
+        assert picked == [i for i in ids if semantic_scoring.sampled(i, 0.25)]
+        assert 800 < len(picked) < 1200
+        assert not any(semantic_scoring.sampled(i, 0.0) for i in ids[:100])
+
+
+class TestSpool:
+    def test_lease_complete_and_depth(self, tmp_path):
+        spool = Spool(str(tmp_path / "spool.sqlite3"), max_pending=10)
+        for i in range(3):
+            assert spool.put(f"rw-{i}", {"original_text": "a", "output_text": "b", "intent": "general"})
+        rows = spool.lease(2)
+        assert [r["rewrite_id"] for r in rows] == ["rw-0", "rw-1"]
+        assert spool.depth()["leased"] == 2
+        assert [r["rewrite_id"] for r in spool.lease(5)] == ["rw-2"]
+        spool.complete(["rw-0", "rw-1", "rw-2"])
+        assert spool.depth()["pending"] == 0
+
+    def test_full_spool_rejects(self, tmp_path):
+        spool = Spool(str(tmp_path / "spool.sqlite3"), max_pending=1)
+        assert spool.put("rw-0", {})
+        assert not spool.put("rw-1", {})
+
+    def test_expired_lease_is_reclaimed(self, tmp_path):
+        spool = Spool(str(tmp_path / "spool.sqlite3"), max_pending=10)
+        spool.put("rw-0", {})
+        assert spool.lease(1, lease_s=-1)
+        assert [r["rewrite_id"] for r in spool.lease(1)] == ["rw-0"]
+
+    def test_busy_lock_does_not_wait(self, tmp_path):
+        spool = Spool(str(tmp_path / "spool.sqlite3"), max_pending=10)
+        with spool._lock:
+            start = time.monotonic()
+            assert not spool.put("rw-0", {}, lock_timeout=0.01)
+        assert time.monotonic() - start < 0.5
+
+
+class TestSubmitAndProcess:
+    def setup_method(self):
+        semantic_scoring.clear_stats()
+
+    def teardown_method(self):
+        semantic_scoring.set_spool(None)
+
+    def _spool(self, tmp_path, max_pending=100):
+        spool = Spool(str(tmp_path / "spool.sqlite3"), max_pending=max_pending)
+        semantic_scoring.set_spool(spool)
+        return spool
+
+    def test_disabled_by_default(self, tmp_path):
+        spool = self._spool(tmp_path)
+        with patch("config.SEMANTIC_SCORING", False):
+            assert semantic_scoring.submit(_result()) is False
+        assert spool.depth()["pending"] == 0
+
+    def test_sampled_rewrite_is_queued(self, tmp_path):
+        spool = self._spool(tmp_path)
+        with patch("config.SEMANTIC_SCORING", True), patch("config.SEMANTIC_SAMPLE_RATE", 1.0), \
+             patch("config.SEMANTIC_WORKERS", 0):
+            assert semantic_scoring.submit(_result()) is True
+            assert semantic_scoring.submit(_result("rw-2", cache_hit=True)) is False
+        assert spool.depth()["pending"] == 1
+        assert semantic_scoring.stats()["submitted"] == 1
+
+    def test_backpressure_drops_when_full(self, tmp_path):
+        self._spool(tmp_path, max_pending=1)
+        with patch("config.SEMANTIC_SCORING", True), patch("config.SEMANTIC_SAMPLE_RATE", 1.0), \
+             patch("config.SEMANTIC_WORKERS", 0):
+            semantic_scoring.submit(_result("rw-1"))
+            assert semantic_scoring.submit(_result("rw-2")) is False
+            stats = semantic_scoring.stats()
+        assert stats["dropped"] == 1
+        assert stats["pending"] == 1
+        assert stats["oldest_pending_s"] is not None
+
+    def test_batch_scored_and_written_back(self, tmp_path):
+        spool = self._spool(tmp_path)
+        for i in range(3):
+            spool.put(f"rw-{i}", {"original_text": "a", "output_text": "b", "intent": "general"})
+        scores = [{"meaning_score": 5, "tone_score": 4, "issues": []}] * 3
+        with patch("config.SEMANTIC_SCORING", True), patch("config.SEMANTIC_BATCH_SIZE", 2), \
+             patch("loma.semantic_scoring.score_semantic_quality_batch", side_effect=lambda rows: scores[:len(rows)]) as score, \
+             patch("loma.db.update_rewrite_semantic_scores", return_value=True) as write:
+            assert semantic_scoring.drain() == 3
+            stats = semantic_scoring.stats()
+        assert score.call_count == 2
+        assert write.call_args_list[0].args == ("rw-0", {"meaning_score": 5, "tone_score": 4, "issues": []})
+        assert stats["scored"] == 3 and stats["batches"] == 2 and stats["pending"] == 0
+        assert stats["lag_p50_s"] is not None
+
+    def test_failed_item_retried_then_given_up(self, tmp_path):
+        spool = self._spool(tmp_path)
+        spool.put("rw-0", {"original_text": "a", "output_text": "b", "intent": "general"})
+        with patch("config.SEMANTIC_SCORING", True), patch("loma.semantic_scoring.RETRY_BACKOFF_S", 0), \
+             patch("loma.semantic_scoring.score_semantic_quality_batch", return_value=[None]), \
+             patch("loma.db.update_rewrite_semantic_scores") as write:
+            semantic_scoring.drain()
+            stats = semantic_scoring.stats()
+        assert stats["retried"] == semantic_scoring.MAX_ATTEMPTS - 1
+        assert stats["failed"] == 1 and stats["pending"] == 0
+        write.assert_not_called()
+
+
+class TestHandlerIntegration:
+    def test_rewrite_submitted_after_store(self):
+        import handler
+        with patch("handler.run_rewrite", return_value=_result()), \
+             patch("handler.billing.check_quota", return_value={"allowed": True, "tier": "free", "remaining": 4}), \
+             patch("handler.db.store_rewrite"), patch("handler.analytics.track_rewrite"), \
+             patch("handler.semantic_scoring.submit") as submit:
+            resp = handler.handler({"rawPath": "/api/v1/rewrite", "headers": {}, "body": '{"input_text": "x"}'}, None)
+        assert resp["statusCode"] == 200
+        assert submit.call_args.args[0]["rewrite_id"] == "rw-1"
@@ -0,0 +1,67 @@
+"""Tests for loma.timing — per-stage request timings and percentiles."""
+import json
+import logging
+
+from loma import timing
+from loma.timing import Timings
+
+
+class TestTimings:
+    def test_add_accumulates_and_chains(self):
+        timings = Timings(started=0.0)
+        t = timing.now()
+        t2 = timings.add(timing.LLM, t - 0.2)
+        assert t2 >= t
+        timings.add(timing.LLM, t2 - 0.1)
+        assert 300 <= timings.ms(timing.LLM) < 400
+
+    def test_only_stages_that_ran_are_reported(self):
+        timings = Timings()
+        timings.add(timing.INTENT, timing.now())
+        stages = timings.as_dict()
+        assert list(stages) == ["intent", "total"]
+        assert timings.ms(timing.LLM) is None
+
+    def test_parallel_parts_add_longest(self):
+        timings = Timings()
+        fast, slow = Timings(), Timings()
+        t = timing.now()
+        fast.add(timing.LLM, t - 0.1)
+        slow.add(timing.LLM, t - 0.3)
+        slow.add(timing.CACHE, t - 0.01)
+        timings.add_parallel([fast, slow])
+        assert 300 <= timings.ms(timing.LLM) < 400
+        assert timings.ms(timing.CACHE) is not None
+
+    def test_stage_constants_match_names(self):
+        assert timing.STAGES[timing.LANGUAGE] == "language"
+        assert timing.STAGES[timing.DB_STORE] == "db_store"
+        assert timing.STAGES[timing.ANALYTICS] == "analytics"
+
+
+class TestEmitAndStats:
+    def setup_method(self):
+        timing.clear_stats()
+
+    def test_percentiles_per_stage(self):
+        for i in range(1, 101):
+            timings = Timings()
+            timings.add(timing.QUALITY, timing.now() - i / 1000)
+            timing.emit(timings)
+        stats = timing.stats()
+        assert stats["quality"]["count"] == 100
+        assert 49 <= stats["quality"]["p50_ms"] <= 52
+        assert 94 <= stats["quality"]["p95_ms"] <= 97
+        assert "llm" not in stats
+        assert stats["total"]["count"] == 100
+
+    def test_structured_log_line(self, caplog):
+        timings = Timings()
+        timings.add(timing.ROUTE, timing.now())
+        with caplog.at_level(logging.INFO, logger="loma.timing"):
+            stages = timing.emit(timings, {"rewrite_id": "rw-1", "routing_tier": "haiku"})
+        message = caplog.records[-1].getMessage()
+        assert message.startswith("rewrite_timings ")
+        payload = json.loads(message.split(" ", 1)[1])
+        assert payload["rewrite_id"] == "rw-1"
+        assert payload["timings_ms"] == stages
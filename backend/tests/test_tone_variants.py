@@ -0,0 +1,119 @@
+"""Tests for loma.tone_variants — multi-tone generation, storage and tone-switch lookups."""
+import json
+from unittest.mock import patch
+
+from loma import rewrite_cache, tone_variants
+from loma.quality import scan_entities
+
+_TEXT = "Anh Hùng ơi, em follow up cái invoice INV-2024-031 nhé"
+
+
+def _request(**overrides):
+    request = {
+        "rewrite_id": "rw-1",
+        "owner": "user-1",
+        "original_text": _TEXT,
+        "llm_input": "Anh ⟦NAME_1⟧ ơi, em follow up cái invoice ⟦ID_2⟧ nhé",
+        "placeholders": {"⟦NAME_1⟧": "Hùng", "⟦ID_2⟧": "INV-2024-031"},
+        "entities": scan_entities(_TEXT),
+        "prompt_entities": None,
+        "tone": "professional",
+        "platform": "gmail",
+        "language_mix": {"vi_ratio": 0.6, "en_ratio": 0.4},
+        "detected_intent": "follow_up",
+        "output_language": "en",
+        "max_tokens": 300,
+    }
+    return {**request, **overrides}
+
+
+_REPLY = "```json\n" + json.dumps({
+    "direct": "Hi ⟦NAME_1⟧, invoice ⟦ID_2⟧ is still open. Please pay by Friday.",
+    "warm": "Hi ⟦NAME_1⟧, hope you're well! Just checking on invoice ⟦ID_2⟧.",
+    "formal": "Dear Mr. ⟦NAME_1⟧, I am writing regarding invoice ⟦ID_2⟧.",
+}) + "\n```"
+
+
+class TestParse:
+    def test_fenced_json_and_unknown_tones(self):
+        parsed = tone_variants.parse_variants(_REPLY, ["direct", "warm"])
+        assert set(parsed) == {"direct", "warm"}
+
+    def test_garbage_is_empty(self):
+        assert tone_variants.parse_variants("Sorry, I can't.", ["direct"]) == {}
+        assert tone_variants.parse_variants('{"direct": 3}', ["direct"]) == {}
+
+
+class TestGenerate:
+    def setup_method(self):
+        tone_variants.clear()
+        rewrite_cache.clear()
+
+    def test_one_call_for_all_tones_restored_and_stored(self):
+        with patch("loma.tone_variants.llm.call_claude", return_value=_REPLY) as call:
+            future = tone_variants.start(
+                _request(), ["direct", "warm", "formal"], "claude-3-5-haiku-20241022", None, tone_variants.VariantUsage(),
+            )
+            variants = tone_variants.wait(future, 5)
+        assert call.call_count == 1
+        assert call.call_args.kwargs["max_tokens"] == 900
+        assert set(variants) == {"direct", "warm", "formal"}
+        assert variants["direct"]["output_text"].startswith("Hi Hùng, invoice INV-2024-031")
+        stored = tone_variants.lookup("rw-1", "warm", "user-1")
+        assert "INV-2024-031" in stored["output_text"]
+        assert stored["routing_tier"] == "haiku"
+        assert tone_variants.lookup("rw-1", "professional", "user-1") is None
+
+    def test_only_the_owner_reads_variants(self):
+        with patch("loma.tone_variants.llm.call_claude", return_value=_REPLY):
+            tone_variants.wait(tone_variants.start(_request(), ["direct"], "claude-3-5-haiku-20241022", None, tone_variants.VariantUsage()), 5)
+        assert tone_variants.lookup("rw-1", "direct", "user-1") is not None
+        assert tone_variants.lookup("rw-1", "direct", "user-2") is None
+        assert tone_variants.lookup("rw-1", "direct", None) is None
+
+    def test_variants_written_to_rewrite_cache_under_their_tone(self):
+        request = _request()
+        with patch("loma.tone_variants.llm.call_claude", return_value=_REPLY):
+            tone_variants.wait(tone_variants.start(request, ["direct"], "claude-3-5-haiku-20241022", None, tone_variants.VariantUsage()), 5)
+        key = rewrite_cache.cache_key(
+            request["llm_input"], "follow_up", "direct", "gmail", "en",
+            language_mix=request["language_mix"], placeholders=True,
+        )
+        assert rewrite_cache.lookup(key)["output_text"].startswith("Hi ⟦NAME_1⟧")
+
+        tone_variants.clear()
+        variants = tone_variants.from_cache(_request(rewrite_id="rw-2"), "haiku")
+        assert set(variants) == {"direct"}
+        assert tone_variants.lookup("rw-2", "direct", "user-1")["output_text"].startswith("Hi Hùng")
+
+    def test_detached_call_records_its_usage_when_done(self):
+        from loma import usage
+        usage.clear()
+        record = usage.call_record("claude-3-5-haiku-20241022", {"input_tokens": 800, "output_tokens": 200})
+
+        def reply(**kwargs):
+            kwargs["usage_sink"].append(record)
+            return _REPLY
+        variant_usage = tone_variants.VariantUsage()
+        assert variant_usage.detach() is True
+        with patch("loma.tone_variants.llm.call_claude", side_effect=reply):
+            tone_variants.wait(tone_variants.start(_request(), ["direct"], "claude-3-5-haiku-20241022", None, variant_usage), 5)
+        overall = usage.stats()["overall"]
+        assert overall["llm_calls"] == 1
+        assert overall["cost_usd"] == round(record["cost_usd"], 6)
+        assert overall["rewrites"] == 0
+        assert variant_usage.detach() is False
+        usage.clear()
+
+    def test_failed_call_stores_nothing(self):
+        with patch("loma.tone_variants.llm.call_claude", side_effect=RuntimeError("down")):
+            variants = tone_variants.generate(_request(), ["direct"], "claude-3-5-haiku-20241022", None, [])
+        assert variants == {}
+        assert tone_variants.stats()["failed"] == 1
+
+    def test_switch_latency_stats(self):
+        tone_variants.record_switch("variant", 3.0)
+        tone_variants.record_switch("rewrite", 1800.0)
+        latency = tone_variants.stats()["switch_latency"]
+        assert latency["variant"]["p50_ms"] == 3.0
+        assert latency["rewrite"]["count"] == 1
@@ -0,0 +1,60 @@
+"""Tests for loma.usage — per-call cost and rolling usage aggregates."""
+import pytest
+
+from loma import usage
+
+
+class TestCost:
+    def test_sonnet_cost(self):
+        cost = usage.cost_usd("claude-sonnet-4-20250514", {"input_tokens": 1_000_000, "output_tokens": 100_000})
+        assert cost == pytest.approx(3.0 + 1.5)
+
+    def test_cache_tokens_priced_relative_to_input(self):
+        model = "claude-3-5-haiku-20241022"
+        write = usage.cost_usd(model, {"cache_creation_input_tokens": 1_000_000})
+        read = usage.cost_usd(model, {"cache_read_input_tokens": 1_000_000})
+        assert write == pytest.approx(0.80 * 1.25)
+        assert read == pytest.approx(0.08)
+
+    def test_summarize_calls(self):
+        calls = [
+            usage.call_record("claude-sonnet-4-20250514", {"input_tokens": 100, "output_tokens": 10}),
+            usage.call_record("claude-3-5-haiku-20241022", {"input_tokens": 50, "output_tokens": 5}),
+        ]
+        summary = usage.summarize_calls(calls)
+        assert summary["calls"] == 2
+        assert summary["input_tokens"] == 150
+        assert summary["models"] == ["claude-3-5-haiku-20241022", "claude-sonnet-4-20250514"]
+        assert usage.summarize_calls([]) is None
+
+
+class TestRollingStats:
+    def setup_method(self):
+        usage.clear()
+
+    def teardown_method(self):
+        usage.clear()
+
+    def _record(self, tier, intent, ms, cost, platform="gmail"):
+        usage.record_rewrite(
+            {"routing_tier": tier, "detected_intent": intent, "response_time_ms": ms,
+             "usage": {"calls": 1, "input_tokens": 100, "cache_read_input_tokens": 300, "cost_usd": cost}},
+            platform,
+        )
+
+    def test_groups_by_dimension(self):
+        self._record("haiku", "follow_up", 300, 0.001)
+        self._record("sonnet", "escalate", 1500, 0.01, platform="slack")
+        self._record("sonnet", "escalate", 2500, 0.02, platform="slack")
+        stats = usage.stats()
+        assert stats["overall"]["rewrites"] == 3
+        assert stats["by_tier"]["sonnet"]["cost_usd"] == pytest.approx(0.03)
+        assert stats["by_intent"]["escalate"]["p95_ms"] == 2500
+        assert stats["by_platform"]["gmail"]["avg_input_tokens"] == 400
+        assert stats["by_tier"]["haiku"]["cache_read_ratio"] == 0.75
+
+    def test_window_excludes_old_entries(self):
+        self._record("haiku", "follow_up", 300, 0.001)
+        usage._window[0]["ts"] -= 7200
+        assert usage.stats()["overall"]["rewrites"] == 0
+        assert usage.stats(window_s=10_000)["overall"]["rewrites"] == 1